@@ -3,23 +3,53 @@
 === 缓存管理器 ===
 
 提供查询结果缓存和模型缓存功能
+
+查询缓存存储在单个 SQLite 文件中：
+1. 主键查找 / 写入均为 O(1)（B 树索引），不再逐文件读写 JSON
+2. 过期时间单独建索引，清理过期项只扫描已过期的行
+3. 按最近访问时间淘汰，严格保证条目数不超过 max_cache_size
+4. 结果用 pickle 序列化，较大的结果再做 zlib 压缩
 """
 
 import os
-import json
 import pickle
+import sqlite3
 import hashlib
 import logging
+import threading
+import time
+import zlib
 from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 logger = logging.getLogger(__name__)
 
+QUERY_CACHE_DB = "query_cache.sqlite3"
+# 超过该字节数的结果才压缩，小结果压缩收益不抵开销
+COMPRESS_THRESHOLD = 1024
+_FLAG_RAW = 0
+_FLAG_ZLIB = 1
+
+
+def _dumps(value: Any) -> bytes:
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) > COMPRESS_THRESHOLD:
+        return bytes([_FLAG_ZLIB]) + zlib.compress(data, 3)
+    return bytes([_FLAG_RAW]) + data
+
+
+def _loads(blob: bytes) -> Any:
+    flag, data = blob[0], blob[1:]
+    if flag == _FLAG_ZLIB:
+        data = zlib.decompress(data)
+    return pickle.loads(data)
+
 
 class CacheManager:
     """缓存管理器"""
     
-    def __init__(self, cache_dir: str = "/root/autodl-tmp/rag_project/cache"):
+    def __init__(self, cache_dir: str = "/root/autodl-tmp/rag_project/cache",
+                 max_cache_size: int = 1000, max_cache_age_hours: float = 24):
         self.cache_dir = cache_dir
         self.query_cache_dir = os.path.join(cache_dir, "queries")
         self.model_cache_dir = os.path.join(cache_dir, "models")
@@ -29,11 +59,38 @@ class CacheManager:
         os.makedirs(self.model_cache_dir, exist_ok=True)
         
         # 缓存配置
-        self.max_cache_age = timedelta(hours=24)  # 24小时过期
-        self.max_cache_size = 1000  # 最大缓存条目数
+        self.max_cache_age = timedelta(hours=max_cache_age_hours)  # 默认24小时过期
+        self.max_cache_size = max_cache_size  # 最大缓存条目数
+        
+        self.db_path = os.path.join(self.query_cache_dir, QUERY_CACHE_DB)
+        self._lock = threading.RLock()
+        self._conn = self._connect()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
         
         logger.info(f"CacheManager 初始化完成，缓存目录: {cache_dir}")
     
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                config_hash TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_expires ON query_cache(expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_access ON query_cache(last_access)")
+        return conn
+    
     def _get_cache_key(self, query: str, config_hash: str = "") -> str:
         """生成缓存键"""
         content = f"{query}_{config_hash}"
@@ -42,23 +99,30 @@ class CacheManager:
     def get_query_cache(self, query: str, config_hash: str = "") -> Optional[Dict[str, Any]]:
         """获取查询缓存"""
         cache_key = self._get_cache_key(query, config_hash)
-        cache_file = os.path.join(self.query_cache_dir, f"{cache_key}.json")
-        
-        if not os.path.exists(cache_file):
-            return None
+        now = time.time()
         
         try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cache_data = json.load(f)
-            
-            # 检查缓存是否过期
-            cache_time = datetime.fromisoformat(cache_data['timestamp'])
-            if datetime.now() - cache_time > self.max_cache_age:
-                os.remove(cache_file)
-                return None
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM query_cache WHERE key = ?", (cache_key,)
+                ).fetchone()
+                
+                if row is None:
+                    self.misses += 1
+                    return None
+                
+                # 检查缓存是否过期
+                if row[1] <= now:
+                    self._conn.execute("DELETE FROM query_cache WHERE key = ?", (cache_key,))
+                    self._count -= 1
+                    self.misses += 1
+                    return None
+                
+                self._conn.execute("UPDATE query_cache SET last_access = ? WHERE key = ?", (now, cache_key))
+                self.hits += 1
             
             logger.info(f"命中查询缓存: {query[:50]}...")
-            return cache_data['result']
+            return _loads(row[0])
             
         except Exception as e:
             logger.error(f"读取查询缓存失败: {e}")
@@ -68,66 +132,76 @@ class CacheManager:
         """设置查询缓存"""
         try:
             cache_key = self._get_cache_key(query, config_hash)
-            cache_file = os.path.join(self.query_cache_dir, f"{cache_key}.json")
-            
-            cache_data = {
-                'query': query,
-                'result': result,
-                'timestamp': datetime.now().isoformat(),
-                'config_hash': config_hash
-            }
+            blob = _dumps(result)
+            now = time.time()
+            expires_at = now + self.max_cache_age.total_seconds()
             
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            with self._lock:
+                existed = self._conn.execute(
+                    "SELECT 1 FROM query_cache WHERE key = ?", (cache_key,)
+                ).fetchone() is not None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO query_cache "
+                    "(key, query, config_hash, value, size, created_at, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (cache_key, query, config_hash, sqlite3.Binary(blob), len(blob), now, expires_at, now)
+                )
+                if not existed:
+                    self._count += 1
+                    # 只在条目数超限时清理：先删过期项，再按最近访问时间淘汰
+                    if self._count > self.max_cache_size:
+                        self._cleanup_expired_cache(now)
+                        self._evict_lru()
             
             logger.info(f"保存查询缓存: {query[:50]}...")
             
-            # 清理过期缓存
-            self._cleanup_expired_cache()
-            
         except Exception as e:
             logger.error(f"保存查询缓存失败: {e}")
     
-    def _cleanup_expired_cache(self):
-        """清理过期缓存"""
+    def _cleanup_expired_cache(self, now: Optional[float] = None) -> int:
+        """清理过期缓存（走 expires_at 索引，只触及已过期的行）"""
         try:
-            cache_files = os.listdir(self.query_cache_dir)
-            current_time = datetime.now()
-            
-            for cache_file in cache_files:
-                if not cache_file.endswith('.json'):
-                    continue
-                
-                file_path = os.path.join(self.query_cache_dir, cache_file)
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        cache_data = json.load(f)
-                    
-                    cache_time = datetime.fromisoformat(cache_data['timestamp'])
-                    if current_time - cache_time > self.max_cache_age:
-                        os.remove(file_path)
-                        logger.debug(f"删除过期缓存: {cache_file}")
-                        
-                except Exception as e:
-                    logger.warning(f"处理缓存文件 {cache_file} 失败: {e}")
-                    
+            with self._lock:
+                removed = self._conn.execute(
+                    "DELETE FROM query_cache WHERE expires_at <= ?", (now or time.time(),)
+                ).rowcount
+                self._count -= removed
+            if removed:
+                logger.debug(f"删除过期缓存: {removed} 条")
+            return removed
         except Exception as e:
             logger.error(f"清理缓存失败: {e}")
+            return 0
+    
+    def _evict_lru(self):
+        """淘汰最久未访问的条目，直到不超过 max_cache_size"""
+        overflow = self._count - self.max_cache_size
+        if overflow <= 0:
+            return
+        removed = self._conn.execute(
+            "DELETE FROM query_cache WHERE key IN "
+            "(SELECT key FROM query_cache ORDER BY last_access LIMIT ?)", (overflow,)
+        ).rowcount
+        self._count -= removed
+        logger.debug(f"淘汰最久未访问的缓存: {removed} 条")
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
         try:
-            query_cache_files = [f for f in os.listdir(self.query_cache_dir) if f.endswith('.json')]
-            
-            total_size = 0
-            for cache_file in query_cache_files:
-                file_path = os.path.join(self.query_cache_dir, cache_file)
-                total_size += os.path.getsize(file_path)
+            with self._lock:
+                count, total_size = self._conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM query_cache"
+                ).fetchone()
+            total = self.hits + self.misses
             
             return {
-                'query_cache_count': len(query_cache_files),
+                'query_cache_count': count,
                 'total_cache_size_mb': total_size / (1024 * 1024),
+                'db_size_mb': os.path.getsize(self.db_path) / (1024 * 1024),
+                'max_cache_size': self.max_cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total > 0 else 0.0,
                 'cache_dir': self.cache_dir,
                 'max_cache_age_hours': self.max_cache_age.total_seconds() / 3600
             }
@@ -140,16 +214,28 @@ class CacheManager:
         """清空所有缓存"""
         try:
             import shutil
-            if os.path.exists(self.cache_dir):
-                shutil.rmtree(self.cache_dir)
-            
-            os.makedirs(self.query_cache_dir, exist_ok=True)
-            os.makedirs(self.model_cache_dir, exist_ok=True)
+            with self._lock:
+                self._conn.close()
+                if os.path.exists(self.cache_dir):
+                    shutil.rmtree(self.cache_dir)
+                
+                os.makedirs(self.query_cache_dir, exist_ok=True)
+                os.makedirs(self.model_cache_dir, exist_ok=True)
+                
+                self._conn = self._connect()
+                self._count = 0
+                self.hits = 0
+                self.misses = 0
             
             logger.info("缓存已清空")
             
         except Exception as e:
             logger.error(f"清空缓存失败: {e}")
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
 
 
 # 全局缓存管理器实例
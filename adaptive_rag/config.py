@@ -223,6 +223,15 @@ class FlexRAGIntegratedConfig:
             "retriever_type": "mock",
             "config": {
                 "retriever_path": "./adaptive_rag/data/dense_index"
+            },
+            # 稠密索引类型: flat(精确) / ivf / ivf_pq / hnsw
+            "index_config": {
+                "index_type": "flat",
+                "backend": "numpy",
+                "nlist": 1024,
+                "nprobe": 16,
+                "pq_m": 16,
+                "ef_search": 64
             }
         },
         "web_retriever": {
@@ -233,6 +242,49 @@ class FlexRAGIntegratedConfig:
         }
     })
 
+    # 并行检索配置（见 modules/retriever/retrieval_executor.py）
+    retrieval_executor_config: Dict[str, Any] = field(default_factory=lambda: {
+        "enabled": True,
+        "max_workers": 4,
+        "max_subtask_workers": 4,
+        "timeouts": {"keyword": 2.0, "dense": 2.0, "web": 5.0},
+        "deadline": None
+    })
+
+    # 检索结果去重配置（见 modules/refiner/deduplicator.py）
+    dedup_config: Dict[str, Any] = field(default_factory=lambda: {
+        "enabled": True,
+        "threshold": 0.85,
+        "num_perm": 64
+    })
+
+    # 启动配置（见 webui/engines/local_model_engine.py）
+    startup_config: Dict[str, Any] = field(default_factory=lambda: {
+        "lazy_loading": True,
+        "warmup": True,
+        "warmup_queries": []
+    })
+
+    # 缓存模块配置（见 core/semantic_cache.py、core/predictive_cache.py）
+    cache_configs: Dict[str, Any] = field(default_factory=lambda: {
+        "semantic_cache": {
+            "similarity_threshold": 0.92,
+            "verify": "key_terms",
+            "max_cache_size": 1000,
+            "ttl_seconds": 3600
+        },
+        "predictive_cache": {
+            "prediction_window": 5,
+            "confidence_threshold": 0.7,
+            "min_support": 2,
+            "prefetch_top_k": 10,
+            "max_entries": 512,
+            "ttl_seconds": 300,
+            "max_workers": 2,
+            "query_log_path": None
+        }
+    })
+
     # FlexRAG 重排序器配置（简化版）
     ranker_configs: Dict[str, Any] = field(default_factory=lambda: {
         "cross_encoder": {
@@ -918,6 +970,31 @@ def load_modular_config_from_yaml(yaml_path: str) -> FlexRAGIntegratedConfig:
         config.batch_size = basic_config.get('batch_size', config.batch_size)
         config.max_input_length = basic_config.get('max_input_length', config.max_input_length)
 
+    # 加载稠密检索索引配置
+    dense_yaml = yaml_config.get('retrievers', {}).get('dense_retriever', {})
+    if 'index' in dense_yaml:
+        config.retriever_configs['dense_retriever'].setdefault('index_config', {}).update(dense_yaml['index'])
+
+    # 加载并行检索配置
+    if 'retrieval_executor' in yaml_config:
+        config.retrieval_executor_config.update(yaml_config['retrieval_executor'])
+
+    # 加载去重配置
+    if 'dedup' in yaml_config:
+        config.dedup_config.update(yaml_config['dedup'] or {})
+
+    # 加载启动配置
+    if 'startup' in yaml_config:
+        config.startup_config.update(yaml_config['startup'] or {})
+
+    # 加载缓存模块配置
+    for cache_name, cache_config in (yaml_config.get('cache') or {}).items():
+        config.cache_configs.setdefault(cache_name, {}).update(cache_config or {})
+
+    # 数据路径配置（LocalModelEngine 通过 config.data 读取）
+    if 'data' in yaml_config:
+        config.data = yaml_config['data']
+
     return config
 
 
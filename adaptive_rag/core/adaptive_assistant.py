@@ -71,6 +71,13 @@ class AdaptiveConfig:
     diversity_weight: float = 0.3
     redundancy_threshold: float = 0.85
 
+    # 本地索引配置（见 core/local_indexes.py），corpus_path 为空时使用模拟检索
+    corpus_path: Optional[str] = None
+    index_cache_dir: str = "./adaptive_rag/data/cache"
+    embedding_model_path: Optional[str] = None
+    max_documents: Optional[int] = None
+    index_build_async: bool = True  # 后台构建本地索引，完成前使用模拟检索
+
 
 @ASSISTANTS("adaptive", config_class=AdaptiveConfig)
 class AdaptiveAssistant(BasicAssistant):
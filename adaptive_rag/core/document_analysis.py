@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+=== 请求级文档分析缓存 ===
+
+一次检索中，相关性评分、实体 / 关键词评分、查询类型评分、去重和多样性选择
+都要对同一批候选文档小写、分词、建词集合。这里每个候选只分析一次：
+1. AnalyzedDocument 保存小写正文、词列表、词集合、词频和长度
+2. DocumentAnalysisCache 随一次 retrieve 调用创建、随之丢弃，先按对象、再按正文命中，
+   不同检索器返回的同一篇文档也只分析一次
+"""
+
+import logging
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, List, Tuple
+
+from ..modules.retriever.sparse_retriever import default_tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyzedDocument:
+    """一篇文档的分析结果（只读）"""
+
+    __slots__ = ("text", "tokens", "_token_set", "_term_freqs")
+
+    def __init__(self, text: str, tokens: List[str]):
+        self.text = text
+        self.tokens = tokens
+        self._token_set = None
+        self._term_freqs = None
+
+    @property
+    def token_set(self) -> FrozenSet[str]:
+        if self._token_set is None:
+            self._token_set = frozenset(self.tokens)
+        return self._token_set
+
+    @property
+    def term_freqs(self) -> Counter:
+        if self._term_freqs is None:
+            self._term_freqs = Counter(self.tokens)
+        return self._term_freqs
+
+    @property
+    def length(self) -> int:
+        return len(self.tokens)
+
+    def contains(self, phrase: str) -> bool:
+        """短语（已小写）是否出现在正文中"""
+        return phrase in self.text
+
+
+class DocumentAnalysisCache:
+    """
+    请求级分析缓存
+
+    Args:
+        tokenizer: 作用于小写正文的分词函数，默认与 BM25 / 去重一致（空白切分）
+    """
+
+    def __init__(self, tokenizer: Callable[[str], List[str]] = default_tokenize):
+        self.tokenizer = tokenizer
+        # id(文档) -> (文档, 分析结果)；保留文档引用，请求期间 id 不会被复用
+        self._by_object: Dict[int, Tuple[Any, AnalyzedDocument]] = {}
+        self._by_text: Dict[str, AnalyzedDocument] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def analyze_text(self, text: str) -> AnalyzedDocument:
+        analyzed = self._by_text.get(text)
+        if analyzed is None:
+            lowered = text.lower()
+            analyzed = AnalyzedDocument(lowered, self.tokenizer(lowered))
+            self._by_text[text] = analyzed
+            self.misses += 1
+        else:
+            self.hits += 1
+        return analyzed
+
+    def get(self, doc: Any) -> AnalyzedDocument:
+        """取文档（具有 content 属性）的分析结果"""
+        entry = self._by_object.get(id(doc))
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        analyzed = self.analyze_text(doc.content)
+        self._by_object[id(doc)] = (doc, analyzed)
+        return analyzed
+
+    def get_many(self, docs: List[Any]) -> List[AnalyzedDocument]:
+        return [self.get(doc) for doc in docs]
+
+    def __len__(self) -> int:
+        return len(self._by_text)
+
+    def get_statistics(self) -> Dict[str, int]:
+        return {"documents": len(self._by_text), "hits": self.hits, "misses": self.misses}
+
+
+if __name__ == "__main__":
+    import random
+    import time
+    from types import SimpleNamespace
+
+    random.seed(0)
+    vocabulary = [f"w{i}" for i in range(3000)]
+    docs = [SimpleNamespace(content=" ".join(random.choices(vocabulary, k=150))) for _ in range(60)]
+    query = " ".join(random.choices(vocabulary, k=8))
+    keywords, entities = random.choices(vocabulary, k=5), random.choices(vocabulary, k=3)
+    indicators = ["is", "are", "means", "refers to", "define", "definition"]
+
+    def uncached_scoring():
+        # 原实现：每个评分函数各自小写、切分
+        query_words = set(query.lower().split())
+        for doc in docs:
+            len(query_words & set(doc.content.lower().split()))
+            sum(entity.lower() in doc.content.lower() for entity in entities)
+            sum(keyword.lower() in doc.content.lower() for keyword in keywords)
+            sum(indicator in doc.content.lower() for indicator in indicators)
+        # 去重与多样性选择再各自分词一次
+        [set(doc.content.lower().split()) for doc in docs]
+        [set(doc.content.lower().split()) for doc in docs]
+
+    def cached_scoring():
+        cache = DocumentAnalysisCache()
+        query_words = cache.analyze_text(query).token_set
+        lowered_entities = [entity.lower() for entity in entities]
+        lowered_keywords = [keyword.lower() for keyword in keywords]
+        for analyzed in cache.get_many(docs):
+            len(query_words & analyzed.token_set)
+            sum(analyzed.contains(entity) for entity in lowered_entities)
+            sum(analyzed.contains(keyword) for keyword in lowered_keywords)
+            sum(analyzed.contains(indicator) for indicator in indicators)
+        [cache.get(doc).token_set for doc in docs]
+        [cache.get(doc).token_set for doc in docs]
+
+    for name, fn in [("逐函数分词", uncached_scoring), ("请求级缓存", cached_scoring)]:
+        start = time.perf_counter()
+        for _ in range(20):
+            fn()
+        print(f"{name}: {(time.perf_counter() - start) / 20 * 1000:.2f}ms / 查询（{len(docs)} 个候选）")
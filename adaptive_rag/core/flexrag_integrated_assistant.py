@@ -21,6 +21,7 @@ from ..retrieval_planner import RetrievalPlanner
 
 # 导入统一的数据结构
 from ..modules.retriever.flexrag_integrated_retriever import RetrievedContext
+from ..modules.retriever.retrieval_executor import run_concurrently
 
 # 检查 FlexRAG 可用性
 try:
@@ -70,6 +71,10 @@ class FlexRAGIntegratedAssistant:
         self.ranker = FlexRAGIntegratedRanker(config)
         self.generator = FlexRAGIntegratedGenerator(config)
         
+        # 子任务并发检索数
+        executor_config = getattr(config, 'retrieval_executor_config', None) or {}
+        self.max_subtask_workers = executor_config.get("max_subtask_workers", 4)
+        
         # 系统状态
         self.is_initialized = True
         self.component_status = self._check_component_status()
@@ -115,20 +120,23 @@ class FlexRAGIntegratedAssistant:
             logger.info("📋 第一阶段：任务分解和策略规划")
             
             # 1. 任务分解
+            stage_start = time.time()
             subtasks = self.task_decomposer.decompose_query(query)
+            decomposition_time = time.time() - stage_start
             logger.info(f"   分解为 {len(subtasks)} 个子任务")
             
             # 2. 检索策略规划
+            stage_start = time.time()
             retrieval_plans = self.retrieval_planner.plan_retrieval_strategy(subtasks)
+            planning_time = time.time() - stage_start
             logger.info(f"   生成 {len(retrieval_plans)} 个检索计划")
             
-            # === 第二阶段：多模态检索 ===
+            # === 第二阶段：多模态检索（子任务并发） ===
             logger.info("🔍 第二阶段：多模态检索")
             
-            retrieval_results = []
-            all_contexts = []
+            retrieval_top_k = strategy_config.get("retrieval_top_k", 10)
             
-            for subtask in subtasks:
+            def retrieve_subtask(subtask):
                 plan = retrieval_plans[subtask.id]
                 
                 # 转换计划为检索策略
@@ -138,17 +146,25 @@ class FlexRAGIntegratedAssistant:
                     "fusion_method": plan.fusion_method
                 }
                 
-                # 执行检索
-                result = self.retriever.adaptive_retrieve(
+                return self.retriever.adaptive_retrieve(
                     query=subtask.content,
                     strategy=retrieval_strategy,
-                    top_k=strategy_config.get("retrieval_top_k", 10)
+                    top_k=retrieval_top_k
                 )
-                
-                retrieval_results.append(result)
-                all_contexts.extend(result.contexts)
-                
-                logger.info(f"   子任务 '{subtask.content}' 检索到 {len(result.contexts)} 个文档")
+            
+            stage_start = time.time()
+            timed_results = run_concurrently(retrieve_subtask, subtasks, self.max_subtask_workers)
+            retrieval_time = time.time() - stage_start
+            
+            retrieval_results = [result for result, _ in timed_results]
+            subtask_times = {}
+            for subtask, (result, elapsed) in zip(subtasks, timed_results):
+                subtask_times[subtask.id] = {"content": subtask.content, "time": elapsed}
+                logger.info(f"   子任务 '{subtask.content}' 检索到 {len(result.contexts)} 个文档 ({elapsed:.3f}s)")
+            
+            # 跨子任务去重
+            retrieved_count = sum(len(result.contexts) for result in retrieval_results)
+            all_contexts = self._merge_subtask_contexts(retrieval_results)
             
             # === 第三阶段：智能重排序 ===
             logger.info("🎯 第三阶段：智能重排序")
@@ -212,12 +228,16 @@ class FlexRAGIntegratedAssistant:
                     "component_status": self.component_status,
                     "stage_times": {
                         "total": total_time,
+                        "decomposition": decomposition_time,
+                        "planning": planning_time,
                         "generation": generation_result.generation_time,
                         "ranking": ranking_results[0].ranking_time if ranking_results else 0,
-                        "retrieval": sum(r.retrieval_time for r in retrieval_results)
+                        "retrieval": retrieval_time,
+                        "retrieval_subtasks": subtask_times
                     },
                     "document_counts": {
-                        "total_retrieved": len(all_contexts),
+                        "total_retrieved": retrieved_count,
+                        "unique_retrieved": len(all_contexts),
                         "final_contexts": len(final_contexts),
                         "subtasks": len(subtasks)
                     }
@@ -244,6 +264,16 @@ class FlexRAGIntegratedAssistant:
                 metadata={"error": str(e)}
             )
     
+    def _merge_subtask_contexts(self, retrieval_results: List[Any]) -> List[RetrievedContext]:
+        """合并各子任务的检索结果，按内容去重并保留分数最高的一条（按子任务顺序，结果确定）"""
+        merged = {}
+        for result in retrieval_results:
+            for ctx in result.contexts:
+                content_key = ctx.content[:200].strip()
+                if content_key not in merged or ctx.score > merged[content_key].score:
+                    merged[content_key] = ctx
+        return list(merged.values())
+    
     def _get_default_strategy(self) -> Dict[str, Any]:
         """获取默认策略配置"""
         return {
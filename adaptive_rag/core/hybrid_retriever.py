@@ -10,32 +10,75 @@
 """
 
 import logging
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+import threading
+from typing import List, Dict, Any, FrozenSet, Optional, Tuple
 
 # 导入 FlexRAG 组件
 from flexrag.retriever import FlexRetriever
 # from flexrag.ranker import HFRanker  # 暂时注释掉，使用简化版本
 from flexrag.utils.dataclasses import RetrievedContext
 
-from .query_analyzer import AnalysisResult
+from .query_analyzer import AnalysisResult, QueryComplexity, QueryType
 from .strategy_router import RetrievalStrategy
+from .document_analysis import AnalyzedDocument, DocumentAnalysisCache
+from .local_indexes import LocalIndexes
+from ..modules.refiner.deduplicator import MinHashDeduplicator
+from ..modules.refiner.mmr import MMRSelector, novelty_scores
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
 class ScoredDocument:
-    """评分文档数据结构"""
-    content: str
-    title: str
-    doc_id: str
-    keyword_score: float
-    vector_score: float
-    combined_score: float
-    relevance_score: float
-    diversity_score: float
-    final_score: float
+    """
+    评分文档数据结构（__slots__）
+
+    可以直接持有正文，也可以只引用文档库中的文档号（store + doc_index），
+    此时标题和正文在访问时才从文档库读取；各项评分默认为 0。
+    """
+
+    __slots__ = (
+        "_content", "_title", "_doc_id", "store", "doc_index",
+        "keyword_score", "vector_score", "combined_score",
+        "relevance_score", "diversity_score", "final_score"
+    )
+
+    def __init__(self, content: Optional[str] = None, title: Optional[str] = None,
+                 doc_id: Optional[str] = None, keyword_score: float = 0.0,
+                 vector_score: float = 0.0, combined_score: float = 0.0,
+                 relevance_score: float = 0.0, diversity_score: float = 0.0,
+                 final_score: float = 0.0, store=None, doc_index: int = -1):
+        self._content = content
+        self._title = title
+        self._doc_id = doc_id
+        self.store = store
+        self.doc_index = doc_index
+        self.keyword_score = keyword_score
+        self.vector_score = vector_score
+        self.combined_score = combined_score
+        self.relevance_score = relevance_score
+        self.diversity_score = diversity_score
+        self.final_score = final_score
+
+    @property
+    def content(self) -> str:
+        if self._content is None and self.store is not None:
+            return self.store.get_content(self.doc_index)
+        return self._content or ""
+
+    @property
+    def title(self) -> str:
+        if self._title is None and self.store is not None:
+            return self.store.get_title(self.doc_index)
+        return self._title or ""
+
+    @property
+    def doc_id(self) -> str:
+        if self._doc_id is None and self.store is not None:
+            return self.store.get_id(self.doc_index)
+        return self._doc_id or ""
+
+    def __repr__(self) -> str:
+        return f"ScoredDocument(doc_id={self.doc_id!r}, final_score={self.final_score:.4f})"
 
 
 class HybridRetriever:
@@ -57,23 +100,55 @@ class HybridRetriever:
         
         # 初始化重排序器
         self._init_ranker()
+
+        # 近似去重（MinHash + LSH）
+        self.deduplicator = MinHashDeduplicator(threshold=cfg.redundancy_threshold)
+
+        # 多样性选择（MMR），相关度权重 λ = relevance_weight / (relevance_weight + diversity_weight)
+        total_weight = cfg.relevance_weight + cfg.diversity_weight
+        self.mmr_selector = MMRSelector(
+            lambda_=cfg.relevance_weight / total_weight if total_weight > 0 else 0.7
+        )
         
         logger.info("HybridRetriever 初始化完成")
     
     def _init_retrievers(self):
-        """初始化检索器"""
+        """
+        初始化检索器：配置了本地语料时使用真实的 BM25 / 稠密索引，否则使用模拟检索
+
+        首次构建需要扫描全部语料并编码全部文档，默认（index_build_async）在后台线程中完成，
+        构建完成前检索走模拟通道，不阻塞检索器初始化。
+        """
+        self.local_indexes = None
+        self.keyword_retriever = None
+        self.vector_retriever = None
+        self._indexes_ready = threading.Event()
+        if getattr(self.cfg, 'index_build_async', True):
+            threading.Thread(target=self._load_local_indexes, name="local-index-build", daemon=True).start()
+        else:
+            self._load_local_indexes()
+
+    def _load_local_indexes(self):
+        local_indexes = None
         try:
-            # 这里需要根据实际的 FlexRAG 配置来初始化
-            # 暂时使用模拟实现，后续替换为真实的 FlexRAG 检索器
-            self.keyword_retriever = None  # FlexRetriever(keyword_config)
-            self.vector_retriever = None   # FlexRetriever(vector_config)
-            
-            logger.warning("使用模拟检索器，需要配置真实的 FlexRAG 检索器")
-            
+            local_indexes = LocalIndexes.from_config(self.cfg)
         except Exception as e:
             logger.error(f"检索器初始化失败: {e}")
-            self.keyword_retriever = None
-            self.vector_retriever = None
+
+        if local_indexes is None:
+            logger.warning("使用模拟检索器，需要配置 corpus_path 以使用本地索引")
+        else:
+            self.keyword_retriever = local_indexes.bm25
+            self.vector_retriever = local_indexes.dense
+            if self.vector_retriever is None:
+                logger.warning("⚠️ 未配置嵌入模型，向量检索通道不返回结果")
+            # 最后发布：检索线程看到 local_indexes 时各通道都已就绪
+            self.local_indexes = local_indexes
+        self._indexes_ready.set()
+
+    def wait_for_indexes(self, timeout: Optional[float] = None) -> bool:
+        """等待本地索引加载或构建结束（含不可用的情况），返回是否已结束"""
+        return self._indexes_ready.wait(timeout)
     
     def _init_ranker(self):
         """初始化重排序器"""
@@ -101,15 +176,19 @@ class HybridRetriever:
         logger.info(f"开始混合检索: {query}")
         
         retrieval_strategy = strategy["strategy"]
+
+        # 本次请求的文档分析缓存：每个候选只小写、分词一次，供所有评分与聚合阶段共用
+        doc_analysis = DocumentAnalysisCache()
         
         # 1. 执行多路检索
         all_documents = self._multi_retrieval(query, analysis_result, retrieval_strategy)
         
         # 2. 计算综合评分
-        scored_documents = self._score_documents(all_documents, query, retrieval_strategy)
+        scored_documents = self._score_documents(all_documents, query, retrieval_strategy, doc_analysis)
         
         # 3. 增强聚合算法 - 改进相关度和多样性平衡
-        aggregated_documents = self._enhanced_aggregate_documents(scored_documents, retrieval_strategy, analysis_result, strategy)
+        aggregated_documents = self._enhanced_aggregate_documents(scored_documents, retrieval_strategy, analysis_result,
+                                                                  strategy, doc_analysis)
         
         # 4. 重排序（如果启用）
         if retrieval_strategy.rerank_enabled and self.ranker:
@@ -123,6 +202,9 @@ class HybridRetriever:
     
     def _multi_retrieval(self, query: str, analysis_result: AnalysisResult, strategy: RetrievalStrategy) -> List[ScoredDocument]:
         """多路检索"""
+        if self.local_indexes is not None:
+            return self._batched_index_retrieval(query, analysis_result, strategy)
+
         all_documents = []
         
         # 1. 关键词检索
@@ -142,9 +224,62 @@ class HybridRetriever:
         
         return all_documents
     
+    def _batched_index_retrieval(self, query: str, analysis_result: AnalysisResult,
+                                 strategy: RetrievalStrategy) -> List[ScoredDocument]:
+        """
+        基于本地索引的多路检索
+
+        关键词查询、原始查询和全部子查询合并为一次批量检索（稠密查询一次编码），
+        同一文档在各路结果中取最高分合并为一个候选。
+        """
+        # (查询, 分数系数)
+        keyword_requests: List[Tuple[str, float]] = []
+        vector_requests: List[Tuple[str, float]] = []
+
+        # 1. 关键词检索
+        if strategy.keyword_weight > 0:
+            keywords = analysis_result.keywords + analysis_result.entities
+            keyword_requests.append((" ".join(keywords[:5]) or query, 1.0))
+
+        # 2. 向量检索
+        if strategy.vector_weight > 0:
+            vector_requests.append((query, 1.0))
+
+        # 3. 子查询检索：两路各占一半权重
+        for sub_query in analysis_result.sub_queries or []:
+            keyword_requests.append((sub_query.content, sub_query.priority * 0.5))
+            vector_requests.append((sub_query.content, sub_query.priority * 0.5))
+
+        logger.info(f"批量检索: {len(keyword_requests)} 个关键词查询, {len(vector_requests)} 个向量查询")
+        keyword_results = self.local_indexes.keyword_search_batch([q for q, _ in keyword_requests], strategy.max_docs)
+        vector_results = self.local_indexes.dense_search_batch([q for q, _ in vector_requests], strategy.max_docs)
+
+        documents: Dict[int, ScoredDocument] = {}
+
+        def candidate(doc_index: int) -> ScoredDocument:
+            doc = documents.get(doc_index)
+            if doc is None:
+                doc = ScoredDocument(store=self.local_indexes.documents, doc_index=doc_index)
+                documents[doc_index] = doc
+            return doc
+
+        for (_, weight), (doc_indices, scores) in zip(keyword_requests, keyword_results):
+            # BM25 分数无上界，按本次查询的最高分归一化到 [0, 1]
+            top_score = float(scores[0]) if scores.size else 0.0
+            for doc_index, score in zip(doc_indices.tolist(), scores.tolist()):
+                doc = candidate(doc_index)
+                doc.keyword_score = max(doc.keyword_score, weight * (score / top_score if top_score > 0 else 0.0))
+
+        for (_, weight), (doc_indices, scores) in zip(vector_requests, vector_results):
+            for doc_index, score in zip(doc_indices.tolist(), scores.tolist()):
+                doc = candidate(doc_index)
+                doc.vector_score = max(doc.vector_score, weight * score)
+
+        return list(documents.values())
+
     def _keyword_retrieval(self, query: str, analysis_result: AnalysisResult, strategy: RetrievalStrategy) -> List[ScoredDocument]:
         """关键词检索"""
-        # 模拟实现 - 实际应该使用 FlexRAG 的关键词检索器
+        # 未配置本地索引时的模拟实现
         logger.info("执行关键词检索")
         
         # 构建关键词查询
@@ -164,12 +299,7 @@ class HybridRetriever:
                 content=result["content"],
                 title=result["title"],
                 doc_id=result["doc_id"],
-                keyword_score=result["score"],
-                vector_score=0.0,
-                combined_score=0.0,
-                relevance_score=0.0,
-                diversity_score=0.0,
-                final_score=0.0
+                keyword_score=result["score"]
             )
             documents.append(doc)
         
@@ -177,7 +307,7 @@ class HybridRetriever:
     
     def _vector_retrieval(self, query: str, analysis_result: AnalysisResult, strategy: RetrievalStrategy) -> List[ScoredDocument]:
         """向量检索"""
-        # 模拟实现 - 实际应该使用 FlexRAG 的向量检索器
+        # 未配置本地索引时的模拟实现
         logger.info("执行向量检索")
         
         # 模拟检索结果
@@ -193,12 +323,7 @@ class HybridRetriever:
                 content=result["content"],
                 title=result["title"],
                 doc_id=result["doc_id"],
-                keyword_score=0.0,
-                vector_score=result["score"],
-                combined_score=0.0,
-                relevance_score=0.0,
-                diversity_score=0.0,
-                final_score=0.0
+                vector_score=result["score"]
             )
             documents.append(doc)
         
@@ -222,21 +347,27 @@ class HybridRetriever:
                     title=result["title"],
                     doc_id=result["doc_id"],
                     keyword_score=result["score"] * 0.5,
-                    vector_score=result["score"] * 0.5,
-                    combined_score=0.0,
-                    relevance_score=0.0,
-                    diversity_score=0.0,
-                    final_score=0.0
+                    vector_score=result["score"] * 0.5
                 )
                 all_docs.append(doc)
         
         return all_docs
     
-    def _score_documents(self, documents: List[ScoredDocument], query: str, strategy: RetrievalStrategy) -> List[ScoredDocument]:
+    def _score_documents(self, documents: List[ScoredDocument], query: str, strategy: RetrievalStrategy,
+                         doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
         """计算文档综合评分"""
         logger.info(f"计算 {len(documents)} 个文档的综合评分")
+
+        analyzed_documents = doc_analysis.get_many(documents)
+        query_words = doc_analysis.analyze_text(query).token_set
+
+        # 多样性评分：候选相似度矩阵只计算一次，取 1 - 与其他候选的最大相似度
+        similarity = self.mmr_selector.similarity_matrix(
+            token_sets=[analyzed.token_set for analyzed in analyzed_documents]
+        )
+        diversity_scores = novelty_scores(similarity)
         
-        for doc in documents:
+        for doc, analyzed, diversity_score in zip(documents, analyzed_documents, diversity_scores):
             # 1. 计算综合检索评分
             doc.combined_score = (
                 doc.keyword_score * strategy.keyword_weight +
@@ -244,10 +375,10 @@ class HybridRetriever:
             )
             
             # 2. 计算相关性评分（简单实现）
-            doc.relevance_score = self._calculate_relevance(doc, query)
+            doc.relevance_score = self._calculate_relevance(analyzed, query_words)
             
-            # 3. 计算多样性评分（简单实现）
-            doc.diversity_score = self._calculate_diversity(doc, documents)
+            # 3. 多样性评分
+            doc.diversity_score = float(diversity_score)
             
             # 4. 计算最终评分
             doc.final_score = (
@@ -258,34 +389,15 @@ class HybridRetriever:
         
         return documents
     
-    def _calculate_relevance(self, doc: ScoredDocument, query: str) -> float:
-        """计算相关性评分"""
-        # 简单的相关性计算
-        query_words = set(query.lower().split())
-        doc_words = set(doc.content.lower().split())
-        
+    def _calculate_relevance(self, analyzed: AnalyzedDocument, query_words: FrozenSet[str]) -> float:
+        """计算相关性评分：查询词在文档中出现的比例"""
         if not query_words:
             return 0.0
         
-        intersection = query_words.intersection(doc_words)
-        return len(intersection) / len(query_words)
-    
-    def _calculate_diversity(self, doc: ScoredDocument, all_docs: List[ScoredDocument]) -> float:
-        """计算多样性评分"""
-        # 简单的多样性计算 - 基于内容长度差异
-        doc_length = len(doc.content)
-        
-        diversity_score = 0.5  # 基础分数
-        
-        # 与其他文档的差异性
-        for other_doc in all_docs:
-            if other_doc.doc_id != doc.doc_id:
-                length_diff = abs(len(other_doc.content) - doc_length)
-                diversity_score += min(length_diff / 1000, 0.1)  # 长度差异贡献
-        
-        return min(diversity_score, 1.0)
+        return len(query_words & analyzed.token_set) / len(query_words)
     
-    def _aggregate_documents(self, documents: List[ScoredDocument], strategy: RetrievalStrategy) -> List[ScoredDocument]:
+    def _aggregate_documents(self, documents: List[ScoredDocument], strategy: RetrievalStrategy,
+                             doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
         """智能聚合和去重"""
         logger.info(f"聚合和去重 {len(documents)} 个文档")
         
@@ -293,73 +405,30 @@ class HybridRetriever:
         documents.sort(key=lambda x: x.final_score, reverse=True)
         
         # 2. 去重（基于内容相似度）
-        unique_documents = []
-        for doc in documents:
-            is_duplicate = False
-            for existing_doc in unique_documents:
-                if self._is_duplicate(doc, existing_doc):
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                unique_documents.append(doc)
+        unique_documents = self.deduplicator.deduplicate(documents, token_sets=self._token_sets(documents, doc_analysis))
         
         # 3. 应用多样性过滤
         if strategy.diversity_factor > 0.5:
-            unique_documents = self._apply_diversity_filter(unique_documents, strategy)
+            unique_documents = self._apply_diversity_filter(unique_documents, strategy, doc_analysis)
         
         logger.info(f"聚合完成，保留 {len(unique_documents)} 个文档")
         return unique_documents
     
-    def _is_duplicate(self, doc1: ScoredDocument, doc2: ScoredDocument) -> bool:
-        """检查是否为重复文档"""
-        # 简单的重复检测 - 基于内容相似度
-        content1_words = set(doc1.content.lower().split())
-        content2_words = set(doc2.content.lower().split())
-        
-        if not content1_words or not content2_words:
-            return False
-        
-        intersection = content1_words.intersection(content2_words)
-        union = content1_words.union(content2_words)
-        
-        similarity = len(intersection) / len(union)
-        return similarity > self.cfg.redundancy_threshold
-    
-    def _apply_diversity_filter(self, documents: List[ScoredDocument], strategy: RetrievalStrategy) -> List[ScoredDocument]:
-        """应用多样性过滤"""
+    def _apply_diversity_filter(self, documents: List[ScoredDocument], strategy: RetrievalStrategy,
+                                doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
+        """应用多样性过滤：多样性因子越大，MMR 越偏向多样性"""
         if len(documents) <= strategy.max_docs:
             return documents
-        
-        # 选择多样性最高的文档
-        selected = [documents[0]]  # 保留评分最高的
-        
-        for doc in documents[1:]:
-            if len(selected) >= strategy.max_docs:
-                break
-            
-            # 计算与已选文档的多样性
-            avg_diversity = sum(self._calculate_pairwise_diversity(doc, selected_doc) for selected_doc in selected) / len(selected)
-            
-            if avg_diversity > strategy.diversity_factor:
-                selected.append(doc)
-        
-        return selected
-    
-    def _calculate_pairwise_diversity(self, doc1: ScoredDocument, doc2: ScoredDocument) -> float:
-        """计算两个文档之间的多样性"""
-        # 简单实现 - 基于内容差异
-        words1 = set(doc1.content.lower().split())
-        words2 = set(doc2.content.lower().split())
-        
-        if not words1 or not words2:
-            return 1.0
-        
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        similarity = len(intersection) / len(union)
-        return 1.0 - similarity
+
+        return self.mmr_selector.select(
+            documents, [doc.final_score for doc in documents], strategy.max_docs,
+            lambda_=1.0 - strategy.diversity_factor,
+            token_sets=self._token_sets(documents, doc_analysis)
+        )
+
+    @staticmethod
+    def _token_sets(documents: List[ScoredDocument], doc_analysis: DocumentAnalysisCache) -> List[FrozenSet[str]]:
+        return [analyzed.token_set for analyzed in doc_analysis.get_many(documents)]
     
     def _rerank_documents(self, documents: List[ScoredDocument], query: str) -> List[ScoredDocument]:
         """重排序文档"""
@@ -395,181 +464,110 @@ class HybridRetriever:
     def _enhanced_aggregate_documents(self, scored_documents: List[ScoredDocument],
                                     retrieval_strategy: RetrievalStrategy,
                                     analysis_result: AnalysisResult,
-                                    strategy_info: Dict[str, Any]) -> List[ScoredDocument]:
+                                    strategy_info: Dict[str, Any],
+                                    doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
         """增强聚合算法 - 改进相关度和多样性平衡"""
 
         # 1. 去重处理
-        unique_documents = self._deduplicate_documents(scored_documents)
+        unique_documents = self._deduplicate_documents(scored_documents, doc_analysis)
 
         # 2. 多维度评分
-        multi_scored_documents = self._multi_dimensional_scoring(unique_documents, analysis_result, strategy_info)
+        multi_scored_documents = self._multi_dimensional_scoring(unique_documents, analysis_result, strategy_info,
+                                                                 doc_analysis)
 
         # 3. 相关度和多样性平衡
-        balanced_documents = self._balance_relevance_diversity(multi_scored_documents, retrieval_strategy)
+        balanced_documents = self._balance_relevance_diversity(multi_scored_documents, retrieval_strategy,
+                                                               doc_analysis)
 
         # 4. 动态选择最终文档
         final_documents = self._dynamic_document_selection(balanced_documents, retrieval_strategy, analysis_result)
 
         return final_documents
 
-    def _deduplicate_documents(self, documents: List[ScoredDocument]) -> List[ScoredDocument]:
-        """智能去重"""
-        unique_docs = {}
-
-        for doc in documents:
-            # 使用内容哈希作为去重键
-            content_hash = hash(doc.content[:200])  # 使用前200字符计算哈希
-
-            if content_hash not in unique_docs:
-                unique_docs[content_hash] = doc
-            else:
-                # 保留评分更高的文档
-                if doc.score > unique_docs[content_hash].score:
-                    unique_docs[content_hash] = doc
-
-        return list(unique_docs.values())
+    def _deduplicate_documents(self, documents: List[ScoredDocument],
+                               doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
+        """智能去重：近似重复的文档只保留评分最高的一篇"""
+        ranked = sorted(documents, key=lambda x: x.final_score, reverse=True)
+        return self.deduplicator.deduplicate(ranked, token_sets=self._token_sets(ranked, doc_analysis))
 
     def _multi_dimensional_scoring(self, documents: List[ScoredDocument],
                                  analysis_result: AnalysisResult,
-                                 strategy_info: Dict[str, Any]) -> List[ScoredDocument]:
-        """多维度评分"""
-        enhanced_documents = []
+                                 strategy_info: Dict[str, Any],
+                                 doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
+        """多维度评分（原地更新 final_score）"""
+        entities = [entity.lower() for entity in analysis_result.entities]
+        keywords = [keyword.lower() for keyword in analysis_result.keywords]
 
-        for doc in documents:
+        for doc, analyzed in zip(documents, doc_analysis.get_many(documents)):
             # 基础相关度评分
-            relevance_score = doc.score
+            relevance_score = doc.final_score
 
             # 实体匹配评分
-            entity_score = self._calculate_entity_score(doc, analysis_result.entities)
+            entity_score = self._calculate_entity_score(analyzed, entities)
 
             # 关键词匹配评分
-            keyword_score = self._calculate_keyword_score(doc, analysis_result.keywords)
+            keyword_score = self._calculate_keyword_score(analyzed, keywords)
 
             # 查询类型特定评分
-            type_score = self._calculate_type_specific_score(doc, analysis_result.query_type)
+            type_score = self._calculate_type_specific_score(analyzed, analysis_result.query_type)
 
             # 综合评分
-            final_score = (
+            doc.final_score = (
                 relevance_score * 0.4 +
                 entity_score * 0.25 +
                 keyword_score * 0.2 +
                 type_score * 0.15
             )
 
-            # 创建增强的文档对象
-            enhanced_doc = ScoredDocument(
-                content=doc.content,
-                score=final_score,
-                metadata={
-                    **doc.metadata,
-                    "relevance_score": relevance_score,
-                    "entity_score": entity_score,
-                    "keyword_score": keyword_score,
-                    "type_score": type_score,
-                    "enhanced": True
-                }
-            )
-            enhanced_documents.append(enhanced_doc)
-
-        return enhanced_documents
+        return documents
 
-    def _calculate_entity_score(self, doc: ScoredDocument, entities: List[str]) -> float:
-        """计算实体匹配评分"""
+    def _calculate_entity_score(self, analyzed: AnalyzedDocument, entities: List[str]) -> float:
+        """计算实体匹配评分（entities 已小写）"""
         if not entities:
             return 0.5  # 默认分数
 
-        content_lower = doc.content.lower()
-        matched_entities = 0
-
-        for entity in entities:
-            if entity.lower() in content_lower:
-                matched_entities += 1
-
+        matched_entities = sum(1 for entity in entities if analyzed.contains(entity))
         return min(matched_entities / len(entities), 1.0)
 
-    def _calculate_keyword_score(self, doc: ScoredDocument, keywords: List[str]) -> float:
-        """计算关键词匹配评分"""
+    def _calculate_keyword_score(self, analyzed: AnalyzedDocument, keywords: List[str]) -> float:
+        """计算关键词匹配评分（keywords 已小写）"""
         if not keywords:
             return 0.5  # 默认分数
 
-        content_lower = doc.content.lower()
-        matched_keywords = 0
-
-        for keyword in keywords:
-            if keyword.lower() in content_lower:
-                matched_keywords += 1
-
+        matched_keywords = sum(1 for keyword in keywords if analyzed.contains(keyword))
         return min(matched_keywords / len(keywords), 1.0)
 
-    def _calculate_type_specific_score(self, doc: ScoredDocument, query_type: QueryType) -> float:
+    # 查询类型特定评分的指示词
+    TYPE_INDICATORS = {
+        # 事实性查询偏好定义性内容
+        QueryType.FACTUAL: ["define", "definition", "is", "are", "means", "refers to"],
+        # 比较性查询偏好对比性内容
+        QueryType.COMPARATIVE: ["compare", "contrast", "difference", "similar", "versus", "vs"],
+        # 时间相关查询偏好时间信息
+        QueryType.TEMPORAL: ["when", "time", "date", "year", "before", "after", "during"]
+    }
+
+    def _calculate_type_specific_score(self, analyzed: AnalyzedDocument, query_type: QueryType) -> float:
         """计算查询类型特定评分"""
-        content_lower = doc.content.lower()
-
-        if query_type == QueryType.FACTUAL:
-            # 事实性查询偏好定义性内容
-            factual_indicators = ["define", "definition", "is", "are", "means", "refers to"]
-            score = sum(1 for indicator in factual_indicators if indicator in content_lower)
-            return min(score / len(factual_indicators), 1.0)
-
-        elif query_type == QueryType.COMPARATIVE:
-            # 比较性查询偏好对比性内容
-            comparative_indicators = ["compare", "contrast", "difference", "similar", "versus", "vs"]
-            score = sum(1 for indicator in comparative_indicators if indicator in content_lower)
-            return min(score / len(comparative_indicators), 1.0)
-
-        elif query_type == QueryType.TEMPORAL:
-            # 时间相关查询偏好时间信息
-            temporal_indicators = ["when", "time", "date", "year", "before", "after", "during"]
-            score = sum(1 for indicator in temporal_indicators if indicator in content_lower)
-            return min(score / len(temporal_indicators), 1.0)
+        indicators = self.TYPE_INDICATORS.get(query_type)
+        if not indicators:
+            return 0.5  # 默认分数
 
-        return 0.5  # 默认分数
+        score = sum(1 for indicator in indicators if analyzed.contains(indicator))
+        return min(score / len(indicators), 1.0)
 
     def _balance_relevance_diversity(self, documents: List[ScoredDocument],
-                                   strategy: RetrievalStrategy) -> List[ScoredDocument]:
-        """平衡相关度和多样性"""
+                                   strategy: RetrievalStrategy,
+                                   doc_analysis: DocumentAnalysisCache) -> List[ScoredDocument]:
+        """平衡相关度和多样性：MMR 选择，与已选文档相似度超过 0.8 的不再入选（至少保证前 3 个文档）"""
         if not documents:
             return documents
 
-        # 按相关度排序
-        sorted_docs = sorted(documents, key=lambda x: x.score, reverse=True)
-
-        # 多样性选择
-        selected_docs = []
-        diversity_threshold = 0.8  # 相似度阈值
-
-        for doc in sorted_docs:
-            is_diverse = True
-
-            # 检查与已选择文档的相似度
-            for selected_doc in selected_docs:
-                similarity = self._calculate_content_similarity(doc.content, selected_doc.content)
-                if similarity > diversity_threshold:
-                    is_diverse = False
-                    break
-
-            if is_diverse or len(selected_docs) < 3:  # 至少保证前3个文档
-                selected_docs.append(doc)
-
-            # 达到目标数量就停止
-            if len(selected_docs) >= strategy.max_docs:
-                break
-
-        return selected_docs
-
-    def _calculate_content_similarity(self, content1: str, content2: str) -> float:
-        """计算内容相似度（简化版本）"""
-        # 简单的词汇重叠相似度
-        words1 = set(content1.lower().split())
-        words2 = set(content2.lower().split())
-
-        if not words1 or not words2:
-            return 0.0
-
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-
-        return len(intersection) / len(union)
+        return self.mmr_selector.select(
+            documents, [doc.final_score for doc in documents], strategy.max_docs,
+            max_similarity=0.8, min_keep=3,
+            token_sets=self._token_sets(documents, doc_analysis)
+        )
 
     def _dynamic_document_selection(self, documents: List[ScoredDocument],
                                   strategy: RetrievalStrategy,
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+=== 本地检索索引 ===
+
+为核心 HybridRetriever 提供真实的本地索引（替代模拟检索结果）：
+1. 文档库（列式、mmap）+ BM25 倒排索引 + 稠密分片索引，从本地语料构建
+2. 产物与索引清单放在 cache_dir 下按读取文档数和嵌入类型区分的子目录（core_<文档数>_<类型>），
+   与 LocalModelEngine 或其他配置的实例共用 cache_dir 时互不删除、重建对方的索引
+3. 多查询批量检索：一次检索调用处理主查询、关键词查询和全部子查询，
+   稠密检索的查询在一次编码器前向中完成编码并与文档向量做矩阵-矩阵乘法，
+   BM25 对全部查询词的倒排只遍历一次
+
+清单校验失败的产物会被重建；语料只在末尾追加了新行时，只解析、编码新增文档，
+BM25 的 IDF 依赖全部文档，由文档库重建（不涉及嵌入计算）。
+"""
+
+import logging
+import os
+import shutil
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..data_processing.corpus_builder import CorpusBuilder
+from ..data_processing.document_store import DocumentStore, STORE_FORMAT_VERSION
+from ..data_processing.index_manifest import APPEND, IndexManifest, VALID
+from ..modules.retriever.dense_retriever import INDEX_FORMAT_VERSION, ShardedDenseIndex
+from ..modules.retriever.sparse_retriever import BM25_FORMAT_VERSION, BM25IndexBuilder, InvertedBM25Index
+
+logger = logging.getLogger(__name__)
+
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+    logger.warning("sentence-transformers 不可用，本地索引只提供 BM25 检索")
+
+SearchResult = Tuple[np.ndarray, np.ndarray]
+
+
+def store_params() -> Dict[str, Any]:
+    return {"format": STORE_FORMAT_VERSION}
+
+
+def bm25_params() -> Dict[str, Any]:
+    """
+    BM25 索引的构建参数（写入索引清单，变化即重建）
+
+    与替换前的 rank_bm25.BM25Okapi 相比打分有两处变化：
+    1. 分词不区分大小写（default_tokenize 先转小写，原方案为 text.split()）
+    2. IDF 为 log(1 + (N - df + 0.5) / (df + 0.5))，始终为正；BM25Okapi 用 log((N - df + 0.5) / (df + 0.5))，
+       高频词的负 IDF 以 epsilon * 平均 IDF 兜底。出现在一半以上文档中的词现在仍有少量正分
+    """
+    builder = BM25IndexBuilder()
+    tokenizer = builder.tokenizer
+    return {
+        "format": BM25_FORMAT_VERSION,
+        "k1": builder.k1,
+        "b": builder.b,
+        "idf": "log1p",
+        "tokenizer": f"{tokenizer.__module__}.{tokenizer.__qualname__}"
+    }
+
+
+def dense_index_params(encoder_id: Optional[str], dtype: str = "float32") -> Dict[str, Any]:
+    """稠密索引的构建参数（写入索引清单，变化即重建）"""
+    return {
+        "format": INDEX_FORMAT_VERSION,
+        "encoder": encoder_id,
+        "dtype": dtype
+    }
+
+
+def index_subdir(max_documents: Optional[int], embedding_dtype: str) -> str:
+    """核心本地索引在 cache_dir 下的子目录名，读取文档数或嵌入类型不同的配置各用一份产物"""
+    return f"core_{'all' if max_documents is None else max_documents}_{embedding_dtype}"
+
+
+class LocalIndexes:
+    """
+    本地文档库与检索索引
+
+    Args:
+        corpus_path: 本地语料（jsonl）
+        cache_dir: 索引缓存目录，产物写在其下的 index_subdir() 子目录
+        encode_fn: 文本批量编码函数；为 None 时不构建稠密索引
+        encoder_id: 编码器标识（写入索引清单）
+        max_documents: 最多读取的文档数
+        embedding_dtype: 稠密索引存储类型
+        encode_batch_size: 构建时每批编码的文档数
+    """
+
+    def __init__(self, corpus_path: str, cache_dir: str,
+                 encode_fn: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 encoder_id: Optional[str] = None, max_documents: Optional[int] = None,
+                 embedding_dtype: str = "float32", encode_batch_size: int = 256):
+        self.corpus_path = corpus_path
+        self.cache_dir = cache_dir
+        self.encode_fn = encode_fn
+        self.encoder_id = encoder_id
+        self.max_documents = max_documents
+        self.embedding_dtype = embedding_dtype
+        self.encode_batch_size = encode_batch_size
+
+        self.index_dir = os.path.join(cache_dir, index_subdir(max_documents, embedding_dtype))
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.manifest = IndexManifest(self.index_dir, corpus_path, max_documents)
+        self.documents: Optional[DocumentStore] = None
+        self.bm25: Optional[InvertedBM25Index] = None
+        self.dense: Optional[ShardedDenseIndex] = None
+        self._load_or_build()
+
+    @classmethod
+    def from_config(cls, cfg) -> Optional["LocalIndexes"]:
+        """按 AdaptiveConfig 的 corpus_path / index_cache_dir / embedding_model_path 构建，语料不存在时返回 None"""
+        corpus_path = getattr(cfg, 'corpus_path', None)
+        if not corpus_path or not os.path.exists(corpus_path):
+            if corpus_path:
+                logger.warning(f"⚠️ 语料不存在: {corpus_path}")
+            return None
+
+        encode_fn, encoder_id = None, None
+        model_path = getattr(cfg, 'embedding_model_path', None)
+        if model_path and SENTENCE_TRANSFORMERS_AVAILABLE:
+            try:
+                model = SentenceTransformer(model_path)
+                encode_fn, encoder_id = model.encode, model_path
+                logger.info(f"✅ 嵌入模型加载成功: {model_path}")
+            except Exception as e:
+                logger.error(f"❌ 嵌入模型加载失败，只使用 BM25 检索: {e}")
+
+        return cls(
+            corpus_path,
+            getattr(cfg, 'index_cache_dir', os.path.join(os.path.dirname(corpus_path), "cache")),
+            encode_fn=encode_fn,
+            encoder_id=encoder_id,
+            max_documents=getattr(cfg, 'max_documents', None)
+        )
+
+    # ===== 加载与构建 =====
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _load_or_build(self):
+        manifest = self.manifest
+        dense_params = dense_index_params(self.encoder_id, self.embedding_dtype)
+        store_status = manifest.status("document_store", store_params(),
+                                       DocumentStore.exists(self._path("document_store")))
+        if store_status == APPEND:
+            self._append(dense_params)
+        elif store_status == VALID:
+            self.documents = DocumentStore.load(self._path("document_store"))
+        store_valid = self.documents is not None
+        num_docs = len(self.documents) if store_valid else None
+        bm25_valid = manifest.status("bm25_index", bm25_params(),
+                                     InvertedBM25Index.exists(self._path("bm25_index")), num_docs=num_docs) == VALID
+        dense_valid = self.encode_fn is None or manifest.status(
+            "dense_index", dense_params, ShardedDenseIndex.exists(self._path("dense_index")), num_docs=num_docs) == VALID
+
+        if not store_valid:
+            self._rebuild(rebuild_bm25=not bm25_valid, rebuild_dense=not dense_valid, dense_params=dense_params)
+        else:
+            if not bm25_valid:
+                self._rebuild_bm25_from_store()
+            if not dense_valid:
+                self._rebuild_dense_from_store(dense_params)
+
+        if self.bm25 is None:
+            self.bm25 = InvertedBM25Index.load(self._path("bm25_index"))
+        if self.dense is None and self.encode_fn is not None:
+            self.dense = ShardedDenseIndex.load(self._path("dense_index"))
+        logger.info(f"✅ 本地索引就绪: {len(self.documents)} 个文档，"
+                    f"稠密索引: {'有' if self.dense is not None else '无'}")
+
+    def _invalidate(self, name: str):
+        # 先注销再清理，构建中断时不会留下被认为有效的半成品；只清理本实例子目录下的产物
+        self.manifest.invalidate(name)
+        shutil.rmtree(self._path(name), ignore_errors=True)
+
+    def _new_dense_index(self) -> ShardedDenseIndex:
+        return ShardedDenseIndex(self._path("dense_index"), dtype=self.embedding_dtype)
+
+    def _rebuild(self, rebuild_bm25: bool, rebuild_dense: bool, dense_params: Dict[str, Any]):
+        """单遍扫描语料，重建文档库以及失效的索引"""
+        logger.info("⚠️ 文档库需要重建")
+        for name, rebuild in (("document_store", True), ("bm25_index", rebuild_bm25), ("dense_index", rebuild_dense)):
+            if rebuild:
+                self._invalidate(name)
+
+        builder = CorpusBuilder(
+            self._path("document_store"),
+            bm25_builder=BM25IndexBuilder() if rebuild_bm25 else None,
+            dense_index=self._new_dense_index() if rebuild_dense else None,
+            encode_fn=self.encode_fn,
+            encode_batch_size=self.encode_batch_size
+        )
+        result = builder.build(self.corpus_path, max_documents=self.max_documents)
+        self.documents = result['documents']
+        num_docs = len(self.documents)
+        self.manifest.record("document_store", store_params(), num_docs)
+        if result['bm25'] is not None:
+            result['bm25'].save(self._path("bm25_index"))
+            self.bm25 = result['bm25']
+            self.manifest.record("bm25_index", bm25_params(), num_docs)
+        if result['dense'] is not None:
+            self.dense = result['dense']
+            self.manifest.record("dense_index", dense_params, num_docs)
+
+    def _append(self, dense_params: Dict[str, Any]):
+        """语料只在末尾追加了新行：新增行追加到文档库，稠密索引同样可追加时只编码新增文档"""
+        manifest = self.manifest
+        previous = manifest.get("document_store")
+        dense_dir = self._path("dense_index")
+        dense_index = None
+        if self.encode_fn is not None and manifest.status(
+                "dense_index", dense_params, ShardedDenseIndex.exists(dense_dir)) == APPEND:
+            index = ShardedDenseIndex.open_for_append(dense_dir)
+            if index.num_vectors == manifest.get("dense_index")["num_docs"] == previous["num_docs"]:
+                dense_index = index
+            else:
+                logger.warning("⚠️ 稠密索引与清单记录不一致，将从文档库重建")
+
+        # 先注销再追加，追加中断时不会把半成品当作有效产物
+        manifest.invalidate("document_store")
+        if dense_index is not None:
+            manifest.invalidate("dense_index")
+
+        builder = CorpusBuilder(
+            self._path("document_store"),
+            dense_index=dense_index,
+            encode_fn=self.encode_fn,
+            encode_batch_size=self.encode_batch_size
+        )
+        result = builder.append(self.corpus_path, start_offset=previous["corpus"]["size"])
+        self.documents = result['documents']
+        manifest.record("document_store", store_params(), len(self.documents))
+        if result['dense'] is not None:
+            self.dense = result['dense']
+            manifest.record("dense_index", dense_params, len(self.dense))
+        logger.info(f"✅ 语料新增 {result['appended']} 个文档，已追加到文档库")
+
+    def _rebuild_bm25_from_store(self):
+        logger.info("⚠️ BM25索引需要重建")
+        self._invalidate("bm25_index")
+        builder = BM25IndexBuilder()
+        for batch in self.documents.iter_content_batches():
+            builder.add_documents(batch)
+        self.bm25 = builder.finalize()
+        self.bm25.save(self._path("bm25_index"))
+        self.manifest.record("bm25_index", bm25_params(), len(self.bm25))
+
+    def _rebuild_dense_from_store(self, dense_params: Dict[str, Any]):
+        logger.info("⚠️ 稠密索引需要重建")
+        self._invalidate("dense_index")
+        index = self._new_dense_index()
+        for batch in self.documents.iter_content_batches(self.encode_batch_size):
+            index.add(self.encode_fn(batch))
+        self.dense = index.finalize()
+        self.manifest.record("dense_index", dense_params, len(self.dense))
+
+    # ===== 批量检索 =====
+
+    def encode_queries(self, queries: Sequence[str]) -> np.ndarray:
+        """全部查询在一次编码器前向中编码，返回 (查询数, 维度)"""
+        return np.asarray(self.encode_fn(list(queries)), dtype=np.float32).reshape(len(queries), -1)
+
+    def keyword_search_batch(self, queries: Sequence[str], top_k: int) -> List[SearchResult]:
+        """多查询 BM25 检索（查询词并集的倒排只遍历一次），返回每个查询的 (文档号, 分数)"""
+        return self.bm25.search_batch(list(queries), top_k)
+
+    def dense_search_batch(self, queries: Sequence[str], top_k: int) -> List[SearchResult]:
+        """多查询稠密检索，返回每个查询的 (文档号, 余弦相似度)；无稠密索引时返回空结果"""
+        if self.dense is None or not queries:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        return self.dense.search_batch(self.encode_queries(queries), top_k)
+
+    def get_index_info(self) -> Dict[str, Any]:
+        return {
+            "corpus_path": self.corpus_path,
+            "num_documents": len(self.documents) if self.documents is not None else 0,
+            "bm25": self.bm25.get_index_info() if self.bm25 is not None else None,
+            "dense": self.dense.get_index_info() if self.dense is not None else None,
+            "manifest": self.manifest.get_summary()
+        }
+
+
+if __name__ == "__main__":
+    import json
+    import tempfile
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus = os.path.join(tmp_dir, "corpus.jsonl")
+        rng = np.random.RandomState(0)
+        vocabulary = [f"w{i}" for i in range(2000)]
+        with open(corpus, 'w', encoding='utf-8') as f:
+            for i in range(20000):
+                text = " ".join(rng.choice(vocabulary, size=40))
+                f.write(json.dumps({"id": str(i), "contents": f"doc {i}\n{text}"}) + "\n")
+
+        # 以词袋哈希向量代替真实编码器
+        def hash_encode(texts: List[str]) -> np.ndarray:
+            vectors = np.zeros((len(texts), 64), dtype=np.float32)
+            for row, text in enumerate(texts):
+                for token in text.split():
+                    vectors[row, hash(token) % 64] += 1.0
+            return vectors
+
+        start = time.perf_counter()
+        indexes = LocalIndexes(corpus, os.path.join(tmp_dir, "cache"), encode_fn=hash_encode, encoder_id="hash")
+        print(f"构建: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+        start = time.perf_counter()
+        LocalIndexes(corpus, os.path.join(tmp_dir, "cache"), encode_fn=hash_encode, encoder_id="hash")
+        print(f"从缓存加载: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+        queries = [" ".join(rng.choice(vocabulary, size=4)) for _ in range(32)]
+        start = time.perf_counter()
+        for query in queries:
+            indexes.bm25.search(query, 10)
+            indexes.dense.search(indexes.encode_queries([query])[0], 10)
+        print(f"{len(queries)} 个查询逐条检索: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+        start = time.perf_counter()
+        keyword_results = indexes.keyword_search_batch(queries, 10)
+        dense_results = indexes.dense_search_batch(queries, 10)
+        print(f"{len(queries)} 个查询批量检索: {(time.perf_counter() - start) * 1000:.0f}ms")
+        print(f"第一个查询: BM25 {keyword_results[0][0][:3].tolist()} / 稠密 {dense_results[0][0][:3].tolist()}")
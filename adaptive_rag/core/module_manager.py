@@ -298,6 +298,20 @@ class ModuleManager:
         except ImportError:
             return None
     
+    def _get_semantic_cache_class(self):
+        try:
+            from .semantic_cache import SemanticCache
+            return SemanticCache
+        except ImportError:
+            return None
+    
+    def _get_predictive_cache_class(self):
+        try:
+            from .predictive_cache import PredictiveCache
+            return PredictiveCache
+        except ImportError:
+            return None
+    
     # 其他模块类获取方法（简化版，返回None表示使用模拟实现）
     def _get_keyword_retriever_class(self): return None
     def _get_dense_retriever_class(self): return None
@@ -312,5 +326,3 @@ class ModuleManager:
     def _get_fact_verification_class(self): return None
     def _get_confidence_estimation_class(self): return None
     def _get_result_analyzer_class(self): return None
-    def _get_semantic_cache_class(self): return None
-    def _get_predictive_cache_class(self): return None
@@ -6,18 +6,30 @@
 这是我们在效率方面的创新点
 """
 
+import json
 import logging
+import sys
 import time
 import hashlib
 import pickle
-from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
+import unicodedata
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple
+from dataclasses import dataclass, fields, is_dataclass
 from collections import OrderedDict
 import threading
-from functools import wraps
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial, wraps
+from itertools import islice
+from operator import methodcaller
 
 logger = logging.getLogger(__name__)
 
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 
 @dataclass
 class CacheEntry:
@@ -39,12 +51,181 @@ class PerformanceMetrics:
     total_queries: int
 
 
+# ===== 缓存条目大小估算 =====
+# LRUCache 默认对每次写入做 pickle.dumps 来计算大小，结果对象（上下文列表、生成结果）
+# 较大时序列化本身就成了热点。这里改为基于 __sizeof__ 的估算，代价只与抽样元素数有关：
+# 只含内置类型的容器（文档字典列表、生成结果）走快速路径，每层抽样、只对子容器递归；
+# NumPy 数组按 nbytes 计，dataclass 和 __slots__ 对象按字段递归，大容器抽样后按比例放大。
+
+_SIZE_SAMPLE_THRESHOLD = 8    # 容器元素数超过该值时抽样估算（检索结果列表通常同构）
+_SIZE_SAMPLE_COUNT = 4        # 抽样元素数
+_SIZE_MAX_DEPTH = 6           # 递归深度上限，更深的对象只计自身大小
+
+_ATOMIC_TYPES = frozenset((str, bytes, bytearray, int, float, bool, complex, type(None)))
+_TYPE_SIZERS: Dict[type, Callable[[Any], int]] = {}
+_FIELD_NAMES_CACHE: Dict[type, Tuple[str, ...]] = {}
+_getsizeof = sys.getsizeof
+_sizeof = methodcaller("__sizeof__")   # 比 sys.getsizeof 少一次查找，不含 GC 头（约 16 字节）
+_str_sizeof = str.__sizeof__
+
+
+def register_sizer(cls: type, sizer: Callable[[Any], int]):
+    """为特定类型注册大小估算函数（优先于通用递归估算）"""
+    _TYPE_SIZERS[cls] = sizer
+
+
+def pickle_sizer(data: Any) -> int:
+    """按序列化长度计算大小（精确但慢，LRUCache 的旧行为）"""
+    return len(pickle.dumps(data))
+
+
+def _field_names(cls: type) -> Tuple[str, ...]:
+    names = _FIELD_NAMES_CACHE.get(cls)
+    if names is None:
+        if cls is type or not (is_dataclass(cls) or hasattr(cls, '__slots__')):
+            names = ()
+        elif NUMPY_AVAILABLE and issubclass(cls, np.ndarray):
+            names = ()
+        elif is_dataclass(cls):
+            names = tuple(f.name for f in fields(cls))
+        else:
+            names = tuple(
+                slot for klass in cls.__mro__
+                for slot in getattr(klass, '__slots__', ())
+                if slot not in ('__dict__', '__weakref__')
+            )
+        _FIELD_NAMES_CACHE[cls] = names
+    return names
+
+
+def _sample(items: List[Any]) -> Tuple[List[Any], float]:
+    """等间隔抽样，返回 (样本, 放大倍数)"""
+    n = len(items)
+    if n <= _SIZE_SAMPLE_THRESHOLD:
+        return items, 1.0
+    step = n / _SIZE_SAMPLE_COUNT
+    return [items[int(i * step)] for i in range(_SIZE_SAMPLE_COUNT)], n / _SIZE_SAMPLE_COUNT
+
+
+def _builtin_size(data: Any, cls: type, depth: int = 0) -> Optional[int]:
+    """
+    只含内置类型的 dict / list / tuple 的快速估算，遇到其他类型返回 None（回退到通用估算）
+
+    每层容器只抽样部分元素，只对子列表 / 元组递归；嵌套字典（文档字典、元数据）只统计一层，
+    其值在 C 层求和。字符串直接调用 str.__sizeof__，不经过 estimate_size 的类型分派。
+    """
+    values = data.values() if cls is dict else data
+    n = len(values)
+    scale = 1.0
+    if n > _SIZE_SAMPLE_THRESHOLD:
+        step = -(-n // _SIZE_SAMPLE_COUNT)
+        values = list(islice(values, 0, None, step)) if cls is dict else values[::step]
+        scale = n / len(values)
+
+    if cls is not dict and n and type(values[0]) is str:
+        try:
+            return _sizeof(data) + int(sum(map(_str_sizeof, values)) * scale)
+        except TypeError:
+            pass
+
+    total = 0
+    for value in values:
+        value_cls = type(value)
+        if value_cls is str:
+            total += _str_sizeof(value)
+        elif value_cls is dict:
+            total += _sizeof(value) + sum(map(_sizeof, value.values()))
+        elif value_cls is list or value_cls is tuple:
+            inner_n = len(value)
+            if inner_n and type(value[0]) is str:
+                # 上下文 / 段落列表通常全是字符串：就地抽样，在 C 层求和
+                inner = value if inner_n <= _SIZE_SAMPLE_THRESHOLD else value[::-(-inner_n // _SIZE_SAMPLE_COUNT)]
+                try:
+                    total += _sizeof(value) + sum(map(_str_sizeof, inner)) * inner_n // len(inner)
+                    continue
+                except TypeError:
+                    pass
+            if depth >= _SIZE_MAX_DEPTH:
+                total += _sizeof(value)
+                continue
+            size = _builtin_size(value, value_cls, depth + 1)
+            if size is None:
+                return None
+            total += size
+        elif value_cls in _ATOMIC_TYPES:
+            total += _sizeof(value)
+        else:
+            return None
+    # 字典的键多为驻留的字段名，由所有条目共享，不计入
+    return _sizeof(data) + int(total * scale)
+
+
+def estimate_size(data: Any, _depth: int = 0) -> int:
+    """
+    估算对象占用的字节数（近似值，用于缓存内存上限）
+
+    - 字符串 / 数值：sys.getsizeof
+    - 只含内置类型的 dict / list / tuple（顶层）：快速路径，见 _builtin_size
+    - NumPy 数组：自有数据计 nbytes，视图和 memmap 只计数组头
+    - dict / list / tuple / set：容器自身 + 元素（超过阈值时抽样放大）
+    - dataclass / __slots__ 对象：对象自身 + 各字段
+    - 其他对象（如文档库、模型）视为共享资源，只计对象自身
+    - 深度超过上限时只计自身（同时防止循环引用）
+    """
+    cls = type(data)
+    if _depth == 0 and (cls is dict or cls is list or cls is tuple):
+        size = _builtin_size(data, cls)
+        if size is not None:
+            return size
+    elif cls in _ATOMIC_TYPES:
+        return _getsizeof(data)
+
+    custom = _TYPE_SIZERS.get(cls)
+    if custom is not None:
+        return custom(data)
+
+    size = _getsizeof(data)
+    if _depth >= _SIZE_MAX_DEPTH:
+        return size
+    _depth += 1
+
+    if isinstance(data, dict):
+        if len(data) > _SIZE_SAMPLE_THRESHOLD:
+            items, scale = _sample(list(data.items()))
+        else:
+            items, scale = data.items(), 1.0
+        total = 0
+        for key, value in items:
+            total += _getsizeof(key) if type(key) in _ATOMIC_TYPES else estimate_size(key, _depth)
+            total += _getsizeof(value) if type(value) in _ATOMIC_TYPES else estimate_size(value, _depth)
+        return size + int(total * scale)
+
+    if isinstance(data, (list, tuple, set, frozenset)):
+        if len(data) > _SIZE_SAMPLE_THRESHOLD:
+            items, scale = _sample(data if isinstance(data, (list, tuple)) else list(data))
+        else:
+            items, scale = data, 1.0
+        total = 0
+        for item in items:
+            total += _getsizeof(item) if type(item) in _ATOMIC_TYPES else estimate_size(item, _depth)
+        return size + int(total * scale)
+
+    # NumPy 数组没有字段：自有数据的数组 getsizeof 已包含 nbytes，视图和 memmap 只返回数组头
+    names = _field_names(cls)
+    for name in names:
+        value = getattr(data, name, None)
+        size += _getsizeof(value) if type(value) in _ATOMIC_TYPES else estimate_size(value, _depth)
+    return size
+
+
 class LRUCache:
     """LRU缓存实现"""
     
-    def __init__(self, max_size: int = 1000, max_memory_mb: int = 500):
+    def __init__(self, max_size: int = 1000, max_memory_mb: int = 500,
+                 sizer: Optional[Callable[[Any], int]] = None):
         self.max_size = max_size
         self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.sizer = sizer or estimate_size
         self.cache: OrderedDict[str, CacheEntry] = OrderedDict()
         self.current_memory = 0
         self.lock = threading.RLock()
@@ -68,17 +249,35 @@ class LRUCache:
                 self.misses += 1
                 return None
     
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """获取缓存条目（含写入时间戳），用于判断是否过期"""
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.access_count += 1
+            entry.last_access = time.time()
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """查看缓存条目，不计入命中统计、不调整顺序"""
+        with self.lock:
+            return self.cache.get(key)
+    
     def put(self, key: str, data: Any, size_bytes: int = None):
         """添加缓存项"""
         if size_bytes is None:
-            size_bytes = len(pickle.dumps(data))
+            size_bytes = self.sizer(data)
         
         with self.lock:
             current_time = time.time()
             
-            # 如果已存在，更新
+            # 如果已存在，先移除旧条目再写入（避免驱逐时重复扣减）
             if key in self.cache:
-                old_entry = self.cache[key]
+                old_entry = self.cache.pop(key)
                 self.current_memory -= old_entry.size_bytes
             
             # 创建新条目
@@ -116,13 +315,425 @@ class LRUCache:
             self.current_memory = 0
             self.hits = 0
             self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self.cache)
+
+
+class ClockCache:
+    """
+    CLOCK 近似 LRU 缓存（与 LRUCache 接口相同）
+
+    读取不加锁、不调整顺序，只把条目的 access_count 置为非零作为引用位；
+    写入时加锁，时钟指针扫过环形槽位，引用位非零的条目清零后获得第二次机会，
+    为零的条目被淘汰。命中 / 未命中计数在无锁读取下是近似值。
+    """
+    
+    def __init__(self, max_size: int = 1000, max_memory_mb: int = 500,
+                 sizer: Optional[Callable[[Any], int]] = None):
+        self.max_size = max_size
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.sizer = sizer or estimate_size
+        self.cache: Dict[str, CacheEntry] = {}
+        self.current_memory = 0
+        self.lock = threading.RLock()
+        
+        # 环形槽位：槽位中保存键，空槽位（淘汰后留下）记录在 _free_slots
+        self._ring: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._free_slots: List[int] = []
+        self._hand = 0
+        
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """获取缓存项（无锁）"""
+        entry = self.get_entry(key)
+        return entry.data if entry is not None else None
+    
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """获取缓存条目（无锁），只设置引用位"""
+        entry = self.cache.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry.access_count += 1
+        self.hits += 1
+        return entry
+    
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """查看缓存条目（无锁），不设置引用位、不计入命中统计"""
+        return self.cache.get(key)
+    
+    def put(self, key: str, data: Any, size_bytes: int = None):
+        """添加缓存项"""
+        if size_bytes is None:
+            size_bytes = self.sizer(data)
+        
+        with self.lock:
+            current_time = time.time()
+            # 新条目引用位为 0，只访问过一次的条目会先被淘汰
+            entry = CacheEntry(
+                data=data,
+                timestamp=current_time,
+                access_count=0,
+                last_access=current_time,
+                size_bytes=size_bytes
+            )
+            
+            old_entry = self.cache.pop(key, None)
+            if old_entry is not None:
+                self.current_memory -= old_entry.size_bytes
+                self._release_slot(key)
+            
+            while (self.current_memory + size_bytes > self.max_memory_bytes or 
+                   len(self.cache) >= self.max_size) and self.cache:
+                self._evict_one()
+            
+            if self._free_slots:
+                slot = self._free_slots.pop()
+                self._ring[slot] = key
+            else:
+                slot = len(self._ring)
+                self._ring.append(key)
+            self._slots[key] = slot
+            self.cache[key] = entry
+            self.current_memory += size_bytes
+    
+    def _release_slot(self, key: str):
+        slot = self._slots.pop(key)
+        self._ring[slot] = None
+        self._free_slots.append(slot)
+    
+    def _evict_one(self):
+        """转动时钟指针，淘汰第一个引用位为 0 的条目"""
+        while True:
+            key = self._ring[self._hand]
+            self._hand = (self._hand + 1) % len(self._ring)
+            if key is None:
+                continue
+            entry = self.cache[key]
+            if entry.access_count > 0:
+                entry.access_count = 0
+                continue
+            del self.cache[key]
+            self.current_memory -= entry.size_bytes
+            self._release_slot(key)
+            return
+    
+    def get_hit_rate(self) -> float:
+        """获取缓存命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+    
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.cache = {}
+            self._ring = []
+            self._slots = {}
+            self._free_slots = []
+            self._hand = 0
+            self.current_memory = 0
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self.cache)
+
+
+class ShardedCache:
+    """
+    分片缓存（锁分段）
+
+    按键哈希分到 num_shards 个独立的 LRUCache / ClockCache，
+    每个分片有自己的锁，不同键的并发读写互不阻塞；容量和内存上限按分片均分。
+    """
+    
+    def __init__(self, max_size: int = 1000, max_memory_mb: int = 500,
+                 sizer: Optional[Callable[[Any], int]] = None,
+                 num_shards: int = 16, shard_class: type = LRUCache):
+        self.num_shards = max(1, num_shards)
+        self.max_size = max_size
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.shards = [
+            shard_class(max_size=max(1, max_size // self.num_shards),
+                        max_memory_mb=max_memory_mb / self.num_shards, sizer=sizer)
+            for _ in range(self.num_shards)
+        ]
+    
+    def _shard(self, key: str):
+        return self.shards[hash(key) % self.num_shards]
+    
+    def get(self, key: str) -> Optional[Any]:
+        return self._shard(key).get(key)
+    
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        return self._shard(key).get_entry(key)
+    
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        return self._shard(key).peek(key)
+    
+    def put(self, key: str, data: Any, size_bytes: int = None):
+        self._shard(key).put(key, data, size_bytes=size_bytes)
+    
+    @property
+    def hits(self) -> int:
+        return sum(shard.hits for shard in self.shards)
+    
+    @property
+    def misses(self) -> int:
+        return sum(shard.misses for shard in self.shards)
+    
+    @property
+    def current_memory(self) -> int:
+        return sum(shard.current_memory for shard in self.shards)
+    
+    def get_hit_rate(self) -> float:
+        """获取缓存命中率"""
+        hits, misses = self.hits, self.misses
+        return hits / (hits + misses) if hits + misses > 0 else 0.0
+    
+    def clear(self):
+        """清空缓存"""
+        for shard in self.shards:
+            shard.clear()
+    
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+
+class FrequencySketch:
+    """
+    Count-Min 频率草图（TinyLFU 的频率估计）
+
+    depth 行计数器，每行按不同哈希取一个计数器，频率取各行最小值；
+    计数器上限 15（4 bit 语义），累计 sample_size 次计数后全部减半，
+    让历史热度随时间衰减。
+    """
+    
+    _HALVE_TABLE = bytes(i >> 1 for i in range(256))
+    
+    def __init__(self, capacity: int, depth: int = 4):
+        width = 1
+        while width < max(capacity, 16):
+            width <<= 1
+        self.width_mask = width - 1
+        self.depth = depth
+        self.table = bytearray(width * depth)
+        self.sample_size = 10 * max(capacity, 16)
+        self.additions = 0
+    
+    def _indexes(self, key: str):
+        width = self.width_mask + 1
+        for row in range(self.depth):
+            yield row * width + (hash((row, key)) & self.width_mask)
+    
+    def increment(self, key: str):
+        table = self.table
+        for index in self._indexes(key):
+            if table[index] < 15:
+                table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.table = bytearray(self.table.translate(self._HALVE_TABLE))
+            self.additions //= 2
+    
+    def frequency(self, key: str) -> int:
+        table = self.table
+        return min(table[index] for index in self._indexes(key))
+
+
+class TinyLFUCache:
+    """
+    W-TinyLFU 准入控制缓存（与 LRUCache 接口相同）
+
+    新条目先进入容量约 1% 的窗口 LRU；被挤出窗口时与主缓存的 LRU 淘汰候选比较
+    频率草图中的访问频率，只有更"热"的条目才能进入主缓存。
+    偶发的长尾查询停留在窗口中很快被淘汰，不会冲掉主缓存里的热点条目。
+    """
+    
+    def __init__(self, max_size: int = 1000, max_memory_mb: int = 500,
+                 sizer: Optional[Callable[[Any], int]] = None, window_ratio: float = 0.01):
+        self.max_size = max_size
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.sizer = sizer or estimate_size
+        self.window_size = max(1, int(max_size * window_ratio))
+        self.main_size = max_size - self.window_size  # max_size 为 1 时没有主缓存，退化为单条目窗口
+        self.window: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.main: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.sketch = FrequencySketch(max_size)
+        self.current_memory = 0
+        self.lock = threading.RLock()
+        
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.admitted = 0
+        self.rejected = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """获取缓存项"""
+        entry = self.get_entry(key)
+        return entry.data if entry is not None else None
+    
+    def get_entry(self, key: str) -> Optional[CacheEntry]:
+        """获取缓存条目；无论是否命中都计入访问频率"""
+        with self.lock:
+            self.sketch.increment(key)
+            for segment in (self.main, self.window):
+                entry = segment.get(key)
+                if entry is not None:
+                    segment.move_to_end(key)
+                    entry.access_count += 1
+                    entry.last_access = time.time()
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+    
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """查看缓存条目，不计入访问频率和命中统计"""
+        with self.lock:
+            return self.main.get(key) or self.window.get(key)
+    
+    def put(self, key: str, data: Any, size_bytes: int = None):
+        """添加缓存项（先进入窗口，挤出窗口时经过准入判断）"""
+        if size_bytes is None:
+            size_bytes = self.sizer(data)
+        
+        with self.lock:
+            current_time = time.time()
+            entry = CacheEntry(
+                data=data,
+                timestamp=current_time,
+                access_count=1,
+                last_access=current_time,
+                size_bytes=size_bytes
+            )
+            
+            # 已存在的键原地更新
+            for segment in (self.main, self.window):
+                old_entry = segment.get(key)
+                if old_entry is not None:
+                    self.current_memory += size_bytes - old_entry.size_bytes
+                    segment[key] = entry
+                    segment.move_to_end(key)
+                    break
+            else:
+                self.window[key] = entry
+                self.current_memory += size_bytes
+                while len(self.window) > self.window_size:
+                    self._admit(*self.window.popitem(last=False))
+            
+            # 内存超限时先淘汰主缓存的冷条目
+            while self.current_memory > self.max_memory_bytes and (self.main or self.window):
+                segment = self.main if self.main else self.window
+                _, evicted = segment.popitem(last=False)
+                self.current_memory -= evicted.size_bytes
+    
+    def _admit(self, key: str, entry: CacheEntry):
+        """窗口淘汰的候选与主缓存淘汰候选比较频率，胜者留在主缓存"""
+        if len(self.main) < self.main_size:
+            self.main[key] = entry
+            return
+        if not self.main:
+            self.current_memory -= entry.size_bytes
+            return
+        
+        victim_key = next(iter(self.main))
+        if self.sketch.frequency(key) > self.sketch.frequency(victim_key):
+            victim = self.main.pop(victim_key)
+            self.current_memory -= victim.size_bytes
+            self.main[key] = entry
+            self.admitted += 1
+        else:
+            self.current_memory -= entry.size_bytes
+            self.rejected += 1
+    
+    def get_hit_rate(self) -> float:
+        """获取缓存命中率"""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+    
+    def clear(self):
+        """清空缓存（保留频率草图）"""
+        with self.lock:
+            self.window.clear()
+            self.main.clear()
+            self.current_memory = 0
+            self.hits = 0
+            self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self.window) + len(self.main)
+
+
+CACHE_TYPES = ("lru", "clock", "tinylfu", "sharded_lru", "sharded_clock", "sharded_tinylfu")
+_CACHE_CLASSES = {"lru": LRUCache, "clock": ClockCache, "tinylfu": TinyLFUCache}
+
+
+def create_cache(max_size: int = 1000, max_memory_mb: int = 500,
+                 sizer: Optional[Callable[[Any], int]] = None,
+                 cache_type: str = "lru", num_shards: int = 16):
+    """
+    按类型创建缓存
+
+    Args:
+        cache_type: lru（单锁 LRU）/ clock（无锁读的 CLOCK）/ tinylfu（W-TinyLFU 准入控制）/
+                    sharded_*（锁分段）
+    """
+    if cache_type not in CACHE_TYPES:
+        raise ValueError(f"未知的缓存类型: {cache_type}，可选: {CACHE_TYPES}")
+    shard_class = _CACHE_CLASSES[cache_type.replace("sharded_", "")]
+    if cache_type.startswith("sharded"):
+        return ShardedCache(max_size, max_memory_mb, sizer, num_shards=num_shards, shard_class=shard_class)
+    return shard_class(max_size=max_size, max_memory_mb=max_memory_mb, sizer=sizer)
+
+
+def load_query_trace(trace_path: str) -> List[str]:
+    """
+    读取查询轨迹：每行一个 JSON 对象（取 query / question / title 字段）或一行纯文本查询
+    """
+    queries = []
+    with open(trace_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                queries.append(line)
+                continue
+            if isinstance(record, dict):
+                record = next((record[field] for field in ("query", "question", "title") if field in record), None)
+            if record:
+                queries.append(str(record))
+    return queries
+
+
+def replay_trace(queries: List[str], capacity: int,
+                 cache_types: Tuple[str, ...] = ("lru", "tinylfu")) -> Dict[str, float]:
+    """按轨迹回放 查询 -> 未命中则写入，返回各缓存类型的命中率"""
+    hit_rates = {}
+    for cache_type in cache_types:
+        cache = create_cache(max_size=capacity, max_memory_mb=1024, cache_type=cache_type)
+        for query in queries:
+            if cache.get(query) is None:
+                cache.put(query, query, size_bytes=1)
+        hit_rates[cache_type] = cache.get_hit_rate()
+    return hit_rates
 
 
 class QueryCache:
     """查询结果缓存"""
     
-    def __init__(self, max_size: int = 500):
-        self.cache = LRUCache(max_size=max_size, max_memory_mb=200)
+    def __init__(self, max_size: int = 500, sizer: Optional[Callable[[Any], int]] = None,
+                 cache_type: str = "lru", num_shards: int = 16):
+        self.cache = create_cache(max_size, 200, sizer, cache_type, num_shards)
     
     def get_cache_key(self, query: str, strategy_config: Dict[str, Any]) -> str:
         """生成缓存键"""
@@ -144,24 +755,52 @@ class QueryCache:
 class DocumentCache:
     """文档检索缓存 - 借鉴 TurboRAG 思想"""
     
-    def __init__(self, max_size: int = 2000):
-        self.cache = LRUCache(max_size=max_size, max_memory_mb=300)
+    def __init__(self, max_size: int = 2000, sizer: Optional[Callable[[Any], int]] = None,
+                 cache_type: str = "lru", num_shards: int = 16):
+        self.cache = create_cache(max_size, 300, sizer, cache_type, num_shards)
         self.precomputed_embeddings = {}  # 预计算的文档嵌入
+        self.lock = threading.Lock()  # 保护"比较深度后写入"
     
-    def get_cache_key(self, query: str, retriever_type: str, top_k: int) -> str:
-        """生成检索缓存键"""
-        content = f"{query}_{retriever_type}_{top_k}"
+    def get_cache_key(self, query: str, retriever_type: str) -> str:
+        """生成检索缓存键（与 top_k 无关，同一查询和检索器只保存最深的排序列表）"""
+        content = f"{query}_{retriever_type}"
         return hashlib.md5(content.encode()).hexdigest()
     
+    @staticmethod
+    def covers(cached: Tuple[int, List[Any]], top_k: int) -> bool:
+        """缓存的 (检索深度, 文档列表) 能否回答 top_k 请求：深度足够，或检索器已无更多结果"""
+        depth, documents = cached
+        return depth >= top_k or len(documents) < depth
+    
     def get_cached_documents(self, query: str, retriever_type: str, top_k: int) -> Optional[List[Any]]:
-        """获取缓存的检索结果"""
-        key = self.get_cache_key(query, retriever_type, top_k)
-        return self.cache.get(key)
+        """获取缓存的检索结果；较小的 top_k 直接截取已缓存列表的前缀"""
+        key = self.get_cache_key(query, retriever_type)
+        cached = self.cache.get(key)
+        if cached is None or not self.covers(cached, top_k):
+            return None
+        return cached[1][:top_k]
     
-    def cache_documents(self, query: str, retriever_type: str, top_k: int, documents: List[Any]):
-        """缓存检索结果"""
-        key = self.get_cache_key(query, retriever_type, top_k)
-        self.cache.put(key, documents)
+    def cached_depth(self, query: str, retriever_type: str) -> int:
+        """已缓存结果的检索深度，没有缓存时为 0"""
+        entry = self.cache.peek(self.get_cache_key(query, retriever_type))
+        return entry.data[0] if entry is not None else 0
+    
+    def cache_documents(self, query: str, retriever_type: str, top_k: int, documents: List[Any],
+                        ttl: Optional[float] = None) -> bool:
+        """
+        缓存以 top_k 检索得到的结果
+        
+        未过期（ttl 内）的更深结果不会被更浅的结果覆盖：并发的 k=5 与 k=20 检索先后完成时，
+        保留 k=20 的结果。返回是否写入。
+        """
+        key = self.get_cache_key(query, retriever_type)
+        with self.lock:
+            entry = self.cache.peek(key)
+            if (entry is not None and entry.data[0] > top_k
+                    and (ttl is None or time.time() - entry.timestamp <= ttl)):
+                return False
+            self.cache.put(key, (top_k, documents))
+            return True
     
     def precompute_document_embeddings(self, documents: List[Any], embedder):
         """预计算文档嵌入 - TurboRAG 启发"""
@@ -176,6 +815,118 @@ class DocumentCache:
         logger.info("文档嵌入预计算完成")
 
 
+class QueryEmbeddingCache:
+    """
+    查询嵌入缓存
+
+    同一查询文本在稠密检索、子任务检索和预热之间只编码一次。
+    键为 (编码器标识, 规范化查询)，按嵌入字节数计入内存上限；
+    缓存的数组设为只读，调用方不能就地修改。
+    """
+    
+    def __init__(self, max_size: int = 10000, max_memory_mb: int = 64,
+                 cache_type: str = "lru", num_shards: int = 16):
+        self.cache = create_cache(max_size, max_memory_mb, None, cache_type, num_shards)
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """规范化查询：NFKC + 合并空白（不改变大小写，避免影响区分大小写的编码器）"""
+        return " ".join(unicodedata.normalize("NFKC", query).split())
+    
+    def get_cache_key(self, query: str, encoder_id: str) -> str:
+        """生成嵌入缓存键"""
+        content = f"{encoder_id}\x00{self.normalize_query(query)}"
+        return hashlib.md5(content.encode()).hexdigest()
+    
+    def get_embedding(self, query: str, encoder_id: str) -> Optional[Any]:
+        """获取缓存的查询嵌入"""
+        return self.cache.get(self.get_cache_key(query, encoder_id))
+    
+    def cache_embedding(self, query: str, encoder_id: str, embedding: Any) -> Any:
+        """缓存查询嵌入，返回实际缓存的（只读）对象"""
+        if hasattr(embedding, 'setflags'):
+            embedding = embedding.copy()
+            embedding.setflags(write=False)
+        size_bytes = getattr(embedding, 'nbytes', None)
+        self.cache.put(self.get_cache_key(query, encoder_id), embedding, size_bytes=size_bytes)
+        return embedding
+    
+    def get_or_encode(self, query: str, encoder_id: str, encode_fn) -> Any:
+        """命中则直接返回，否则调用 encode_fn(query) 编码并缓存"""
+        embedding = self.get_embedding(query, encoder_id)
+        if embedding is None:
+            embedding = self.cache_embedding(query, encoder_id, encode_fn(query))
+        return embedding
+
+    def get_or_encode_batch(self, queries: List[str], encoder_id: str, encode_batch_fn) -> List[Any]:
+        """
+        批量版本：未命中的查询（去重后）一次交给 encode_batch_fn(查询列表) 编码
+
+        encode_batch_fn 返回 (未命中数, dim) 的矩阵；每行按 (1, dim) 缓存，与 get_or_encode 的单条编码形状一致。
+        """
+        embeddings = [self.get_embedding(query, encoder_id) for query in queries]
+        missing = list(dict.fromkeys(query for query, embedding in zip(queries, embeddings) if embedding is None))
+        if missing:
+            encoded = encode_batch_fn(missing)
+            fresh = {
+                query: self.cache_embedding(query, encoder_id, encoded[i:i + 1])
+                for i, query in enumerate(missing)
+            }
+            embeddings = [fresh[query] if embedding is None else embedding
+                          for query, embedding in zip(queries, embeddings)]
+        return embeddings
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            'size': len(self.cache),
+            'hits': self.cache.hits,
+            'misses': self.cache.misses,
+            'hit_rate': self.cache.get_hit_rate(),
+            'memory_mb': self.cache.current_memory / (1024 * 1024)
+        }
+
+
+class SingleFlight:
+    """
+    请求合并：同一个键同时只执行一次计算，并发的相同请求等待并共享其结果
+
+    避免缓存失效瞬间的并发相同查询全部穿透到检索 / 生成（缓存击穿）。
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls: Dict[str, Future] = {}
+    
+    def do(self, key: str, fn, *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        执行或等待计算
+        
+        Returns:
+            (结果, 是否共享了其他线程的计算)
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = self.calls[key] = Future()
+        
+        if not owner:
+            return future.result(), True
+        
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return future.result(), False
+    
+    def in_flight(self, key: str) -> bool:
+        with self.lock:
+            return key in self.calls
+
+
 def performance_monitor(func):
     """性能监控装饰器"""
     @wraps(func)
@@ -205,14 +956,42 @@ class PerformanceOptimizer:
     def __init__(self, config):
         self.config = config
         
-        # 初始化缓存
-        self.query_cache = QueryCache(max_size=config.get('query_cache_size', 500))
-        self.document_cache = DocumentCache(max_size=config.get('doc_cache_size', 2000))
+        # 初始化缓存（cache_sizer: "estimate" 递归估算，"pickle" 按序列化长度精确计算）
+        sizer = pickle_sizer if self._get_config('cache_sizer', 'estimate') == 'pickle' else estimate_size
+        # cache_type: lru / clock / sharded_lru / sharded_clock（多线程服务时使用分片缓存）
+        # 查询 / 文档缓存可用 query_cache_type、doc_cache_type 单独指定（如 tinylfu 抵御长尾查询）
+        cache_type = self._get_config('cache_type', 'lru')
+        cache_options = {'cache_type': cache_type, 'num_shards': self._get_config('cache_shards', 16)}
+        self.query_cache = QueryCache(
+            max_size=self._get_config('query_cache_size', 500), sizer=sizer,
+            cache_type=self._get_config('query_cache_type', cache_type), num_shards=cache_options['num_shards']
+        )
+        self.document_cache = DocumentCache(
+            max_size=self._get_config('doc_cache_size', 2000), sizer=sizer,
+            cache_type=self._get_config('doc_cache_type', cache_type), num_shards=cache_options['num_shards']
+        )
+        self.embedding_cache = QueryEmbeddingCache(
+            max_size=self._get_config('embedding_cache_size', 10000),
+            max_memory_mb=self._get_config('embedding_cache_memory_mb', 64),
+            **cache_options
+        )
+        
+        # 缓存有效期；过期后 stale_ttl 秒内先返回旧结果，同时在后台刷新
+        self.cache_ttl = self._get_config('cache_ttl_seconds', 3600)
+        self.stale_ttl = self._get_config('cache_stale_ttl_seconds', 300)
+        self.single_flight = SingleFlight()
+        self._refresh_pool: Optional[ThreadPoolExecutor] = None
+        # 已提交但可能尚未开始执行的后台刷新（single_flight 只在任务开始后才登记）
+        self._refreshing: Set[str] = set()
+        self._refresh_lock = threading.Lock()
         
         # 性能统计
         self.performance_stats = {
             'total_queries': 0,
             'cache_hits': 0,
+            'coalesced_requests': 0,
+            'stale_hits': 0,
+            'background_refreshes': 0,
             'total_retrieval_time': 0.0,
             'total_generation_time': 0.0,
             'start_time': time.time()
@@ -223,54 +1002,106 @@ class PerformanceOptimizer:
         
         logger.info("PerformanceOptimizer 初始化完成")
     
-    @performance_monitor
-    def optimize_retrieval(self, query: str, retriever_type: str, top_k: int, 
-                          retriever_func, *args, **kwargs) -> List[Any]:
-        """优化检索过程"""
-        # 1. 尝试从缓存获取
-        cached_docs = self.document_cache.get_cached_documents(query, retriever_type, top_k)
-        if cached_docs is not None:
-            logger.debug(f"缓存命中: {retriever_type} 检索")
-            self.performance_stats['cache_hits'] += 1
-            return cached_docs
+    def _get_config(self, key: str, default: Any) -> Any:
+        """兼容字典配置和 dataclass 配置（ModuleManager 传入的是 FlexRAGIntegratedConfig）"""
+        if isinstance(self.config, dict):
+            return self.config.get(key, default)
+        return getattr(self.config, key, default)
+    
+    def _cached_call(self, cache: LRUCache, key: str, compute_fn,
+                     accept: Optional[Callable[[Any], bool]] = None, flight_key: Optional[str] = None) -> Any:
+        """
+        带请求合并和 stale-while-revalidate 的缓存读取
         
-        # 2. 执行实际检索
-        start_time = time.time()
-        documents = retriever_func(*args, **kwargs)
-        retrieval_time = time.time() - start_time
+        1. 未过期：直接返回
+        2. 过期但在 stale_ttl 内：返回旧结果，后台刷新（同一键只刷新一次）
+        3. 未命中或过旧：同一键的并发请求只计算一次
+        
+        Args:
+            accept: 判断缓存值能否满足本次请求（如缓存的检索深度不足时视为未命中）
+            flight_key: 请求合并使用的键，默认与缓存键相同
+        """
+        flight_key = flight_key or key
+        entry = cache.get_entry(key)
+        if entry is not None and (accept is None or accept(entry.data)):
+            age = time.time() - entry.timestamp
+            if self.cache_ttl is None or age <= self.cache_ttl:
+                logger.debug(f"缓存命中: {key}")
+                self.performance_stats['cache_hits'] += 1
+                return entry.data
+            if self.stale_ttl and age <= self.cache_ttl + self.stale_ttl:
+                self.performance_stats['stale_hits'] += 1
+                self._schedule_refresh(flight_key, compute_fn)
+                return entry.data
         
-        # 3. 缓存结果
-        self.document_cache.cache_documents(query, retriever_type, top_k, documents)
+        result, shared = self.single_flight.do(flight_key, compute_fn)
+        if shared:
+            self.performance_stats['coalesced_requests'] += 1
+        return result
+    
+    def _schedule_refresh(self, key: str, compute_fn):
+        """后台刷新过期条目；已有进行中或已提交的计算时不重复提交"""
+        with self._refresh_lock:
+            if key in self._refreshing or self.single_flight.in_flight(key):
+                return
+            self._refreshing.add(key)
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache_refresh")
+            self.performance_stats['background_refreshes'] += 1
+        future = self._refresh_pool.submit(self.single_flight.do, key, compute_fn)
+        future.add_done_callback(partial(self._finish_refresh, key))
+    
+    def _finish_refresh(self, key: str, future: Future):
+        with self._refresh_lock:
+            self._refreshing.discard(key)
+        if future.exception() is not None:
+            logger.warning(f"后台刷新缓存失败: {future.exception()}")
+    
+    @performance_monitor
+    def optimize_retrieval(self, query: str, retriever_type: str, top_k: int, 
+                          retriever_func, *args, top_k_arg: Optional[str] = None, **kwargs) -> List[Any]:
+        """
+        优化检索过程：缓存按 (查询, 检索器) 保存最深的结果，较小的 top_k 截取前缀，更大的 top_k 才重新检索
         
-        # 4. 更新统计
-        self.performance_stats['total_retrieval_time'] += retrieval_time
+        Args:
+            top_k_arg: retriever_func 接收检索深度的关键字参数名。给定时检索（含过期后的后台刷新）
+                按 max(top_k, 已缓存深度) 进行，刷新不会让缓存变浅
+        """
+        def retrieve():
+            # 执行实际检索并缓存
+            depth, call_kwargs = top_k, kwargs
+            if top_k_arg is not None:
+                depth = max(top_k, self.document_cache.cached_depth(query, retriever_type))
+                call_kwargs = {**kwargs, top_k_arg: depth}
+            start_time = time.time()
+            documents = retriever_func(*args, **call_kwargs)
+            self.performance_stats['total_retrieval_time'] += time.time() - start_time
+            self.document_cache.cache_documents(query, retriever_type, depth, documents, ttl=self.cache_ttl)
+            return depth, documents
         
-        return documents
+        key = self.document_cache.get_cache_key(query, retriever_type)
+        _, documents = self._cached_call(
+            self.document_cache.cache, key, retrieve,
+            accept=lambda cached: DocumentCache.covers(cached, top_k),
+            flight_key=f"{key}_{top_k}"
+        )
+        return documents[:top_k]
     
     @performance_monitor
     def optimize_query_processing(self, query: str, strategy_config: Dict[str, Any], 
                                  processing_func, *args, **kwargs) -> Any:
         """优化查询处理过程"""
-        # 1. 尝试从缓存获取完整结果
-        cached_result = self.query_cache.get_cached_result(query, strategy_config)
-        if cached_result is not None:
-            logger.debug("查询结果缓存命中")
-            self.performance_stats['cache_hits'] += 1
-            return cached_result
-        
-        # 2. 执行实际处理
-        start_time = time.time()
-        result = processing_func(*args, **kwargs)
-        processing_time = time.time() - start_time
-        
-        # 3. 缓存结果
-        self.query_cache.cache_result(query, strategy_config, result)
-        
-        # 4. 更新统计
-        self.performance_stats['total_generation_time'] += processing_time
-        self.performance_stats['total_queries'] += 1
+        def process():
+            # 执行实际处理并缓存完整结果
+            start_time = time.time()
+            result = processing_func(*args, **kwargs)
+            self.performance_stats['total_generation_time'] += time.time() - start_time
+            self.performance_stats['total_queries'] += 1
+            self.query_cache.cache_result(query, strategy_config, result)
+            return result
         
-        return result
+        key = self.query_cache.get_cache_key(query, strategy_config)
+        return self._cached_call(self.query_cache.cache, key, process)
     
     def warmup_cache(self, sample_queries: List[str], retriever, generator):
         """缓存预热 - 提升首次查询性能"""
@@ -333,20 +1164,103 @@ class PerformanceOptimizer:
         """清空所有缓存"""
         self.query_cache.cache.clear()
         self.document_cache.cache.clear()
+        self.embedding_cache.cache.clear()
         logger.info("所有缓存已清空")
     
     def get_cache_statistics(self) -> Dict[str, Any]:
         """获取缓存统计信息"""
         return {
             'query_cache': {
-                'size': len(self.query_cache.cache.cache),
+                'size': len(self.query_cache.cache),
                 'hit_rate': self.query_cache.cache.get_hit_rate(),
                 'memory_mb': self.query_cache.cache.current_memory / (1024 * 1024)
             },
             'document_cache': {
-                'size': len(self.document_cache.cache.cache),
+                'size': len(self.document_cache.cache),
                 'hit_rate': self.document_cache.cache.get_hit_rate(),
                 'memory_mb': self.document_cache.cache.current_memory / (1024 * 1024)
             },
-            'precomputed_embeddings': len(self.document_cache.precomputed_embeddings)
+            'query_embedding_cache': self.embedding_cache.get_statistics(),
+            'precomputed_embeddings': len(self.document_cache.precomputed_embeddings),
+            'coalesced_requests': self.performance_stats['coalesced_requests'],
+            'stale_hits': self.performance_stats['stale_hits'],
+            'background_refreshes': self.performance_stats['background_refreshes']
+        }
+
+
+def benchmark_concurrent_gets(num_threads: int = 8, ops_per_thread: int = 20000, num_keys: int = 1000):
+    """基准测试：多线程读多写少场景下各缓存实现的吞吐量（ops/s）"""
+    results = {}
+    for cache_type in CACHE_TYPES:
+        cache = create_cache(max_size=num_keys, max_memory_mb=64, cache_type=cache_type)
+        for i in range(num_keys):
+            cache.put(f"key_{i}", i, size_bytes=64)
+
+        def worker(seed: int):
+            for i in range(ops_per_thread):
+                key = f"key_{(seed * 7919 + i * 31) % (num_keys * 2)}"
+                if cache.get(key) is None and i % 10 == 0:
+                    cache.put(key, i, size_bytes=64)
+
+        threads = [threading.Thread(target=worker, args=(t,)) for t in range(num_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        results[cache_type] = {
+            'ops_per_sec': num_threads * ops_per_thread / elapsed,
+            'hit_rate': cache.get_hit_rate()
         }
+    return results
+
+
+if __name__ == "__main__":
+    import itertools
+    import random
+
+    # 命中率对比：回放查询轨迹（命令行传入 JSONL 路径），默认使用 Zipf 热点 + 一次性长尾查询的合成轨迹
+    if len(sys.argv) > 1:
+        trace = load_query_trace(sys.argv[1])
+    else:
+        rng = random.Random(0)
+        hot = [f"hot query {i}" for i in range(2000)]
+        cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(hot))))
+        trace = []
+        for i in range(50000):
+            trace.append(rng.choices(hot, cum_weights=cum_weights)[0] if rng.random() < 0.7 else f"long tail query {i}")
+    for capacity in (100, 500):
+        hit_rates = replay_trace(trace, capacity, ("lru", "clock", "tinylfu"))
+        print(f"容量 {capacity:4} | " + " | ".join(f"{name}: {rate:.2%}" for name, rate in hit_rates.items()))
+
+    # 基准测试：多线程读取
+    for cache_type, result in benchmark_concurrent_gets().items():
+        print(f"{cache_type:14} {result['ops_per_sec']:>12,.0f} ops/s  命中率 {result['hit_rate']:.2%}")
+
+    # 基准测试：LRUCache.put 的大小计算开销（pickle.dumps vs 估算，固定大小为不计算大小的基线）
+    from adaptive_rag.data_processing.document_store import DocumentStore
+
+    store = DocumentStore.from_records(
+        (f"doc_{i}", f"Title {i}", "retrieval augmented generation " * 40) for i in range(1000)
+    )
+    payloads = {
+        "文档字典列表": [dict(store[i], score=0.5, retrieval_type="dense") for i in range(20)],
+        "文档字典列表(50)": [dict(store[i], score=0.5, retrieval_type="dense") for i in range(50)],
+        "命中对象列表": [store.hit(i, 0.5, "dense") for i in range(20)],
+        "生成结果": {"answer": "answer " * 200, "contexts": [store[i]["content"] for i in range(10)],
+                 "metadata": {"stage_times": {"retrieval": 0.1, "generation": 0.5}}},
+        "查询嵌入": np.random.rand(1, 768).astype(np.float32) if NUMPY_AVAILABLE else [0.0] * 768,
+    }
+
+    rounds = 2000
+    for name, payload in payloads.items():
+        line = [f"{name:8}"]
+        for sizer_name, sizer in (("固定大小", lambda data: 1), ("pickle", pickle_sizer), ("estimate", estimate_size)):
+            cache = LRUCache(max_size=rounds, max_memory_mb=1024, sizer=sizer)
+            start = time.perf_counter()
+            for i in range(rounds):
+                cache.put(str(i), payload)
+            latency_us = (time.perf_counter() - start) / rounds * 1e6
+            line.append(f"{sizer_name}: {latency_us:7.1f}us/put, 大小 {sizer(payload):>8} B")
+        print(" | ".join(line))
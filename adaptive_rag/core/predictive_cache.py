@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+=== 预测性缓存 ===
+
+任务分解完成后立即在后台预取检索结果，检索规划与预取重叠执行：
+1. 预取当前查询分解出的子查询
+2. 从查询日志学习查询之间的转移（用户问完 A 之后常问 B），
+   对置信度足够高的后续查询一并预取
+3. 检索阶段通过 get_or_fetch 读取：已完成直接返回，进行中则等待，
+   未预取的查询同步检索，同一查询的并发请求只检索一次
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _PrefetchEntry:
+    """预取条目：结果以 Future 保存，进行中的预取也可被等待"""
+
+    __slots__ = ("future", "created_at", "speculative", "used")
+
+    def __init__(self, future: Future, speculative: bool):
+        self.future = future
+        self.created_at = time.time()
+        self.speculative = speculative
+        self.used = False
+
+
+class PredictiveCache:
+    """
+    预测性预取缓存
+
+    Args:
+        config: FlexRAGIntegratedConfig（读取 cache_configs['predictive_cache']）或配置字典
+    """
+
+    def __init__(self, config=None):
+        if isinstance(config, dict):
+            cache_config = config
+        else:
+            cache_config = getattr(config, 'cache_configs', {}).get('predictive_cache', {})
+
+        self.prediction_window = cache_config.get('prediction_window', 5)
+        self.confidence_threshold = cache_config.get('confidence_threshold', 0.7)
+        self.min_support = cache_config.get('min_support', 2)
+        self.max_entries = cache_config.get('max_entries', 512)
+        self.ttl_seconds = cache_config.get('ttl_seconds', 300)
+        self.max_workers = cache_config.get('max_workers', 2)
+        self.prefetch_top_k = cache_config.get('prefetch_top_k', 10)
+
+        self.lock = threading.RLock()
+        self.entries: "OrderedDict[Tuple[str, str], _PrefetchEntry]" = OrderedDict()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+        # 查询转移统计：规范化查询 -> Counter(下一个规范化查询)
+        self.transitions: Dict[str, Counter] = defaultdict(Counter)
+        self.query_texts: Dict[str, str] = {}
+        self.last_queries: Dict[str, str] = {}
+
+        # 统计信息
+        self.stats = Counter()
+
+        query_log_path = cache_config.get('query_log_path')
+        if query_log_path and os.path.exists(query_log_path):
+            self.load_query_log(query_log_path)
+
+        logger.info(f"PredictiveCache 初始化完成，预测窗口: {self.prediction_window}")
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="prefetch")
+        return self._pool
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    # ===== 查询日志学习 =====
+
+    def record_query(self, query: str, session_id: str = "default"):
+        """记录一次用户查询，更新同一会话内 上一个查询 -> 当前查询 的转移计数"""
+        normalized = self.normalize_query(query)
+        with self.lock:
+            self.query_texts.setdefault(normalized, query)
+            previous = self.last_queries.get(session_id)
+            if previous is not None and previous != normalized:
+                self.transitions[previous][normalized] += 1
+            self.last_queries[session_id] = normalized
+
+    def load_query_log(self, log_path: str) -> int:
+        """
+        从查询日志学习转移统计
+
+        每行一个 JSON 对象 {"query": ..., "session_id": ...}，或一行纯文本查询（视为同一会话）
+        """
+        count = 0
+        with open(log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = line
+                if isinstance(record, dict):
+                    self.record_query(record.get("query", ""), str(record.get("session_id", "log")))
+                else:
+                    self.record_query(str(record), "log")
+                count += 1
+        logger.info(f"从查询日志学习了 {count} 条查询: {log_path}")
+        return count
+
+    def predict_followups(self, query: str) -> List[str]:
+        """预测紧随其后的查询：条件概率不低于 confidence_threshold 且出现次数不少于 min_support"""
+        with self.lock:
+            counter = self.transitions.get(self.normalize_query(query))
+            if not counter:
+                return []
+            total = sum(counter.values())
+            return [
+                self.query_texts[next_query]
+                for next_query, count in counter.most_common(self.prediction_window)
+                if count >= self.min_support and count / total >= self.confidence_threshold
+            ]
+
+    # ===== 预取 =====
+
+    def prefetch(self, queries: Iterable[str], fetch_fn: Callable[[str], Any],
+                 namespace: str = "default", speculative: bool = False) -> int:
+        """
+        后台预取查询结果
+
+        Args:
+            queries: 待预取的查询
+            fetch_fn: 检索函数 query -> 结果
+            namespace: 区分不同的检索函数（如不同的 top_k）
+            speculative: 是否为预测的后续查询（只影响统计）
+
+        Returns:
+            新提交的预取任务数
+        """
+        scheduled = 0
+        with self.lock:
+            self._expire()
+            for query in queries:
+                key = (namespace, self.normalize_query(query))
+                if key in self.entries:
+                    continue
+                future = self.pool.submit(fetch_fn, query)
+                self._put(key, _PrefetchEntry(future, speculative))
+                scheduled += 1
+            self.stats["prefetched"] += scheduled
+        return scheduled
+
+    def get_or_fetch(self, query: str, fetch_fn: Callable[[str], Any], namespace: str = "default",
+                     timeout: Optional[float] = None) -> Any:
+        """
+        读取预取结果；未预取时在当前线程检索并缓存，并发的相同请求等待同一结果
+
+        Args:
+            timeout: 等待进行中的预取的最长秒数（通常为调用方检索器的超时），超时抛出 TimeoutError；
+                预取条目保留，完成后仍可服务后续请求
+        """
+        key = (namespace, self.normalize_query(query))
+        owner = False
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._is_expired(entry):
+                del self.entries[key]
+                entry = None
+
+            if entry is None:
+                entry = _PrefetchEntry(Future(), speculative=False)
+                self._put(key, entry)
+                owner = True
+                self.stats["misses"] += 1
+            else:
+                self.stats["hits" if entry.future.done() else "waited"] += 1
+                if entry.speculative and not entry.used:
+                    self.stats["speculative_hits"] += 1
+                self.entries.move_to_end(key)
+            entry.used = True
+
+        if owner:
+            try:
+                entry.future.set_result(fetch_fn(query))
+            except Exception as e:
+                entry.future.set_exception(e)
+                with self.lock:
+                    self.entries.pop(key, None)
+                raise
+            return entry.future.result()
+
+        try:
+            return entry.future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self.lock:
+                self.stats["wait_timeouts"] += 1
+            logger.warning(f"⚠️ 等待预取超时 ({timeout}s): {query}")
+            raise TimeoutError(f"等待预取结果超时 ({timeout}s)")
+        except Exception as e:
+            # 预取失败不影响正常检索
+            logger.warning(f"⚠️ 预取失败，改为同步检索: {e}")
+            with self.lock:
+                if self.entries.get(key) is entry:
+                    del self.entries[key]
+            return fetch_fn(query)
+
+    def _put(self, key: Tuple[str, str], entry: _PrefetchEntry):
+        self.entries[key] = entry
+        while len(self.entries) > self.max_entries:
+            _, evicted = self.entries.popitem(last=False)
+            if not evicted.used:
+                self.stats["wasted"] += 1
+
+    def _is_expired(self, entry: _PrefetchEntry) -> bool:
+        return self.ttl_seconds is not None and time.time() - entry.created_at > self.ttl_seconds
+
+    def _expire(self):
+        for key in [key for key, entry in self.entries.items() if self._is_expired(entry)]:
+            if not self.entries.pop(key).used:
+                self.stats["wasted"] += 1
+
+    def clear(self):
+        """清空预取结果（保留学习到的转移统计）"""
+        with self.lock:
+            self.entries.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self.lock:
+            served = self.stats["hits"] + self.stats["waited"]
+            total = served + self.stats["misses"]
+            return {
+                'size': len(self.entries),
+                'prefetched': self.stats["prefetched"],
+                'hits': self.stats["hits"],
+                'waited': self.stats["waited"],
+                'misses': self.stats["misses"],
+                'hit_rate': served / total if total > 0 else 0.0,
+                'speculative_hits': self.stats["speculative_hits"],
+                'wasted': self.stats["wasted"],
+                'wait_timeouts': self.stats["wait_timeouts"],
+                'learned_queries': len(self.transitions)
+            }
+
+    def shutdown(self, wait: bool = False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+if __name__ == "__main__":
+    def slow_search(query: str) -> List[str]:
+        time.sleep(0.1)
+        return [f"doc for {query}"]
+
+    cache = PredictiveCache({"min_support": 1, "confidence_threshold": 0.5})
+    for session in range(3):
+        cache.record_query("What is BM25?", session_id=str(session))
+        cache.record_query("How does BM25 compare to dense retrieval?", session_id=str(session))
+
+    followups = cache.predict_followups("what is bm25?")
+    print(f"预测的后续查询: {followups}")
+
+    subqueries = ["BM25 definition", "BM25 scoring formula"]
+    cache.prefetch(subqueries, slow_search, namespace="search")
+    cache.prefetch(followups, slow_search, namespace="search", speculative=True)
+
+    time.sleep(0.05)  # 模拟检索规划，与预取重叠
+    start = time.perf_counter()
+    for query in subqueries + followups:
+        cache.get_or_fetch(query, slow_search, namespace="search")
+    print(f"检索耗时: {(time.perf_counter() - start) * 1000:.0f}ms（顺序同步检索约 300ms）")
+    print(cache.get_statistics())
+    cache.shutdown()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+=== 语义缓存 ===
+
+QueryCache 以精确查询文本作为键，"What is ML?" 与 "what is machine learning"
+这类改写永远不会命中。语义缓存对查询嵌入建立向量索引：
+1. 新查询与已缓存查询的余弦相似度超过阈值即视为同一意图，直接返回缓存结果，
+   跳过检索和生成
+2. 命中前对高风险差异做二次确认：数字 / 序数、否定词必须一致，双方都含专名时专名必须一致。
+   "第一任总统" 与 "第三任总统" 这类只差一个数字的查询嵌入相似度很高，答案却不同；
+   其余措辞差异（同义词、缩写、语序）交给嵌入相似度判断。阈值可用 calibrate() 按嵌入模型校准
+3. 兜底的字符 n-gram 编码器只能反映字面重叠，接入嵌入模型之前缓存不提供命中
+4. 按策略分区（启用的模块 / 检索策略不同，答案不可复用）
+5. 条目数上限 + 全局 LRU 淘汰 + 可选 TTL
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITION = "default"
+FALLBACK_ENCODER_ID = "char_ngram"
+# 命中的二次确认方式
+VERIFY_MODES = ("key_terms", "token_set", "none")
+
+# 改变答案的高风险词：数字 / 序数、否定
+_NUMBER_WORDS = frozenset(
+    "zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen fifteen "
+    "sixteen seventeen eighteen nineteen twenty thirty forty fifty sixty seventy eighty ninety "
+    "hundred thousand million billion first second third fourth fifth sixth seventh eighth ninth "
+    "tenth eleventh twelfth twentieth hundredth last".split()
+)
+_NEGATION_WORDS = frozenset({"not", "no", "never", "without", "none", "nor"})
+_NUMERAL_PATTERN = re.compile(r"\d+(?:\.\d+)?|第[零〇一二三四五六七八九十百千万两\d]+")
+# 大写开头的词视为专名，句首的疑问词 / 虚词除外
+_ENTITY_PATTERN = re.compile(r"(?<![A-Za-z])[A-Z][A-Za-z0-9]*")
+_NON_ENTITY_WORDS = frozenset(
+    "what who whom whose which when where why how is are was were do does did can could should would "
+    "will the a an in on of for to and or tell explain describe define list give show please i".split()
+)
+
+
+def make_partition_key(strategy_config: Optional[Dict[str, Any]] = None) -> str:
+    """将策略配置转换为分区键，策略相同的查询共享一个分区"""
+    if not strategy_config:
+        return DEFAULT_PARTITION
+    content = json.dumps(strategy_config, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+def normalize_tokens(text: str) -> FrozenSet[str]:
+    """小写、去标点后的词集合（二次确认用）"""
+    return frozenset(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def key_terms(text: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    """提取二次确认用的 (数字 / 序数 / 否定词, 专名)"""
+    lowered = text.lower().replace("cannot", "can not").replace("n't", " not")
+    words = re.sub(r"[^\w\s]", " ", lowered).split()
+    exact = {word for word in words if word in _NUMBER_WORDS or word in _NEGATION_WORDS}
+    exact.update(_NUMERAL_PATTERN.findall(lowered))
+    entities = {word.lower() for word in _ENTITY_PATTERN.findall(text)} - _NON_ENTITY_WORDS - exact
+    return frozenset(exact), frozenset(entities)
+
+
+def char_ngram_embedding(text: str, dim: int = 512, n: int = 3) -> np.ndarray:
+    """
+    字符 n-gram 哈希向量，未接入嵌入模型时的兜底编码器
+
+    只能识别大小写、标点、词序等表层改写，只差一个词的不同问题相似度也很高，
+    因此使用该编码器时缓存只存不取；真正的语义匹配需要通过 set_encoder 接入嵌入模型。
+    """
+    normalized = " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+    padded = f" {normalized} "
+    vector = np.zeros(dim, dtype=np.float32)
+    for i in range(max(len(padded) - n + 1, 1)):
+        vector[zlib.crc32(padded[i:i + n].encode('utf-8')) % dim] += 1.0
+    return vector
+
+
+@dataclass
+class SemanticCacheEntry:
+    """语义缓存条目"""
+    entry_id: int
+    query: str
+    partition: str
+    result: Any
+    created_at: float
+    row: int
+    tokens: FrozenSet[str] = frozenset()
+    terms: Tuple[FrozenSet[str], FrozenSet[str]] = (frozenset(), frozenset())
+    hits: int = 0
+
+
+class _PartitionIndex:
+    """单个分区的向量索引：连续的归一化嵌入矩阵，删除时用末行填补空位"""
+
+    def __init__(self, dim: int, initial_capacity: int = 64):
+        self.dim = dim
+        self.matrix = np.zeros((initial_capacity, dim), dtype=np.float32)
+        self.entry_ids: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self.entry_ids)
+
+    def add(self, vector: np.ndarray, entry_id: int) -> int:
+        row = len(self.entry_ids)
+        if row == self.matrix.shape[0]:
+            grown = np.zeros((row * 2, self.dim), dtype=np.float32)
+            grown[:row] = self.matrix
+            self.matrix = grown
+        self.matrix[row] = vector
+        self.entry_ids.append(entry_id)
+        return row
+
+    def remove(self, row: int) -> Optional[int]:
+        """删除一行，返回被移动到该行的条目 id（没有移动时为 None）"""
+        last = len(self.entry_ids) - 1
+        moved = None
+        if row != last:
+            self.matrix[row] = self.matrix[last]
+            self.entry_ids[row] = self.entry_ids[last]
+            moved = self.entry_ids[row]
+        self.entry_ids.pop()
+        return moved
+
+    def search(self, vector: np.ndarray):
+        """返回 (最相似行号, 相似度)"""
+        similarities = self.matrix[:len(self.entry_ids)] @ vector
+        row = int(np.argmax(similarities))
+        return row, float(similarities[row])
+
+    def search_above(self, vector: np.ndarray, threshold: float):
+        """返回相似度不低于阈值的 [(条目 id, 相似度)]，按相似度降序"""
+        similarities = self.matrix[:len(self.entry_ids)] @ vector
+        rows = np.flatnonzero(similarities >= threshold)
+        rows = rows[np.argsort(-similarities[rows], kind="stable")]
+        return [(self.entry_ids[row], float(similarities[row])) for row in rows]
+
+
+class SemanticCache:
+    """
+    语义缓存
+
+    Args:
+        config: FlexRAGIntegratedConfig（读取 cache_configs['semantic_cache']）或配置字典
+        encode_fn: 查询编码函数 str -> 向量，默认使用字符 n-gram 哈希（只存不取）
+        encoder_id: 编码器标识，切换编码器时缓存自动清空
+
+    配置项 verify 为命中前的二次确认方式：key_terms（默认）要求数字 / 序数、否定词一致，
+    双方都含专名时专名一致；token_set 要求规范化词集合完全相同（只接受表层改写）；
+    none 只看相似度阈值。
+    """
+
+    def __init__(self, config=None, encode_fn: Optional[Callable[[str], Any]] = None,
+                 encoder_id: Optional[str] = None):
+        if isinstance(config, dict):
+            cache_config = config
+        else:
+            cache_config = getattr(config, 'cache_configs', {}).get('semantic_cache', {})
+
+        self.similarity_threshold = cache_config.get('similarity_threshold', 0.92)
+        self.max_cache_size = cache_config.get('max_cache_size', 1000)
+        self.ttl_seconds = cache_config.get('ttl_seconds', 3600)
+        self.verify = cache_config.get('verify', "key_terms")
+        if self.verify not in VERIFY_MODES:
+            raise ValueError(f"不支持的语义缓存确认方式: {self.verify}，可选 {VERIFY_MODES}")
+
+        self.encode_fn = encode_fn or char_ngram_embedding
+        self.encoder_id = encoder_id or (FALLBACK_ENCODER_ID if encode_fn is None else "custom")
+
+        self.lock = threading.RLock()
+        self.entries: "OrderedDict[int, SemanticCacheEntry]" = OrderedDict()
+        self.partitions: Dict[str, _PartitionIndex] = {}
+        self._next_id = 0
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejections = 0
+        self.fallback_skips = 0
+
+        logger.info(f"SemanticCache 初始化完成，相似度阈值: {self.similarity_threshold}，二次确认: {self.verify}")
+
+    def set_encoder(self, encode_fn: Callable[[str], Any], encoder_id: str):
+        """接入嵌入模型；编码器变化时旧向量不可比较，清空缓存"""
+        with self.lock:
+            if encoder_id != self.encoder_id:
+                self.clear()
+            self.encode_fn = encode_fn
+            self.encoder_id = encoder_id
+        logger.info(f"语义缓存编码器: {encoder_id}")
+
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        vector = np.asarray(self.encode_fn(query), dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            return None
+        return vector / norm
+
+    @property
+    def serving(self) -> bool:
+        """是否提供命中（兜底编码器只存不取）"""
+        return self.encoder_id != FALLBACK_ENCODER_ID
+
+    def _confirm(self, tokens: FrozenSet[str], terms: Tuple[FrozenSet[str], FrozenSet[str]],
+                 entry: SemanticCacheEntry) -> bool:
+        if self.verify == "token_set":
+            return tokens == entry.tokens
+        if self.verify == "key_terms":
+            return self._terms_agree(terms, entry.terms)
+        return True
+
+    @staticmethod
+    def _terms_agree(terms: Tuple[FrozenSet[str], FrozenSet[str]],
+                     other: Tuple[FrozenSet[str], FrozenSet[str]]) -> bool:
+        """数字 / 序数、否定词必须一致；专名只在双方都出现时比较（"ML" 与 "machine learning" 可以匹配）"""
+        (exact, entities), (other_exact, other_entities) = terms, other
+        return exact == other_exact and (not entities or not other_entities or entities == other_entities)
+
+    def calibrate(self, same_pairs: Sequence[Tuple[str, str]], different_pairs: Sequence[Tuple[str, str]],
+                  margin: float = 0.01) -> float:
+        """
+        用标注的查询对校准相似度阈值（使用当前编码器）
+
+        阈值取能通过二次确认的不同意图查询对的最高相似度加 margin，
+        被二次确认拦下的查询对不约束阈值。
+
+        Args:
+            same_pairs: 意图相同、应当命中的查询对
+            different_pairs: 意图不同、不应命中的查询对
+
+        Returns:
+            校准后的阈值（同时写入 similarity_threshold）
+        """
+        def similarity(a: str, b: str) -> float:
+            va, vb = self._embed(a), self._embed(b)
+            return 0.0 if va is None or vb is None else float(va @ vb)
+
+        def confirmed(a: str, b: str) -> bool:
+            entry = SemanticCacheEntry(entry_id=-1, query=b, partition=DEFAULT_PARTITION, result=None,
+                                       created_at=0.0, row=-1, tokens=normalize_tokens(b), terms=key_terms(b))
+            return self._confirm(normalize_tokens(a), key_terms(a), entry)
+
+        risky = [similarity(a, b) for a, b in different_pairs if confirmed(a, b)]
+        threshold = min(max(risky, default=0.0) + margin, 1.0)
+        same = [similarity(a, b) for a, b in same_pairs if confirmed(a, b)]
+        recall = sum(s >= threshold for s in same) / len(same_pairs) if same_pairs else 0.0
+
+        with self.lock:
+            self.similarity_threshold = threshold
+        logger.info(f"✅ 语义缓存阈值校准为 {threshold:.3f}，相同意图查询对命中率 {recall:.0%}")
+        return threshold
+
+    def lookup(self, query: str, partition: str = DEFAULT_PARTITION) -> Optional[Dict[str, Any]]:
+        """
+        查找语义相近的缓存结果
+
+        相似度不低于阈值的候选按相似度降序逐个确认，第一个通过二次确认且未过期的条目为命中。
+
+        Returns:
+            命中时返回 {"result", "similarity", "cached_query"}，否则 None
+        """
+        if not self.serving:
+            with self.lock:
+                self.fallback_skips += 1
+                self.misses += 1
+            return None
+
+        vector = self._embed(query)
+        tokens = normalize_tokens(query)
+        terms = key_terms(query)
+
+        with self.lock:
+            index = self.partitions.get(partition)
+            if vector is None or index is None or len(index) == 0 or index.dim != vector.shape[0]:
+                self.misses += 1
+                return None
+
+            entry, similarity = None, 0.0
+            now = time.time()
+            for entry_id, candidate_similarity in index.search_above(vector, self.similarity_threshold):
+                candidate = self.entries[entry_id]
+                if self.ttl_seconds is not None and now - candidate.created_at > self.ttl_seconds:
+                    self._remove(candidate)
+                    self.expirations += 1
+                    continue
+                if not self._confirm(tokens, terms, candidate):
+                    self.rejections += 1
+                    continue
+                entry, similarity = candidate, candidate_similarity
+                break
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry.hits += 1
+            self.entries.move_to_end(entry.entry_id)
+            self.hits += 1
+
+        logger.info(f"🎯 命中语义缓存 (相似度 {similarity:.3f}): {query[:50]} ≈ {entry.query[:50]}")
+        return {"result": entry.result, "similarity": similarity, "cached_query": entry.query}
+
+    def store(self, query: str, result: Any, partition: str = DEFAULT_PARTITION):
+        """缓存查询结果；与已有条目几乎相同时覆盖旧结果。兜底编码器下不缓存（接入嵌入模型时会清空）"""
+        if not self.serving or self.max_cache_size <= 0:
+            return
+        vector = self._embed(query)
+        if vector is None:
+            return
+
+        with self.lock:
+            index = self.partitions.get(partition)
+            if index is not None and index.dim != vector.shape[0]:
+                # 编码器维度变化，旧分区作废
+                for entry_id in list(index.entry_ids):
+                    del self.entries[entry_id]
+                index = None
+            if index is None:
+                index = self.partitions[partition] = _PartitionIndex(vector.shape[0])
+
+            tokens = normalize_tokens(query)
+            if len(index) > 0:
+                row, similarity = index.search(vector)
+                if similarity >= 0.999 and self.entries[index.entry_ids[row]].tokens == tokens:
+                    self._remove(self.entries[index.entry_ids[row]])
+
+            while len(self.entries) >= self.max_cache_size:
+                _, oldest = self.entries.popitem(last=False)
+                self._remove_from_index(oldest)
+                self.evictions += 1
+
+            entry_id = self._next_id
+            self._next_id += 1
+            row = index.add(vector, entry_id)
+            self.entries[entry_id] = SemanticCacheEntry(
+                entry_id=entry_id,
+                query=query,
+                partition=partition,
+                result=result,
+                created_at=time.time(),
+                row=row,
+                tokens=tokens,
+                terms=key_terms(query)
+            )
+
+    def _remove(self, entry: SemanticCacheEntry):
+        del self.entries[entry.entry_id]
+        self._remove_from_index(entry)
+
+    def _remove_from_index(self, entry: SemanticCacheEntry):
+        index = self.partitions[entry.partition]
+        moved = index.remove(entry.row)
+        if moved is not None:
+            self.entries[moved].row = entry.row
+        if len(index) == 0:
+            del self.partitions[entry.partition]
+
+    def invalidate(self, partition: Optional[str] = None):
+        """清除指定分区（语料或索引更新后调用）；partition 为 None 时清空全部"""
+        with self.lock:
+            if partition is None:
+                self.clear()
+                return
+            index = self.partitions.pop(partition, None)
+            if index is not None:
+                for entry_id in index.entry_ids:
+                    del self.entries[entry_id]
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.entries.clear()
+            self.partitions.clear()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'partitions': len(self.partitions),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total > 0 else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'rejections': self.rejections,
+                'fallback_skips': self.fallback_skips,
+                'similarity_threshold': self.similarity_threshold,
+                'verify': self.verify,
+                'encoder_id': self.encoder_id,
+                'serving': self.serving
+            }
+
+
+if __name__ == "__main__":
+    fallback = SemanticCache()
+    fallback.store("What is machine learning?", {"answer": "ML 是..."})
+    print(f"兜底编码器: 命中 {fallback.lookup('what is machine learning') is not None}，"
+          f"缓存条目 {fallback.get_statistics()['size']}")
+
+    # 以字符 n-gram 充当外部接入的编码器，演示二次确认
+    cache = SemanticCache({"similarity_threshold": 0.8, "max_cache_size": 3},
+                          encode_fn=char_ngram_embedding, encoder_id="demo")
+    cache.store("What is machine learning?", {"answer": "ML 是..."})
+    cache.store("Who was the first president of the United States?", {"answer": "George Washington"})
+    cache.store("How does BM25 work?", {"answer": "BM25 是..."}, partition="keyword_only")
+
+    for query, partition in [
+        ("what is machine learning", DEFAULT_PARTITION),
+        ("What is machine-learning??", DEFAULT_PARTITION),
+        ("Who was the third president of the United States?", DEFAULT_PARTITION),
+        ("How does BM25 work?", DEFAULT_PARTITION),
+        ("how does bm25 work", "keyword_only"),
+        ("Explain transformers", DEFAULT_PARTITION),
+    ]:
+        hit = cache.lookup(query, partition)
+        print(f"{query!r:55} [{partition}] -> {'命中 %.3f' % hit['similarity'] if hit else '未命中'}")
+
+    print(cache.get_statistics())
@@ -1 +1,146 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""
+=== 流式语料加载器 ===
+
+以生成器方式分块读取 JSONL 语料：
+1. 逐行读取，按 chunk_size 行为一块，内存占用与语料规模无关
+2. 可选多进程 JSON 解析（有界的 apply_async 窗口，保持行序）
+3. 将 HotpotQA / TriviaQA / MS MARCO / FlashRAG 等格式统一为 (id, title, content) 三元组，
+   不再保留原始记录的完整副本
+"""
+
+import json
+import logging
+import multiprocessing
+from collections import deque
+from itertools import islice
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (文档ID, 标题, 正文)
+DocumentRecord = Tuple[str, str, str]
+
+
+def record_to_document(data: Dict[str, Any], line_no: int) -> DocumentRecord:
+    """将一条原始记录转换为 (id, title, content)"""
+    doc_id = str(data.get('id', data.get('_id', f"doc_{line_no}")))
+
+    if 'question' in data and 'answer' in data:
+        # HotpotQA格式
+        question = data.get('question', '')
+        return doc_id, question[:100], f"问题: {question}\n答案: {data.get('answer', '')}"
+
+    if 'query' in data and 'golden_answers' in data:
+        # TriviaQA格式
+        query = data.get('query', '')
+        return doc_id, query[:100], f"问题: {query}\n答案: {', '.join(data.get('golden_answers', []))}"
+
+    if 'contents' in data:
+        # FlashRAG 语料格式: 首行为标题
+        contents = data['contents']
+        title = data.get('title') or contents.split('\n', 1)[0]
+        return doc_id, title[:100], contents
+
+    for text_key in ('passage', 'text', 'content'):
+        if text_key in data:
+            # MS MARCO / 通用段落格式
+            text = str(data[text_key])
+            return doc_id, str(data.get('title', text))[:100], text
+
+    # 通用格式
+    text = str(data)
+    return doc_id, text[:100], text
+
+
+def _parse_lines(chunk: Tuple[int, List[str]]) -> List[DocumentRecord]:
+    """解析一块 JSONL 行（模块级函数，便于多进程序列化）"""
+    start, lines = chunk
+    documents = []
+    for offset, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            documents.append(record_to_document(json.loads(line), start + offset))
+        except Exception as e:
+            logger.warning(f"跳过无效数据行 {start + offset}: {e}")
+    return documents
+
+
+def _iter_line_chunks(corpus_path: str, chunk_size: int,
+                      max_documents: Optional[int] = None,
+                      start_offset: int = 0, start_line: int = 0) -> Iterator[Tuple[int, List[str]]]:
+    """按块读取原始行，可从行首字节偏移 start_offset 开始（增量追加）"""
+    with open(corpus_path, 'r', encoding='utf-8') as f:
+        if start_offset:
+            f.seek(start_offset)
+        start = start_line
+        while max_documents is None or start < max_documents:
+            size = chunk_size if max_documents is None else min(chunk_size, max_documents - start)
+            lines = list(islice(f, size))
+            if not lines:
+                break
+            yield start, lines
+            start += len(lines)
+
+
+def count_lines(corpus_path: str, start_offset: int = 0, end_offset: Optional[int] = None,
+                block_size: int = 1 << 20) -> int:
+    """统计 [start_offset, end_offset) 字节区间内的行数（末尾没有换行的残行也计一行）"""
+    with open(corpus_path, 'rb') as f:
+        f.seek(start_offset)
+        remaining = None if end_offset is None else max(end_offset - start_offset, 0)
+        lines, last = 0, b"\n"
+        while remaining is None or remaining > 0:
+            block = f.read(block_size if remaining is None else min(block_size, remaining))
+            if not block:
+                break
+            lines += block.count(b"\n")
+            last = block[-1:]
+            if remaining is not None:
+                remaining -= len(block)
+    return lines + (last != b"\n")
+
+
+def iter_corpus_chunks(
+    corpus_path: str,
+    chunk_size: int = 10000,
+    num_workers: int = 0,
+    max_documents: Optional[int] = None,
+    start_offset: int = 0,
+    start_line: int = 0
+) -> Iterator[List[DocumentRecord]]:
+    """
+    流式读取语料，按块产出文档三元组
+
+    Args:
+        corpus_path: JSONL 语料路径
+        chunk_size: 每块行数
+        num_workers: JSON 解析进程数，0 表示在当前进程解析
+        max_documents: 最多读取的行数，None 表示不限制
+        start_offset: 起始字节偏移（必须位于行首），用于只读取追加的新行
+        start_line: 起始行号，缺少 id 的记录以行号生成文档 ID
+    """
+    line_chunks = _iter_line_chunks(corpus_path, chunk_size, max_documents, start_offset, start_line)
+
+    if num_workers and num_workers > 0:
+        with multiprocessing.Pool(num_workers) as pool:
+            # Pool.imap 的任务线程会读完整个输入迭代器，这里自行维护有界窗口：
+            # 最多 2 * num_workers 个块在途，按提交顺序产出
+            pending = deque()
+            for chunk in line_chunks:
+                pending.append(pool.apply_async(_parse_lines, (chunk,)))
+                if len(pending) >= 2 * num_workers:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+    else:
+        for chunk in line_chunks:
+            yield _parse_lines(chunk)
+
+
+def iter_corpus_documents(corpus_path: str, **kwargs) -> Iterator[DocumentRecord]:
+    """逐个产出文档三元组"""
+    for documents in iter_corpus_chunks(corpus_path, **kwargs):
+        yield from documents
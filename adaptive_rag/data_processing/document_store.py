@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+=== 列式文档库 ===
+
+1. DocumentStore: ID / 标题 / 正文分别拼接为 UTF-8 字节块，配合 int64 偏移数组，
+   磁盘上的文档库通过 mmap 随机访问
+2. DocumentHit: __slots__ 命中对象，只保存文档号与分数，
+   正文在需要时才从文档库解码，检索→融合→重排→生成链路中不再复制文档字典
+"""
+
+import json
+import logging
+import os
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 1
+STORE_META_FILE = "document_store_meta.json"
+STORE_COLUMNS = ("ids", "titles", "contents")
+
+
+class DocumentStoreWriter:
+    """
+    列式文档库写入器：正文直接追加到磁盘，内存中只保留偏移量
+
+    append=True 时在已有文档库末尾追加，已写入的文档不会重写。
+    """
+
+    def __init__(self, store_dir: str, append: bool = False):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+
+        self._offsets = {column: array('q', [0]) for column in STORE_COLUMNS}
+        if append and DocumentStore.exists(store_dir):
+            for column in STORE_COLUMNS:
+                offsets = np.load(os.path.join(store_dir, f"{column}_offsets.npy"))
+                blob_path = os.path.join(store_dir, f"{column}.bin")
+                # 上次写入中断时 .bin 可能长于偏移数组记录的长度，截掉未登记的尾部
+                with open(blob_path, 'r+b') as f:
+                    f.truncate(int(offsets[-1]))
+                self._offsets[column] = array('q', offsets.astype(np.int64).tolist())
+
+        mode = 'ab' if append else 'wb'
+        self._files = {
+            column: open(os.path.join(store_dir, f"{column}.bin"), mode)
+            for column in STORE_COLUMNS
+        }
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._offsets["ids"]) - 1
+
+    def add(self, documents: Iterable[Tuple[str, str, str]]):
+        for record in documents:
+            for column, value in zip(STORE_COLUMNS, record):
+                encoded = value.encode('utf-8')
+                self._files[column].write(encoded)
+                self._offsets[column].append(self._offsets[column][-1] + len(encoded))
+
+    def finalize(self, source: Optional[Dict[str, Any]] = None) -> "DocumentStore":
+        for column in STORE_COLUMNS:
+            self._files[column].close()
+            np.save(os.path.join(self.store_dir, f"{column}_offsets.npy"),
+                    np.frombuffer(self._offsets[column], dtype=np.int64))
+
+        meta = {
+            "version": STORE_FORMAT_VERSION,
+            "num_docs": self.num_docs,
+            "source": source or {}
+        }
+        with open(os.path.join(self.store_dir, STORE_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        return DocumentStore.load(self.store_dir)
+
+
+class DocumentStore:
+    """
+    只读列式文档库
+
+    支持 len() 与下标访问，store[i] 返回与原文档字典相同结构的新字典；
+    检索路径应使用 DocumentHit 引用文档号，避免逐条构造字典。
+    运行时通过 extend() 加入的文档保存在内存尾部，不写回磁盘。
+    """
+
+    def __init__(self, blobs: Dict[str, np.ndarray], offsets: Dict[str, np.ndarray],
+                 meta: Dict[str, Any], store_dir: Optional[str] = None):
+        self.store_dir = store_dir
+        self.meta = meta
+        self.num_docs = meta["num_docs"]
+        self._blobs = blobs
+        self._offsets = offsets
+        self._base_docs = self.num_docs
+        self._tail: List[Tuple[str, str, str]] = []
+
+    @staticmethod
+    def exists(store_dir: str) -> bool:
+        return os.path.exists(os.path.join(store_dir, STORE_META_FILE))
+
+    @classmethod
+    def load(cls, store_dir: str) -> "DocumentStore":
+        with open(os.path.join(store_dir, STORE_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get("version") != STORE_FORMAT_VERSION:
+            raise ValueError(f"文档库版本不兼容: {meta.get('version')} != {STORE_FORMAT_VERSION}")
+
+        blobs, offsets = {}, {}
+        for column in STORE_COLUMNS:
+            blob_path = os.path.join(store_dir, f"{column}.bin")
+            if os.path.getsize(blob_path) > 0:
+                blobs[column] = np.memmap(blob_path, dtype=np.uint8, mode='r')
+            else:
+                blobs[column] = np.empty(0, dtype=np.uint8)
+            offsets[column] = np.load(os.path.join(store_dir, f"{column}_offsets.npy"), mmap_mode='r')
+        return cls(blobs, offsets, meta, store_dir=store_dir)
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, str, str]]) -> "DocumentStore":
+        """由 (id, title, content) 在内存中构建文档库（示例数据、小语料）"""
+        columns = {column: [] for column in STORE_COLUMNS}
+        for record in records:
+            for column, value in zip(STORE_COLUMNS, record):
+                columns[column].append(value.encode('utf-8'))
+
+        blobs, offsets = {}, {}
+        for column, values in columns.items():
+            blobs[column] = np.frombuffer(b"".join(values), dtype=np.uint8)
+            offsets[column] = np.zeros(len(values) + 1, dtype=np.int64)
+            offsets[column][1:] = np.cumsum([len(value) for value in values])
+        return cls(blobs, offsets, {"version": STORE_FORMAT_VERSION, "num_docs": len(columns["ids"])})
+
+    @staticmethod
+    def source_signature(corpus_path: str) -> Dict[str, Any]:
+        """语料文件签名（路径 + 大小 + 修改时间），用于判断缓存是否过期"""
+        stat = os.stat(corpus_path)
+        return {
+            "path": os.path.abspath(corpus_path),
+            "size": stat.st_size,
+            "mtime": int(stat.st_mtime)
+        }
+
+    def matches_source(self, corpus_path: str, max_documents: Optional[int] = None) -> bool:
+        source = self.meta.get("source", {})
+        return (source.get("max_documents") == max_documents and
+                {k: source.get(k) for k in ("path", "size", "mtime")} == self.source_signature(corpus_path))
+
+    @property
+    def num_persisted(self) -> int:
+        """落盘部分的文档数（不含运行时 extend 加入的文档），持久化索引只覆盖这一前缀"""
+        return self._base_docs
+
+    def extend(self, records: Iterable[Tuple[str, str, str]]) -> List[int]:
+        """运行时追加 (id, title, content)，返回新文档号"""
+        start = self.num_docs
+        self._tail.extend((str(doc_id), str(title), str(content)) for doc_id, title, content in records)
+        self.num_docs = self._base_docs + len(self._tail)
+        return list(range(start, self.num_docs))
+
+    def _get(self, column: str, i: int) -> str:
+        if i >= self._base_docs:
+            return self._tail[i - self._base_docs][STORE_COLUMNS.index(column)]
+        offsets = self._offsets[column]
+        return self._blobs[column][offsets[i]:offsets[i + 1]].tobytes().decode('utf-8')
+
+    def get_id(self, i: int) -> str:
+        return self._get("ids", i)
+
+    def get_title(self, i: int) -> str:
+        return self._get("titles", i)
+
+    def get_content(self, i: int) -> str:
+        return self._get("contents", i)
+
+    def hit(self, i: int, score: float, retrieval_type: str) -> "DocumentHit":
+        return DocumentHit(self, int(i), float(score), retrieval_type)
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if i < 0:
+            i += self.num_docs
+        if not 0 <= i < self.num_docs:
+            raise IndexError(f"文档下标越界: {i}")
+        return {
+            "id": self.get_id(i),
+            "title": self.get_title(i),
+            "content": self.get_content(i),
+            "metadata": {"doc_index": int(i)}
+        }
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.num_docs):
+            yield self[i]
+
+    def iter_content_batches(self, batch_size: int = 1024) -> Iterator[List[str]]:
+        """按批遍历正文，用于重建索引"""
+        for start in range(0, self.num_docs, batch_size):
+            yield [self.get_content(i) for i in range(start, min(start + batch_size, self.num_docs))]
+
+    def get_store_info(self) -> Dict[str, Any]:
+        return {
+            "store_dir": self.store_dir,
+            "num_docs": self.num_docs,
+            "content_bytes": int(self._offsets["contents"][-1]),
+            "runtime_docs": len(self._tail),
+            "source": self.meta.get("source", {})
+        }
+
+
+class DocumentHit:
+    """
+    检索命中
+
+    只持有文档库引用、文档号和分数。为兼容现有的字典式调用方
+    （doc.get('content')、doc['score'] = ...），提供只读的字典接口，
+    并允许写入分数相关字段；输出到界面时用 to_dict() 物化。
+    """
+
+    __slots__ = ("store", "doc_index", "score", "retrieval_type", "rerank_score", "rerank_position")
+
+    _STORE_FIELDS = {"id": "get_id", "title": "get_title", "content": "get_content"}
+    _WRITABLE_FIELDS = ("score", "retrieval_type", "rerank_score", "rerank_position")
+
+    def __init__(self, store: DocumentStore, doc_index: int, score: float, retrieval_type: str):
+        self.store = store
+        self.doc_index = doc_index
+        self.score = score
+        self.retrieval_type = retrieval_type
+        self.rerank_score = None
+        self.rerank_position = None
+
+    @property
+    def id(self) -> str:
+        return self.store.get_id(self.doc_index)
+
+    @property
+    def title(self) -> str:
+        return self.store.get_title(self.doc_index)
+
+    @property
+    def content(self) -> str:
+        return self.store.get_content(self.doc_index)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._STORE_FIELDS:
+            return getattr(self.store, self._STORE_FIELDS[key])(self.doc_index)
+        if key == "metadata":
+            return {"doc_index": self.doc_index}
+        if key in self._WRITABLE_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self._WRITABLE_FIELDS:
+            raise KeyError(f"DocumentHit 不支持写入字段: {key}")
+        setattr(self, key, value)
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self) -> Dict[str, Any]:
+        doc = {
+            "id": self.id,
+            "title": self.title,
+            "content": self.content,
+            "metadata": {"doc_index": self.doc_index},
+            "score": self.score,
+            "retrieval_type": self.retrieval_type
+        }
+        if self.rerank_score is not None:
+            doc["rerank_score"] = self.rerank_score
+            doc["rerank_position"] = self.rerank_position
+        return doc
+
+    def __repr__(self) -> str:
+        return f"DocumentHit(doc_index={self.doc_index}, score={self.score:.4f}, retrieval_type={self.retrieval_type!r})"
+
+
+def materialize_hits(documents: List[Any]) -> List[Dict[str, Any]]:
+    """将命中对象转换为字典（混合列表中已是字典的保持不变），用于界面输出与序列化"""
+    return [doc.to_dict() if isinstance(doc, DocumentHit) else doc for doc in documents]
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+=== 索引清单 ===
+
+缓存目录下的 index_manifest.json 记录每个索引产物（文档库、BM25、稠密索引、ANN 索引）
+构建时的语料指纹与构建参数（编码器、分词器、k1/b、数据类型等），启动时逐个校验：
+1. valid: 语料与参数都未变化，直接加载
+2. append: 参数未变，语料只在末尾追加了新行，只处理新增部分
+3. stale / missing: 需要重建，只重建失效的产物
+
+语料指纹 = 路径 + 大小 + 修改时间 + 首部 / 尾部 64KB 的 MD5。
+判断追加时，检查新文件的前缀是否与旧指纹记录的首部、尾部一致。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_FILE = "index_manifest.json"
+FINGERPRINT_BYTES = 64 * 1024
+
+VALID = "valid"
+APPEND = "append"
+STALE = "stale"
+MISSING = "missing"
+
+
+def _region_md5(f, start: int, end: int) -> str:
+    f.seek(start)
+    return hashlib.md5(f.read(max(end - start, 0))).hexdigest()
+
+
+def corpus_fingerprint(corpus_path: str, max_documents: Optional[int] = None) -> Dict[str, Any]:
+    """计算语料指纹：只读取首尾各 64KB，与语料规模无关"""
+    stat = os.stat(corpus_path)
+    size = stat.st_size
+    with open(corpus_path, 'rb') as f:
+        head_md5 = _region_md5(f, 0, min(size, FINGERPRINT_BYTES))
+        tail_md5 = _region_md5(f, max(size - FINGERPRINT_BYTES, 0), size)
+        f.seek(max(size - 1, 0))
+        ends_with_newline = f.read(1) == b"\n"
+    return {
+        "path": os.path.abspath(corpus_path),
+        "size": size,
+        "mtime": int(stat.st_mtime),
+        "head_md5": head_md5,
+        "tail_md5": tail_md5,
+        "ends_with_newline": ends_with_newline,
+        "max_documents": max_documents
+    }
+
+
+def is_appended(old: Optional[Dict[str, Any]], corpus_path: str, current: Dict[str, Any]) -> bool:
+    """判断当前语料是否只是在旧语料末尾追加了新行"""
+    if not old or old.get("path") != current["path"]:
+        return False
+    # 截断读取（max_documents）时无法确定追加的行从哪里开始
+    if old.get("max_documents") is not None or current["max_documents"] is not None:
+        return False
+    old_size = old.get("size", 0)
+    if current["size"] <= old_size or not old.get("ends_with_newline"):
+        return False
+
+    with open(corpus_path, 'rb') as f:
+        return (_region_md5(f, 0, min(old_size, FINGERPRINT_BYTES)) == old.get("head_md5") and
+                _region_md5(f, max(old_size - FINGERPRINT_BYTES, 0), old_size) == old.get("tail_md5"))
+
+
+def _canonical(params: Dict[str, Any]) -> Dict[str, Any]:
+    """参数经 JSON 往返规范化（元组变列表等），保证与从文件读出的记录可比较"""
+    return json.loads(json.dumps(params, sort_keys=True, default=str))
+
+
+class IndexManifest:
+    """
+    索引清单
+
+    Args:
+        cache_dir: 索引缓存目录
+        corpus_path: 当前语料路径
+        max_documents: 当前读取的最大文档数
+    """
+
+    def __init__(self, cache_dir: str, corpus_path: str, max_documents: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, MANIFEST_FILE)
+        self.corpus_path = corpus_path
+        self.corpus = corpus_fingerprint(corpus_path, max_documents)
+        self.artifacts: Dict[str, Dict[str, Any]] = self._load()
+        self._append_checks: Dict[str, bool] = {}
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ 索引清单读取失败，所有索引将重建: {e}")
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            logger.warning(f"⚠️ 索引清单版本不兼容: {manifest.get('version')} != {MANIFEST_VERSION}")
+            return {}
+        return manifest.get("artifacts", {})
+
+    def save(self):
+        """原子写入：先写临时文件再替换，中断时不会留下半个清单"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "artifacts": self.artifacts}, f,
+                      ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self.artifacts.get(name)
+
+    def status(self, name: str, params: Dict[str, Any], exists: bool = True,
+               num_docs: Optional[int] = None) -> str:
+        """
+        校验产物
+
+        Args:
+            name: 产物名
+            params: 当前构建参数，与记录不一致即失效
+            exists: 产物文件是否存在
+            num_docs: 期望的文档数（依赖文档库的产物），语料未变时用于交叉校验
+        """
+        record = self.artifacts.get(name)
+        if record is None or not exists:
+            return MISSING
+        if record.get("params") != _canonical(params):
+            logger.info(f"⚠️ {name} 构建参数已变化: {record.get('params')} -> {_canonical(params)}")
+            return STALE
+        if record.get("corpus") == self.corpus:
+            if num_docs is not None and record.get("num_docs") != num_docs:
+                return STALE
+            return VALID
+        if self._is_appended(record.get("corpus")):
+            return APPEND
+        return STALE
+
+    def _is_appended(self, old: Optional[Dict[str, Any]]) -> bool:
+        key = json.dumps(old, sort_keys=True)
+        if key not in self._append_checks:
+            self._append_checks[key] = is_appended(old, self.corpus_path, self.corpus)
+        return self._append_checks[key]
+
+    def record(self, name: str, params: Dict[str, Any], num_docs: int):
+        """登记构建完成的产物（立即写盘）"""
+        self.artifacts[name] = {
+            "params": _canonical(params),
+            "corpus": self.corpus,
+            "num_docs": int(num_docs),
+            "built_at": time.time()
+        }
+        self.save()
+
+    def invalidate(self, name: str):
+        if self.artifacts.pop(name, None) is not None:
+            self.save()
+
+    def get_summary(self) -> Dict[str, Any]:
+        return {
+            name: {"num_docs": record.get("num_docs"), "built_at": record.get("built_at")}
+            for name, record in self.artifacts.items()
+        }
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus = os.path.join(tmp_dir, "corpus.jsonl")
+        with open(corpus, 'w', encoding='utf-8') as f:
+            f.write('{"id": "1", "contents": "a"}\n')
+
+        manifest = IndexManifest(tmp_dir, corpus)
+        params = {"encoder": "e5-base-v2", "dtype": "float32"}
+        print(f"首次: {manifest.status('dense_index', params)}")
+        manifest.record("dense_index", params, num_docs=1)
+
+        print(f"未变化: {IndexManifest(tmp_dir, corpus).status('dense_index', params)}")
+        print(f"换编码器: {IndexManifest(tmp_dir, corpus).status('dense_index', {**params, 'encoder': 'bge'})}")
+
+        with open(corpus, 'a', encoding='utf-8') as f:
+            f.write('{"id": "2", "contents": "b"}\n')
+        print(f"追加后: {IndexManifest(tmp_dir, corpus).status('dense_index', params)}")
+
+        with open(corpus, 'w', encoding='utf-8') as f:
+            f.write('{"id": "3", "contents": "c"}\n')
+        print(f"改写后: {IndexManifest(tmp_dir, corpus).status('dense_index', params)}")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+=== 近似去重（MinHash + LSH） ===
+
+原先的去重对每一对文档重新分词并求词集合的 Jaccard 相似度，复杂度 O(n²)。这里：
+1. 每篇文档只分词一次，得到词集合
+2. 用 num_perm 个哈希函数计算 MinHash 签名（整批向量化计算）
+3. 签名切分为 bands 段，同一段完全相同的文档落入同一个桶，只有同桶文档才成为候选对
+4. 候选对用词集合精确校验 Jaccard > threshold，LSH 只负责筛选，不引入误判
+
+按输入顺序贪心保留：与已保留文档重复的文档被丢弃，调用方先按分数排序即可保留高分文档。
+"""
+
+import logging
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import AbstractSet, Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEDUP_CONFIG = {
+    "enabled": True,
+    # 词集合 Jaccard 相似度超过该值视为重复
+    "threshold": 0.85,
+    "num_perm": 64,
+    # 文档数不超过该值时直接两两比较（仍只分词一次）
+    "exact_below": 16,
+    "seed": 1
+}
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def tokenize(text: str) -> Set[str]:
+    """与原有重复检测一致：小写后按空白切分"""
+    return set(text.lower().split())
+
+
+def jaccard(tokens1: AbstractSet[str], tokens2: AbstractSet[str]) -> float:
+    if not tokens1 or not tokens2:
+        return 0.0
+    intersection = len(tokens1 & tokens2)
+    return intersection / (len(tokens1) + len(tokens2) - intersection)
+
+
+@lru_cache(maxsize=32)
+def optimal_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    选择 (bands, rows)，bands * rows <= num_perm
+
+    成为候选对的概率为 1 - (1 - s^r)^b。候选对会被精确校验，误报只多一次集合运算，
+    漏报则直接漏掉重复文档，因此漏报的权重取得更高。
+    """
+    similarities = np.linspace(0.0, 1.0, 201)
+    below = similarities < threshold
+    best, best_cost = (num_perm, 1), float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        probability = 1.0 - (1.0 - similarities ** rows) ** bands
+        false_positive = probability[below].mean() if below.any() else 0.0
+        false_negative = (1.0 - probability[~below]).mean() if (~below).any() else 0.0
+        cost = 0.1 * false_positive + 0.9 * false_negative
+        if cost < best_cost:
+            best, best_cost = (bands, rows), cost
+    return best
+
+
+class MinHashDeduplicator:
+    """
+    MinHash / LSH 去重器
+
+    Args:
+        threshold: Jaccard 相似度阈值（严格大于时视为重复）
+        num_perm: MinHash 签名长度
+        exact_below: 文档数不超过该值时跳过 LSH，直接两两校验
+        seed: 哈希函数随机种子（固定后签名可复现）
+        enabled: 为 False 时只去除正文完全相同的文档
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, exact_below: int = 16,
+                 seed: int = 1, enabled: bool = True):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.exact_below = exact_below
+        self.enabled = enabled
+        self.bands, self.rows = optimal_bands(num_perm, threshold)
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+        self.stats = Counter()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None, **overrides) -> "MinHashDeduplicator":
+        merged = dict(DEFAULT_DEDUP_CONFIG)
+        merged.update(config or {})
+        merged.update(overrides)
+        return cls(
+            threshold=merged["threshold"],
+            num_perm=merged["num_perm"],
+            exact_below=merged["exact_below"],
+            seed=merged["seed"],
+            enabled=merged["enabled"]
+        )
+
+    def signatures(self, token_sets: Sequence[AbstractSet[str]]) -> np.ndarray:
+        """批量计算 MinHash 签名，返回 (文档数, num_perm)；空文档的签名为全 0（不会参与比较）"""
+        lengths = np.fromiter((len(tokens) for tokens in token_sets), dtype=np.int64, count=len(token_sets))
+        result = np.zeros((len(token_sets), self.num_perm), dtype=np.uint64)
+        non_empty = np.flatnonzero(lengths)
+        if non_empty.size == 0:
+            return result
+
+        hashes = np.fromiter(
+            (zlib.crc32(token.encode("utf-8")) for i in non_empty for token in token_sets[i]),
+            dtype=np.uint64, count=int(lengths.sum())
+        ) % np.uint64(_MERSENNE_PRIME)
+        # (a * x + b) mod p，a、x < 2^31，乘积不会溢出 uint64
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_MERSENNE_PRIME)
+        offsets = np.concatenate(([0], np.cumsum(lengths[non_empty])[:-1]))
+        # 沿连续内存的最后一维分段求最小值
+        result[non_empty] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return result
+
+    def select(self, texts: Sequence[str]) -> List[int]:
+        """返回按输入顺序保留的下标"""
+        if not self.enabled:
+            seen, kept = set(), []
+            for i, text in enumerate(texts):
+                if text not in seen:
+                    seen.add(text)
+                    kept.append(i)
+            return kept
+        return self.select_token_sets([tokenize(text) for text in texts])
+
+    def select_token_sets(self, token_sets: Sequence[AbstractSet[str]]) -> List[int]:
+        """对已分词的词集合去重（调用方已缓存分词结果时使用），返回按输入顺序保留的下标"""
+        token_sets = list(token_sets)
+        if len(token_sets) <= self.exact_below:
+            kept = self._select_exact(token_sets)
+        else:
+            kept = self._select_lsh(token_sets)
+        self.stats["documents"] += len(token_sets)
+        self.stats["duplicates"] += len(token_sets) - len(kept)
+        return kept
+
+    def _select_exact(self, token_sets: List[AbstractSet[str]]) -> List[int]:
+        kept: List[int] = []
+        for i, tokens in enumerate(token_sets):
+            self.stats["comparisons"] += len(kept)
+            if not any(jaccard(tokens, token_sets[j]) > self.threshold for j in kept):
+                kept.append(i)
+        return kept
+
+    def _select_lsh(self, token_sets: List[AbstractSet[str]]) -> List[int]:
+        signatures = self.signatures(token_sets)
+        buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        kept: List[int] = []
+
+        for i, tokens in enumerate(token_sets):
+            if not tokens:
+                # 空文档与任何文档的相似度都为 0
+                kept.append(i)
+                continue
+
+            keys = [signatures[i, band * self.rows:(band + 1) * self.rows].tobytes()
+                    for band in range(self.bands)]
+            candidates = set()
+            for band, key in enumerate(keys):
+                candidates.update(buckets[band].get(key, ()))
+            self.stats["comparisons"] += len(candidates)
+
+            if any(jaccard(tokens, token_sets[j]) > self.threshold for j in candidates):
+                continue
+            kept.append(i)
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(i)
+        return kept
+
+    def deduplicate(self, items: Sequence[Any], text_fn: Callable[[Any], str] = lambda item: item.content,
+                    token_sets: Optional[Sequence[AbstractSet[str]]] = None) -> List[Any]:
+        """对任意文档对象去重（默认读取 item.content，也可直接给出词集合），保持输入顺序"""
+        items = list(items)
+        if token_sets is not None and self.enabled:
+            kept = self.select_token_sets(token_sets)
+        else:
+            kept = self.select([text_fn(item) for item in items])
+        return [items[i] for i in kept]
+
+    def get_statistics(self) -> Dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "bands": self.bands,
+            "rows": self.rows,
+            **self.stats
+        }
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    random.seed(0)
+    vocabulary = [f"w{i}" for i in range(5000)]
+    originals = [" ".join(random.choices(vocabulary, k=80)) for _ in range(1000)]
+    texts = []
+    for text in originals:
+        texts.append(text)
+        words = text.split()
+        words[random.randrange(len(words))] = random.choice(vocabulary)
+        texts.append(" ".join(words))  # 近似重复
+    random.shuffle(texts)
+
+    deduplicator = MinHashDeduplicator(threshold=0.85)
+    start = time.perf_counter()
+    kept = deduplicator.select(texts)
+    lsh_ms = (time.perf_counter() - start) * 1000
+
+    exact = MinHashDeduplicator(threshold=0.85, exact_below=len(texts))
+    start = time.perf_counter()
+    reference = exact.select(texts)
+    exact_ms = (time.perf_counter() - start) * 1000
+
+    print(f"bands={deduplicator.bands} rows={deduplicator.rows}")
+    print(f"LSH: 保留 {len(kept)}/{len(texts)}，{lsh_ms:.0f}ms，比较 {deduplicator.stats['comparisons']} 次")
+    print(f"两两比较: 保留 {len(reference)}/{len(texts)}，{exact_ms:.0f}ms，比较 {exact.stats['comparisons']} 次")
+    print(f"结果一致: {kept == reference}")
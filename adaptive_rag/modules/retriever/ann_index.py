@@ -0,0 +1,743 @@
+#!/usr/bin/env python3
+"""
+=== 近似最近邻索引 ===
+
+为稠密检索提供可插拔的 ANN 后端：
+1. ivf / ivf_pq: 纯 NumPy 实现的倒排文件索引（可选乘积量化压缩）
+2. hnsw: 基于 hnswlib 或 faiss 的 HNSW 图索引（可选依赖）
+3. flat: 精确检索（直接使用 ShardedDenseIndex）
+
+所有索引统一提供 search(query_embedding, top_k) -> (文档下标, 分数) 接口
+和批量的 search_batch(query_embeddings, top_k) -> [(文档下标, 分数)] 接口，
+并可通过 evaluate_ann_recall 与精确检索对比 recall@k 与延迟。
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .dense_retriever import ShardedDenseIndex, normalize_embeddings, top_k_from_scores, top_k_per_row
+
+logger = logging.getLogger(__name__)
+
+# 可选依赖
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+ANN_FORMAT_VERSION = 1
+ANN_META_FILE = "ann_index_meta.json"
+SUPPORTED_INDEX_TYPES = ("flat", "ivf", "ivf_pq", "hnsw")
+
+DEFAULT_INDEX_CONFIG = {
+    "index_type": "flat",      # flat / ivf / ivf_pq / hnsw
+    "backend": "numpy",        # numpy / faiss / hnswlib
+    "nlist": 1024,             # IVF 聚类中心数
+    "nprobe": 16,              # 查询时探测的倒排列表数
+    "pq_m": 16,                # PQ 子空间数（ivf_pq）
+    "pq_bits": 8,              # 每个子空间码本位数
+    "rerank_factor": 4,        # 用精确向量重排 top_k * rerank_factor 个候选
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "train_size": 100000,      # 训练样本上限
+    "kmeans_iters": 15,
+    "seed": 42
+}
+
+EmbeddingSource = Union[np.ndarray, ShardedDenseIndex]
+
+
+def _iter_source_blocks(source: EmbeddingSource, block_size: int = 65536) -> Iterator[Tuple[int, np.ndarray]]:
+    """统一遍历 ndarray 或分片索引中的向量块"""
+    if isinstance(source, ShardedDenseIndex):
+        yield from source.iter_blocks(block_size)
+    else:
+        for start in range(0, source.shape[0], block_size):
+            yield start, normalize_embeddings(source[start:start + block_size])
+
+
+def _sample_vectors(source: EmbeddingSource, sample_size: int, seed: int) -> np.ndarray:
+    """随机抽取训练样本"""
+    total = len(source)
+    rng = np.random.default_rng(seed)
+    if total <= sample_size:
+        indices = np.arange(total)
+    else:
+        indices = np.sort(rng.choice(total, size=sample_size, replace=False))
+    if isinstance(source, ShardedDenseIndex):
+        return source.get_vectors(indices)
+    return normalize_embeddings(source[indices])
+
+
+def kmeans(vectors: np.ndarray, k: int, iters: int = 15, seed: int = 42,
+           spherical: bool = True) -> np.ndarray:
+    """Lloyd k-means；spherical=True 时按内积分配并归一化中心"""
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, vectors.shape[0]))
+    centroids = vectors[rng.choice(vectors.shape[0], size=k, replace=False)].copy()
+
+    for _ in range(iters):
+        assignments = assign_to_centroids(vectors, centroids, spherical=spherical)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # 空簇重新随机初始化
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(vectors.shape[0], size=int(empty.sum()))]
+        if spherical:
+            centroids = normalize_embeddings(centroids)
+
+    return centroids.astype(np.float32)
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, spherical: bool = True,
+                        block_size: int = 16384) -> np.ndarray:
+    """将向量分配到最近的中心"""
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    centroid_norms = None if spherical else (centroids ** 2).sum(axis=1)
+    for start in range(0, vectors.shape[0], block_size):
+        block = vectors[start:start + block_size]
+        products = block @ centroids.T
+        if spherical:
+            assignments[start:start + block_size] = products.argmax(axis=1)
+        else:
+            assignments[start:start + block_size] = (centroid_norms - 2 * products).argmin(axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    倒排文件索引（纯 NumPy）
+
+    - 粗量化：球面 k-means 得到 nlist 个中心，每个文档归入最近中心的倒排列表
+    - 存储：pq_m == 0 时保存原始向量（IVF-Flat），否则保存 PQ 编码（IVF-PQ）
+    - 查询：探测 nprobe 个最近的列表，PQ 模式下用查表法 (ADC) 计算内积，
+      再可选地用精确向量对候选重排
+    """
+
+    def __init__(self, nlist: int = 1024, nprobe: int = 16, pq_m: int = 0, pq_bits: int = 8,
+                 rerank_factor: int = 4, dtype: str = "float32", train_size: int = 100000,
+                 kmeans_iters: int = 15, seed: int = 42):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.rerank_factor = rerank_factor
+        self.dtype = dtype
+        self.train_size = train_size
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+
+        self.dim: Optional[int] = None
+        self.num_docs = 0
+        self.centroids: Optional[np.ndarray] = None
+        self.pq_codebooks: Optional[np.ndarray] = None   # (pq_m, ksub, dsub)
+        self.list_offsets: Optional[np.ndarray] = None   # (nlist + 1,)
+        self.list_ids: Optional[np.ndarray] = None       # 按列表排序后的文档下标
+        self.list_data: Optional[np.ndarray] = None      # 向量或 PQ 编码，与 list_ids 对齐
+
+        # 精确向量来源，用于候选重排
+        self.exact_source: Optional[ShardedDenseIndex] = None
+        # 构建参数（见 ann_build_config），随索引持久化，加载时与当前配置比较
+        self.build_config: Optional[Dict[str, Any]] = None
+
+    @property
+    def index_type(self) -> str:
+        return "ivf_pq" if self.pq_m else "ivf"
+
+    # ===== 构建 =====
+
+    def train(self, source: EmbeddingSource):
+        """训练粗量化器和 PQ 码本"""
+        sample = _sample_vectors(source, self.train_size, self.seed)
+        self.dim = int(sample.shape[1])
+        self.nlist = max(1, min(self.nlist, sample.shape[0]))
+        self.centroids = kmeans(sample, self.nlist, iters=self.kmeans_iters, seed=self.seed)
+
+        if self.pq_m:
+            if self.dim % self.pq_m != 0:
+                raise ValueError(f"维度 {self.dim} 不能被 pq_m={self.pq_m} 整除")
+            dsub = self.dim // self.pq_m
+            ksub = min(2 ** self.pq_bits, sample.shape[0])
+            self.pq_codebooks = np.stack([
+                kmeans(sample[:, m * dsub:(m + 1) * dsub], ksub, iters=self.kmeans_iters,
+                       seed=self.seed + m, spherical=False)
+                for m in range(self.pq_m)
+            ])
+
+    def _encode_pq(self, vectors: np.ndarray) -> np.ndarray:
+        dsub = self.dim // self.pq_m
+        code_dtype = np.uint8 if self.pq_codebooks.shape[1] <= 256 else np.uint16
+        codes = np.empty((vectors.shape[0], self.pq_m), dtype=code_dtype)
+        for m in range(self.pq_m):
+            codes[:, m] = assign_to_centroids(
+                vectors[:, m * dsub:(m + 1) * dsub], self.pq_codebooks[m], spherical=False
+            )
+        return codes
+
+    def add(self, source: EmbeddingSource, block_size: int = 65536):
+        """将全部向量分配到倒排列表"""
+        if self.centroids is None:
+            self.train(source)
+
+        ids_per_block, lists_per_block, data_per_block = [], [], []
+        for start, block in _iter_source_blocks(source, block_size):
+            assignments = assign_to_centroids(block, self.centroids)
+            ids_per_block.append(np.arange(start, start + block.shape[0], dtype=np.int64))
+            lists_per_block.append(assignments)
+            data_per_block.append(self._encode_pq(block) if self.pq_m else block.astype(self.dtype))
+
+        ids = np.concatenate(ids_per_block)
+        lists = np.concatenate(lists_per_block)
+        data = np.concatenate(data_per_block)
+
+        order = np.argsort(lists, kind="stable")
+        self.list_ids = ids[order]
+        self.list_data = data[order]
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))]).astype(np.int64)
+        self.num_docs = int(ids.size)
+
+        if isinstance(source, ShardedDenseIndex):
+            self.exact_source = source
+
+        sizes = np.diff(self.list_offsets)
+        logger.info(f"{self.index_type} 索引构建完成: {self.num_docs} 个向量, {self.nlist} 个列表, "
+                    f"平均列表长度 {sizes.mean():.1f}, 最大 {sizes.max()}")
+
+    # ===== 检索 =====
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        if self.num_docs == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = normalize_embeddings(query_embedding)[0]
+        nprobe = min(self.nprobe, self.nlist)
+        probe_lists, _ = top_k_from_scores(self.centroids @ query, nprobe)
+        return self._search_lists(query, probe_lists, top_k)
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索：全部查询与聚类中心做一次矩阵乘法选出探测列表，再逐查询扫描各自的列表"""
+        queries = normalize_embeddings(query_embeddings)
+        if self.num_docs == 0 or top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(queries.shape[0])]
+        probe_lists, _ = top_k_per_row(queries @ self.centroids.T, min(self.nprobe, self.nlist))
+        return [self._search_lists(query, probes, top_k) for query, probes in zip(queries, probe_lists)]
+
+    def _search_lists(self, query: np.ndarray, probe_lists: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """在给定的倒排列表中检索（query 已归一化）"""
+        ranges = [(self.list_offsets[l], self.list_offsets[l + 1]) for l in probe_lists]
+        positions = np.concatenate([np.arange(start, end) for start, end in ranges]) if ranges else np.empty(0, dtype=np.int64)
+        if positions.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        candidate_ids = self.list_ids[positions]
+        candidate_data = self.list_data[positions]
+
+        if self.pq_m:
+            # ADC：每个子空间预先计算查询与码本的内积表
+            dsub = self.dim // self.pq_m
+            tables = np.einsum('mkd,md->mk', self.pq_codebooks, query.reshape(self.pq_m, dsub))
+            scores = tables[np.arange(self.pq_m), candidate_data.astype(np.int64)].sum(axis=1)
+        else:
+            scores = np.asarray(candidate_data, dtype=np.float32) @ query
+
+        # 用精确向量重排候选（PQ 的近似误差在此被修正）
+        if self.pq_m and self.exact_source is not None and self.rerank_factor > 1:
+            keep, _ = top_k_from_scores(scores, top_k * self.rerank_factor)
+            candidate_ids = candidate_ids[keep]
+            scores = self.exact_source.get_vectors(candidate_ids) @ query
+
+        keep, top_scores = top_k_from_scores(scores.astype(np.float32), top_k)
+        return candidate_ids[keep], top_scores
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    # ===== 持久化 =====
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        arrays = {
+            "centroids": self.centroids,
+            "list_offsets": self.list_offsets,
+            "list_ids": self.list_ids,
+            "list_data": self.list_data
+        }
+        if self.pq_m:
+            arrays["pq_codebooks"] = self.pq_codebooks
+        for name, array in arrays.items():
+            np.save(os.path.join(index_dir, f"{name}.npy"), array)
+
+        meta = {
+            "version": ANN_FORMAT_VERSION,
+            "index_type": self.index_type,
+            "backend": "numpy",
+            "dim": self.dim,
+            "num_docs": self.num_docs,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "pq_m": self.pq_m,
+            "pq_bits": self.pq_bits,
+            "rerank_factor": self.rerank_factor,
+            "dtype": self.dtype,
+            "build_config": self.build_config
+        }
+        with open(os.path.join(index_dir, ANN_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str, meta: Dict[str, Any]) -> "IVFIndex":
+        index = cls(nlist=meta["nlist"], nprobe=meta["nprobe"], pq_m=meta["pq_m"], pq_bits=meta["pq_bits"],
+                    rerank_factor=meta["rerank_factor"], dtype=meta["dtype"])
+        index.dim = meta["dim"]
+        index.num_docs = meta["num_docs"]
+        index.build_config = meta.get("build_config")
+        index.centroids = np.load(os.path.join(index_dir, "centroids.npy"))
+        index.list_offsets = np.load(os.path.join(index_dir, "list_offsets.npy"))
+        index.list_ids = np.load(os.path.join(index_dir, "list_ids.npy"), mmap_mode='r')
+        index.list_data = np.load(os.path.join(index_dir, "list_data.npy"), mmap_mode='r')
+        if index.pq_m:
+            index.pq_codebooks = np.load(os.path.join(index_dir, "pq_codebooks.npy"))
+        return index
+
+    def get_index_info(self) -> Dict[str, Any]:
+        return {
+            "index_type": self.index_type,
+            "backend": "numpy",
+            "num_docs": self.num_docs,
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "pq_m": self.pq_m
+        }
+
+
+class HNSWIndex:
+    """HNSW 图索引，使用 hnswlib（优先）或 faiss 作为后端"""
+
+    def __init__(self, hnsw_m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                 backend: str = "hnswlib"):
+        if backend == "hnswlib" and not HNSWLIB_AVAILABLE:
+            backend = "faiss"
+        if backend == "faiss" and not FAISS_AVAILABLE:
+            raise ImportError("HNSW 索引需要安装 hnswlib 或 faiss")
+
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.backend = backend
+        self.dim: Optional[int] = None
+        self.num_docs = 0
+        self._index = None
+        self.build_config: Optional[Dict[str, Any]] = None
+
+    @property
+    def index_type(self) -> str:
+        return "hnsw"
+
+    def add(self, source: EmbeddingSource, block_size: int = 65536):
+        total = len(source)
+        for start, block in _iter_source_blocks(source, block_size):
+            if self._index is None:
+                self.dim = int(block.shape[1])
+                self._create(total)
+            if self.backend == "hnswlib":
+                self._index.add_items(block, np.arange(start, start + block.shape[0]))
+            else:
+                self._index.add(block)
+        self.num_docs = total
+        logger.info(f"HNSW 索引构建完成 ({self.backend}): {self.num_docs} 个向量")
+
+    def _create(self, max_elements: int):
+        if self.backend == "hnswlib":
+            self._index = hnswlib.Index(space='ip', dim=self.dim)
+            self._index.init_index(max_elements=max_elements, M=self.hnsw_m, ef_construction=self.ef_construction)
+            self._index.set_ef(self.ef_search)
+        else:
+            self._index = faiss.IndexHNSWFlat(self.dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            self._index.hnsw.efConstruction = self.ef_construction
+            self._index.hnsw.efSearch = self.ef_search
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        if self.num_docs == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = normalize_embeddings(query_embedding)
+        top_k = min(top_k, self.num_docs)
+        if self.backend == "hnswlib":
+            labels, distances = self._index.knn_query(query, k=top_k)
+            # hnswlib 的 ip 距离为 1 - 内积
+            return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+        scores, labels = self._index.search(query, top_k)
+        valid = labels[0] >= 0
+        return labels[0][valid].astype(np.int64), scores[0][valid].astype(np.float32)
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索：整个查询矩阵一次交给后端"""
+        queries = normalize_embeddings(query_embeddings)
+        if self.num_docs == 0 or top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(queries.shape[0])]
+
+        top_k = min(top_k, self.num_docs)
+        if self.backend == "hnswlib":
+            labels, distances = self._index.knn_query(queries, k=top_k)
+            return [(labels[q].astype(np.int64), (1.0 - distances[q]).astype(np.float32))
+                    for q in range(queries.shape[0])]
+
+        scores, labels = self._index.search(queries, top_k)
+        return [(labels[q][labels[q] >= 0].astype(np.int64), scores[q][labels[q] >= 0].astype(np.float32))
+                for q in range(queries.shape[0])]
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        index_path = os.path.join(index_dir, "hnsw.index")
+        if self.backend == "hnswlib":
+            self._index.save_index(index_path)
+        else:
+            faiss.write_index(self._index, index_path)
+
+        meta = {
+            "version": ANN_FORMAT_VERSION,
+            "index_type": "hnsw",
+            "backend": self.backend,
+            "dim": self.dim,
+            "num_docs": self.num_docs,
+            "hnsw_m": self.hnsw_m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "build_config": self.build_config
+        }
+        with open(os.path.join(index_dir, ANN_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str, meta: Dict[str, Any]) -> "HNSWIndex":
+        index = cls(hnsw_m=meta["hnsw_m"], ef_construction=meta["ef_construction"],
+                    ef_search=meta["ef_search"], backend=meta["backend"])
+        index.dim = meta["dim"]
+        index.num_docs = meta["num_docs"]
+        index.build_config = meta.get("build_config")
+        index_path = os.path.join(index_dir, "hnsw.index")
+        if index.backend == "hnswlib":
+            index._index = hnswlib.Index(space='ip', dim=index.dim)
+            index._index.load_index(index_path, max_elements=index.num_docs)
+            index._index.set_ef(index.ef_search)
+        else:
+            index._index = faiss.read_index(index_path)
+            index._index.hnsw.efSearch = index.ef_search
+        return index
+
+    def get_index_info(self) -> Dict[str, Any]:
+        return {
+            "index_type": "hnsw",
+            "backend": self.backend,
+            "num_docs": self.num_docs,
+            "dim": self.dim,
+            "hnsw_m": self.hnsw_m,
+            "ef_search": self.ef_search
+        }
+
+
+class FaissIVFIndex:
+    """faiss 后端的 IVF / IVF-PQ 索引"""
+
+    def __init__(self, nlist: int = 1024, nprobe: int = 16, pq_m: int = 0, pq_bits: int = 8,
+                 train_size: int = 100000, seed: int = 42):
+        if not FAISS_AVAILABLE:
+            raise ImportError("faiss 未安装")
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.train_size = train_size
+        self.seed = seed
+        self.dim: Optional[int] = None
+        self.num_docs = 0
+        self._index = None
+        self.build_config: Optional[Dict[str, Any]] = None
+
+    @property
+    def index_type(self) -> str:
+        return "ivf_pq" if self.pq_m else "ivf"
+
+    def add(self, source: EmbeddingSource, block_size: int = 65536):
+        sample = _sample_vectors(source, self.train_size, self.seed)
+        self.dim = int(sample.shape[1])
+        self.nlist = max(1, min(self.nlist, sample.shape[0]))
+        storage = f"PQ{self.pq_m}x{self.pq_bits}" if self.pq_m else "Flat"
+        self._index = faiss.index_factory(self.dim, f"IVF{self.nlist},{storage}", faiss.METRIC_INNER_PRODUCT)
+        self._index.train(sample)
+        for _, block in _iter_source_blocks(source, block_size):
+            self._index.add(block)
+        self._index.nprobe = self.nprobe
+        self.num_docs = int(self._index.ntotal)
+        logger.info(f"faiss {self.index_type} 索引构建完成: {self.num_docs} 个向量")
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        if self.num_docs == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores, labels = self._index.search(normalize_embeddings(query_embedding), top_k)
+        valid = labels[0] >= 0
+        return labels[0][valid].astype(np.int64), scores[0][valid].astype(np.float32)
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索：整个查询矩阵一次交给 faiss"""
+        queries = normalize_embeddings(query_embeddings)
+        if self.num_docs == 0 or top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(queries.shape[0])]
+        scores, labels = self._index.search(queries, top_k)
+        return [(labels[q][labels[q] >= 0].astype(np.int64), scores[q][labels[q] >= 0].astype(np.float32))
+                for q in range(queries.shape[0])]
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        faiss.write_index(self._index, os.path.join(index_dir, "ivf.index"))
+        meta = {
+            "version": ANN_FORMAT_VERSION,
+            "index_type": self.index_type,
+            "backend": "faiss",
+            "dim": self.dim,
+            "num_docs": self.num_docs,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "pq_m": self.pq_m,
+            "pq_bits": self.pq_bits,
+            "build_config": self.build_config
+        }
+        with open(os.path.join(index_dir, ANN_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str, meta: Dict[str, Any]) -> "FaissIVFIndex":
+        index = cls(nlist=meta["nlist"], nprobe=meta["nprobe"], pq_m=meta["pq_m"], pq_bits=meta["pq_bits"])
+        index.dim = meta["dim"]
+        index.num_docs = meta["num_docs"]
+        index.build_config = meta.get("build_config")
+        index._index = faiss.read_index(os.path.join(index_dir, "ivf.index"), faiss.IO_FLAG_MMAP)
+        index._index.nprobe = index.nprobe
+        return index
+
+    def get_index_info(self) -> Dict[str, Any]:
+        return {
+            "index_type": self.index_type,
+            "backend": "faiss",
+            "num_docs": self.num_docs,
+            "dim": self.dim,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "pq_m": self.pq_m
+        }
+
+
+def get_dense_index_config(config) -> Dict[str, Any]:
+    """从 FlexRAGIntegratedConfig.retriever_configs['dense_retriever'] 读取索引配置"""
+    retriever_configs = getattr(config, 'retriever_configs', None) or {}
+    return dict(retriever_configs.get('dense_retriever', {}).get('index_config', {}))
+
+
+def resolve_index_config(index_config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """合并默认 ANN 配置"""
+    resolved = dict(DEFAULT_INDEX_CONFIG)
+    resolved.update(index_config or {})
+    if resolved["index_type"] not in SUPPORTED_INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {resolved['index_type']}，可选: {SUPPORTED_INDEX_TYPES}")
+    return resolved
+
+
+def ann_build_config(index_config: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    决定索引结构的构建参数：实际使用的索引类型与后端，以及影响训练 / 建图的参数；flat 返回 None
+
+    nprobe、ef_search、rerank_factor 只影响查询，加载时直接采用当前配置，不在其中。
+    """
+    cfg = resolve_index_config(index_config)
+    index_type = cfg["index_type"]
+    if index_type == "flat":
+        return None
+
+    if index_type == "hnsw":
+        if HNSWLIB_AVAILABLE or FAISS_AVAILABLE:
+            backend = cfg["backend"] if cfg["backend"] in ("hnswlib", "faiss") else "hnswlib"
+            if backend == "hnswlib" and not HNSWLIB_AVAILABLE:
+                backend = "faiss"
+            return {"index_type": "hnsw", "backend": backend,
+                    "hnsw_m": cfg["hnsw_m"], "ef_construction": cfg["ef_construction"]}
+        index_type = "ivf"
+
+    build_config = {
+        "index_type": index_type,
+        "backend": "faiss" if cfg["backend"] == "faiss" and FAISS_AVAILABLE else "numpy",
+        "nlist": cfg["nlist"],
+        "pq_m": cfg["pq_m"] if index_type == "ivf_pq" else 0,
+        "pq_bits": cfg["pq_bits"],
+        "train_size": cfg["train_size"],
+        "seed": cfg["seed"]
+    }
+    if build_config["backend"] == "numpy":
+        build_config["kmeans_iters"] = cfg["kmeans_iters"]
+    return build_config
+
+
+def create_ann_index(index_config: Optional[Dict[str, Any]]):
+    """根据配置创建（未构建的）ANN 索引；flat 返回 None 表示使用精确检索"""
+    cfg = resolve_index_config(index_config)
+    build_config = ann_build_config(cfg)
+    if build_config is None:
+        return None
+
+    if build_config["index_type"] != cfg["index_type"]:
+        logger.warning("⚠️ hnswlib 和 faiss 均不可用，HNSW 回退为 NumPy IVF 索引")
+
+    if build_config["index_type"] == "hnsw":
+        index = HNSWIndex(hnsw_m=build_config["hnsw_m"], ef_construction=build_config["ef_construction"],
+                          ef_search=cfg["ef_search"], backend=build_config["backend"])
+    elif build_config["backend"] == "faiss":
+        index = FaissIVFIndex(nlist=build_config["nlist"], nprobe=cfg["nprobe"], pq_m=build_config["pq_m"],
+                              pq_bits=build_config["pq_bits"], train_size=build_config["train_size"],
+                              seed=build_config["seed"])
+    else:
+        index = IVFIndex(nlist=build_config["nlist"], nprobe=cfg["nprobe"], pq_m=build_config["pq_m"],
+                         pq_bits=build_config["pq_bits"], rerank_factor=cfg["rerank_factor"],
+                         train_size=build_config["train_size"], kmeans_iters=build_config["kmeans_iters"],
+                         seed=build_config["seed"])
+    index.build_config = build_config
+    return index
+
+
+def build_ann_index(index_config: Optional[Dict[str, Any]], source: EmbeddingSource,
+                    index_dir: Optional[str] = None):
+    """构建 ANN 索引；提供 index_dir 时持久化到磁盘"""
+    index = create_ann_index(index_config)
+    if index is None:
+        return None
+    index.add(source)
+    if index_dir:
+        index.save(index_dir)
+    return index
+
+
+def load_ann_index(index_dir: str, index_config: Optional[Dict[str, Any]] = None,
+                   exact_source: Optional[ShardedDenseIndex] = None):
+    """
+    加载已持久化的 ANN 索引
+
+    保存的构建参数（ann_build_config）与当前配置不一致时返回 None，由调用方重建；
+    只影响查询的参数（nprobe、ef_search、rerank_factor）直接采用当前配置。
+    """
+    meta_path = os.path.join(index_dir, ANN_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get("version") != ANN_FORMAT_VERSION:
+        return None
+
+    cfg = resolve_index_config(index_config)
+    build_config = ann_build_config(cfg)
+    if build_config is None:
+        return None
+    if meta.get("build_config") != build_config:
+        logger.info(f"⚠️ ANN 索引构建参数与配置不一致，需要重建: 已保存 {meta.get('build_config')}，"
+                    f"当前 {build_config}")
+        return None
+
+    meta.update(nprobe=cfg["nprobe"], ef_search=cfg["ef_search"], rerank_factor=cfg["rerank_factor"])
+    if meta["index_type"] == "hnsw":
+        return HNSWIndex.load(index_dir, meta)
+    if meta["backend"] == "faiss":
+        return FaissIVFIndex.load(index_dir, meta)
+    index = IVFIndex.load(index_dir, meta)
+    index.exact_source = exact_source
+    return index
+
+
+def sample_eval_queries(source: EmbeddingSource, num_queries: int = 50, noise: float = 0.05,
+                        seed: int = 42) -> np.ndarray:
+    """从库中抽取向量并加入扰动，作为评估用查询"""
+    sample = _sample_vectors(source, num_queries, seed)
+    rng = np.random.default_rng(seed)
+    return sample + noise * rng.standard_normal(sample.shape).astype(np.float32)
+
+
+def evaluate_ann_recall(ann_index, exact_index, queries: np.ndarray, top_k: int = 10) -> Dict[str, float]:
+    """
+    以精确检索为基准评估 ANN 索引
+
+    Returns:
+        recall@k、两者平均延迟（毫秒）和加速比
+    """
+    queries = normalize_embeddings(queries)
+    recalls: List[float] = []
+    exact_time = ann_time = 0.0
+
+    for query in queries:
+        start = time.perf_counter()
+        exact_ids, _ = exact_index.search(query, top_k)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ann_ids, _ = ann_index.search(query, top_k)
+        ann_time += time.perf_counter() - start
+
+        if exact_ids.size:
+            recalls.append(len(set(exact_ids.tolist()) & set(ann_ids.tolist())) / exact_ids.size)
+
+    num_queries = max(len(queries), 1)
+    exact_ms = exact_time * 1000 / num_queries
+    ann_ms = ann_time * 1000 / num_queries
+    return {
+        f"recall@{top_k}": float(np.mean(recalls)) if recalls else 0.0,
+        "exact_latency_ms": exact_ms,
+        "ann_latency_ms": ann_ms,
+        "speedup": exact_ms / ann_ms if ann_ms > 0 else 0.0,
+        "num_queries": len(queries)
+    }
+
+
+if __name__ == "__main__":
+    # 在带簇结构的合成数据上对比 ANN 与精确检索
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    topics = rng.standard_normal((500, 128))
+    corpus = (topics[rng.integers(0, 500, 50000)] + 0.5 * rng.standard_normal((50000, 128))).astype(np.float32)
+    queries = corpus[rng.choice(corpus.shape[0], 100, replace=False)] + 0.1 * rng.standard_normal((100, 128))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        exact = ShardedDenseIndex.build(os.path.join(tmp_dir, "flat"), corpus)
+        for config in [
+            {"index_type": "ivf", "nlist": 256, "nprobe": 8},
+            {"index_type": "ivf_pq", "nlist": 256, "nprobe": 8, "pq_m": 16},
+            {"index_type": "hnsw"}
+        ]:
+            try:
+                ann = build_ann_index(config, exact)
+            except ImportError as e:
+                print(f"{config['index_type']}: 跳过 ({e})")
+                continue
+            report = evaluate_ann_recall(ann, exact, queries, top_k=10)
+            print(f"{config['index_type']}: {report}")
@@ -1 +1,328 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""
+=== 稠密向量索引 ===
+
+基于内存映射分片文件的稠密检索索引：
+1. 嵌入在写入前做 L2 归一化，内积即余弦相似度
+2. 按分片保存为 .npy 文件（float32 / float16），查询时通过 mmap 映射，不进入进程堆
+3. 分块矩阵-向量乘法 + argpartition 求 top-k，避免对全量分数做 argsort
+4. 批量检索时一个分块与全部查询做一次矩阵-矩阵乘法，每个分块只读一次
+"""
+
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+INDEX_META_FILE = "dense_index_meta.json"
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def normalize_embeddings(embeddings: np.ndarray) -> np.ndarray:
+    """L2 归一化（零向量保持为零）"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        embeddings = embeddings[None, :]
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def top_k_from_scores(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """使用 argpartition 选出 top-k，仅对候选部分排序"""
+    if top_k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if top_k < scores.size:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.size)
+    order = np.argsort(-scores[candidates], kind="stable")
+    indices = candidates[order]
+    return indices.astype(np.int64), scores[indices].astype(np.float32)
+
+
+def top_k_per_row(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """对分数矩阵 (查询数, 候选数) 逐行求 top-k，返回按分数降序的 (列下标, 分数)，形状 (查询数, k)"""
+    num_rows, num_cols = scores.shape
+    top_k = min(top_k, num_cols)
+    if top_k <= 0:
+        return np.empty((num_rows, 0), dtype=np.int64), np.empty((num_rows, 0), dtype=np.float32)
+    if top_k < num_cols:
+        candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    else:
+        candidates = np.broadcast_to(np.arange(num_cols), (num_rows, num_cols))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices.astype(np.int64), np.take_along_axis(candidate_scores, order, axis=1).astype(np.float32)
+
+
+class ShardedDenseIndex:
+    """
+    内存映射的分片稠密索引
+
+    目录结构：
+        dense_index_meta.json   # 版本、维度、数据类型、分片列表
+        shard_00000.npy         # 每个分片 shard_size 行，已归一化
+        shard_00001.npy
+        ...
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        dtype: str = "float32",
+        shard_size: int = 100000,
+        block_size: int = 16384
+    ):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"不支持的嵌入数据类型: {dtype}，可选: {SUPPORTED_DTYPES}")
+
+        self.index_dir = index_dir
+        self.dtype = dtype
+        self.shard_size = shard_size
+        self.block_size = block_size
+
+        self.dim: Optional[int] = None
+        self.num_docs = 0
+        self.shard_files: List[str] = []
+        self.shard_rows: List[int] = []
+
+        # 写入缓冲区（尚未落盘的行）
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+
+        # 已映射的分片
+        self._shards: List[np.ndarray] = []
+
+    @property
+    def num_vectors(self) -> int:
+        """已加入的向量总数（含尚未落盘的缓冲区）"""
+        return self.num_docs + self._pending_rows
+
+    # ===== 构建 =====
+
+    def add(self, embeddings: np.ndarray):
+        """追加一批嵌入，满一个分片即落盘"""
+        embeddings = normalize_embeddings(embeddings)
+        if embeddings.shape[0] == 0:
+            return
+
+        if self.dim is None:
+            self.dim = int(embeddings.shape[1])
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"嵌入维度不一致: 期望 {self.dim}，实际 {embeddings.shape[1]}")
+
+        self._pending.append(embeddings.astype(self.dtype))
+        self._pending_rows += embeddings.shape[0]
+
+        while self._pending_rows >= self.shard_size:
+            self._write_shard(self.shard_size)
+
+    def finalize(self) -> "ShardedDenseIndex":
+        """写出剩余缓冲区和元数据，并以 mmap 方式重新打开"""
+        if self._pending_rows > 0:
+            self._write_shard(self._pending_rows)
+        self._write_meta()
+        self._open_shards()
+        logger.info(f"稠密索引构建完成: {self.num_docs} 个向量, {len(self.shard_files)} 个分片 ({self.dtype})")
+        return self
+
+    def _write_shard(self, rows: int):
+        """将缓冲区前 rows 行写成一个分片"""
+        buffer = np.concatenate(self._pending, axis=0)
+        shard, rest = buffer[:rows], buffer[rows:]
+        self._pending = [rest] if rest.shape[0] > 0 else []
+        self._pending_rows = rest.shape[0]
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        file_name = f"shard_{len(self.shard_files):05d}.npy"
+        # 先写临时文件再替换：追加时可能覆盖同名分片，已映射的旧文件不受影响
+        tmp_path = os.path.join(self.index_dir, f"{file_name}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(shard))
+        os.replace(tmp_path, os.path.join(self.index_dir, file_name))
+
+        self.shard_files.append(file_name)
+        self.shard_rows.append(int(shard.shape[0]))
+        self.num_docs += int(shard.shape[0])
+
+    def _write_meta(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        meta = {
+            "version": INDEX_FORMAT_VERSION,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "shard_size": self.shard_size,
+            "num_docs": self.num_docs,
+            "shards": [
+                {"file": file_name, "rows": rows}
+                for file_name, rows in zip(self.shard_files, self.shard_rows)
+            ]
+        }
+        with open(os.path.join(self.index_dir, INDEX_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def build(cls, index_dir: str, embeddings: np.ndarray, dtype: str = "float32",
+              shard_size: int = 100000, chunk_size: int = 65536) -> "ShardedDenseIndex":
+        """从已有嵌入矩阵（可以是 mmap 数组）分块构建索引"""
+        index = cls(index_dir, dtype=dtype, shard_size=shard_size)
+        for start in range(0, embeddings.shape[0], chunk_size):
+            index.add(embeddings[start:start + chunk_size])
+        return index.finalize()
+
+    # ===== 加载 =====
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, INDEX_META_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str, block_size: int = 16384) -> "ShardedDenseIndex":
+        """以 mmap 方式加载已构建的索引"""
+        with open(os.path.join(index_dir, INDEX_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta.get("version") != INDEX_FORMAT_VERSION:
+            raise ValueError(f"稠密索引版本不兼容: {meta.get('version')} != {INDEX_FORMAT_VERSION}")
+
+        index = cls(index_dir, dtype=meta["dtype"], shard_size=meta["shard_size"], block_size=block_size)
+        index.dim = meta["dim"]
+        index.num_docs = meta["num_docs"]
+        index.shard_files = [shard["file"] for shard in meta["shards"]]
+        index.shard_rows = [shard["rows"] for shard in meta["shards"]]
+        index._open_shards()
+
+        logger.info(f"稠密索引加载成功: {index.num_docs} 个向量, {len(index.shard_files)} 个分片")
+        return index
+
+    @classmethod
+    def open_for_append(cls, index_dir: str) -> "ShardedDenseIndex":
+        """
+        重新打开已有索引以追加向量，已落盘的完整分片保持不变
+
+        未写满的最后一个分片读回缓冲区，追加后与新向量一起重写，避免反复追加产生大量小分片。
+        """
+        index = cls.load(index_dir)
+        if index.shard_files and index.shard_rows[-1] < index.shard_size:
+            last = np.array(index._shards[-1])
+            index.shard_files.pop()
+            index.shard_rows.pop()
+            index.num_docs -= last.shape[0]
+            index._pending = [last]
+            index._pending_rows = last.shape[0]
+        index._shards = []
+        return index
+
+    def _open_shards(self):
+        self._shards = [
+            np.load(os.path.join(self.index_dir, file_name), mmap_mode='r')
+            for file_name in self.shard_files
+        ]
+
+    # ===== 检索 =====
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索与查询最相似的文档
+
+        Args:
+            query_embedding: 查询向量，形状 (dim,) 或 (1, dim)
+            top_k: 返回数量
+
+        Returns:
+            (文档下标, 余弦相似度)，按相似度降序
+        """
+        if self.num_docs == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        query = normalize_embeddings(query_embedding)[0]
+
+        best_indices = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        offset = 0
+
+        for shard in self._shards:
+            for start in range(0, shard.shape[0], self.block_size):
+                block = np.asarray(shard[start:start + self.block_size], dtype=np.float32)
+                block_indices, block_scores = top_k_from_scores(block @ query, top_k)
+
+                best_indices = np.concatenate([best_indices, block_indices + offset + start])
+                best_scores = np.concatenate([best_scores, block_scores])
+                if best_scores.size > top_k:
+                    keep, best_scores = top_k_from_scores(best_scores, top_k)
+                    best_indices = best_indices[keep]
+            offset += shard.shape[0]
+
+        order, best_scores = top_k_from_scores(best_scores, top_k)
+        return best_indices[order], best_scores
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        批量检索：每个分块与全部查询做一次矩阵-矩阵乘法，逐行维护 top-k
+
+        Args:
+            query_embeddings: 查询向量矩阵 (查询数, dim)
+
+        Returns:
+            每个查询一个 (文档下标, 余弦相似度)，按相似度降序
+        """
+        queries = normalize_embeddings(query_embeddings)
+        num_queries = queries.shape[0]
+        if self.num_docs == 0 or top_k <= 0:
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in range(num_queries)]
+
+        best_indices = np.empty((num_queries, 0), dtype=np.int64)
+        best_scores = np.empty((num_queries, 0), dtype=np.float32)
+
+        for block_start, block in self.iter_blocks():
+            block_indices, block_scores = top_k_per_row(queries @ block.T, top_k)
+            best_indices = np.concatenate([best_indices, block_indices + block_start], axis=1)
+            best_scores = np.concatenate([best_scores, block_scores], axis=1)
+            if best_scores.shape[1] > top_k:
+                keep, best_scores = top_k_per_row(best_scores, top_k)
+                best_indices = np.take_along_axis(best_indices, keep, axis=1)
+
+        order, best_scores = top_k_per_row(best_scores, top_k)
+        best_indices = np.take_along_axis(best_indices, order, axis=1)
+        return [(best_indices[q], best_scores[q]) for q in range(num_queries)]
+
+    def iter_blocks(self, block_size: Optional[int] = None):
+        """按块遍历全部向量，产出 (起始下标, float32 块)"""
+        block_size = block_size or self.block_size
+        offset = 0
+        for shard in self._shards:
+            for start in range(0, shard.shape[0], block_size):
+                yield offset + start, np.asarray(shard[start:start + block_size], dtype=np.float32)
+            offset += shard.shape[0]
+
+    def get_vectors(self, indices: np.ndarray) -> np.ndarray:
+        """按文档下标读取向量（只触及对应的 mmap 页）"""
+        indices = np.asarray(indices, dtype=np.int64)
+        vectors = np.empty((indices.size, self.dim or 0), dtype=np.float32)
+        boundaries = np.cumsum([0] + self.shard_rows)
+        shard_ids = np.searchsorted(boundaries, indices, side='right') - 1
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            vectors[mask] = self._shards[shard_id][indices[mask] - boundaries[shard_id]]
+        return vectors
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    def get_index_info(self) -> dict:
+        """获取索引信息"""
+        return {
+            "index_dir": self.index_dir,
+            "num_docs": self.num_docs,
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "num_shards": len(self.shard_files),
+            "shard_size": self.shard_size
+        }
@@ -6,9 +6,13 @@
 """
 
 import logging
+from functools import partial
 from typing import List, Dict, Any, Optional, Union
 from dataclasses import dataclass
 
+from .retrieval_executor import ParallelRetrievalExecutor, summarize_outcomes
+from ..refiner.deduplicator import MinHashDeduplicator
+
 logger = logging.getLogger(__name__)
 
 # 定义统一的数据结构
@@ -53,6 +57,10 @@ class FlexRAGIntegratedRetriever:
         self.config = config
         self.retrievers = {}
         self.fallback_mode = not FLEXRAG_AVAILABLE
+        self.executor = ParallelRetrievalExecutor.from_config(
+            getattr(config, 'retrieval_executor_config', None)
+        )
+        self.deduplicator = MinHashDeduplicator.from_config(getattr(config, 'dedup_config', None))
         
         if FLEXRAG_AVAILABLE:
             self._init_flexrag_retrievers()
@@ -74,7 +82,9 @@ class FlexRAGIntegratedRetriever:
                         logger.info(f"✅ 使用模拟检索器: {name}")
                     else:
                         # 尝试创建 FlexRAG 检索器配置
-                        retriever_config = RetrieverConfig(**config_dict)
+                        # index_config 由本地稠密索引使用，不传给 FlexRAG
+                        flex_config = {k: v for k, v in config_dict.items() if k != "index_config"}
+                        retriever_config = RetrieverConfig(**flex_config)
                         retriever = RETRIEVERS.load(retriever_config)
                         self.retrievers[name] = retriever
                         logger.info(f"✅ 成功加载 FlexRAG 检索器: {name}")
@@ -134,6 +144,9 @@ class FlexRAGIntegratedRetriever:
                     results.append(context)
                 
                 return results
+
+            def search_batch(self, queries: List[str], top_k: int = 10) -> List[List[RetrievedContext]]:
+                return [self.search(query, top_k=top_k) for query in queries]
         
         return MockRetriever(retriever_type)
     
@@ -164,28 +177,30 @@ class FlexRAGIntegratedRetriever:
         
         all_contexts = []
         
-        # 执行多种检索
+        # 并行发出所有加权检索器
+        tasks = {}
         for retriever_name, weight in weights.items():
             if weight > 0 and retriever_name + "_retriever" in self.retrievers:
                 retriever = self.retrievers[retriever_name + "_retriever"]
                 k = retriever_top_k.get(retriever_name, top_k)
-                
-                try:
-                    contexts = retriever.search(query, top_k=k)
-                    
-                    # 调整分数权重
-                    for ctx in contexts:
-                        ctx.score *= weight
-                        if not hasattr(ctx, 'metadata') or ctx.metadata is None:
-                            ctx.metadata = {}
-                        ctx.metadata["retriever_weight"] = weight
-                        ctx.metadata["original_retriever"] = retriever_name
-                    
-                    all_contexts.extend(contexts)
-                    logger.debug(f"检索器 {retriever_name} 返回 {len(contexts)} 个结果")
-                    
-                except Exception as e:
-                    logger.error(f"检索器 {retriever_name} 执行失败: {e}")
+                tasks[retriever_name] = partial(retriever.search, query, top_k=k)
+        
+        outcomes = self.executor.run(tasks, deadline=strategy.get("deadline"))
+        
+        for retriever_name, outcome in outcomes.items():
+            weight = weights[retriever_name]
+            contexts = outcome.results
+            
+            # 调整分数权重
+            for ctx in contexts:
+                ctx.score *= weight
+                if not hasattr(ctx, 'metadata') or ctx.metadata is None:
+                    ctx.metadata = {}
+                ctx.metadata["retriever_weight"] = weight
+                ctx.metadata["original_retriever"] = retriever_name
+            
+            all_contexts.extend(contexts)
+            logger.debug(f"检索器 {retriever_name} 返回 {len(contexts)} 个结果 ({outcome.status}, {outcome.latency:.3f}s)")
         
         # 融合结果
         fused_contexts = self._fuse_results(all_contexts, fusion_method, top_k)
@@ -202,7 +217,8 @@ class FlexRAGIntegratedRetriever:
                 "total_retrieved": len(all_contexts),
                 "final_count": len(fused_contexts),
                 "fusion_method": fusion_method,
-                "flexrag_mode": not self.fallback_mode
+                "flexrag_mode": not self.fallback_mode,
+                "retrievers": summarize_outcomes(outcomes)
             }
         )
         
@@ -257,18 +273,8 @@ class FlexRAGIntegratedRetriever:
         return unique_contexts[:top_k]
     
     def _deduplicate_contexts(self, contexts: List[RetrievedContext]) -> List[RetrievedContext]:
-        """去重检索结果"""
-        seen_content = set()
-        unique_contexts = []
-        
-        for ctx in contexts:
-            # 使用内容的前200字符作为去重键
-            content_key = ctx.content[:200].strip()
-            if content_key not in seen_content:
-                seen_content.add(content_key)
-                unique_contexts.append(ctx)
-        
-        return unique_contexts
+        """去重检索结果：与排在前面的结果近似重复的上下文被丢弃"""
+        return self.deduplicator.deduplicate(contexts)
     
     def get_retriever_info(self) -> Dict[str, Any]:
         """获取检索器信息"""
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+=== 并行检索执行器 ===
+
+将关键词 / 密集 / Web 等检索器同时发出，检索延迟由各检索器之和变为最大值：
+1. 线程池版本 run()，适用于同步检索器（BM25、向量检索、HTTP 客户端）
+2. asyncio 版本 run_async()，协程检索器直接 await，同步检索器放入线程池
+3. 每个检索器独立超时，从任务实际开始执行时计时（在共享线程池中排队的时间不计入）；
+   设置 deadline 时只融合截止时间前返回的结果（截止时间从发出时计）
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 有任务仍在排队时，主线程检查其是否已开始执行的间隔（秒）
+QUEUE_POLL_INTERVAL = 0.01
+
+DEFAULT_EXECUTOR_CONFIG = {
+    "enabled": True,
+    "max_workers": 4,
+    # 子任务级并发数（任务分解后的各子任务同时检索）
+    "max_subtask_workers": 4,
+    # 每个检索器的超时（秒），None 表示不限制
+    "timeouts": {"keyword": 2.0, "dense": 2.0, "web": 5.0},
+    # 整体截止时间（秒），到期后融合已返回的结果；None 表示等待全部检索器（受各自超时约束）
+    "deadline": None
+}
+
+
+@dataclass
+class RetrievalOutcome:
+    """单个检索器的执行结果"""
+    name: str
+    results: List[Any]
+    latency: float
+    status: str = "ok"  # ok / timeout / error
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ok"
+
+
+def _timed_call(fn: Callable[[], List[Any]]):
+    start = time.perf_counter()
+    results = fn()
+    return results, time.perf_counter() - start
+
+
+class ParallelRetrievalExecutor:
+    """
+    并行检索执行器
+
+    Args:
+        max_workers: 线程池大小
+        timeouts: {检索器名: 超时秒数}
+        deadline: 整体截止时间（秒）
+        enabled: 为 False 时在调用线程中顺序执行（不做超时控制），便于对比和调试
+    """
+
+    def __init__(self, max_workers: int = 4, timeouts: Optional[Dict[str, float]] = None,
+                 deadline: Optional[float] = None, enabled: bool = True):
+        self.enabled = enabled
+        self.max_workers = max_workers
+        self.timeouts = dict(timeouts or {})
+        self.deadline = deadline
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]] = None) -> "ParallelRetrievalExecutor":
+        merged = dict(DEFAULT_EXECUTOR_CONFIG)
+        merged.update(config or {})
+        return cls(
+            max_workers=merged["max_workers"],
+            timeouts=merged["timeouts"],
+            deadline=merged["deadline"],
+            enabled=merged["enabled"]
+        )
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="retriever")
+        return self._pool
+
+    def _resolve_timeouts(self, names, timeouts: Optional[Dict[str, float]]) -> Dict[str, Optional[float]]:
+        merged = dict(self.timeouts)
+        merged.update(timeouts or {})
+        return {name: merged.get(name) for name in names}
+
+    # ===== 线程池版本 =====
+
+    def run(
+        self,
+        tasks: Dict[str, Callable[[], List[Any]]],
+        timeouts: Optional[Dict[str, float]] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, RetrievalOutcome]:
+        """
+        并行执行检索任务
+
+        Args:
+            tasks: {检索器名: 无参检索函数}
+            timeouts: 覆盖默认的每检索器超时
+            deadline: 覆盖默认的整体截止时间
+
+        Returns:
+            {检索器名: RetrievalOutcome}，顺序与 tasks 一致
+        """
+        if not tasks:
+            return {}
+        if not self.enabled:
+            return self._run_sequential(tasks)
+
+        deadline = self.deadline if deadline is None else deadline
+        task_timeouts = self._resolve_timeouts(tasks, timeouts)
+
+        start = time.perf_counter()
+        global_end = start + deadline if deadline is not None else float("inf")
+        # 各任务开始执行的时间：线程池被其他请求（如并发子任务）占满时任务会排队，超时从开始执行时计
+        started: Dict[str, float] = {}
+
+        def begin(name: str, fn: Callable[[], List[Any]]):
+            started[name] = time.perf_counter()
+            return _timed_call(fn)
+
+        def expiry(name: str) -> float:
+            timeout = task_timeouts[name]
+            if timeout is None or name not in started:
+                return global_end
+            return min(started[name] + timeout, global_end)
+
+        futures = {self.pool.submit(begin, name, fn): name for name, fn in tasks.items()}
+
+        outcomes: Dict[str, RetrievalOutcome] = {}
+        pending = set(futures)
+        while pending:
+            now = time.perf_counter()
+            next_expiry = min(expiry(futures[f]) for f in pending)
+            wait_time = None if next_expiry == float("inf") else max(0.0, next_expiry - now)
+            if any(task_timeouts[futures[f]] is not None and futures[f] not in started for f in pending):
+                # 仍有排队中的任务：定期检查，开始执行后才能确定其超时时间
+                wait_time = QUEUE_POLL_INTERVAL if wait_time is None else min(wait_time, QUEUE_POLL_INTERVAL)
+            done, pending = wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                name = futures[future]
+                try:
+                    results, latency = future.result()
+                    outcomes[name] = RetrievalOutcome(name, list(results or []), latency)
+                except Exception as e:
+                    logger.error(f"检索器 {name} 执行失败: {e}")
+                    outcomes[name] = RetrievalOutcome(name, [], time.perf_counter() - start, "error", str(e))
+
+            now = time.perf_counter()
+            expired = {f for f in pending if expiry(futures[f]) <= now}
+            for future in expired:
+                name = futures[future]
+                # 线程无法强制终止，未开始的任务直接取消，已开始的结果丢弃
+                future.cancel()
+                logger.warning(f"⚠️ 检索器 {name} 超时，跳过其结果")
+                outcomes[name] = RetrievalOutcome(name, [], now - started.get(name, start), "timeout")
+            pending -= expired
+
+        return {name: outcomes[name] for name in tasks}
+
+    def _run_sequential(self, tasks: Dict[str, Callable[[], List[Any]]]) -> Dict[str, RetrievalOutcome]:
+        outcomes = {}
+        for name, fn in tasks.items():
+            start = time.perf_counter()
+            try:
+                results, latency = _timed_call(fn)
+                outcomes[name] = RetrievalOutcome(name, list(results or []), latency)
+            except Exception as e:
+                logger.error(f"检索器 {name} 执行失败: {e}")
+                outcomes[name] = RetrievalOutcome(name, [], time.perf_counter() - start, "error", str(e))
+        return outcomes
+
+    # ===== asyncio 版本 =====
+
+    async def run_async(
+        self,
+        tasks: Dict[str, Callable[[], Any]],
+        timeouts: Optional[Dict[str, float]] = None,
+        deadline: Optional[float] = None
+    ) -> Dict[str, RetrievalOutcome]:
+        """
+        asyncio 并行检索：协程函数直接 await，同步函数放入线程池执行
+        """
+        if not tasks:
+            return {}
+
+        deadline = self.deadline if deadline is None else deadline
+        task_timeouts = self._resolve_timeouts(tasks, timeouts)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        async def run_one(name: str, fn: Callable[[], Any]) -> RetrievalOutcome:
+            call_start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    results = await asyncio.wait_for(fn(), timeout=task_timeouts[name])
+                else:
+                    # 同步检索器在线程池中开始执行后才计时，排队时间不计入超时
+                    began = asyncio.Event()
+
+                    def begin():
+                        loop.call_soon_threadsafe(began.set)
+                        return fn()
+
+                    future = loop.run_in_executor(self.pool, begin)
+                    await began.wait()
+                    call_start = time.perf_counter()
+                    results = await asyncio.wait_for(future, timeout=task_timeouts[name])
+                return RetrievalOutcome(name, list(results or []), time.perf_counter() - call_start)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ 检索器 {name} 超时，跳过其结果")
+                return RetrievalOutcome(name, [], time.perf_counter() - call_start, "timeout")
+            except Exception as e:
+                logger.error(f"检索器 {name} 执行失败: {e}")
+                return RetrievalOutcome(name, [], time.perf_counter() - call_start, "error", str(e))
+
+        running = {asyncio.ensure_future(run_one(name, fn)): name for name, fn in tasks.items()}
+        done, pending = await asyncio.wait(running, timeout=deadline)
+
+        outcomes = {running[task]: task.result() for task in done}
+        for task in pending:
+            task.cancel()
+            name = running[task]
+            logger.warning(f"⚠️ 检索器 {name} 未在截止时间前返回")
+            outcomes[name] = RetrievalOutcome(name, [], time.perf_counter() - start, "timeout")
+
+        return {name: outcomes[name] for name in tasks}
+
+    def shutdown(self, wait: bool = False):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+
+def run_concurrently(
+    fn: Callable[[Any], Any],
+    items: Sequence[Any],
+    max_workers: int = 4
+) -> List[Tuple[Any, float]]:
+    """
+    对每个元素并发执行 fn（有界线程池），按输入顺序返回 (结果, 耗时秒数)
+
+    用于子任务级并发；异常会在取结果时抛出，与顺序执行的行为一致。
+    """
+    if not items:
+        return []
+    if max_workers <= 1 or len(items) == 1:
+        return [_timed_call(partial(fn, item)) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix="subtask") as pool:
+        futures = [pool.submit(_timed_call, partial(fn, item)) for item in items]
+        return [future.result() for future in futures]
+
+
+def summarize_outcomes(outcomes: Dict[str, RetrievalOutcome]) -> Dict[str, Dict[str, Any]]:
+    """用于结果元数据的执行摘要"""
+    return {
+        name: {
+            "status": outcome.status,
+            "latency": round(outcome.latency, 4),
+            "count": len(outcome.results)
+        }
+        for name, outcome in outcomes.items()
+    }
+
+
+if __name__ == "__main__":
+    # 演示：顺序执行 vs 并行执行
+    def make_retriever(name: str, delay: float):
+        def search():
+            time.sleep(delay)
+            return [f"{name}_doc_{i}" for i in range(3)]
+        return search
+
+    tasks = {
+        "keyword": make_retriever("keyword", 0.05),
+        "dense": make_retriever("dense", 0.12),
+        "web": make_retriever("web", 0.4)
+    }
+
+    start = time.perf_counter()
+    for fn in tasks.values():
+        fn()
+    print(f"顺序执行: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    executor = ParallelRetrievalExecutor(max_workers=3)
+    start = time.perf_counter()
+    outcomes = executor.run(tasks)
+    print(f"并行执行: {(time.perf_counter() - start) * 1000:.0f}ms {summarize_outcomes(outcomes)}")
+
+    start = time.perf_counter()
+    outcomes = executor.run(tasks, deadline=0.2)
+    print(f"截止 200ms: {(time.perf_counter() - start) * 1000:.0f}ms {summarize_outcomes(outcomes)}")
+
+    start = time.perf_counter()
+    outcomes = asyncio.run(executor.run_async(tasks, timeouts={"web": 0.2}))
+    print(f"asyncio + web 超时: {(time.perf_counter() - start) * 1000:.0f}ms {summarize_outcomes(outcomes)}")
+    executor.shutdown()
@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+=== 分段可更新索引（LSM 风格） ===
+
+磁盘上的 BM25 / 稠密索引是只读的，新增或删除文档原本只能全量重建。分段索引在其上
+增加一层可更新结构，检索器无需感知：
+1. 基础段：启动时加载的只读索引（由索引清单校验），文档号即文档库下标
+2. 增量段：新文档先写入内存中的小索引，达到 flush_docs 后冻结为不可变段
+3. 墓碑：删除只记录文档号，检索时按各段已删除数多取候选并过滤
+4. 后台合并：运行时段数超过 max_segments 时，在后台线程中合并为一段并物理丢弃已删除文档，
+   合并完成后在锁内原子替换段列表，检索不被阻塞
+
+基础段不参与合并（可能是 ANN 索引，且已持久化）；运行时的增删在下次启动时
+由语料追加 / 重建（见 index_manifest）落到基础段。
+"""
+
+import logging
+import math
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .dense_retriever import normalize_embeddings, top_k_from_scores, top_k_per_row
+from .sparse_retriever import BM25IndexBuilder, InvertedBM25Index, default_tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_DOCS = 1000
+DEFAULT_MAX_SEGMENTS = 8
+
+
+class _Segment:
+    """不可变段：底层索引 + 段内下标到全局文档号的映射（基础段为 None，即恒等映射）"""
+
+    __slots__ = ("index", "doc_ids", "num_deleted")
+
+    def __init__(self, index, doc_ids: Optional[np.ndarray], num_deleted: int = 0):
+        self.index = index
+        self.doc_ids = doc_ids
+        self.num_deleted = num_deleted
+
+    def __len__(self) -> int:
+        return len(self.index) if self.doc_ids is None else int(self.doc_ids.size)
+
+    def contains(self, doc_id: int) -> bool:
+        if self.doc_ids is None:
+            return 0 <= doc_id < len(self.index)
+        # 运行时文档号单调递增，段内映射有序
+        position = int(np.searchsorted(self.doc_ids, doc_id))
+        return position < self.doc_ids.size and int(self.doc_ids[position]) == doc_id
+
+    def to_global(self, local_ids: np.ndarray) -> np.ndarray:
+        if self.doc_ids is None:
+            return np.asarray(local_ids, dtype=np.int64)
+        return self.doc_ids[local_ids]
+
+
+class _SegmentedIndex:
+    """
+    分段索引的通用部分：增量段、墓碑、冻结与后台合并
+
+    子类实现 _new_delta / _delta_add / _freeze_delta / _merge_indexes。
+    """
+
+    def __init__(self, base=None, flush_docs: int = DEFAULT_FLUSH_DOCS,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS, background_merge: bool = True):
+        self.flush_docs = flush_docs
+        self.max_segments = max_segments
+        self.background_merge = background_merge
+
+        self.lock = threading.RLock()
+        self.segments: List[_Segment] = []
+        if base is not None and len(base) > 0:
+            self.segments.append(_Segment(base, None))
+        self.next_id = len(base) if base is not None else 0
+        self.tombstones: Set[int] = set()
+
+        self._delta = self._new_delta()
+        self._delta_ids: List[int] = []
+        self._delta_deleted = 0
+        self._delta_snapshot: Optional[_Segment] = None
+
+        # 合并互斥（后台合并与 compact 不会同时改写同一批段）
+        self._merge_lock = threading.Lock()
+        self._merging = False
+        self._merge_pool: Optional[ThreadPoolExecutor] = None
+        self.stats = Counter()
+
+    # ===== 子类接口 =====
+
+    def _new_delta(self):
+        raise NotImplementedError
+
+    def _delta_add(self, delta, payloads: List[Any]):
+        raise NotImplementedError
+
+    def _freeze_delta(self, delta):
+        raise NotImplementedError
+
+    def _merge_indexes(self, parts: List[Tuple[Any, np.ndarray]]):
+        raise NotImplementedError
+
+    # ===== 写入 =====
+
+    def _add(self, payloads: List[Any], doc_ids: Optional[Sequence[int]] = None) -> List[int]:
+        if not payloads:
+            return []
+        with self.lock:
+            if doc_ids is None:
+                doc_ids = list(range(self.next_id, self.next_id + len(payloads)))
+            else:
+                doc_ids = [int(doc_id) for doc_id in doc_ids]
+                if len(doc_ids) != len(payloads):
+                    raise ValueError(f"文档号数量 {len(doc_ids)} 与文档数量 {len(payloads)} 不一致")
+                if doc_ids[0] < self.next_id or any(b <= a for a, b in zip(doc_ids, doc_ids[1:])):
+                    raise ValueError(f"新文档号必须递增且不小于 {self.next_id}")
+
+            self._delta_add(self._delta, payloads)
+            self._delta_ids.extend(doc_ids)
+            self._delta_snapshot = None
+            self.next_id = doc_ids[-1] + 1
+            self.stats["added"] += len(doc_ids)
+
+            merge_now = len(self._delta_ids) >= self.flush_docs and self._flush_locked()
+        if merge_now:
+            self._merge_runtime_segments()
+        return doc_ids
+
+    def delete(self, doc_ids: Iterable[int]) -> int:
+        """删除文档（写墓碑），返回实际删除的数量"""
+        deleted = 0
+        with self.lock:
+            delta_ids = set(self._delta_ids)
+            for doc_id in doc_ids:
+                doc_id = int(doc_id)
+                if doc_id in self.tombstones:
+                    continue
+                if doc_id in delta_ids:
+                    self._delta_deleted += 1
+                    self._delta_snapshot = None
+                else:
+                    segment = next((s for s in self.segments if s.contains(doc_id)), None)
+                    if segment is None:
+                        continue
+                    segment.num_deleted += 1
+                self.tombstones.add(doc_id)
+                deleted += 1
+            self.stats["deleted"] += deleted
+        return deleted
+
+    def flush(self):
+        """将增量段冻结为不可变段"""
+        with self.lock:
+            merge_now = self._flush_locked()
+        if merge_now:
+            self._merge_runtime_segments()
+
+    def _flush_locked(self) -> bool:
+        """冻结增量段；返回 True 表示需要由调用方在释放 self.lock 后同步合并"""
+        if not self._delta_ids:
+            return False
+        segment = _Segment(self._freeze_delta(self._delta), np.asarray(self._delta_ids, dtype=np.int64),
+                           self._delta_deleted)
+        self.segments.append(segment)
+        self._delta = self._new_delta()
+        self._delta_ids = []
+        self._delta_deleted = 0
+        self._delta_snapshot = None
+        self.stats["flushes"] += 1
+
+        return len(self._runtime_segments()) > self.max_segments and self._schedule_merge()
+
+    def _runtime_segments(self) -> List[_Segment]:
+        return [segment for segment in self.segments if segment.doc_ids is not None]
+
+    # ===== 合并 =====
+
+    def _schedule_merge(self) -> bool:
+        """
+        安排一次合并（调用时持有 self.lock）
+
+        同步模式下不能在此直接合并：合并先取 _merge_lock 再取 self.lock，而 compact 正是按这个
+        顺序加锁，持有 self.lock 去等 _merge_lock 会与之死锁。此时返回 True，由调用方释放锁后执行。
+        """
+        if self._merging:
+            return False
+        self._merging = True
+        if self.background_merge:
+            if self._merge_pool is None:
+                self._merge_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="segment-merge")
+            self._merge_pool.submit(self._merge_runtime_segments)
+            return False
+        return True
+
+    def compact(self):
+        """冻结增量段并同步合并全部运行时段"""
+        with self.lock:
+            self._flush_locked()
+        self._merge_runtime_segments()
+
+    def _merge_runtime_segments(self):
+        with self._merge_lock:
+            try:
+                self._merge_locked()
+            except Exception as e:
+                logger.error(f"❌ 段合并失败: {e}")
+            finally:
+                self._merging = False
+
+        # 合并期间冻结的新段可能再次超过上限
+        with self.lock:
+            if self.background_merge and len(self._runtime_segments()) > self.max_segments:
+                self._schedule_merge()
+
+    def _merge_locked(self):
+        with self.lock:
+            to_merge = self._runtime_segments()
+            if len(to_merge) < 2 and not any(segment.num_deleted for segment in to_merge):
+                return
+            deleted = frozenset(self.tombstones)
+
+        # 合并在锁外进行，期间的检索与写入不受影响
+        keeps = [
+            ~np.isin(segment.doc_ids, np.fromiter(deleted, dtype=np.int64, count=len(deleted)))
+            for segment in to_merge
+        ]
+        kept_ids = np.concatenate([segment.doc_ids[keep] for segment, keep in zip(to_merge, keeps)])
+        purged = {int(doc_id) for segment, keep in zip(to_merge, keeps) for doc_id in segment.doc_ids[~keep]}
+        merged = None
+        if kept_ids.size:
+            merged = _Segment(self._merge_indexes([(s.index, keep) for s, keep in zip(to_merge, keeps)]),
+                              kept_ids)
+
+        with self.lock:
+            merged_set = set(map(id, to_merge))
+            remaining = [segment for segment in self.segments if id(segment) not in merged_set]
+            base = [segment for segment in remaining if segment.doc_ids is None]
+            newer = [segment for segment in remaining if segment.doc_ids is not None]
+            if merged is not None:
+                # 合并期间新产生的墓碑
+                merged.num_deleted = sum(1 for doc_id in self.tombstones - deleted if merged.contains(doc_id))
+                self.segments = base + [merged] + newer
+            else:
+                self.segments = base + newer
+            self.tombstones -= purged
+            self.stats["merges"] += 1
+            self.stats["purged"] += len(purged)
+        logger.info(f"✅ 段合并完成: {len(to_merge)} 段 -> {int(kept_ids.size)} 个文档，清除 {len(purged)} 个已删除文档")
+
+    # ===== 检索 =====
+
+    def _snapshot(self) -> Tuple[List[_Segment], Set[int]]:
+        """检索用快照：段列表 + 当前增量段（冻结结果缓存到下一次写入）+ 墓碑副本"""
+        with self.lock:
+            if self._delta_ids and self._delta_snapshot is None:
+                self._delta_snapshot = _Segment(self._freeze_delta(self._delta),
+                                                np.asarray(self._delta_ids, dtype=np.int64),
+                                                self._delta_deleted)
+            segments = list(self.segments)
+            if self._delta_snapshot is not None:
+                segments.append(self._delta_snapshot)
+            return segments, set(self.tombstones)
+
+    @classmethod
+    def _search_segments(cls, segments: List[_Segment], tombstones: Set[int], top_k: int,
+                         search_fn: Callable[[Any, int], Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+        hits = []
+        for segment in segments:
+            k = min(top_k + segment.num_deleted, len(segment.index))
+            if k > 0:
+                hits.append((segment, *search_fn(segment.index, k)))
+        return cls._merge_segment_hits(hits, tombstones, top_k)
+
+    @classmethod
+    def _search_segments_batch(cls, segments: List[_Segment], tombstones: Set[int], top_k: int, num_queries: int,
+                               search_batch_fn: Callable[[Any, int], List[Tuple[np.ndarray, np.ndarray]]]
+                               ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """每段对全部查询只检索一次，再逐查询合并各段结果"""
+        per_query = [[] for _ in range(num_queries)]
+        for segment in segments:
+            k = min(top_k + segment.num_deleted, len(segment.index))
+            if k <= 0:
+                continue
+            for hits, (local_ids, scores) in zip(per_query, search_batch_fn(segment.index, k)):
+                hits.append((segment, local_ids, scores))
+        return [cls._merge_segment_hits(hits, tombstones, top_k) for hits in per_query]
+
+    @staticmethod
+    def _merge_segment_hits(hits: List[Tuple[_Segment, np.ndarray, np.ndarray]], tombstones: Set[int],
+                            top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """段内结果映射为全局文档号、过滤墓碑后取全局 top-k"""
+        all_ids, all_scores = [], []
+        for segment, local_ids, scores in hits:
+            doc_ids = segment.to_global(np.asarray(local_ids, dtype=np.int64))
+            if segment.num_deleted:
+                alive = np.fromiter((int(doc_id) not in tombstones for doc_id in doc_ids),
+                                    dtype=bool, count=doc_ids.size)
+                doc_ids, scores = doc_ids[alive], np.asarray(scores)[alive]
+            all_ids.append(doc_ids)
+            all_scores.append(np.asarray(scores, dtype=np.float32))
+
+        if not all_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        doc_ids, scores = np.concatenate(all_ids), np.concatenate(all_scores)
+        order, top_scores = top_k_from_scores(scores, top_k)
+        return doc_ids[order], top_scores
+
+    def __len__(self) -> int:
+        """有效文档数（不含已删除）"""
+        with self.lock:
+            return sum(len(segment) for segment in self.segments) + len(self._delta_ids) - len(self.tombstones)
+
+    def get_segment_info(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "segments": [len(segment) for segment in self.segments],
+                "delta_docs": len(self._delta_ids),
+                "tombstones": len(self.tombstones),
+                "merging": self._merging,
+                **self.stats
+            }
+
+    def shutdown(self, wait: bool = True):
+        if self._merge_pool is not None:
+            self._merge_pool.shutdown(wait=wait)
+            self._merge_pool = None
+
+
+class SegmentedBM25Index(_SegmentedIndex):
+    """
+    可更新 BM25 索引
+
+    各段用全局统计量（总文档数、词项文档频率之和算出的 IDF，以及全局平均文档长度）打分，
+    使不同段的分数可比，且与对全部文档重建的单一索引一致；
+    已删除文档在合并前仍计入统计量（与 Lucene 一致）。
+    """
+
+    def __init__(self, base: Optional[InvertedBM25Index] = None, k1: float = 1.5, b: float = 0.75,
+                 tokenizer: Callable[[str], List[str]] = default_tokenize, **kwargs):
+        self.k1 = base.k1 if base is not None else k1
+        self.b = base.b if base is not None else b
+        self.tokenizer = base.tokenizer if base is not None else tokenizer
+        super().__init__(base, **kwargs)
+
+    def _new_delta(self) -> BM25IndexBuilder:
+        return BM25IndexBuilder(k1=self.k1, b=self.b, tokenizer=self.tokenizer)
+
+    def _delta_add(self, delta: BM25IndexBuilder, payloads: List[str]):
+        delta.add_documents(payloads)
+
+    def _freeze_delta(self, delta: BM25IndexBuilder) -> InvertedBM25Index:
+        return delta.finalize()
+
+    def _merge_indexes(self, parts: List[Tuple[InvertedBM25Index, np.ndarray]]) -> InvertedBM25Index:
+        return InvertedBM25Index.merge(parts)
+
+    def add_documents(self, texts: Iterable[str], doc_ids: Optional[Sequence[int]] = None) -> List[int]:
+        """加入文档，返回分配的文档号"""
+        return self._add(list(texts), doc_ids)
+
+    def search(self, query: str, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        segments, tombstones = self._snapshot()
+        if len(segments) == 1 and not segments[0].num_deleted:
+            local_ids, scores = segments[0].index.search(query, top_k)
+            return segments[0].to_global(local_ids), scores
+
+        idf, avgdl = self._global_statistics(segments, set(self.tokenizer(query)))
+        return self._search_segments(segments, tombstones, top_k,
+                                     lambda index, k: index.search(query, k, idf_override=idf,
+                                                                   avgdl_override=avgdl))
+
+    def search_batch(self, queries: List[str], top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索：每段对全部查询只遍历一次倒排，全局 IDF 对查询词并集统一计算"""
+        segments, tombstones = self._snapshot()
+        if len(segments) == 1 and not segments[0].num_deleted:
+            return [(segments[0].to_global(local_ids), scores)
+                    for local_ids, scores in segments[0].index.search_batch(queries, top_k)]
+
+        idf, avgdl = self._global_statistics(segments, {term for query in queries for term in self.tokenizer(query)})
+        return self._search_segments_batch(segments, tombstones, top_k, len(queries),
+                                           lambda index, k: index.search_batch(queries, k, idf_override=idf,
+                                                                               avgdl_override=avgdl))
+
+    @staticmethod
+    def _global_statistics(segments: List[_Segment], terms: Set[str]) -> Tuple[Dict[str, float], float]:
+        """查询词的全局 IDF 与全局平均文档长度（Σ 文档长度 / Σ 文档数）"""
+        num_docs = sum(len(segment.index) for segment in segments)
+        total_length = sum(segment.index.avgdl * len(segment.index) for segment in segments)
+        idf = {}
+        for term in terms:
+            df = sum(segment.index.document_frequency(term) for segment in segments)
+            if df:
+                idf[term] = math.log1p((num_docs - df + 0.5) / (df + 0.5))
+        return idf, total_length / num_docs if num_docs else 0.0
+
+    def get_index_info(self) -> Dict[str, Any]:
+        base = self.segments[0].index if self.segments and self.segments[0].doc_ids is None else None
+        info = base.get_index_info() if base is not None else {"k1": self.k1, "b": self.b}
+        info.update(self.get_segment_info())
+        return info
+
+
+class _MatrixSegment:
+    """内存中的稠密段（已归一化的向量矩阵）"""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        query = normalize_embeddings(query_embedding)[0]
+        return top_k_from_scores(self.vectors @ query, top_k)
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        indices, scores = top_k_per_row(normalize_embeddings(query_embeddings) @ self.vectors.T, top_k)
+        return list(zip(indices, scores))
+
+    def get_vectors(self, indices: np.ndarray) -> np.ndarray:
+        return self.vectors[indices]
+
+
+class SegmentedDenseIndex(_SegmentedIndex):
+    """
+    可更新稠密索引
+
+    基础段可以是 ShardedDenseIndex 或 ANN 索引；运行时段为内存矩阵，精确检索。
+    余弦相似度与段无关，各段分数直接可比。
+    """
+
+    def _new_delta(self) -> List[np.ndarray]:
+        return []
+
+    def _delta_add(self, delta: List[np.ndarray], payloads: List[np.ndarray]):
+        delta.extend(payloads)
+
+    def _freeze_delta(self, delta: List[np.ndarray]) -> _MatrixSegment:
+        return _MatrixSegment(np.stack(delta).astype(np.float32))
+
+    def _merge_indexes(self, parts: List[Tuple[Any, np.ndarray]]) -> _MatrixSegment:
+        return _MatrixSegment(np.concatenate([index.get_vectors(np.flatnonzero(keep)) for index, keep in parts]))
+
+    def add_embeddings(self, embeddings: np.ndarray, doc_ids: Optional[Sequence[int]] = None) -> List[int]:
+        """加入文档嵌入，返回分配的文档号"""
+        return self._add(list(normalize_embeddings(embeddings)), doc_ids)
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        segments, tombstones = self._snapshot()
+        if len(segments) == 1 and not segments[0].num_deleted:
+            local_ids, scores = segments[0].index.search(query_embedding, top_k)
+            return segments[0].to_global(local_ids), scores
+        return self._search_segments(segments, tombstones, top_k,
+                                     lambda index, k: index.search(query_embedding, k))
+
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 10) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """批量检索：每段与全部查询做一次矩阵-矩阵乘法（ANN 基础段交给其批量接口）"""
+        query_embeddings = normalize_embeddings(query_embeddings)
+        segments, tombstones = self._snapshot()
+        if len(segments) == 1 and not segments[0].num_deleted:
+            return [(segments[0].to_global(local_ids), scores)
+                    for local_ids, scores in segments[0].index.search_batch(query_embeddings, top_k)]
+        return self._search_segments_batch(segments, tombstones, top_k, query_embeddings.shape[0],
+                                           lambda index, k: index.search_batch(query_embeddings, k))
+
+    def get_index_info(self) -> Dict[str, Any]:
+        info = {}
+        if self.segments and self.segments[0].doc_ids is None and hasattr(self.segments[0].index, 'get_index_info'):
+            info.update(self.segments[0].index.get_index_info())
+        info.update(self.get_segment_info())
+        return info
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    random.seed(0)
+    vocabulary = [f"w{i}" for i in range(2000)]
+
+    def random_text() -> str:
+        return " ".join(random.choices(vocabulary, k=30))
+
+    base_texts = [random_text() for _ in range(20000)]
+    start = time.perf_counter()
+    base = InvertedBM25Index.from_texts(base_texts)
+    print(f"全量构建 {len(base_texts)} 篇: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    index = SegmentedBM25Index(base, flush_docs=200, max_segments=4, background_merge=False)
+    new_texts = [random_text() for _ in range(1000)]
+    start = time.perf_counter()
+    for i in range(0, len(new_texts), 50):
+        index.add_documents(new_texts[i:i + 50])
+    index.delete(range(0, 21000, 7))
+    print(f"增量加入 {len(new_texts)} 篇 + 删除 3000 篇: {(time.perf_counter() - start) * 1000:.0f}ms")
+    print(index.get_segment_info())
+
+    # 与全量重建的结果对比（已删除文档在合并前仍计入统计量，重建索引同样包含它们，再过滤掉）
+    reference = InvertedBM25Index.from_texts(base_texts + new_texts)
+    for query in ["w1 w2 w3", "w42 w1999", "w7"]:
+        ids, scores = index.search(query, 5)
+        ref_ids, ref_scores = reference.search(query, 5 + 3000)
+        alive = ref_ids % 7 != 0
+        print(f"{query!r}: 分段 {list(zip(ids.tolist(), scores.round(4).tolist()))} / "
+              f"重建 {list(zip(ref_ids[alive][:5].tolist(), ref_scores[alive][:5].round(4).tolist()))}")
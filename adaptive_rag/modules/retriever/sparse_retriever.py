@@ -1 +1,507 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""
+=== 倒排索引 BM25 检索器 ===
+
+替代 rank_bm25 的逐文档打分：
+1. 倒排列表以紧凑的 NumPy 数组保存（CSR 布局：词项偏移 + 文档号 + 词频）
+2. MaxScore 风格的 top-k 提前终止：按词项得分上界排序，剩余上界之和低于
+   当前第 k 名分数后，只对已有候选做跳跃式累加
+3. 带版本号的磁盘格式，词典与倒排列表均通过 mmap 加载，无需反序列化
+4. 批量检索：多个查询的词项取并集，倒排只遍历一次
+
+检索代价只与查询词的倒排列表长度相关，而与语料规模无关。
+"""
+
+import json
+import logging
+import math
+import os
+from array import array
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BM25_FORMAT_VERSION = 1
+BM25_META_FILE = "bm25_meta.json"
+BM25_ARRAYS = (
+    "term_blob", "term_offsets", "postings_offsets", "postings_docs",
+    "postings_tfs", "doc_lengths", "idf", "term_upper_bounds"
+)
+
+
+def default_tokenize(text: str) -> List[str]:
+    """
+    默认分词：小写 + 空白切分
+
+    切分粒度与原 BM25Okapi 方案的 text.split() 相同，但不区分大小写（原方案区分），
+    因此 "BM25" 与 "bm25" 现在匹配同一词项。
+    """
+    return text.lower().split()
+
+
+class BM25IndexBuilder:
+    """
+    增量构建倒排索引
+
+    文档逐批加入，词项的倒排列表以 array('I') 累积，finalize 时一次性转换为 CSR 数组。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75,
+                 tokenizer: Callable[[str], List[str]] = default_tokenize):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+        self._postings_docs: Dict[str, array] = {}
+        self._postings_tfs: Dict[str, array] = {}
+        self._doc_lengths = array('I')
+
+    @property
+    def num_docs(self) -> int:
+        return len(self._doc_lengths)
+
+    def add_document(self, text: str) -> int:
+        """加入一个文档，返回其文档号"""
+        doc_id = len(self._doc_lengths)
+        tokens = self.tokenizer(text)
+        self._doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            if term not in self._postings_docs:
+                self._postings_docs[term] = array('I')
+                self._postings_tfs[term] = array('I')
+            self._postings_docs[term].append(doc_id)
+            self._postings_tfs[term].append(tf)
+        return doc_id
+
+    def add_documents(self, texts: Iterable[str]):
+        for text in texts:
+            self.add_document(text)
+
+    def finalize(self) -> "InvertedBM25Index":
+        """转换为只读的 CSR 倒排索引"""
+        terms = sorted(self._postings_docs)
+        encoded_terms = [term.encode('utf-8') for term in terms]
+
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(term) for term in encoded_terms])
+        term_blob = np.frombuffer(b"".join(encoded_terms), dtype=np.uint8).copy()
+
+        lengths = [len(self._postings_docs[term]) for term in terms]
+        postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings_offsets[1:] = np.cumsum(lengths)
+
+        postings_docs = np.empty(int(postings_offsets[-1]), dtype=np.int32)
+        postings_tfs = np.empty(int(postings_offsets[-1]), dtype=np.uint16)
+        for i, term in enumerate(terms):
+            start, end = postings_offsets[i], postings_offsets[i + 1]
+            postings_docs[start:end] = np.frombuffer(self._postings_docs[term], dtype=np.uint32)
+            postings_tfs[start:end] = np.minimum(np.frombuffer(self._postings_tfs[term], dtype=np.uint32), 65535)
+
+        doc_lengths = np.frombuffer(self._doc_lengths, dtype=np.uint32).astype(np.int32)
+
+        index = InvertedBM25Index(
+            k1=self.k1,
+            b=self.b,
+            tokenizer=self.tokenizer,
+            arrays={
+                "term_blob": term_blob,
+                "term_offsets": term_offsets,
+                "postings_offsets": postings_offsets,
+                "postings_docs": postings_docs,
+                "postings_tfs": postings_tfs,
+                "doc_lengths": doc_lengths
+            }
+        )
+        logger.info(f"BM25 倒排索引构建完成: {index.num_docs} 个文档, {index.num_terms} 个词项, "
+                    f"{postings_docs.size} 条倒排记录")
+        return index
+
+
+class InvertedBM25Index:
+    """
+    只读倒排 BM25 索引
+
+    IDF 采用 log(1 + (N - df + 0.5) / (df + 0.5))，保证非负，
+    使每个词项的得分上界可用于 MaxScore 剪枝。
+    """
+
+    def __init__(self, k1: float, b: float, arrays: Dict[str, np.ndarray],
+                 tokenizer: Callable[[str], List[str]] = default_tokenize):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = tokenizer
+
+        self.term_blob = arrays["term_blob"]
+        self.term_offsets = arrays["term_offsets"]
+        self.postings_offsets = arrays["postings_offsets"]
+        self.postings_docs = arrays["postings_docs"]
+        self.postings_tfs = arrays["postings_tfs"]
+        self.doc_lengths = arrays["doc_lengths"]
+
+        self.num_docs = int(self.doc_lengths.size)
+        self.num_terms = int(self.term_offsets.size - 1)
+        self.avgdl = float(self.doc_lengths.mean()) if self.num_docs else 0.0
+
+        # 文档长度归一化因子 k1 * (1 - b + b * dl / avgdl)
+        if self.num_docs:
+            self.length_norms = (self.k1 * (1 - self.b + self.b * self.doc_lengths / self.avgdl)).astype(np.float32)
+        else:
+            self.length_norms = np.empty(0, dtype=np.float32)
+
+        if "idf" in arrays and "term_upper_bounds" in arrays:
+            self.idf = arrays["idf"]
+            self.term_upper_bounds = arrays["term_upper_bounds"]
+        else:
+            self._compute_term_statistics()
+
+    def _compute_term_statistics(self):
+        """计算每个词项的 IDF 和得分上界"""
+        df = np.diff(self.postings_offsets).astype(np.float64)
+        self.idf = np.log1p((self.num_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        weights = self._posting_weights(0, self.postings_docs.size)
+        upper_bounds = np.zeros(self.num_terms, dtype=np.float32)
+        non_empty = np.diff(self.postings_offsets) > 0
+        if weights.size:
+            upper_bounds[non_empty] = np.maximum.reduceat(weights, self.postings_offsets[:-1][non_empty])
+        self.term_upper_bounds = upper_bounds * self.idf
+
+    def _posting_weights(self, start: int, end: int, avgdl: Optional[float] = None) -> np.ndarray:
+        """倒排区间内每条记录的 tf 饱和项 tf*(k1+1)/(tf+norm)（不含 IDF）"""
+        tfs = np.asarray(self.postings_tfs[start:end], dtype=np.float32)
+        norms = self._length_norms(self.postings_docs[start:end], avgdl)
+        return tfs * (self.k1 + 1) / (tfs + norms)
+
+    def _length_norms(self, docs: np.ndarray, avgdl: Optional[float] = None) -> np.ndarray:
+        """文档的长度归一化因子；给定 avgdl 时按该平均长度计算（分段索引使用全局平均长度）"""
+        if avgdl is None:
+            return self.length_norms[docs]
+        lengths = np.asarray(self.doc_lengths[docs], dtype=np.float32)
+        return (self.k1 * (1 - self.b + self.b * lengths / avgdl)).astype(np.float32)
+
+    def _bound_scale(self, avgdl: Optional[float]) -> float:
+        """
+        按 avgdl 替换后词项得分上界的放大系数
+
+        norm 与 1/avgdl 线性相关：avgdl 变大时 norm 至多缩小为原来的 self.avgdl / avgdl，
+        tf*(k1+1)/(tf+norm) 至多放大 avgdl / self.avgdl 倍；avgdl 变小时得分只会变小，上界仍然有效。
+        """
+        if avgdl is None or self.avgdl <= 0:
+            return 1.0
+        return max(1.0, avgdl / self.avgdl)
+
+    # ===== 词典 =====
+
+    def _term_at(self, i: int) -> bytes:
+        return self.term_blob[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes()
+
+    def lookup_term(self, term: str) -> int:
+        """二分查找词项号，不存在时返回 -1"""
+        target = term.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self._term_at(lo) == target:
+            return lo
+        return -1
+
+    def document_frequency(self, term: str) -> int:
+        """词项的文档频率（未出现时为 0）"""
+        term_id = self.lookup_term(term)
+        if term_id < 0:
+            return 0
+        return int(self.postings_offsets[term_id + 1] - self.postings_offsets[term_id])
+
+    # ===== 检索 =====
+
+    def search(self, query: str, top_k: int = 10,
+               idf_override: Optional[Dict[str, float]] = None,
+               avgdl_override: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            idf_override: {词项: IDF}，分段索引用全局统计量代替本段 IDF，使各段分数可比
+            avgdl_override: 平均文档长度，分段索引用全局值代替本段值（与 idf_override 一起使用）
+
+        Returns:
+            (文档下标, BM25 分数)，按分数降序
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        if self.num_docs == 0 or top_k <= 0:
+            return empty
+
+        # 查询词项（重复词按出现次数加权，与 BM25Okapi 一致）
+        term_counts = Counter(self.tokenizer(query))
+        query_terms = []
+        for term, count in term_counts.items():
+            term_id = self.lookup_term(term)
+            if term_id >= 0 and self.term_upper_bounds[term_id] > 0:
+                if idf_override is not None and term in idf_override:
+                    # 得分与上界都与 IDF 成正比，替换 IDF 等价于按比例调整词项权重
+                    count = count * idf_override[term] / float(self.idf[term_id])
+                query_terms.append((term_id, count))
+        if not query_terms:
+            return empty
+
+        # 按得分上界降序处理
+        query_terms.sort(key=lambda item: -float(self.term_upper_bounds[item[0]]) * item[1])
+        bound_scale = self._bound_scale(avgdl_override)
+        upper_bounds = [float(self.term_upper_bounds[term_id]) * count * bound_scale for term_id, count in query_terms]
+        remaining_bounds = np.cumsum(upper_bounds[::-1])[::-1].tolist() + [0.0]
+
+        cand_docs = np.empty(0, dtype=np.int32)
+        cand_scores = np.empty(0, dtype=np.float32)
+
+        for i, (term_id, count) in enumerate(query_terms):
+            start, end = int(self.postings_offsets[term_id]), int(self.postings_offsets[term_id + 1])
+            idf = float(self.idf[term_id]) * count
+            threshold = self._kth_score(cand_scores, top_k)
+
+            if remaining_bounds[i] > threshold:
+                # 必要词项：其倒排中的新文档仍可能进入 top-k，完整合并
+                term_docs = np.asarray(self.postings_docs[start:end])
+                term_scores = self._posting_weights(start, end, avgdl_override) * idf
+                merged_docs = np.concatenate([cand_docs, term_docs])
+                merged_scores = np.concatenate([cand_scores, term_scores])
+                cand_docs, inverse = np.unique(merged_docs, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=merged_scores).astype(np.float32)
+            else:
+                # 非必要词项：剪掉无望的候选，再在倒排中跳跃查找剩余候选
+                alive = cand_scores + remaining_bounds[i] >= threshold
+                cand_docs, cand_scores = cand_docs[alive], cand_scores[alive]
+                term_docs = self.postings_docs[start:end]
+                positions = np.searchsorted(term_docs, cand_docs)
+                positions = np.minimum(positions, end - start - 1)
+                hits = np.asarray(term_docs[positions]) == cand_docs
+                if hits.any():
+                    hit_positions = positions[hits] + start
+                    tfs = np.asarray(self.postings_tfs[hit_positions], dtype=np.float32)
+                    norms = self._length_norms(cand_docs[hits], avgdl_override)
+                    cand_scores[hits] += idf * tfs * (self.k1 + 1) / (tfs + norms)
+
+        if cand_docs.size == 0:
+            return empty
+
+        if top_k < cand_docs.size:
+            top = np.argpartition(-cand_scores, top_k - 1)[:top_k]
+        else:
+            top = np.arange(cand_docs.size)
+        top = top[np.argsort(-cand_scores[top], kind="stable")]
+        return cand_docs[top].astype(np.int64), cand_scores[top]
+
+    def search_batch(self, queries: List[str], top_k: int = 10,
+                     idf_override: Optional[Dict[str, float]] = None,
+                     avgdl_override: Optional[float] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        批量 BM25 检索
+
+        所有查询的词项取并集后只遍历一次倒排：每条倒排记录的得分只计算一次，
+        (查询, 候选文档) 的得分通过一次 bincount 累加，再逐查询取 top-k。
+        不做 MaxScore 剪枝，结果与逐条 search 一致（精确）。
+
+        Returns:
+            每个查询一个 (文档下标, BM25 分数)，按分数降序
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        if self.num_docs == 0 or top_k <= 0 or not queries:
+            return [empty for _ in queries]
+
+        # 词项并集 -> 列号；每个 (查询, 列) 记录一次查询内权重（次数，按 idf_override 缩放）
+        columns: Dict[int, int] = {}
+        entry_queries, entry_columns, entry_weights = [], [], []
+        for q, query in enumerate(queries):
+            for term, count in Counter(self.tokenizer(query)).items():
+                term_id = self.lookup_term(term)
+                if term_id < 0 or self.term_upper_bounds[term_id] <= 0:
+                    continue
+                if idf_override is not None and term in idf_override:
+                    count = count * idf_override[term] / float(self.idf[term_id])
+                entry_queries.append(q)
+                entry_columns.append(columns.setdefault(term_id, len(columns)))
+                entry_weights.append(count)
+        if not columns:
+            return [empty for _ in queries]
+
+        # 一次遍历并集词项的倒排，每条记录的得分（含 IDF）只计算一次
+        term_ids = np.fromiter(columns, dtype=np.int64, count=len(columns))
+        starts = self.postings_offsets[term_ids].astype(np.int64)
+        lengths = self.postings_offsets[term_ids + 1].astype(np.int64) - starts
+        column_offsets = np.cumsum(lengths) - lengths
+        positions = np.repeat(starts - column_offsets, lengths) + np.arange(int(lengths.sum()))
+        docs = np.asarray(self.postings_docs[positions]).astype(np.int64)
+        tfs = np.asarray(self.postings_tfs[positions], dtype=np.float32)
+        idf = np.repeat(self.idf[term_ids], lengths)
+        contributions = idf * tfs * (self.k1 + 1) / (tfs + self._length_norms(docs, avgdl_override))
+
+        # 展开为 (查询, 倒排记录) 对，按 查询 * N + 文档号 一次累加
+        entry_columns = np.asarray(entry_columns, dtype=np.int64)
+        pair_lengths = lengths[entry_columns]
+        pair_postings = (np.repeat(column_offsets[entry_columns] - (np.cumsum(pair_lengths) - pair_lengths), pair_lengths)
+                         + np.arange(int(pair_lengths.sum())))
+        keys = np.repeat(np.asarray(entry_queries, dtype=np.int64), pair_lengths) * self.num_docs + docs[pair_postings]
+        pair_scores = np.repeat(np.asarray(entry_weights, dtype=np.float32), pair_lengths) * contributions[pair_postings]
+        keys, inverse = np.unique(keys, return_inverse=True)
+        scores = np.bincount(inverse, weights=pair_scores).astype(np.float32)
+        boundaries = np.searchsorted(keys, np.arange(len(queries) + 1, dtype=np.int64) * self.num_docs)
+
+        results = []
+        for q in range(len(queries)):
+            lo, hi = int(boundaries[q]), int(boundaries[q + 1])
+            if lo == hi:
+                results.append(empty)
+                continue
+            row = scores[lo:hi]
+            if top_k < row.size:
+                top = np.argpartition(-row, top_k - 1)[:top_k]
+            else:
+                top = np.arange(row.size)
+            top = top[np.argsort(-row[top], kind="stable")]
+            results.append((keys[lo + top] - q * self.num_docs, row[top]))
+        return results
+
+    @staticmethod
+    def _kth_score(scores: np.ndarray, k: int) -> float:
+        if scores.size < k:
+            return 0.0
+        return float(np.partition(scores, scores.size - k)[scores.size - k])
+
+    def __len__(self) -> int:
+        return self.num_docs
+
+    # ===== 持久化 =====
+
+    def save(self, index_dir: str):
+        """保存为带版本号的目录格式（JSON 元数据 + .npy 数组）"""
+        os.makedirs(index_dir, exist_ok=True)
+        arrays = {
+            "term_blob": self.term_blob,
+            "term_offsets": self.term_offsets,
+            "postings_offsets": self.postings_offsets,
+            "postings_docs": self.postings_docs,
+            "postings_tfs": self.postings_tfs,
+            "doc_lengths": self.doc_lengths,
+            "idf": self.idf,
+            "term_upper_bounds": self.term_upper_bounds
+        }
+        for name, values in arrays.items():
+            np.save(os.path.join(index_dir, f"{name}.npy"), np.asarray(values))
+
+        meta = {
+            "version": BM25_FORMAT_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "num_docs": self.num_docs,
+            "num_terms": self.num_terms,
+            "num_postings": int(self.postings_docs.size),
+            "avgdl": self.avgdl,
+            "tokenizer": getattr(self.tokenizer, "__name__", "custom")
+        }
+        with open(os.path.join(index_dir, BM25_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, BM25_META_FILE))
+
+    @classmethod
+    def load(cls, index_dir: str, tokenizer: Callable[[str], List[str]] = default_tokenize) -> "InvertedBM25Index":
+        """通过 mmap 加载索引"""
+        with open(os.path.join(index_dir, BM25_META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta.get("version") != BM25_FORMAT_VERSION:
+            raise ValueError(f"BM25 索引版本不兼容: {meta.get('version')} != {BM25_FORMAT_VERSION}")
+
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+            for name in BM25_ARRAYS
+        }
+        # 文档长度需要参与向量化归一化计算，读入内存（每文档 4 字节）
+        arrays["doc_lengths"] = np.asarray(arrays["doc_lengths"])
+
+        index = cls(k1=meta["k1"], b=meta["b"], arrays=arrays, tokenizer=tokenizer)
+        logger.info(f"BM25 倒排索引加载成功: {index.num_docs} 个文档, {index.num_terms} 个词项")
+        return index
+
+    @classmethod
+    def from_texts(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75,
+                   tokenizer: Callable[[str], List[str]] = default_tokenize) -> "InvertedBM25Index":
+        builder = BM25IndexBuilder(k1=k1, b=b, tokenizer=tokenizer)
+        builder.add_documents(texts)
+        return builder.finalize()
+
+    @classmethod
+    def merge(cls, parts: List[Tuple["InvertedBM25Index", Optional[np.ndarray]]]) -> "InvertedBM25Index":
+        """
+        直接合并多个索引的 CSR 倒排（不需要原文），文档号按 parts 顺序连续重排
+
+        Args:
+            parts: [(索引, 保留掩码)]，掩码为 False 的文档（已删除）在合并时丢弃；None 表示全部保留
+        """
+        first = parts[0][0]
+        postings: Dict[bytes, List[Tuple[np.ndarray, np.ndarray]]] = defaultdict(list)
+        doc_lengths = []
+        offset = 0
+
+        for index, keep in parts:
+            if keep is None:
+                keep = np.ones(index.num_docs, dtype=bool)
+            new_ids = np.cumsum(keep, dtype=np.int64) - 1 + offset
+            new_ids[~keep] = -1
+            all_docs = new_ids[np.asarray(index.postings_docs)]
+            all_tfs = np.asarray(index.postings_tfs)
+
+            for term_id in range(index.num_terms):
+                start, end = int(index.postings_offsets[term_id]), int(index.postings_offsets[term_id + 1])
+                docs, tfs = all_docs[start:end], all_tfs[start:end]
+                alive = docs >= 0
+                if alive.any():
+                    postings[index._term_at(term_id)].append((docs[alive], tfs[alive]))
+
+            doc_lengths.append(np.asarray(index.doc_lengths)[keep])
+            offset += int(keep.sum())
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum([len(term) for term in terms])
+        postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        postings_offsets[1:] = np.cumsum([sum(docs.size for docs, _ in postings[term]) for term in terms])
+
+        chunks = [chunk for term in terms for chunk in postings[term]]
+        index = cls(
+            k1=first.k1,
+            b=first.b,
+            tokenizer=first.tokenizer,
+            arrays={
+                "term_blob": np.frombuffer(b"".join(terms), dtype=np.uint8).copy(),
+                "term_offsets": term_offsets,
+                "postings_offsets": postings_offsets,
+                "postings_docs": np.concatenate([docs for docs, _ in chunks]).astype(np.int32)
+                if chunks else np.empty(0, dtype=np.int32),
+                "postings_tfs": np.concatenate([tfs for _, tfs in chunks]).astype(np.uint16)
+                if chunks else np.empty(0, dtype=np.uint16),
+                "doc_lengths": np.concatenate(doc_lengths).astype(np.int32)
+                if doc_lengths else np.empty(0, dtype=np.int32)
+            }
+        )
+        logger.info(f"BM25 索引合并完成: {len(parts)} 段 -> {index.num_docs} 个文档, {index.num_terms} 个词项")
+        return index
+
+    def get_index_info(self) -> Dict[str, object]:
+        return {
+            "num_docs": self.num_docs,
+            "num_terms": self.num_terms,
+            "num_postings": int(self.postings_docs.size),
+            "avgdl": self.avgdl,
+            "k1": self.k1,
+            "b": self.b
+        }
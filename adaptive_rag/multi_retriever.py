@@ -6,38 +6,63 @@
 """
 
 import logging
+from functools import partial
 from typing import Dict, List, Any
-from dataclasses import dataclass
 from adaptive_rag.task_decomposer import SubTask
 from adaptive_rag.retrieval_planner import RetrievalPlan
+from adaptive_rag.modules.retriever.retrieval_executor import ParallelRetrievalExecutor
+from adaptive_rag.modules.refiner.deduplicator import MinHashDeduplicator
 
 logger = logging.getLogger(__name__)
 
 
-@dataclass
 class RetrievedDocument:
-    """检索到的文档"""
-    content: str
-    score: float
-    retriever_type: str
-    metadata: Dict[str, Any] = None
-    
-    def __post_init__(self):
-        if self.metadata is None:
-            self.metadata = {}
+    """检索到的文档（__slots__，metadata 按需创建）"""
+
+    __slots__ = ("content", "score", "retriever_type", "_metadata")
+
+    def __init__(self, content: str, score: float, retriever_type: str, metadata: Dict[str, Any] = None):
+        self.content = content
+        self.score = score
+        self.retriever_type = retriever_type
+        self._metadata = metadata
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self._metadata is None:
+            self._metadata = {}
+        return self._metadata
+
+    @metadata.setter
+    def metadata(self, value: Dict[str, Any]):
+        self._metadata = value
+
+    def __repr__(self) -> str:
+        return f"RetrievedDocument(score={self.score:.4f}, retriever_type={self.retriever_type!r})"
 
 
 class MultiModalRetriever:
     """多模态检索器"""
     
-    def __init__(self, config, data_manager=None):
+    def __init__(self, config, data_manager=None, predictive_cache=None):
         self.config = config
+        
+        # 预测性缓存（可选）：子查询的检索结果由后台预取
+        self.predictive_cache = predictive_cache
 
         # 初始化各种检索器
         self.keyword_retriever = None
         self.dense_retriever = None
         self.web_retriever = None
 
+        # 并行检索执行器
+        self.executor = ParallelRetrievalExecutor.from_config(
+            getattr(config, 'retrieval_executor_config', None)
+        )
+
+        # 近似去重（MinHash + LSH）
+        self.deduplicator = MinHashDeduplicator.from_config(getattr(config, 'dedup_config', None))
+
         # 使用传入的数据管理器或创建新的
         if data_manager is not None:
             self.data_manager = data_manager
@@ -55,22 +80,23 @@ class MultiModalRetriever:
     
     def adaptive_retrieve(self, subtask: SubTask, plan: RetrievalPlan) -> List[RetrievedDocument]:
         """自适应检索"""
-        all_documents = []
-        
-        # 关键词检索
-        if plan.weights.get("keyword", 0) > 0:
-            keyword_docs = self._keyword_retrieve(subtask, plan)
-            all_documents.extend(keyword_docs)
+        retrieve_fns = {
+            "keyword": self._keyword_retrieve,
+            "dense": self._dense_retrieve,
+            "web": self._web_retrieve
+        }
         
-        # 向量检索
-        if plan.weights.get("dense", 0) > 0:
-            dense_docs = self._dense_retrieve(subtask, plan)
-            all_documents.extend(dense_docs)
+        # 并行发出所有加权检索器，延迟取最大值而非总和
+        tasks = {
+            name: partial(fn, subtask, plan)
+            for name, fn in retrieve_fns.items()
+            if plan.weights.get(name, 0) > 0
+        }
+        outcomes = self.executor.run(tasks)
         
-        # Web 检索
-        if plan.weights.get("web", 0) > 0:
-            web_docs = self._web_retrieve(subtask, plan)
-            all_documents.extend(web_docs)
+        all_documents = []
+        for outcome in outcomes.values():
+            all_documents.extend(outcome.results)
         
         # 融合结果
         fused_documents = self._fuse_results(all_documents, plan)
@@ -78,12 +104,37 @@ class MultiModalRetriever:
         logger.info(f"为子任务 '{subtask.content}' 检索到 {len(fused_documents)} 个文档")
         return fused_documents
     
+    def prefetch(self, queries: List[str], speculative: bool = False) -> int:
+        """后台预取查询的检索结果（未启用预测性缓存时不做任何事）"""
+        if self.predictive_cache is None:
+            return 0
+        return self.predictive_cache.prefetch(
+            queries, self._prefetch_search, namespace="search_documents", speculative=speculative
+        )
+    
+    def _prefetch_search(self, query: str):
+        return self.data_manager.search_documents(query, top_k=self.predictive_cache.prefetch_top_k)
+    
+    def _search_documents(self, query: str, top_k: int, retriever_type: str):
+        """
+        检索文档；启用预测性缓存时三个检索器共享同一次（或已预取的）检索结果
+
+        等待进行中的预取最多用该检索器的超时时间，超时抛出 TimeoutError 而不是一直占住检索线程。
+        """
+        if self.predictive_cache is None or top_k > self.predictive_cache.prefetch_top_k:
+            return self.data_manager.search_documents(query, top_k=top_k)
+        documents = self.predictive_cache.get_or_fetch(
+            query, self._prefetch_search, namespace="search_documents",
+            timeout=self.executor.timeouts.get(retriever_type)
+        )
+        return documents[:top_k]
+    
     def _keyword_retrieve(self, subtask: SubTask, plan: RetrievalPlan) -> List[RetrievedDocument]:
         """关键词检索"""
         try:
             # 使用数据管理器进行搜索
             top_k = plan.top_k_per_retriever.get("keyword", 5)
-            documents = self.data_manager.search_documents(subtask.content, top_k=top_k)
+            documents = self._search_documents(subtask.content, top_k, "keyword")
             
             retrieved_docs = []
             for i, doc in enumerate(documents):
@@ -113,7 +164,7 @@ class MultiModalRetriever:
         try:
             # 模拟向量检索
             top_k = plan.top_k_per_retriever.get("dense", 5)
-            documents = self.data_manager.search_documents(subtask.content, top_k=top_k)
+            documents = self._search_documents(subtask.content, top_k, "dense")
             
             retrieved_docs = []
             for i, doc in enumerate(documents):
@@ -146,7 +197,7 @@ class MultiModalRetriever:
             top_k = plan.top_k_per_retriever.get("web", 3)
             
             # 简单模拟：从现有文档中选择一些作为"web"结果
-            documents = self.data_manager.search_documents(subtask.content, top_k=top_k)
+            documents = self._search_documents(subtask.content, top_k, "web")
             
             retrieved_docs = []
             for i, doc in enumerate(documents):
@@ -220,18 +271,8 @@ class MultiModalRetriever:
         return sorted(fused_docs.values(), key=lambda x: x.score, reverse=True)
     
     def _deduplicate(self, documents: List[RetrievedDocument]) -> List[RetrievedDocument]:
-        """去重"""
-        seen_content = set()
-        unique_docs = []
-        
-        for doc in documents:
-            # 使用内容的前200字符作为去重键
-            content_key = doc.content[:200]
-            if content_key not in seen_content:
-                seen_content.add(content_key)
-                unique_docs.append(doc)
-        
-        return unique_docs
+        """去重：与排在前面的文档近似重复的文档被丢弃"""
+        return self.deduplicator.deduplicate(documents)
     
     def get_retriever_stats(self) -> Dict[str, Any]:
         """获取检索器统计信息"""
@@ -239,7 +280,8 @@ class MultiModalRetriever:
             "keyword_retriever": "active" if self.keyword_retriever else "simulated",
             "dense_retriever": "active" if self.dense_retriever else "simulated",
             "web_retriever": "active" if self.web_retriever else "simulated",
-            "data_manager": "active"
+            "data_manager": "active",
+            "predictive_cache": self.predictive_cache.get_statistics() if self.predictive_cache else None
         }
 
 
@@ -6,9 +6,12 @@
 """
 
 import logging
+import time
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 
+from ..modules.retriever.retrieval_executor import run_concurrently
+
 logger = logging.getLogger(__name__)
 
 
@@ -38,7 +41,7 @@ class LevelRAGStylePipeline:
     第二阶段：低级搜索器 - 具体检索和聚合
     """
     
-    def __init__(self, config):
+    def __init__(self, config, module_manager=None):
         self.config = config
         
         # 高级组件：查询分析和分解
@@ -48,19 +51,33 @@ class LevelRAGStylePipeline:
         self.task_decomposer = TaskDecomposer(config)
         self.retrieval_planner = RetrievalPlanner(config)
         
+        # 预测性缓存（modules.predictive_cache 开启时）：分解完成后立即后台预取子查询
+        # 有模块管理器时复用其实例，查询日志学到的转移与预取结果只有一份
+        self.predictive_cache = None
+        if module_manager is not None:
+            self.predictive_cache = module_manager.get_module("predictive_cache")
+        elif getattr(getattr(config, 'modules', None), 'predictive_cache', False):
+            from ..core.predictive_cache import PredictiveCache
+            self.predictive_cache = PredictiveCache(config)
+        
         # 低级组件：具体检索器
         from ..multi_retriever import MultiModalRetriever
-        self.multi_retriever = MultiModalRetriever(config)
+        self.multi_retriever = MultiModalRetriever(config, predictive_cache=self.predictive_cache)
+        
+        # 子任务并发检索数
+        executor_config = getattr(config, 'retrieval_executor_config', None) or {}
+        self.max_subtask_workers = executor_config.get("max_subtask_workers", 4)
         
         logger.info("LevelRAG 风格管道初始化完成")
     
-    def search(self, query: str, context: str = "") -> Dict[str, Any]:
+    def search(self, query: str, context: str = "", session_id: Optional[str] = None) -> Dict[str, Any]:
         """
         主搜索方法 - 实现两阶段搜索
         
         Args:
             query: 用户查询
             context: 可选上下文
+            session_id: 会话标识，预测性缓存按会话学习查询转移；未提供时不记录本次查询
             
         Returns:
             搜索结果和元数据
@@ -69,23 +86,38 @@ class LevelRAGStylePipeline:
         
         # === 第一阶段：高级搜索器 ===
         # 1. 查询分解
+        stage_start = time.time()
         subtasks = self.task_decomposer.decompose_query(query)
+        decomposition_time = time.time() - stage_start
         logger.info(f"查询分解完成，生成 {len(subtasks)} 个子任务")
         
+        # 子查询及预测的后续查询在后台预取，与检索规划重叠
+        if self.predictive_cache is not None:
+            self._prefetch(query, subtasks, session_id)
+        
         # 2. 检索策略规划
+        stage_start = time.time()
         plans = self.retrieval_planner.plan_retrieval_strategy(subtasks)
+        planning_time = time.time() - stage_start
         logger.info(f"检索策略规划完成")
         
-        # === 第二阶段：低级搜索器 ===
+        # === 第二阶段：低级搜索器（子任务并发检索） ===
+        stage_start = time.time()
+        timed_documents = run_concurrently(
+            lambda subtask: self.multi_retriever.adaptive_retrieve(subtask, plans[subtask.id]),
+            subtasks,
+            self.max_subtask_workers
+        )
+        retrieval_time = time.time() - stage_start
+        
         search_results = []
+        subtask_times = {}
         
-        for subtask in subtasks:
+        for subtask, (documents, elapsed) in zip(subtasks, timed_documents):
             plan = plans[subtask.id]
+            subtask_times[subtask.id] = {"content": subtask.content, "time": elapsed}
             
-            # 3. 执行具体检索
-            documents = self.multi_retriever.adaptive_retrieve(subtask, plan)
-            
-            # 4. 构建搜索结果
+            # 3. 构建搜索结果
             result = SearchResult(
                 sub_query=SubQuery(
                     content=subtask.content,
@@ -108,19 +140,41 @@ class LevelRAGStylePipeline:
                     "subtask_info": {
                         "entities": subtask.entities,
                         "temporal_info": subtask.temporal_info
-                    }
+                    },
+                    "retrieval_time": elapsed
                 }
             )
             
             search_results.append(result)
-            logger.info(f"子任务 '{subtask.content}' 检索完成，获得 {len(documents)} 个文档")
+            logger.info(f"子任务 '{subtask.content}' 检索完成，获得 {len(documents)} 个文档 ({elapsed:.3f}s)")
         
-        # === 结果聚合和后处理 ===
+        # === 结果聚合和后处理（跨子任务去重） ===
+        stage_start = time.time()
         final_result = self._aggregate_results(query, search_results)
+        final_result["metadata"]["stage_times"] = {
+            "decomposition": decomposition_time,
+            "planning": planning_time,
+            "retrieval": retrieval_time,
+            "retrieval_subtasks": subtask_times,
+            "aggregation": time.time() - stage_start
+        }
+        if self.predictive_cache is not None:
+            final_result["metadata"]["predictive_cache"] = self.predictive_cache.get_statistics()
         
         logger.info(f"LevelRAG 风格搜索完成")
         return final_result
     
+    def _prefetch(self, query: str, subtasks: List[Any], session_id: Optional[str] = None):
+        """预取当前子查询，以及从查询日志学到的后续查询分解出的子查询"""
+        # 不同用户的查询混在同一个会话里会学到虚假的转移，没有会话标识时只预测不记录
+        if session_id is not None:
+            self.predictive_cache.record_query(query, session_id=session_id)
+        self.multi_retriever.prefetch([subtask.content for subtask in subtasks])
+        
+        for followup in self.predictive_cache.predict_followups(query):
+            followup_subtasks = self.task_decomposer.decompose_query(followup)
+            self.multi_retriever.prefetch([subtask.content for subtask in followup_subtasks], speculative=True)
+    
     def _aggregate_results(self, original_query: str, search_results: List[SearchResult]) -> Dict[str, Any]:
         """聚合搜索结果"""
         
@@ -5,13 +5,18 @@
 使用 /root/autodl-tmp 目录下的真实模型和数据
 """
 
+import copy
 import logging
 import time
 import json
 import os
-import pickle
-from typing import Dict, List, Any, Optional
+import shutil
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, List, Any, Optional, Set, Tuple
 from pathlib import Path
+from types import SimpleNamespace
 import sys
 
 # 添加项目路径
@@ -41,7 +46,9 @@ except ImportError:
     logger.warning("PyTorch组件不可用")
 
 try:
-    from rank_bm25 import BM25Okapi
+    from adaptive_rag.modules.retriever.sparse_retriever import (
+        InvertedBM25Index, BM25IndexBuilder
+    )
     BM25_AVAILABLE = True
 except ImportError:
     BM25_AVAILABLE = False
@@ -55,30 +62,234 @@ except ImportError:
     SKLEARN_AVAILABLE = False
     logger.warning("scikit-learn不可用")
 
+try:
+    from adaptive_rag.modules.retriever.dense_retriever import ShardedDenseIndex
+    from adaptive_rag.modules.retriever.ann_index import (
+        build_ann_index, load_ann_index, evaluate_ann_recall,
+        get_dense_index_config, sample_eval_queries
+    )
+    DENSE_INDEX_AVAILABLE = True
+except ImportError:
+    DENSE_INDEX_AVAILABLE = False
+    logger.warning("稠密索引不可用")
+
+try:
+    from adaptive_rag.data_processing.corpus_builder import CorpusBuilder
+    from adaptive_rag.data_processing.document_store import DocumentStore, materialize_hits
+    from adaptive_rag.data_processing.index_manifest import IndexManifest, VALID, APPEND
+    from adaptive_rag.core.local_indexes import bm25_params, dense_index_params, store_params
+    CORPUS_STORE_AVAILABLE = True
+except ImportError:
+    CORPUS_STORE_AVAILABLE = False
+    logger.warning("流式语料构建不可用")
+
+try:
+    from adaptive_rag.modules.retriever.segmented_index import SegmentedBM25Index, SegmentedDenseIndex
+    SEGMENTED_INDEX_AVAILABLE = True
+except ImportError:
+    SEGMENTED_INDEX_AVAILABLE = False
+    logger.warning("分段索引不可用，运行时无法增删文档")
+
+try:
+    from adaptive_rag.modules.retriever.retrieval_executor import ParallelRetrievalExecutor, summarize_outcomes
+    RETRIEVAL_EXECUTOR_AVAILABLE = True
+except ImportError:
+    RETRIEVAL_EXECUTOR_AVAILABLE = False
+    logger.warning("并行检索执行器不可用，检索器将顺序执行")
+
+try:
+    from adaptive_rag.core.performance_optimizer import QueryEmbeddingCache
+    EMBEDDING_CACHE_AVAILABLE = True
+except ImportError:
+    EMBEDDING_CACHE_AVAILABLE = False
+    logger.warning("查询嵌入缓存不可用")
+
+try:
+    from adaptive_rag.core.semantic_cache import make_partition_key
+    SEMANTIC_CACHE_AVAILABLE = True
+except ImportError:
+    SEMANTIC_CACHE_AVAILABLE = False
+    logger.warning("语义缓存不可用")
+
+
+# 可懒加载的组件: (需要该组件的模块, 依赖的组件)，按预热顺序排列
+LAZY_COMPONENTS = {
+    "corpus": (("keyword_retriever", "dense_retriever"), ()),
+    "embedding_model": (("dense_retriever",), ()),
+    "dense_index": (("dense_retriever",), ("corpus", "embedding_model")),
+    "reranker_model": (("context_reranker",), ()),
+    "generator_model": (("adaptive_generator",), ()),
+}
+
 
 class LocalModelEngine:
     """本地模型引擎 - 使用 /root/autodl-tmp 下的真实模型和数据"""
     
     def __init__(self, config_path: str = "adaptive_rag/config/modular_config.yaml"):
-        """初始化本地模型引擎"""
+        """
+        初始化本地模型引擎
+
+        默认懒加载：构造时只加载配置和模块管理器，模型与索引按启用的模块在后台线程中预热，
+        未启用模块的组件在首次使用时才加载。get_readiness() 返回各组件状态与启动耗时。
+        """
         logger.info("🚀 初始化本地模型引擎...")
+        init_start = time.perf_counter()
         
         self.config_path = config_path
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        self.components = {}
+        self.documents = []
+        self.index_manifest = None
+        self.dense_index = None
+        self.ann_index = None
+        self.ann_report = None
+        self.dense_segments = None
+        # 运行时删除的文档号，稠密索引晚于删除加载时在其分段层中重放
+        self._runtime_deleted: Set[int] = set()
+        self._runtime_lock = threading.Lock()
+        self.startup_timings: Dict[str, float] = {}
+        self._component_states = {
+            name: {"status": "pending", "seconds": None, "error": None} for name in LAZY_COMPONENTS
+        }
+        self._component_locks = {name: threading.Lock() for name in LAZY_COMPONENTS}
+        self._warmup_thread: Optional[threading.Thread] = None
         
         # 加载配置
-        self.load_config()
+        with self._startup_phase("config"):
+            self.load_config()
+
+        # 并行检索执行器（不可用时检索器顺序执行）
+        self.retrieval_executor = None
+        if RETRIEVAL_EXECUTOR_AVAILABLE:
+            self.retrieval_executor = ParallelRetrievalExecutor.from_config(
+                getattr(self.config, 'retrieval_executor_config', None)
+            )
         
         # 初始化模块管理器
-        self.initialize_module_manager()
-        
-        # 初始化真实组件
-        self.initialize_local_components()
-        
-        # 加载真实数据
-        self.load_real_data()
+        with self._startup_phase("module_manager"):
+            self.initialize_module_manager()
+
+        startup_config = getattr(self.config, 'startup_config', {})
+        if startup_config.get('lazy_loading', True):
+            if startup_config.get('warmup', True):
+                self.start_warmup()
+        else:
+            # 关闭懒加载：与原先一致，同步加载全部模型与数据
+            for name in LAZY_COMPONENTS:
+                self._ensure_component(name)
         
-        logger.info("✅ 本地模型引擎初始化完成")
+        self.startup_timings["init"] = round(time.perf_counter() - init_start, 3)
+        logger.info(f"✅ 本地模型引擎初始化完成，耗时 {self.startup_timings['init']:.2f}s")
+
+    # ===== 懒加载 =====
+
+    @contextmanager
+    def _startup_phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = round(time.perf_counter() - start, 3)
+
+    def _component_loaders(self) -> Dict[str, Any]:
+        return {
+            "corpus": self._load_corpus,
+            "embedding_model": self._load_embedding_model,
+            "dense_index": self._load_dense_indexes,
+            "reranker_model": self._load_reranker_model,
+            "generator_model": self._load_generator_model,
+        }
+
+    def _component_available(self, name: str) -> bool:
+        if name == "corpus":
+            return len(self.documents) > 0
+        if name == "dense_index":
+            return self.dense_index is not None
+        return self.components.get(name) is not None
+
+    def _ensure_component(self, name: str) -> bool:
+        """
+        按需加载组件，返回组件是否可用
+
+        线程安全：预热线程与查询线程同时请求时只加载一次，后到者等待加载完成。
+        """
+        state = self._component_states[name]
+        if state["status"] in ("ready", "unavailable"):
+            return state["status"] == "ready"
+
+        for dependency in LAZY_COMPONENTS[name][1]:
+            self._ensure_component(dependency)
+
+        with self._component_locks[name]:
+            if state["status"] == "pending":
+                state["status"] = "loading"
+                with self._startup_phase(name):
+                    try:
+                        self._component_loaders()[name]()
+                    except Exception as e:
+                        logger.error(f"❌ 组件 {name} 加载失败: {e}")
+                        state["error"] = str(e)
+                state["seconds"] = self.startup_timings[name]
+                state["status"] = "ready" if self._component_available(name) else "unavailable"
+                logger.info(f"{'✅' if state['status'] == 'ready' else '⚠️'} 组件 {name}: "
+                            f"{state['status']} ({state['seconds']:.2f}s)")
+        return state["status"] == "ready"
+
+    def _required_components(self) -> List[str]:
+        """当前启用的模块需要的组件"""
+        return [
+            name for name, (modules, _) in LAZY_COMPONENTS.items()
+            if any(self.is_module_enabled(module_name) for module_name in modules)
+        ]
+
+    def _ensure_components_for(self, module_names: List[str]):
+        """加载指定模块需要的全部组件"""
+        for name, (modules, _) in LAZY_COMPONENTS.items():
+            if any(module_name in modules for module_name in module_names):
+                self._ensure_component(name)
+
+    def start_warmup(self, components: Optional[List[str]] = None) -> threading.Thread:
+        """在后台线程中预热组件（默认为启用模块需要的组件）"""
+        names = components if components is not None else self._required_components()
+        thread = threading.Thread(target=self._warmup, args=(names,), name="engine-warmup", daemon=True)
+        self._warmup_thread = thread
+        thread.start()
+        return thread
+
+    def _warmup(self, names: List[str]):
+        start = time.perf_counter()
+        for name in names:
+            self._ensure_component(name)
+        warmup_queries = getattr(self.config, 'startup_config', {}).get('warmup_queries') or []
+        if warmup_queries:
+            self._warmup_queries(warmup_queries)
+        self.startup_timings["warmup"] = round(time.perf_counter() - start, 3)
+        logger.info(f"✅ 组件预热完成: {names}，耗时 {self.startup_timings['warmup']:.2f}s")
+
+    def _warmup_queries(self, queries: List[str]):
+        """对预热查询各发出一次批量检索：查询嵌入进入缓存，索引的 mmap 页被读入"""
+        if self.components.get('bm25') is not None:
+            self.real_keyword_retrieval_batch(queries)
+        if self.components.get('embedding_model') and self.dense_index is not None:
+            self.real_dense_retrieval_batch(queries)
+        logger.info(f"✅ 预热查询完成: {len(queries)} 条")
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待预热结束，返回是否就绪"""
+        if self._warmup_thread is not None:
+            self._warmup_thread.join(timeout)
+        return self.get_readiness()["ready"]
+
+    def get_readiness(self) -> Dict[str, Any]:
+        """就绪状态：启用模块需要的组件是否都已加载完成（不可用的组件按降级处理，不阻塞就绪）"""
+        required = self._required_components()
+        return {
+            "ready": all(self._component_states[name]["status"] in ("ready", "unavailable") for name in required),
+            "required_components": required,
+            "components": {name: dict(state) for name, state in self._component_states.items()},
+            "startup_timings": dict(self.startup_timings)
+        }
     
     def load_config(self):
         """加载配置"""
@@ -109,18 +320,24 @@ class LocalModelEngine:
             self.module_manager = None
     
     def initialize_local_components(self):
-        """初始化本地组件"""
-        self.components = {}
-        
-        # 获取路径配置
+        """加载全部本地模型（关闭懒加载时使用）"""
+        self._load_embedding_model()
+        self._load_reranker_model()
+        self._load_generator_model()
+
+    def _models_dir(self) -> str:
         paths_config = getattr(self.config, 'paths', {})
-        models_dir = paths_config.get('models_dir', '/root/autodl-tmp/models')
-        
-        # 初始化嵌入模型
+        return paths_config.get('models_dir', '/root/autodl-tmp/models')
+
+    def _load_embedding_model(self):
+        """初始化嵌入模型"""
+        models_dir = self._models_dir()
         if TORCH_AVAILABLE:
             try:
                 logger.info("📥 加载本地嵌入模型...")
                 embedding_model_path = f"{models_dir}/e5-base-v2"
+                # 查询嵌入缓存按编码器区分，本地 / 在线模型使用不同的 id
+                self.embedding_model_id = embedding_model_path
 
                 if os.path.exists(embedding_model_path):
                     # 优先使用SentenceTransformer加载（适合e5模型）
@@ -148,6 +365,7 @@ class LocalModelEngine:
                     try:
                         from sentence_transformers import SentenceTransformer
                         self.components['embedding_model'] = SentenceTransformer('intfloat/e5-base-v2')
+                        self.embedding_model_id = 'intfloat/e5-base-v2'
                         logger.info("✅ 在线嵌入模型加载成功")
                     except Exception as e:
                         logger.error(f"❌ 在线嵌入模型加载失败: {e}")
@@ -156,8 +374,10 @@ class LocalModelEngine:
             except Exception as e:
                 logger.error(f"❌ 嵌入模型加载失败: {e}")
                 self.components['embedding_model'] = None
-        
-        # 初始化重排序模型
+
+    def _load_reranker_model(self):
+        """初始化重排序模型"""
+        models_dir = self._models_dir()
         if TORCH_AVAILABLE:
             try:
                 logger.info("📥 加载本地重排序模型...")
@@ -177,8 +397,10 @@ class LocalModelEngine:
             except Exception as e:
                 logger.error(f"❌ 重排序模型加载失败: {e}")
                 self.components['reranker_model'] = None
-        
-        # 初始化生成模型
+
+    def _load_generator_model(self):
+        """初始化生成模型"""
+        models_dir = self._models_dir()
         if TORCH_AVAILABLE:
             try:
                 logger.info("📥 加载本地生成模型...")
@@ -241,160 +463,485 @@ class LocalModelEngine:
             except Exception as e:
                 logger.error(f"❌ 生成模型加载失败: {e}")
                 self.components['generator_model'] = None
-    
+
     def load_real_data(self):
-        """加载真实数据"""
+        """加载真实数据：文档库与 BM25 索引，嵌入模型已加载时一并加载稠密索引"""
+        self._load_corpus()
+        if self.components.get('embedding_model'):
+            self._load_dense_indexes()
+
+    def _data_paths(self) -> Tuple[Dict[str, Any], str, str]:
+        data_config = getattr(self.config, 'data', {})
+        corpus_path = data_config.get('corpus_path', '/root/autodl-tmp/flashrag_real_data/hotpotqa_dev.jsonl')
+        cache_dir = data_config.get('cache_dir', '/root/autodl-tmp/flashrag_real_data/cache')
+        return data_config, corpus_path, cache_dir
+
+    def _load_corpus(self):
+        """加载文档库与 BM25 索引（索引清单校验缓存，只重建失效的索引）"""
         try:
-            # 获取数据配置
-            data_config = getattr(self.config, 'data', {})
-            corpus_path = data_config.get('corpus_path', '/root/autodl-tmp/flashrag_real_data/hotpotqa_dev.jsonl')
-            cache_dir = data_config.get('cache_dir', '/root/autodl-tmp/flashrag_real_data/cache')
+            data_config, corpus_path, cache_dir = self._data_paths()
             
             logger.info(f"📥 加载真实数据: {corpus_path}")
             
             # 确保缓存目录存在
             os.makedirs(cache_dir, exist_ok=True)
             
-            # 加载数据集
-            self.documents = []
-            if os.path.exists(corpus_path):
-                with open(corpus_path, 'r', encoding='utf-8') as f:
-                    for i, line in enumerate(f):
-                        if i >= 1000:  # 限制数据量以节省内存
-                            break
-                        try:
-                            data = json.loads(line.strip())
-                            # 适配不同数据格式
-                            if 'question' in data and 'answer' in data:
-                                # HotpotQA格式
-                                doc = {
-                                    "id": f"doc_{i}",
-                                    "title": data.get('question', '')[:100],
-                                    "content": f"问题: {data.get('question', '')}\n答案: {data.get('answer', '')}",
-                                    "metadata": data
-                                }
-                            elif 'query' in data and 'golden_answers' in data:
-                                # TriviaQA格式
-                                doc = {
-                                    "id": f"doc_{i}",
-                                    "title": data.get('query', '')[:100],
-                                    "content": f"问题: {data.get('query', '')}\n答案: {', '.join(data.get('golden_answers', []))}",
-                                    "metadata": data
-                                }
-                            else:
-                                # 通用格式
-                                doc = {
-                                    "id": f"doc_{i}",
-                                    "title": str(data)[:100],
-                                    "content": str(data),
-                                    "metadata": data
-                                }
-                            self.documents.append(doc)
-                        except Exception as e:
-                            logger.warning(f"跳过无效数据行 {i}: {e}")
-                            continue
-                
-                logger.info(f"✅ 加载了 {len(self.documents)} 个文档")
+            # 流式加载数据集（列式文档库，mmap 访问）
+            documents = []
+            self.index_manifest = None
+            self._built_indexes = {}
+            if os.path.exists(corpus_path) and CORPUS_STORE_AVAILABLE:
+                self.index_manifest = IndexManifest(cache_dir, corpus_path, data_config.get('max_documents'))
+                documents = self._load_or_build_corpus(corpus_path, cache_dir, data_config)
+                logger.info(f"✅ 加载了 {len(documents)} 个文档")
             else:
                 logger.warning(f"⚠️ 数据文件不存在: {corpus_path}")
                 # 使用示例数据
-                self.documents = self._create_sample_documents()
+                documents = self._create_sample_documents()
+            self.documents = documents
             
-            # 初始化BM25检索器
+            # 初始化BM25检索器（倒排索引目录，mmap 加载），叠加分段层以支持运行时增删文档
             if BM25_AVAILABLE and self.documents:
                 try:
-                    bm25_cache_path = os.path.join(cache_dir, "bm25_index.pkl")
-                    
-                    if os.path.exists(bm25_cache_path):
-                        # 加载缓存的BM25索引
-                        with open(bm25_cache_path, 'rb') as f:
-                            self.components['bm25'] = pickle.load(f)
-                        logger.info("✅ BM25索引从缓存加载成功")
-                    else:
-                        # 创建新的BM25索引
-                        doc_texts = [doc['content'] for doc in self.documents]
-                        tokenized_docs = [text.split() for text in doc_texts]
-                        self.components['bm25'] = BM25Okapi(tokenized_docs)
-                        
-                        # 保存到缓存
-                        with open(bm25_cache_path, 'wb') as f:
-                            pickle.dump(self.components['bm25'], f)
-                        logger.info("✅ BM25索引创建并缓存成功")
-                        
+                    bm25 = self._load_or_build_bm25_index(cache_dir)
+                    if SEGMENTED_INDEX_AVAILABLE:
+                        bm25 = SegmentedBM25Index(bm25, **self._segment_kwargs(data_config))
+                    self.components['bm25'] = bm25
                 except Exception as e:
                     logger.error(f"❌ BM25索引初始化失败: {e}")
                     self.components['bm25'] = None
-            
-            # 预计算文档嵌入
-            if self.components.get('embedding_model') and self.documents:
-                try:
-                    embeddings_cache_path = os.path.join(cache_dir, "document_embeddings.npy")
-                    
-                    if os.path.exists(embeddings_cache_path):
-                        # 加载缓存的嵌入
-                        self.document_embeddings = np.load(embeddings_cache_path)
-                        logger.info("✅ 文档嵌入从缓存加载成功")
-                    else:
-                        # 计算新的嵌入
-                        doc_texts = [doc['content'] for doc in self.documents]
-                        if hasattr(self.components['embedding_model'], 'encode'):
-                            # SentenceTransformer模型
-                            self.document_embeddings = self.components['embedding_model'].encode(doc_texts)
-                        else:
-                            # Transformers模型
-                            self.document_embeddings = self._compute_embeddings_with_transformers(doc_texts)
-                        
-                        # 保存到缓存
-                        np.save(embeddings_cache_path, self.document_embeddings)
-                        logger.info("✅ 文档嵌入计算并缓存成功")
-                        
-                except Exception as e:
-                    logger.error(f"❌ 文档嵌入计算失败: {e}")
-                    self.document_embeddings = None
                     
         except Exception as e:
             logger.error(f"❌ 数据加载失败: {e}")
             self.documents = self._create_sample_documents()
-            self.document_embeddings = None
+            self.index_manifest = None
+
+    def _load_dense_indexes(self):
+        """加载稠密索引与 ANN 索引（需要嵌入模型与文档库）"""
+        self.dense_index = None
+        self.ann_index = None
+        self.ann_report = None
+        self.dense_segments = None
+        if not (DENSE_INDEX_AVAILABLE and self.components.get('embedding_model') and self.documents):
+            return
+
+        data_config, _, cache_dir = self._data_paths()
+
+        # 预计算文档嵌入（内存映射分片索引）
+        try:
+            dense_index = self._load_or_build_dense_index(cache_dir, data_config)
+        except Exception as e:
+            logger.error(f"❌ 文档嵌入计算失败: {e}")
+            return
+
+        # 近似最近邻索引（由 retriever_configs['dense_retriever']['index_config'] 选择）
+        ann_index = None
+        self.dense_index = dense_index
+        try:
+            ann_index = self._load_or_build_ann_index(cache_dir, data_config)
+        except Exception as e:
+            logger.error(f"❌ ANN索引构建失败，回退到精确检索: {e}")
+        self.ann_index = ann_index
+
+        # 在只读的稠密（或 ANN）索引之上叠加分段层，支持运行时增删文档
+        if SEGMENTED_INDEX_AVAILABLE:
+            base = ann_index if ann_index is not None else dense_index
+            segments = SegmentedDenseIndex(base, **self._segment_kwargs(data_config))
+            # 与 add_documents / delete_documents 互斥：重放与接入之间不能漏掉或重复运行时变更
+            with self._runtime_lock:
+                self._replay_runtime_changes(segments)
+                self.dense_segments = segments
+
+    def _persisted_doc_count(self) -> int:
+        """持久化索引覆盖的文档数：运行时加入的文档只进入分段层，不写入磁盘索引"""
+        return getattr(self.documents, 'num_persisted', len(self.documents))
+
+    def _replay_runtime_changes(self, segments: "SegmentedDenseIndex"):
+        """稠密索引在运行时增删之后才加载时，把运行时文档与删除补到其分段层"""
+        start, end = self._persisted_doc_count(), len(self.documents)
+        if end > start:
+            contents = [self.documents[i]['content'] for i in range(start, end)]
+            segments.add_embeddings(self._encode_texts(contents), doc_ids=list(range(start, end)))
+        if self._runtime_deleted:
+            segments.delete(sorted(self._runtime_deleted))
+        if end > start or self._runtime_deleted:
+            logger.info(f"✅ 稠密分段层重放运行时变更: 新增 {end - start} 个文档，删除 {len(self._runtime_deleted)} 个")
+
+    @staticmethod
+    def _segment_kwargs(data_config: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "flush_docs": data_config.get('segment_flush_docs', 1000),
+            "max_segments": data_config.get('max_segments', 8)
+        }
+
+    def add_documents(self, records: List[Tuple[str, str, str]]) -> List[int]:
+        """
+        运行时加入文档 (id, title, content)，无需重建索引
+
+        文档写入文档库内存尾部，BM25 与稠密索引写入增量段，后台合并。
+        """
+        # 文档库与 BM25 在 corpus 组件中加载；稠密索引稍后加载时只按落盘前缀校验 / 构建，
+        # 运行时文档在其分段层中重放（见 _replay_runtime_changes）
+        self._ensure_component("corpus")
+        if not records or not hasattr(self.documents, 'extend'):
+            return []
+
+        contents = [content for _, _, content in records]
+        with self._runtime_lock:
+            doc_indices = self.documents.extend(records)
+            bm25 = self.components.get('bm25')
+            if SEGMENTED_INDEX_AVAILABLE and isinstance(bm25, SegmentedBM25Index):
+                bm25.add_documents(contents, doc_ids=doc_indices)
+            if getattr(self, 'dense_segments', None) is not None:
+                self.dense_segments.add_embeddings(self._encode_texts(contents), doc_ids=doc_indices)
+
+        self._invalidate_result_caches()
+        logger.info(f"✅ 运行时加入 {len(doc_indices)} 个文档")
+        return doc_indices
+
+    def delete_documents(self, doc_indices: List[int]) -> int:
+        """运行时删除文档（写墓碑，合并时物理清除），返回删除数量"""
+        deleted = 0
+        with self._runtime_lock:
+            self._runtime_deleted.update(int(doc_index) for doc_index in doc_indices)
+            bm25 = self.components.get('bm25')
+            if SEGMENTED_INDEX_AVAILABLE and isinstance(bm25, SegmentedBM25Index):
+                deleted = bm25.delete(doc_indices)
+            if getattr(self, 'dense_segments', None) is not None:
+                deleted = max(deleted, self.dense_segments.delete(doc_indices))
+
+        self._invalidate_result_caches()
+        logger.info(f"✅ 运行时删除 {deleted} 个文档")
+        return deleted
+
+    def _invalidate_result_caches(self):
+        """文档集合变化后，缓存的检索结果与答案不再可靠"""
+        semantic_cache = self._get_semantic_cache()
+        if semantic_cache is not None:
+            semantic_cache.invalidate()
+        optimizer = self.module_manager.get_module('performance_optimizer') if self.module_manager else None
+        if optimizer is not None and hasattr(optimizer, 'clear_caches'):
+            optimizer.clear_caches()
+
+    # ===== 索引产物（由 index_manifest.json 校验） =====
+
+    def _artifact_dir(self, cache_dir: str, name: str) -> str:
+        """示例数据没有语料指纹，其索引放在单独目录，不覆盖真实语料的缓存"""
+        return os.path.join(cache_dir, name if self.index_manifest is not None else f"sample_{name}")
+
+    # 构建参数与核心 HybridRetriever 的本地索引（core/local_indexes.py）一致；后者的产物放在 cache_dir 的 core_* 子目录，两者互不覆盖
+    def _bm25_params(self) -> Dict[str, Any]:
+        return bm25_params()
+
+    def _dense_index_params(self, data_config: Dict[str, Any]) -> Dict[str, Any]:
+        return dense_index_params(getattr(self, 'embedding_model_id', None),
+                                  data_config.get('embedding_dtype', 'float32'))
+
+    def _load_or_build_corpus(self, corpus_path: str, cache_dir: str, data_config: Dict[str, Any]) -> "DocumentStore":
+        """
+        加载或流式构建文档库
+
+        - 语料只在末尾追加了新行：只解析新增行并追加到文档库
+        - 需要全量重建：在同一遍扫描中增量生成仍需重建的 BM25 / 稠密索引，
+          参数与语料都有效的索引（如只丢失了文档库）保持不动
+        """
+        manifest = self.index_manifest
+        store_dir = os.path.join(cache_dir, "document_store")
+        status = manifest.status("document_store", store_params(), DocumentStore.exists(store_dir))
+        ingest_kwargs = {
+            "chunk_size": data_config.get('ingest_chunk_size', 10000),
+            "num_workers": data_config.get('parse_workers', 0)
+        }
+
+        if status == VALID:
+            logger.info("✅ 文档库从缓存加载成功")
+            return DocumentStore.load(store_dir)
+
+        if status == APPEND:
+            previous = manifest.get("document_store")
+            result = CorpusBuilder(store_dir).append(
+                corpus_path, start_offset=previous["corpus"]["size"], **ingest_kwargs
+            )
+            manifest.record("document_store", store_params(), len(result['documents']))
+            logger.info(f"✅ 语料新增 {result['appended']} 个文档，已追加到文档库")
+            return result['documents']
+
+        logger.info(f"⚠️ 文档库需要重建 ({status})")
+        bm25_dir = os.path.join(cache_dir, "bm25_index")
+        dense_dir = os.path.join(cache_dir, "dense_index")
+        bm25_params = self._bm25_params() if BM25_AVAILABLE else None
+        dense_params = self._dense_index_params(data_config)
+
+        rebuild_bm25 = BM25_AVAILABLE and manifest.status(
+            "bm25_index", bm25_params, InvertedBM25Index.exists(bm25_dir)) != VALID
+        rebuild_dense = (DENSE_INDEX_AVAILABLE and self.components.get('embedding_model') is not None and
+                         manifest.status("dense_index", dense_params, ShardedDenseIndex.exists(dense_dir)) != VALID)
+
+        # 先注销再清理，构建中断时不会留下被认为有效的半成品
+        for name, rebuild in (("document_store", True), ("bm25_index", rebuild_bm25), ("dense_index", rebuild_dense)):
+            if rebuild:
+                manifest.invalidate(name)
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+
+        dense_index = None
+        if rebuild_dense:
+            dense_index = ShardedDenseIndex(
+                dense_dir,
+                dtype=data_config.get('embedding_dtype', 'float32'),
+                shard_size=data_config.get('dense_shard_size', 100000)
+            )
+
+        builder = CorpusBuilder(
+            store_dir,
+            bm25_builder=BM25IndexBuilder() if rebuild_bm25 else None,
+            dense_index=dense_index,
+            encode_fn=self._encode_texts,
+            encode_batch_size=data_config.get('encode_chunk_size', 1024)
+        )
+        result = builder.build(corpus_path, max_documents=data_config.get('max_documents'), **ingest_kwargs)
+        num_docs = len(result['documents'])
+        manifest.record("document_store", store_params(), num_docs)
+
+        if result['bm25'] is not None:
+            result['bm25'].save(bm25_dir)
+            manifest.record("bm25_index", bm25_params, num_docs)
+            self._built_indexes['bm25'] = result['bm25']
+        if result['dense'] is not None:
+            manifest.record("dense_index", dense_params, num_docs)
+            self._built_indexes['dense'] = result['dense']
+        return result['documents']
+
+    def _load_or_build_bm25_index(self, cache_dir: str) -> "InvertedBM25Index":
+        """加载或重建 BM25 索引；IDF 与平均文档长度依赖全部文档，语料追加后也从文档库重建（不涉及嵌入计算）"""
+        built = self._built_indexes.pop('bm25', None) if hasattr(self, '_built_indexes') else None
+        if built is not None:
+            return built
+
+        manifest = self.index_manifest
+        bm25_dir = self._artifact_dir(cache_dir, "bm25_index")
+        params = self._bm25_params()
+
+        if manifest is not None:
+            status = manifest.status("bm25_index", params, InvertedBM25Index.exists(bm25_dir),
+                                     num_docs=self._persisted_doc_count())
+            if status == VALID:
+                logger.info("✅ BM25索引从缓存加载成功")
+                return InvertedBM25Index.load(bm25_dir)
+            logger.info(f"⚠️ BM25索引需要重建 ({status})")
+            manifest.invalidate("bm25_index")
+
+        index = InvertedBM25Index.from_texts(self.documents[i]['content'] for i in range(self._persisted_doc_count()))
+        index.save(bm25_dir)
+        if manifest is not None:
+            manifest.record("bm25_index", params, len(index))
+        logger.info("✅ BM25索引创建并缓存成功")
+        return index
+
+    def _load_or_build_dense_index(self, cache_dir: str, data_config: Dict[str, Any]) -> "ShardedDenseIndex":
+        """
+        加载或构建稠密索引，嵌入以 mmap 分片形式保存，不整体读入内存
+
+        编码器或数据类型变化时重建；语料追加时只编码新增文档，已有嵌入不重新计算。
+        """
+        built = self._built_indexes.pop('dense', None) if hasattr(self, '_built_indexes') else None
+        if built is not None:
+            return built
+
+        manifest = self.index_manifest
+        index_dir = self._artifact_dir(cache_dir, "dense_index")
+        params = self._dense_index_params(data_config)
+        status = None
+
+        if manifest is not None:
+            status = manifest.status("dense_index", params, ShardedDenseIndex.exists(index_dir),
+                                     num_docs=self._persisted_doc_count())
+            if status == VALID:
+                logger.info("✅ 稠密索引从缓存加载成功")
+                return ShardedDenseIndex.load(index_dir)
+
+            if status == APPEND:
+                index = ShardedDenseIndex.open_for_append(index_dir)
+                start = index.num_vectors
+                if start == manifest.get("dense_index")["num_docs"] and start <= self._persisted_doc_count():
+                    manifest.invalidate("dense_index")
+                    self._encode_documents_into(index, start, data_config)
+                    index.finalize()
+                    manifest.record("dense_index", params, len(index))
+                    logger.info(f"✅ 稠密索引增量追加 {len(index) - start} 个文档")
+                    return index
+                logger.warning("⚠️ 稠密索引与清单记录不一致，重新计算")
+
+            logger.info(f"⚠️ 稠密索引需要重建 ({status})")
+            manifest.invalidate("dense_index")
+
+        shutil.rmtree(index_dir, ignore_errors=True)
+        index = ShardedDenseIndex(
+            index_dir,
+            dtype=data_config.get('embedding_dtype', 'float32'),
+            shard_size=data_config.get('dense_shard_size', 100000)
+        )
+        self._encode_documents_into(index, 0, data_config)
+        index.finalize()
+        if manifest is not None:
+            manifest.record("dense_index", params, len(index))
+        logger.info("✅ 文档嵌入计算并缓存成功")
+        return index
+
+    def _encode_documents_into(self, index: "ShardedDenseIndex", start: int, data_config: Dict[str, Any]):
+        """从第 start 个文档开始分块编码落盘文档并追加到索引（运行时文档不写入持久化索引）"""
+        encode_chunk_size = data_config.get('encode_chunk_size', 1024)
+        end = self._persisted_doc_count()
+        for chunk_start in range(start, end, encode_chunk_size):
+            chunk_end = min(chunk_start + encode_chunk_size, end)
+            doc_texts = [self.documents[i]['content'] for i in range(chunk_start, chunk_end)]
+            index.add(self._encode_texts(doc_texts))
+
+    def _load_or_build_ann_index(self, cache_dir: str, data_config: Dict[str, Any]):
+        """加载或构建 ANN 索引，构建时以精确检索为基准报告 recall@k 与延迟"""
+        index_config = get_dense_index_config(self.config)
+        index_type = index_config.get('index_type', 'flat')
+        if index_type == 'flat':
+            return None
+
+        name = f"ann_{index_type}"
+        ann_dir = self._artifact_dir(cache_dir, name)
+        manifest = self.index_manifest
+        params = {"index_config": index_config, "dense_index": self._dense_index_params(data_config)}
+
+        # ANN 索引不支持增量追加，稠密索引变化后整体重建
+        if manifest is not None and manifest.status(name, params, os.path.exists(ann_dir),
+                                                    num_docs=len(self.dense_index)) == VALID:
+            ann_index = load_ann_index(ann_dir, index_config, exact_source=self.dense_index)
+            if ann_index is not None and len(ann_index) == len(self.dense_index):
+                logger.info(f"✅ {index_type} 索引从缓存加载成功")
+                return ann_index
+
+        if manifest is not None:
+            manifest.invalidate(name)
+        shutil.rmtree(ann_dir, ignore_errors=True)
+        ann_index = build_ann_index(index_config, self.dense_index, ann_dir)
+        if manifest is not None:
+            manifest.record(name, params, len(self.dense_index))
+        eval_queries = sample_eval_queries(self.dense_index, index_config.get('eval_queries', 50))
+        self.ann_report = evaluate_ann_recall(ann_index, self.dense_index, eval_queries, top_k=10)
+        logger.info(f"✅ {index_type} 索引构建完成: {self.ann_report}")
+        return ann_index
+
+    @property
+    def query_embedding_cache(self) -> Optional["QueryEmbeddingCache"]:
+        """查询嵌入缓存：优先与性能优化器共享，子任务、单独测试密集检索和完整流程复用同一份；不可用时为 None"""
+        if getattr(self, '_query_embedding_cache', None) is None:
+            optimizer = self.module_manager.get_module('performance_optimizer') if self.module_manager else None
+            cache = getattr(optimizer, 'embedding_cache', None)
+            if cache is None and EMBEDDING_CACHE_AVAILABLE:
+                cache = QueryEmbeddingCache()
+            self._query_embedding_cache = cache
+        return self._query_embedding_cache
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        """编码单条查询，结果按 (规范化文本, 编码器) 缓存"""
+        cache = self.query_embedding_cache
+        if cache is None:
+            return self._encode_texts([query])
+        encoder_id = getattr(self, 'embedding_model_id', 'default')
+        return cache.get_or_encode(query, encoder_id, lambda q: self._encode_texts([q]))
+
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """批量编码查询：缓存未命中的查询一次前向传播，返回 (查询数, dim)"""
+        cache = self.query_embedding_cache
+        if cache is None:
+            return self._encode_texts(queries)
+        encoder_id = getattr(self, 'embedding_model_id', 'default')
+        embeddings = cache.get_or_encode_batch(queries, encoder_id, self._encode_texts)
+        return np.vstack(embeddings)
+
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """使用已加载的嵌入模型编码文本"""
+        if hasattr(self.components['embedding_model'], 'encode'):
+            # SentenceTransformer模型
+            return self.components['embedding_model'].encode(texts)
+        # Transformers模型
+        return self._compute_embeddings_with_transformers(texts)
     
     def _create_sample_documents(self):
         """创建示例文档"""
+        records = [
+            ("sample_1", "人工智能基础",
+             "人工智能（AI）是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。"),
+            ("sample_2", "机器学习概述",
+             "机器学习是人工智能的一个子集，它使计算机能够在没有明确编程的情况下学习和改进。"),
+            ("sample_3", "深度学习技术",
+             "深度学习是机器学习的一个分支，使用多层神经网络来模拟人脑的工作方式。")
+        ]
+        if CORPUS_STORE_AVAILABLE:
+            return DocumentStore.from_records(records)
         return [
-            {
-                "id": "sample_1",
-                "title": "人工智能基础",
-                "content": "人工智能（AI）是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。",
-                "metadata": {}
-            },
-            {
-                "id": "sample_2",
-                "title": "机器学习概述", 
-                "content": "机器学习是人工智能的一个子集，它使计算机能够在没有明确编程的情况下学习和改进。",
-                "metadata": {}
-            },
-            {
-                "id": "sample_3",
-                "title": "深度学习技术",
-                "content": "深度学习是机器学习的一个分支，使用多层神经网络来模拟人脑的工作方式。",
-                "metadata": {}
-            }
+            {"id": doc_id, "title": title, "content": content, "metadata": {}}
+            for doc_id, title, content in records
         ]
     
     def _compute_embeddings_with_transformers(self, texts: List[str]) -> np.ndarray:
-        """使用Transformers模型计算嵌入"""
-        embeddings = []
+        """
+        使用Transformers模型批量计算嵌入
+
+        1. 一次性分词，按 token 长度排序分桶，同一批内填充最少
+        2. 动态批大小：每批 token 数（批内条数 × 最大长度）不超过预算，
+           预算默认为 config.batch_size × max_length，短文本自动合并为更大的批
+        3. 按 attention_mask 做平均池化，填充位置不参与计算
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
         tokenizer = self.components['embedding_tokenizer']
         model = self.components['embedding_model']
-        
-        for text in texts:
-            inputs = tokenizer(text, return_tensors='pt', truncation=True, max_length=512).to(self.device)
+        data_config = getattr(self.config, 'data', {}) or {}
+        max_length = 512
+        batch_size = max(1, getattr(self.config, 'batch_size', 4))
+        max_batch_tokens = data_config.get('encode_max_batch_tokens') or batch_size * max_length
+
+        encoded = tokenizer(list(texts), truncation=True, max_length=max_length)
+        lengths = np.array([len(ids) for ids in encoded['input_ids']])
+        order = np.argsort(lengths, kind='stable')
+
+        # 按长度分桶切批
+        batches = []
+        current = []
+        for idx in order:
+            if current and (len(current) + 1) * lengths[idx] > max_batch_tokens:
+                batches.append(current)
+                current = []
+            current.append(int(idx))
+        if current:
+            batches.append(current)
+
+        embeddings = None
+        start_time = time.time()
+        total_tokens = 0
+        done_texts = 0
+        for batch_no, batch in enumerate(batches, 1):
+            features = tokenizer.pad(
+                {key: [encoded[key][i] for i in batch] for key in encoded.keys()},
+                return_tensors='pt'
+            ).to(self.device)
+
             with torch.no_grad():
-                outputs = model(**inputs)
-                # 使用[CLS]标记的嵌入或平均池化
-                embedding = outputs.last_hidden_state.mean(dim=1).cpu().numpy()
-                embeddings.append(embedding[0])
-        
-        return np.array(embeddings)
+                hidden = model(**features).last_hidden_state
+                mask = features['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = pooled.float().cpu().numpy()
+
+            if embeddings is None:
+                embeddings = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+            embeddings[batch] = pooled
+            total_tokens += int(lengths[batch].sum())
+            done_texts += len(batch)
+
+            if len(batches) > 1 and (batch_no % 50 == 0 or batch_no == len(batches)):
+                elapsed = max(time.time() - start_time, 1e-9)
+                logger.info(f"🧮 编码进度 {batch_no}/{len(batches)} 批, {done_texts}/{len(texts)} 条, "
+                            f"{done_texts / elapsed:.1f} 条/s, {total_tokens / elapsed:.0f} tokens/s")
+
+        return embeddings
 
     def process_query_with_modules(self, query: str) -> Dict[str, Any]:
         """根据启用的模块处理查询"""
@@ -411,6 +958,28 @@ class LocalModelEngine:
 
         logger.info(f"🔍 处理查询: {query}")
 
+        # 0. 语义缓存（如果启用）：意图相同的查询直接复用结果，跳过检索和生成
+        semantic_cache = self._get_semantic_cache()
+        cache_partition = None
+        if semantic_cache:
+            # 启用的模块不同，答案不可复用，按模块组合分区
+            cache_partition = make_partition_key({"modules": sorted(self.module_manager.get_enabled_modules())})
+            cached = semantic_cache.lookup(query, cache_partition)
+            if cached:
+                cached_result = dict(cached["result"])
+                cached_result["query"] = query
+                cached_result["steps"] = [
+                    f"语义缓存: 命中 \"{cached['cached_query']}\" (相似度 {cached['similarity']:.3f})"
+                ] + cached_result["steps"]
+                cached_result["semantic_cache"] = {
+                    "hit": True,
+                    "similarity": cached["similarity"],
+                    "cached_query": cached["cached_query"]
+                }
+                cached_result["total_time"] = time.time() - start_time
+                logger.info(f"✅ 查询处理完成（语义缓存），耗时 {cached_result['total_time']:.2f}s")
+                return cached_result
+
         # 1. 任务分解（如果启用）
         if self.is_module_enabled("task_decomposer"):
             logger.info("📋 执行任务分解...")
@@ -421,38 +990,36 @@ class LocalModelEngine:
             subtasks = [query]
             result["module_usage"]["task_decomposer"] = False
 
-        # 2. 检索阶段
-        all_retrieved_docs = []
+        # 2. 检索阶段（启用的检索器并行发出）
+        retrievers = {
+            "keyword": ("keyword_retriever", self.real_keyword_retrieval, "🔍 执行关键词检索...", "关键词检索"),
+            "dense": ("dense_retriever", self.real_dense_retrieval, "🧠 执行密集检索...", "密集检索"),
+            "web": ("web_retriever", self.simulate_web_retrieval, "🌐 执行网络检索...", "网络检索")
+        }
+        # 检索器依赖的模型与索引在发出检索前加载（预热未完成或关闭预热时），加载耗时不计入检索器超时
+        self._ensure_components_for([
+            module_name for module_name, *_ in retrievers.values() if self.is_module_enabled(module_name)
+        ])
+
+        tasks = {}
+        for name, (module_name, retrieve_fn, log_message, _) in retrievers.items():
+            enabled = self.is_module_enabled(module_name)
+            result["module_usage"][module_name] = enabled
+            if enabled:
+                logger.info(log_message)
+                tasks[name] = partial(retrieve_fn, query)
+
+        outcomes = self._run_retrievers(tasks)
+        if RETRIEVAL_EXECUTOR_AVAILABLE:
+            result["retrieval_outcomes"] = summarize_outcomes(outcomes)
 
-        # 关键词检索（如果启用）
-        if self.is_module_enabled("keyword_retriever"):
-            logger.info("🔍 执行关键词检索...")
-            keyword_docs = self.real_keyword_retrieval(query)
-            all_retrieved_docs.extend(keyword_docs)
-            result["steps"].append(f"关键词检索: 找到 {len(keyword_docs)} 个文档")
-            result["module_usage"]["keyword_retriever"] = True
-        else:
-            result["module_usage"]["keyword_retriever"] = False
-
-        # 密集检索（如果启用）
-        if self.is_module_enabled("dense_retriever"):
-            logger.info("🧠 执行密集检索...")
-            dense_docs = self.real_dense_retrieval(query)
-            all_retrieved_docs.extend(dense_docs)
-            result["steps"].append(f"密集检索: 找到 {len(dense_docs)} 个文档")
-            result["module_usage"]["dense_retriever"] = True
-        else:
-            result["module_usage"]["dense_retriever"] = False
-
-        # 网络检索（如果启用）
-        if self.is_module_enabled("web_retriever"):
-            logger.info("🌐 执行网络检索...")
-            web_docs = self.simulate_web_retrieval(query)
-            all_retrieved_docs.extend(web_docs)
-            result["steps"].append(f"网络检索: 找到 {len(web_docs)} 个文档")
-            result["module_usage"]["web_retriever"] = True
-        else:
-            result["module_usage"]["web_retriever"] = False
+        all_retrieved_docs = []
+        for name, outcome in outcomes.items():
+            all_retrieved_docs.extend(outcome.results)
+            step = f"{retrievers[name][3]}: 找到 {len(outcome.results)} 个文档"
+            if outcome.status != "ok":
+                step += f" ({outcome.status})"
+            result["steps"].append(step)
 
         result["retrieval_results"] = all_retrieved_docs
 
@@ -479,11 +1046,52 @@ class LocalModelEngine:
             result["generated_answer"] = f"基于检索到的信息：{' '.join(contexts[:200])}..."
             result["module_usage"]["adaptive_generator"] = False
 
+        # 检索链路内部只传递命中对象，输出时再物化为字典
+        if CORPUS_STORE_AVAILABLE:
+            result["retrieval_results"] = materialize_hits(result["retrieval_results"])
+            result["reranked_results"] = materialize_hits(result["reranked_results"])
+
         result["total_time"] = time.time() - start_time
         logger.info(f"✅ 查询处理完成，耗时 {result['total_time']:.2f}s")
 
+        if semantic_cache:
+            result["semantic_cache"] = {"hit": False}
+            # 检索超时 / 出错或没有检索到文档时答案是降级结果，不缓存，避免被改写查询反复复用
+            degraded = not all_retrieved_docs or any(outcome.status != "ok" for outcome in outcomes.values())
+            if degraded:
+                result["semantic_cache"]["stored"] = False
+            else:
+                semantic_cache.store(query, copy.deepcopy(result), cache_partition)
+
         return result
 
+    def _run_retrievers(self, tasks: Dict[str, Any]) -> Dict[str, Any]:
+        """并行执行检索器；执行器不可用时在当前线程顺序执行（无超时），结果字段与 RetrievalOutcome 相同"""
+        if self.retrieval_executor is not None:
+            return self.retrieval_executor.run(tasks)
+
+        outcomes = {}
+        for name, retrieve_fn in tasks.items():
+            start = time.perf_counter()
+            try:
+                outcome = SimpleNamespace(name=name, results=retrieve_fn(), status="ok", error=None)
+            except Exception as e:
+                logger.error(f"❌ {name} 检索失败: {e}")
+                outcome = SimpleNamespace(name=name, results=[], status="error", error=str(e))
+            outcome.latency = time.perf_counter() - start
+            outcomes[name] = outcome
+        return outcomes
+
+    def _get_semantic_cache(self):
+        """获取语义缓存模块，并在嵌入模型可用时接入与密集检索相同的查询编码"""
+        if not self.module_manager or not SEMANTIC_CACHE_AVAILABLE:
+            return None
+        cache = self.module_manager.get_module("semantic_cache")
+        encoder_id = getattr(self, 'embedding_model_id', None)
+        if cache is not None and self.components.get('embedding_model') and cache.encoder_id != encoder_id:
+            cache.set_encoder(self._encode_query, encoder_id)
+        return cache
+
     def real_task_decomposition(self, query: str) -> List[str]:
         """真实的任务分解"""
         if "什么是" in query or "介绍" in query:
@@ -495,22 +1103,18 @@ class LocalModelEngine:
 
     def real_keyword_retrieval(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """真实的关键词检索"""
+        self._ensure_component("corpus")
         if not self.components.get('bm25') or not self.documents:
             return []
 
         try:
-            tokenized_query = query.split()
-            scores = self.components['bm25'].get_scores(tokenized_query)
-
-            top_indices = scores.argsort()[-top_k:][::-1]
+            # 倒排列表 + MaxScore 提前终止，只触及查询词的倒排记录
+            top_indices, scores = self.components['bm25'].search(query, top_k)
 
             results = []
-            for idx in top_indices:
+            for idx, score in zip(top_indices, scores):
                 if idx < len(self.documents):
-                    doc = self.documents[idx].copy()
-                    doc['score'] = float(scores[idx])
-                    doc['retrieval_type'] = 'keyword'
-                    results.append(doc)
+                    results.append(self._make_hit(idx, score, 'keyword'))
 
             return results
         except Exception as e:
@@ -519,42 +1123,76 @@ class LocalModelEngine:
 
     def real_dense_retrieval(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """真实的密集检索"""
-        if not self.components.get('embedding_model') or self.document_embeddings is None:
+        self._ensure_component("dense_index")
+        if not self.components.get('embedding_model') or self.dense_index is None:
             return []
 
         try:
-            # 计算查询嵌入
-            if hasattr(self.components['embedding_model'], 'encode'):
-                # SentenceTransformer模型
-                query_embedding = self.components['embedding_model'].encode([query])
-            else:
-                # Transformers模型
-                query_embedding = self._compute_embeddings_with_transformers([query])
+            # 计算查询嵌入（命中缓存时跳过编码）
+            query_embedding = self._encode_query(query)
 
-            # 计算相似度
-            if SKLEARN_AVAILABLE:
-                similarities = cosine_similarity(query_embedding, self.document_embeddings)[0]
-            else:
-                # 手动计算余弦相似度
-                query_norm = np.linalg.norm(query_embedding)
-                doc_norms = np.linalg.norm(self.document_embeddings, axis=1)
-                similarities = np.dot(query_embedding[0], self.document_embeddings.T) / (query_norm * doc_norms)
-
-            top_indices = similarities.argsort()[-top_k:][::-1]
+            # 分段索引（含运行时增删）优先；其基础段为 ANN 索引或分块内积 + argpartition 精确检索
+            index = getattr(self, 'dense_segments', None)
+            if index is None:
+                index = self.ann_index if self.ann_index is not None else self.dense_index
+            top_indices, similarities = index.search(query_embedding, top_k)
 
             results = []
-            for idx in top_indices:
+            for idx, similarity in zip(top_indices, similarities):
                 if idx < len(self.documents):
-                    doc = self.documents[idx].copy()
-                    doc['score'] = float(similarities[idx])
-                    doc['retrieval_type'] = 'dense'
-                    results.append(doc)
+                    results.append(self._make_hit(idx, similarity, 'dense'))
 
             return results
         except Exception as e:
             logger.error(f"密集检索失败: {e}")
             return []
 
+    def real_keyword_retrieval_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """批量关键词检索：全部查询词的倒排只遍历一次，返回每个查询的结果"""
+        self._ensure_component("corpus")
+        if not self.components.get('bm25') or not self.documents or not queries:
+            return [[] for _ in queries]
+
+        try:
+            return [
+                [self._make_hit(idx, score, 'keyword') for idx, score in zip(top_indices, scores)
+                 if idx < len(self.documents)]
+                for top_indices, scores in self.components['bm25'].search_batch(queries, top_k)
+            ]
+        except Exception as e:
+            logger.error(f"批量关键词检索失败: {e}")
+            return [[] for _ in queries]
+
+    def real_dense_retrieval_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """批量密集检索：查询一次前向编码，与文档向量做矩阵-矩阵乘法，返回每个查询的结果"""
+        self._ensure_component("dense_index")
+        if not self.components.get('embedding_model') or self.dense_index is None or not queries:
+            return [[] for _ in queries]
+
+        try:
+            query_embeddings = self._encode_queries(queries)
+
+            index = getattr(self, 'dense_segments', None)
+            if index is None:
+                index = self.ann_index if self.ann_index is not None else self.dense_index
+            return [
+                [self._make_hit(idx, similarity, 'dense') for idx, similarity in zip(top_indices, similarities)
+                 if idx < len(self.documents)]
+                for top_indices, similarities in index.search_batch(query_embeddings, top_k)
+            ]
+        except Exception as e:
+            logger.error(f"批量密集检索失败: {e}")
+            return [[] for _ in queries]
+
+    def _make_hit(self, idx: int, score: float, retrieval_type: str):
+        """按文档号构造命中：文档库返回只引用文档号的 DocumentHit，列表文档回退为字典副本"""
+        if hasattr(self.documents, 'hit'):
+            return self.documents.hit(idx, score, retrieval_type)
+        doc = self.documents[idx].copy()
+        doc['score'] = float(score)
+        doc['retrieval_type'] = retrieval_type
+        return doc
+
     def simulate_web_retrieval(self, query: str, top_k: int = 2) -> List[Dict[str, Any]]:
         """模拟网络检索"""
         web_results = [
@@ -611,6 +1249,7 @@ class LocalModelEngine:
 
     def real_generation(self, query: str, contexts: List[Dict[str, Any]]) -> str:
         """真实的生成"""
+        self._ensure_component("generator_model")
         if not self.components.get('generator_model') or not self.components.get('generator_tokenizer'):
             # 回退到简单拼接
             if contexts:
@@ -679,6 +1318,12 @@ class LocalModelEngine:
                     self.module_manager = ModuleManager(self.config)
                     self.module_manager.initialize_modules()
 
+                # 新启用模块需要的组件在后台预热
+                pending = [name for name in self._required_components()
+                           if self._component_states[name]["status"] == "pending"]
+                if pending:
+                    self.start_warmup(pending)
+
                 logger.info(f"✅ 模块配置已更新，启用模块数: {sum(module_config.values())}")
                 return True
             else:
@@ -694,6 +1339,7 @@ class LocalModelEngine:
             if self.module_manager:
                 status = self.module_manager.get_module_status()
                 enabled_modules = self.module_manager.get_enabled_modules()
+                semantic_cache = self._get_semantic_cache()
 
                 return {
                     "module_status": status,
@@ -706,9 +1352,19 @@ class LocalModelEngine:
                         "bm25": BM25_AVAILABLE,
                         "sklearn": SKLEARN_AVAILABLE,
                         "embedding_model": self.components.get('embedding_model') is not None,
+                        "dense_index": self.dense_index.get_index_info() if getattr(self, 'dense_index', None) else None,
+                        "ann_index": self.ann_index.get_index_info() if getattr(self, 'ann_index', None) else None,
+                        "ann_report": getattr(self, 'ann_report', None),
+                        "readiness": self.get_readiness(),
+                        "keyword_index": self.components['bm25'].get_index_info() if self.components.get('bm25') else None,
+                        "dense_segments": self.dense_segments.get_segment_info() if getattr(self, 'dense_segments', None) else None,
                         "generator_model": self.components.get('generator_model') is not None,
                         "reranker_model": self.components.get('reranker_model') is not None,
-                        "documents_count": len(self.documents) if hasattr(self, 'documents') else 0
+                        "query_embedding_cache": self.query_embedding_cache.get_statistics() if self.query_embedding_cache else None,
+                        "semantic_cache": semantic_cache.get_statistics() if semantic_cache else None,
+                        "documents_count": len(self.documents) if hasattr(self, 'documents') else 0,
+                        "document_store": self.documents.get_store_info() if hasattr(getattr(self, 'documents', None), 'get_store_info') else None,
+                        "index_manifest": self.index_manifest.get_summary() if getattr(self, 'index_manifest', None) else None
                     }
                 }
             else:
@@ -28,4 +28,8 @@ class MockDataManager:
                 "score": 0.9 - i * 0.1
             }
             for i in range(1, min(top_k + 1, 6))
-        ] 
\ No newline at end of file
+        ]
+
+    def search_batch(self, queries, top_k: int = 5):
+        """模拟批量文档搜索，返回每个查询的结果"""
+        return [self.search_documents(query, top_k) for query in queries]
@@ -41,12 +41,20 @@ except ImportError:
     logger.warning("PyTorch组件不可用")
 
 try:
-    from rank_bm25 import BM25Okapi
+    from adaptive_rag.modules.retriever.sparse_retriever import InvertedBM25Index
     BM25_AVAILABLE = True
 except ImportError:
     BM25_AVAILABLE = False
     logger.warning("BM25不可用")
 
+try:
+    from adaptive_rag.modules.retriever.dense_retriever import normalize_embeddings, top_k_from_scores
+    from adaptive_rag.modules.retriever.ann_index import build_ann_index, get_dense_index_config
+    DENSE_INDEX_AVAILABLE = True
+except ImportError:
+    DENSE_INDEX_AVAILABLE = False
+    logger.warning("稠密索引不可用")
+
 
 class RealModelEngine:
     """真实模型引擎 - 使用真实的检索器、重排序器和生成器"""
@@ -162,22 +170,27 @@ class RealModelEngine:
             try:
                 # 准备文档文本用于BM25
                 doc_texts = [doc['content'] for doc in self.documents]
-                tokenized_docs = [text.split() for text in doc_texts]
-                self.components['bm25'] = BM25Okapi(tokenized_docs)
+                self.components['bm25'] = InvertedBM25Index.from_texts(doc_texts)
                 logger.info("✅ BM25检索器初始化成功")
             except Exception as e:
                 logger.error(f"❌ BM25检索器初始化失败: {e}")
                 self.components['bm25'] = None
         
         # 预计算文档嵌入
-        if self.components.get('embedding_model'):
+        self.document_embeddings = None
+        self.ann_index = None
+        if DENSE_INDEX_AVAILABLE and self.components.get('embedding_model'):
             try:
                 doc_texts = [doc['content'] for doc in self.documents]
-                self.document_embeddings = self.components['embedding_model'].encode(doc_texts)
+                self.document_embeddings = normalize_embeddings(self.components['embedding_model'].encode(doc_texts))
                 logger.info("✅ 文档嵌入预计算完成")
+
+                # 按配置构建 ANN 索引（flat 时使用精确检索）
+                self.ann_index = build_ann_index(get_dense_index_config(self.modular_config), self.document_embeddings)
             except Exception as e:
                 logger.error(f"❌ 文档嵌入计算失败: {e}")
                 self.document_embeddings = None
+                self.ann_index = None
     
     def process_query_with_modules(self, query: str) -> Dict[str, Any]:
         """根据启用的模块处理查询"""
@@ -285,17 +298,13 @@ class RealModelEngine:
         
         try:
             # 使用BM25进行检索
-            tokenized_query = query.split()
-            scores = self.components['bm25'].get_scores(tokenized_query)
-            
-            # 获取top_k结果
-            top_indices = scores.argsort()[-top_k:][::-1]
+            top_indices, scores = self.components['bm25'].search(query, top_k)
             
             results = []
-            for idx in top_indices:
+            for idx, score in zip(top_indices, scores):
                 if idx < len(self.documents):
                     doc = self.documents[idx].copy()
-                    doc['score'] = float(scores[idx])
+                    doc['score'] = float(score)
                     doc['retrieval_type'] = 'keyword'
                     results.append(doc)
             
@@ -313,18 +322,18 @@ class RealModelEngine:
             # 计算查询嵌入
             query_embedding = self.components['embedding_model'].encode([query])
             
-            # 计算相似度
-            from sklearn.metrics.pairwise import cosine_similarity
-            similarities = cosine_similarity(query_embedding, self.document_embeddings)[0]
-            
-            # 获取top_k结果
-            top_indices = similarities.argsort()[-top_k:][::-1]
+            # 计算相似度（文档嵌入已归一化，内积即余弦相似度）
+            if self.ann_index is not None:
+                top_indices, similarities = self.ann_index.search(query_embedding, top_k)
+            else:
+                query_embedding = normalize_embeddings(query_embedding)[0]
+                top_indices, similarities = top_k_from_scores(self.document_embeddings @ query_embedding, top_k)
             
             results = []
-            for idx in top_indices:
+            for idx, similarity in zip(top_indices, similarities):
                 if idx < len(self.documents):
                     doc = self.documents[idx].copy()
-                    doc['score'] = float(similarities[idx])
+                    doc['score'] = float(similarity)
                     doc['retrieval_type'] = 'dense'
                     results.append(doc)
             
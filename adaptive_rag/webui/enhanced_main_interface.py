@@ -369,6 +369,12 @@ def create_enhanced_interface(config_path: str = "real_config.yaml") -> gr.Block
             # 结果分析标签页
             analysis_components = create_analysis_tab(engine)
 
+        # 就绪探针（API 名 readiness）：模型在后台预热，部署脚本可轮询各组件状态与启动耗时
+        if hasattr(engine, 'get_readiness'):
+            readiness_status = gr.JSON(visible=False)
+            readiness_btn = gr.Button(visible=False)
+            readiness_btn.click(fn=engine.get_readiness, outputs=[readiness_status], api_name="readiness")
+
         # 绑定事件处理函数
         bind_events(engine, module_components, resource_components, 
                    basic_components, query_components, analysis_components)
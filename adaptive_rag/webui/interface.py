@@ -55,6 +55,10 @@ class MockDataManager:
             for i in range(1, min(top_k + 1, 6))
         ]
 
+    def search_batch(self, queries, top_k: int = 5):
+        """模拟批量文档搜索，返回每个查询的结果"""
+        return [self.search_documents(query, top_k) for query in queries]
+
 
 class RealConfigAdaptiveRAGEngine:
     """使用真实配置的 AdaptiveRAG 引擎"""
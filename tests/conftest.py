@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 直接运行 pytest（而非 python -m pytest）时也能导入仓库内的 adaptive_rag
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
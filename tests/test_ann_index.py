@@ -0,0 +1,46 @@
+import json
+import os
+
+import numpy as np
+
+from adaptive_rag.modules.retriever.ann_index import ANN_META_FILE, build_ann_index, load_ann_index
+
+CONFIG = {"index_type": "ivf", "backend": "numpy", "nlist": 8, "nprobe": 2, "train_size": 500, "kmeans_iters": 5}
+
+
+def build(tmp_path, config=CONFIG):
+    vectors = np.random.default_rng(0).standard_normal((400, 16)).astype(np.float32)
+    index_dir = str(tmp_path / "ann")
+    build_ann_index(config, vectors, index_dir)
+    return index_dir
+
+
+def test_load_with_same_build_config(tmp_path):
+    index_dir = build(tmp_path)
+    index = load_ann_index(index_dir, CONFIG)
+    assert index is not None and len(index) == 400
+
+
+def test_build_parameter_change_requires_rebuild(tmp_path):
+    index_dir = build(tmp_path)
+    for change in ({"nlist": 16}, {"seed": 7}, {"kmeans_iters": 10}, {"train_size": 200},
+                   {"index_type": "ivf_pq", "pq_m": 4}):
+        assert load_ann_index(index_dir, {**CONFIG, **change}) is None, change
+
+
+def test_query_parameters_are_taken_from_config(tmp_path):
+    index_dir = build(tmp_path)
+    index = load_ann_index(index_dir, {**CONFIG, "nprobe": 6, "rerank_factor": 2})
+    assert index is not None
+    assert (index.nprobe, index.rerank_factor) == (6, 2)
+
+
+def test_index_without_build_config_is_rebuilt(tmp_path):
+    index_dir = build(tmp_path)
+    meta_path = os.path.join(index_dir, ANN_META_FILE)
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    del meta["build_config"]
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    assert load_ann_index(index_dir, CONFIG) is None
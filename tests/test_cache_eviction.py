@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from adaptive_rag.core.performance_optimizer import (
+    CACHE_TYPES, ClockCache, FrequencySketch, ShardedCache, TinyLFUCache, create_cache
+)
+
+
+def leaf_caches(cache):
+    return cache.shards if isinstance(cache, ShardedCache) else [cache]
+
+
+def leaf_entries(leaf):
+    if isinstance(leaf, TinyLFUCache):
+        return {**leaf.main, **leaf.window}
+    return dict(leaf.cache)
+
+
+def assert_within_bounds(cache):
+    for leaf in leaf_caches(cache):
+        entries = leaf_entries(leaf)
+        assert len(leaf) == len(entries) <= leaf.max_size
+        assert leaf.current_memory == sum(entry.size_bytes for entry in entries.values())
+        assert leaf.current_memory <= leaf.max_memory_bytes
+        if isinstance(leaf, ClockCache):
+            assert {key: slot for key, slot in leaf._slots.items()} == \
+                {key: i for i, key in enumerate(leaf._ring) if key is not None}
+            assert set(leaf._slots) == set(leaf.cache)
+
+
+@pytest.mark.parametrize("cache_type", CACHE_TYPES)
+@pytest.mark.parametrize("max_size", [1, 2, 7, 64])
+def test_random_workload_respects_bounds(cache_type, max_size):
+    rng = random.Random(max_size)
+    cache = create_cache(max_size=max_size, max_memory_mb=1, cache_type=cache_type, num_shards=4)
+    latest = {}
+    for step in range(3000):
+        key = f"k{int(rng.paretovariate(1.2)) % 200}"
+        if rng.random() < 0.5:
+            value = (key, step)
+            cache.put(key, value, size_bytes=rng.randint(1, 64 * 1024))
+            latest[key] = value
+        else:
+            # 只能读到最近一次写入的值，或者未命中
+            assert cache.get(key) in (None, latest.get(key))
+        if step % 50 == 0:
+            assert_within_bounds(cache)
+    assert_within_bounds(cache)
+
+
+def test_clock_gives_referenced_entries_a_second_chance():
+    cache = ClockCache(max_size=3)
+    for key in "abc":
+        cache.put(key, key, size_bytes=1)
+    cache.get("a")
+    cache.put("d", "d", size_bytes=1)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["a", "c", "d"]
+
+
+def test_tinylfu_keeps_hot_keys_under_a_scan():
+    # 热点查询与大量只出现一次的长尾查询交替到达
+    rng = random.Random(0)
+    hot = [f"hot{i}" for i in range(50)]
+    hit_rates = {}
+    for cache_type in ("lru", "tinylfu"):
+        cache = create_cache(max_size=100, cache_type=cache_type)
+        hits = 0
+        for i in range(5000):
+            for key in (rng.choice(hot), f"scan{i}"):
+                if cache.get(key) is None:
+                    cache.put(key, key, size_bytes=1)
+                elif key.startswith("hot"):
+                    hits += 1
+        hit_rates[cache_type] = hits / 5000
+        assert_within_bounds(cache)
+
+    assert all(cache.peek(key) is not None for key in hot)
+    assert cache.rejected > 0
+    assert hit_rates["tinylfu"] > hit_rates["lru"] + 0.1
+
+
+def test_tinylfu_with_single_slot():
+    cache = TinyLFUCache(max_size=1)
+    cache.put("a", 1, size_bytes=1)
+    cache.put("b", 2, size_bytes=1)
+    assert len(cache) == 1 and cache.get("b") == 2
+    assert cache.current_memory == 1
+
+
+def test_frequency_sketch_never_underestimates_and_ages():
+    sketch = FrequencySketch(capacity=1000)
+    rng = random.Random(0)
+    counts = {f"k{i}": rng.randint(1, 20) for i in range(300)}
+    for key, count in counts.items():
+        for _ in range(count):
+            sketch.increment(key)
+    assert sketch.additions < sketch.sample_size
+    assert all(sketch.frequency(key) >= min(count, 15) for key, count in counts.items())
+
+    # 累计到 sample_size 后全部计数减半
+    before = sketch.frequency("k0")
+    for i in range(sketch.sample_size - sketch.additions):
+        sketch.increment(f"other{i}")
+    assert sketch.frequency("k0") <= (before + 1) // 2 + 1
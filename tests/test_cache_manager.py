@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import pytest
+
+from adaptive_rag import cache_manager as cache_module
+from adaptive_rag.cache_manager import CacheManager
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可控时钟：每次读取前进 1ms，保证 last_access 严格递增"""
+    state = {"now": 1_000_000.0}
+
+    def now():
+        state["now"] += 0.001
+        return state["now"]
+
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(time=now))
+    return state
+
+
+def test_roundtrip_small_and_compressed_results(tmp_path, clock):
+    cache = CacheManager(str(tmp_path), max_cache_size=10)
+    small = {"answer": "bm25"}
+    large = {"documents": ["x" * 100] * 100}
+    cache.set_query_cache("q1", small)
+    cache.set_query_cache("q2", large, config_hash="cfg")
+    assert cache.get_query_cache("q1") == small
+    assert cache.get_query_cache("q2", config_hash="cfg") == large
+    assert cache.get_query_cache("q2") is None
+    stats = cache.get_cache_stats()
+    assert (stats["hits"], stats["misses"], stats["query_cache_count"]) == (2, 1, 2)
+    cache.close()
+
+
+def test_size_bound_evicts_least_recently_accessed(tmp_path, clock):
+    cache = CacheManager(str(tmp_path), max_cache_size=3)
+    for i in range(3):
+        cache.set_query_cache(f"q{i}", {"i": i})
+    cache.get_query_cache("q0")  # q0 变为最近访问，q1 成为淘汰候选
+    cache.set_query_cache("q3", {"i": 3})
+
+    assert cache.get_cache_stats()["query_cache_count"] == 3
+    assert cache.get_query_cache("q1") is None
+    assert all(cache.get_query_cache(f"q{i}") == {"i": i} for i in (0, 2, 3))
+
+    # 覆盖已有键不增加条目数
+    cache.set_query_cache("q3", {"i": 33})
+    assert cache._count == 3 and cache.get_query_cache("q3") == {"i": 33}
+    cache.close()
+
+
+def test_expired_entries_are_dropped(tmp_path, clock):
+    cache = CacheManager(str(tmp_path), max_cache_size=2, max_cache_age_hours=1)
+    cache.set_query_cache("old", {"v": 1})
+    clock["now"] += 2 * 3600
+    assert cache.get_query_cache("old") is None
+    assert cache._count == 0
+
+    # 超限时先清理过期项，未过期的条目不被淘汰
+    cache.set_query_cache("a", {"v": 1})
+    cache.set_query_cache("b", {"v": 2})
+    clock["now"] += 2 * 3600
+    cache.set_query_cache("c", {"v": 3})
+    cache.set_query_cache("d", {"v": 4})
+    cache.set_query_cache("e", {"v": 5})
+    assert cache.get_cache_stats()["query_cache_count"] == 2
+    assert cache.get_query_cache("c") is None
+    assert cache.get_query_cache("d") == {"v": 4} and cache.get_query_cache("e") == {"v": 5}
+    cache.close()
+
+
+def test_entries_persist_across_instances(tmp_path, clock):
+    cache = CacheManager(str(tmp_path), max_cache_size=5)
+    cache.set_query_cache("q", {"v": 1})
+    cache.close()
+
+    reopened = CacheManager(str(tmp_path), max_cache_size=5)
+    assert reopened._count == 1
+    assert reopened.get_query_cache("q") == {"v": 1}
+    reopened.close()
@@ -0,0 +1,141 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from adaptive_rag.data_processing.corpus_builder import CorpusBuilder
+from adaptive_rag.data_processing.dataset_loader import count_lines
+from adaptive_rag.data_processing.document_store import DocumentStore
+from adaptive_rag.data_processing.index_manifest import APPEND, MISSING, STALE, VALID, IndexManifest
+from adaptive_rag.modules.retriever.dense_retriever import ShardedDenseIndex
+
+PARAMS = {"encoder": "e5-base-v2", "dtype": "float32"}
+
+
+def write_lines(path, lines, mode="w"):
+    with open(path, mode, encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in lines)
+
+
+def record(content, doc_id=None):
+    data = {"contents": content}
+    if doc_id is not None:
+        data["id"] = doc_id
+    return json.dumps(data, ensure_ascii=False)
+
+
+def encode(texts):
+    # 确定性的“编码器”：按字符码统计直方图
+    vectors = np.zeros((len(texts), 8), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for ch in text:
+            vectors[i, ord(ch) % 8] += 1
+    return vectors
+
+
+def test_count_lines(tmp_path):
+    path = tmp_path / "c.jsonl"
+    path.write_bytes(b"a\n\nbb\nccc")
+    assert count_lines(str(path)) == 4
+    assert count_lines(str(path), start_offset=2) == 3
+    assert count_lines(str(path), end_offset=3) == 2
+    assert count_lines(str(path), 2, 2) == 0
+    path.write_bytes(b"")
+    assert count_lines(str(path)) == 0
+
+
+def test_manifest_status(tmp_path):
+    corpus = str(tmp_path / "corpus.jsonl")
+    write_lines(corpus, [record("a"), record("b")])
+    cache_dir = str(tmp_path / "cache")
+
+    manifest = IndexManifest(cache_dir, corpus)
+    assert manifest.status("dense_index", PARAMS) == MISSING
+    manifest.record("dense_index", PARAMS, num_docs=2)
+
+    manifest = IndexManifest(cache_dir, corpus)
+    assert manifest.status("dense_index", PARAMS, num_docs=2) == VALID
+    assert manifest.status("dense_index", PARAMS, num_docs=3) == STALE
+    assert manifest.status("dense_index", PARAMS, exists=False) == MISSING
+    # 参数经 JSON 规范化后比较，键顺序不影响
+    assert manifest.status("dense_index", {"dtype": "float32", "encoder": "e5-base-v2"}) == VALID
+    assert manifest.status("dense_index", {**PARAMS, "encoder": "bge"}) == STALE
+
+    write_lines(corpus, [record("c")], mode="a")
+    assert IndexManifest(cache_dir, corpus).status("dense_index", PARAMS) == APPEND
+    # 截断读取时无法确定追加的起点
+    assert IndexManifest(cache_dir, corpus, max_documents=10).status("dense_index", PARAMS) == STALE
+
+
+def test_manifest_detects_same_size_rewrite(tmp_path):
+    corpus = str(tmp_path / "corpus.jsonl")
+    write_lines(corpus, [record("a"), record("b")])
+    cache_dir = str(tmp_path / "cache")
+    IndexManifest(cache_dir, corpus).record("document_store", PARAMS, num_docs=2)
+
+    stat = os.stat(corpus)
+    write_lines(corpus, [record("x"), record("y")])
+    os.utime(corpus, (stat.st_atime, stat.st_mtime))
+    assert os.path.getsize(corpus) == stat.st_size
+    assert IndexManifest(cache_dir, corpus).status("document_store", PARAMS) == STALE
+
+    # 改写后再追加也不能当作追加处理
+    write_lines(corpus, [record("z")], mode="a")
+    assert IndexManifest(cache_dir, corpus).status("document_store", PARAMS) == STALE
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_append_matches_rebuild(tmp_path, num_workers):
+    corpus = str(tmp_path / "corpus.jsonl")
+    write_lines(corpus, [record("alpha"), "", record("beta"), "{broken", record("gamma", "g")])
+    offset = os.path.getsize(corpus)
+
+    def builder(name, dense_index=None):
+        return CorpusBuilder(str(tmp_path / name / "store"), dense_index=dense_index,
+                             encode_fn=encode, encode_batch_size=2)
+
+    dense_dir = str(tmp_path / "inc" / "dense")
+    builder("inc", ShardedDenseIndex(dense_dir, shard_size=2)).build(corpus, chunk_size=2)
+    write_lines(corpus, [record("delta"), "", record("epsilon")], mode="a")
+    result = builder("inc", ShardedDenseIndex.open_for_append(dense_dir)).append(
+        corpus, start_offset=offset, chunk_size=2, num_workers=num_workers)
+
+    rebuilt = builder("full", ShardedDenseIndex(str(tmp_path / "full" / "dense"), shard_size=2)).build(
+        corpus, chunk_size=2, num_workers=num_workers)
+
+    ids = [doc["id"] for doc in result["documents"]]
+    assert ids == [doc["id"] for doc in rebuilt["documents"]] == ["doc_0", "doc_2", "g", "doc_5", "doc_7"]
+    assert result["appended"] == 2
+    assert [doc["content"] for doc in result["documents"]] == [doc["content"] for doc in rebuilt["documents"]]
+    assert result["documents"].meta["source"]["num_lines"] == rebuilt["documents"].meta["source"]["num_lines"] == 8
+    np.testing.assert_array_equal(np.vstack([b for _, b in result["dense"].iter_blocks()]),
+                                  np.vstack([b for _, b in rebuilt["dense"].iter_blocks()]))
+
+
+def test_append_without_recorded_line_count(tmp_path):
+    """旧版文档库没有记录行数时，重新统计追加起点之前的行数"""
+    corpus = str(tmp_path / "corpus.jsonl")
+    write_lines(corpus, [record("a"), "", record("b")])
+    offset = os.path.getsize(corpus)
+    store_dir = str(tmp_path / "store")
+    CorpusBuilder(store_dir).build(corpus)
+
+    meta_path = os.path.join(store_dir, "document_store_meta.json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    del meta["source"]["num_lines"]
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    write_lines(corpus, [record("c")], mode="a")
+    store = CorpusBuilder(store_dir).append(corpus, start_offset=offset)["documents"]
+    assert [doc["id"] for doc in store] == ["doc_0", "doc_2", "doc_3"]
+    assert DocumentStore.load(store_dir).meta["source"]["num_lines"] == 4
+
+
+def test_truncated_build_records_lines_read(tmp_path):
+    corpus = str(tmp_path / "corpus.jsonl")
+    write_lines(corpus, [record(str(i)) for i in range(10)])
+    store = CorpusBuilder(str(tmp_path / "store")).build(corpus, max_documents=4)["documents"]
+    assert len(store) == 4 and store.meta["source"]["num_lines"] == 4
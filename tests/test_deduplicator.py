@@ -0,0 +1,80 @@
+import random
+import zlib
+
+import numpy as np
+
+from adaptive_rag.modules.refiner.deduplicator import MinHashDeduplicator, jaccard, tokenize
+
+PRIME = (1 << 31) - 1
+
+
+def near_duplicate_texts(seed, originals=300, length=80):
+    rng = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(3000)]
+    texts = []
+    for _ in range(originals):
+        words = rng.choices(vocabulary, k=length)
+        texts.append(" ".join(words))
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        texts.append(" ".join(words))
+    rng.shuffle(texts)
+    return texts
+
+
+def test_signatures_match_naive_minhash():
+    deduplicator = MinHashDeduplicator(num_perm=16)
+    token_sets = [tokenize(text) for text in ["a b c", "", "c d e f", "A a"]]
+    signatures = deduplicator.signatures(token_sets)
+    for tokens, signature in zip(token_sets, signatures):
+        if not tokens:
+            assert not signature.any()
+            continue
+        for k in range(deduplicator.num_perm):
+            a, b = int(deduplicator._a[k]), int(deduplicator._b[k])
+            expected = min((a * (zlib.crc32(t.encode("utf-8")) % PRIME) + b) % PRIME for t in tokens)
+            assert signature[k] == expected
+
+
+def test_signature_agreement_estimates_jaccard():
+    rng = random.Random(0)
+    deduplicator = MinHashDeduplicator(num_perm=256)
+    pairs = []
+    for _ in range(20):
+        shared = {f"s{rng.random()}" for _ in range(rng.randint(10, 60))}
+        pairs.append((shared | {f"x{i}" for i in range(rng.randint(0, 40))},
+                      shared | {f"y{i}" for i in range(rng.randint(0, 40))}))
+    signatures = deduplicator.signatures([tokens for pair in pairs for tokens in pair])
+    errors = [abs((signatures[2 * i] == signatures[2 * i + 1]).mean() - jaccard(*pair))
+              for i, pair in enumerate(pairs)]
+    assert np.mean(errors) < 0.05
+
+
+def test_lsh_matches_exact_deduplication():
+    texts = near_duplicate_texts(0)
+    lsh = MinHashDeduplicator(threshold=0.85)
+    exact = MinHashDeduplicator(threshold=0.85, exact_below=len(texts))
+    kept = lsh.select(texts)
+    assert kept == exact.select(texts)
+    assert len(kept) == 300
+    # LSH 只筛选候选对，比较次数远少于两两比较
+    assert lsh.stats["comparisons"] * 10 < exact.stats["comparisons"]
+
+
+def test_lsh_never_drops_distinct_documents():
+    rng = random.Random(1)
+    texts = [" ".join(rng.choices(["a", "b", "c", "d", "e", "f", "g", "h"], k=rng.randint(1, 6)))
+             for _ in range(200)] + ["", ""]
+    token_sets = [tokenize(text) for text in texts]
+    kept = MinHashDeduplicator(threshold=0.5).select(texts)
+
+    kept_set = set(kept)
+    for position, i in enumerate(kept):
+        assert all(jaccard(token_sets[i], token_sets[j]) <= 0.5 for j in kept[:position])
+    # 被丢弃的文档一定与某个更早保留的文档重复
+    for i in set(range(len(texts))) - kept_set:
+        assert any(jaccard(token_sets[i], token_sets[j]) > 0.5 for j in kept if j < i)
+
+
+def test_disabled_only_removes_identical_texts():
+    deduplicator = MinHashDeduplicator(enabled=False)
+    assert deduplicator.select(["a b", "a b", "A b", "a b c"]) == [0, 2, 3]
@@ -0,0 +1,160 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from adaptive_rag.modules.retriever.dense_retriever import (
+    INDEX_META_FILE, ShardedDenseIndex, normalize_embeddings, top_k_from_scores, top_k_per_row
+)
+
+DIM = 12
+
+
+@pytest.fixture(scope="module")
+def embeddings():
+    rng = np.random.RandomState(0)
+    vectors = rng.randn(257, DIM).astype(np.float32)
+    vectors[5] = 0.0  # 零向量保持为零
+    return vectors
+
+
+@pytest.fixture(scope="module")
+def queries():
+    return np.random.RandomState(1).randn(6, DIM).astype(np.float32)
+
+
+def brute_force(embeddings, query, top_k):
+    """全量分数 + argsort 的精确 top-k"""
+    scores = normalize_embeddings(embeddings) @ normalize_embeddings(query)[0]
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    return scores, order, scores[order]
+
+
+def build(index_dir, embeddings, batch=50, **kwargs):
+    index = ShardedDenseIndex(str(index_dir), **kwargs)
+    for start in range(0, len(embeddings), batch):
+        index.add(embeddings[start:start + batch])
+    return index.finalize()
+
+
+def test_normalize_embeddings():
+    vectors = normalize_embeddings(np.array([[3.0, 4.0], [0.0, 0.0]]))
+    np.testing.assert_allclose(vectors, [[0.6, 0.8], [0.0, 0.0]])
+    assert normalize_embeddings(np.array([1.0, 0.0])).shape == (1, 2)
+
+
+@pytest.mark.parametrize("top_k", [1, 7, 50, 1000])
+def test_top_k_helpers_match_argsort(top_k):
+    rng = np.random.RandomState(top_k)
+    scores = rng.randn(4, 300).astype(np.float32)
+
+    indices, values = top_k_per_row(scores, top_k)
+    expected = np.argsort(-scores, axis=1, kind="stable")[:, :top_k]
+    np.testing.assert_array_equal(indices, expected)
+    np.testing.assert_array_equal(values, np.take_along_axis(scores, expected, axis=1))
+
+    for row in range(4):
+        row_indices, row_values = top_k_from_scores(scores[row], top_k)
+        np.testing.assert_array_equal(row_indices, expected[row])
+        np.testing.assert_array_equal(row_values, scores[row, expected[row]])
+
+
+def test_top_k_helpers_empty():
+    assert top_k_from_scores(np.empty(0, dtype=np.float32), 5)[0].size == 0
+    assert top_k_from_scores(np.ones(3, dtype=np.float32), 0)[0].size == 0
+    indices, values = top_k_per_row(np.ones((2, 3), dtype=np.float32), 0)
+    assert indices.shape == values.shape == (2, 0)
+
+
+def test_shard_boundaries(tmp_path, embeddings):
+    # 50 行一批写入，shard_size 不整除批大小与总数
+    index = build(tmp_path / "index", embeddings, shard_size=64)
+    assert index.shard_rows == [64, 64, 64, 64, 1]
+    assert len(index) == index.num_vectors == 257
+    np.testing.assert_allclose(index.get_vectors(np.arange(257)), normalize_embeddings(embeddings), atol=1e-6)
+    # 跨分片的乱序读取
+    picked = np.array([256, 0, 63, 64, 128, 5])
+    np.testing.assert_allclose(index.get_vectors(picked), normalize_embeddings(embeddings[picked]), atol=1e-6)
+
+    with pytest.raises(ValueError):
+        index.add(np.ones((1, DIM + 1), dtype=np.float32))
+
+
+def test_finalize_load_round_trip(tmp_path, embeddings):
+    index_dir = tmp_path / "index"
+    built = build(index_dir, embeddings, shard_size=100)
+    assert ShardedDenseIndex.exists(str(index_dir))
+    with open(os.path.join(index_dir, INDEX_META_FILE), encoding="utf-8") as f:
+        assert json.load(f)["num_docs"] == 257
+
+    loaded = ShardedDenseIndex.load(str(index_dir))
+    assert (loaded.dim, loaded.dtype, loaded.shard_rows) == (DIM, "float32", [100, 100, 57])
+    np.testing.assert_array_equal(loaded.get_vectors(np.arange(257)), built.get_vectors(np.arange(257)))
+    assert not ShardedDenseIndex.exists(str(tmp_path / "missing"))
+
+
+def test_open_for_append_matches_single_build(tmp_path, embeddings, queries):
+    single = build(tmp_path / "single", embeddings, shard_size=64)
+
+    index_dir = str(tmp_path / "appended")
+    build(index_dir, embeddings[:90], shard_size=64)
+    for end in (150, 200, 257):
+        index = ShardedDenseIndex.open_for_append(index_dir)
+        start = index.num_vectors
+        # 未写满的最后一个分片读回缓冲区
+        assert index.num_docs == start // 64 * 64
+        index.add(embeddings[start:end])
+        index.finalize()
+
+    appended = ShardedDenseIndex.load(index_dir)
+    assert appended.shard_rows == single.shard_rows
+    np.testing.assert_array_equal(appended.get_vectors(np.arange(257)), single.get_vectors(np.arange(257)))
+    for (got_ids, got_scores), (want_ids, want_scores) in zip(appended.search_batch(queries, 10),
+                                                               single.search_batch(queries, 10)):
+        np.testing.assert_array_equal(got_ids, want_ids)
+        np.testing.assert_array_equal(got_scores, want_scores)
+
+
+@pytest.mark.parametrize("top_k", [1, 10, 300])
+@pytest.mark.parametrize("shard_size,block_size", [(64, 16), (100, 1000), (300, 7)])
+def test_search_matches_brute_force(tmp_path, embeddings, queries, top_k, shard_size, block_size):
+    build(tmp_path / "index", embeddings, shard_size=shard_size)
+    index = ShardedDenseIndex.load(str(tmp_path / "index"), block_size=block_size)
+
+    batch = index.search_batch(queries, top_k)
+    assert len(batch) == len(queries)
+    for query, (batch_ids, batch_scores) in zip(queries, batch):
+        exact, expected_ids, expected_scores = brute_force(embeddings, query, top_k)
+        ids, scores = index.search(query, top_k)
+        assert len(ids) == min(top_k, len(embeddings))
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(exact[ids], scores, rtol=1e-5, atol=1e-6)
+        np.testing.assert_array_equal(ids, expected_ids)
+
+        np.testing.assert_array_equal(batch_ids, ids)
+        np.testing.assert_allclose(batch_scores, scores, rtol=1e-5, atol=1e-6)
+
+    # (1, dim) 形状的查询与一维查询结果一致
+    np.testing.assert_array_equal(index.search(queries[:1], top_k)[0], index.search(queries[0], top_k)[0])
+
+
+def test_float16_index(tmp_path, embeddings, queries):
+    index = build(tmp_path / "index", embeddings, shard_size=64, dtype="float16")
+    assert index.get_vectors(np.arange(3)).dtype == np.float32
+    assert ShardedDenseIndex.load(str(tmp_path / "index")).dtype == "float16"
+    for query in queries:
+        exact, _, expected_scores = brute_force(embeddings, query, 10)
+        ids, scores = index.search(query, 10)
+        np.testing.assert_allclose(scores, expected_scores, atol=2e-3)
+        np.testing.assert_allclose(exact[ids], scores, atol=2e-3)
+
+    with pytest.raises(ValueError):
+        ShardedDenseIndex(str(tmp_path / "bad"), dtype="int8")
+
+
+def test_empty_index(tmp_path, queries):
+    index = ShardedDenseIndex(str(tmp_path / "index"))
+    assert index.search(queries[0], 5)[0].size == 0
+    assert index.search(queries[0], 0)[0].size == 0
+    assert [ids.size for ids, _ in index.search_batch(queries, 5)] == [0] * len(queries)
@@ -0,0 +1,126 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from adaptive_rag.data_processing import dataset_loader
+from adaptive_rag.data_processing.dataset_loader import iter_corpus_chunks, iter_corpus_documents
+from adaptive_rag.data_processing.document_store import (DocumentHit, DocumentStore, DocumentStoreWriter,
+                                                         materialize_hits)
+
+LINES = [
+    json.dumps({"id": "a", "contents": "Title A\nbody a"}),
+    "",
+    json.dumps({"question": "q?", "answer": "yes"}),
+    "{not json",
+    json.dumps({"text": "plain passage", "title": "T"}),
+    "   ",
+    json.dumps({"contents": "无 ID 的中文正文"}),
+]
+
+
+@pytest.fixture
+def corpus_path(tmp_path):
+    path = tmp_path / "corpus.jsonl"
+    path.write_text("\n".join(LINES) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_chunks_skip_blank_and_invalid_lines(corpus_path):
+    documents = list(iter_corpus_documents(corpus_path, chunk_size=2))
+    assert [doc_id for doc_id, _, _ in documents] == ["a", "doc_2", "doc_4", "doc_6"]
+    assert documents[0] == ("a", "Title A", "Title A\nbody a")
+    assert documents[1] == ("doc_2", "q?", "问题: q?\n答案: yes")
+    assert documents[2] == ("doc_4", "T", "plain passage")
+    assert documents[3] == ("doc_6", "无 ID 的中文正文", "无 ID 的中文正文")
+
+    # max_documents 按行计数
+    assert [d[0] for d in iter_corpus_documents(corpus_path, chunk_size=2, max_documents=3)] == ["a", "doc_2"]
+
+
+def test_worker_parsing_preserves_order(tmp_path):
+    path = tmp_path / "big.jsonl"
+    path.write_text("".join(json.dumps({"contents": f"doc {i}"}) + "\n" for i in range(500)), encoding="utf-8")
+    serial = list(iter_corpus_chunks(str(path), chunk_size=7))
+    parallel = list(iter_corpus_chunks(str(path), chunk_size=7, num_workers=2))
+    assert parallel == serial
+    assert [d[0] for chunk in parallel for d in chunk] == [f"doc_{i}" for i in range(500)]
+
+
+def test_worker_parsing_reads_a_bounded_window(monkeypatch):
+    pulled = []
+
+    def line_chunks(*args, **kwargs):
+        for i in range(200):
+            pulled.append(i)
+            yield i, [json.dumps({"contents": str(i)})]
+
+    monkeypatch.setattr(dataset_loader, "_iter_line_chunks", line_chunks)
+    chunks = iter_corpus_chunks("unused.jsonl", num_workers=2)
+    assert next(chunks) == [("doc_0", "0", "0")]
+    assert len(pulled) <= 2 * 2
+    assert len(list(chunks)) == 199
+    chunks.close()
+
+
+def test_store_round_trip(tmp_path, corpus_path):
+    store_dir = str(tmp_path / "store")
+    writer = DocumentStoreWriter(store_dir)
+    for chunk in iter_corpus_chunks(corpus_path, chunk_size=3):
+        writer.add(chunk)
+    source = DocumentStore.source_signature(corpus_path)
+    store = writer.finalize(source)
+
+    records = list(iter_corpus_documents(corpus_path))
+    loaded = DocumentStore.load(store_dir)
+    for current in (store, loaded):
+        assert len(current) == len(records)
+        assert [(d["id"], d["title"], d["content"]) for d in current] == records
+        assert current[-1]["metadata"] == {"doc_index": len(records) - 1}
+        with pytest.raises(IndexError):
+            current[len(records)]
+    assert loaded.meta["source"] == source
+    assert loaded.matches_source(corpus_path)
+    assert not loaded.matches_source(corpus_path, max_documents=2)
+    assert loaded.get_store_info()["content_bytes"] == sum(len(c.encode("utf-8")) for _, _, c in records)
+
+
+def test_store_append_truncates_unrecorded_tail(tmp_path):
+    store_dir = str(tmp_path / "store")
+    writer = DocumentStoreWriter(store_dir)
+    writer.add([("1", "t1", "c1"), ("2", "t2", "c2")])
+    writer.finalize()
+
+    # 模拟上次追加写入一半后中断：.bin 多出未登记的字节
+    with open(os.path.join(store_dir, "contents.bin"), "ab") as f:
+        f.write(b"garbage")
+
+    writer = DocumentStoreWriter(store_dir, append=True)
+    assert writer.num_docs == 2
+    writer.add([("3", "t3", "正文三")])
+    store = writer.finalize()
+    assert [doc["content"] for doc in store] == ["c1", "c2", "正文三"]
+    assert DocumentStore.load(store_dir).get_content(2) == "正文三"
+
+
+def test_empty_store_and_runtime_extend(tmp_path):
+    store = DocumentStoreWriter(str(tmp_path / "store")).finalize()
+    assert len(store) == 0 and list(store.iter_content_batches()) == []
+    assert store.extend([("x", "tx", "cx")]) == [0]
+    assert store.num_persisted == 0 and store[0]["content"] == "cx"
+
+
+def test_hits_reference_the_store():
+    store = DocumentStore.from_records([("1", "t1", "c1"), ("2", "t2", "内容二")])
+    hit = store.hit(np.int64(1), np.float32(0.5), "dense")
+    assert isinstance(hit, DocumentHit)
+    assert (hit["id"], hit.get("content"), hit["score"]) == ("2", "内容二", 0.5)
+    assert "rerank_score" not in hit
+    hit["rerank_score"] = 0.9
+    with pytest.raises(KeyError):
+        hit["content"] = "x"
+    assert materialize_hits([hit, {"id": "raw"}]) == [{
+        "id": "2", "title": "t2", "content": "内容二", "metadata": {"doc_index": 1},
+        "score": 0.5, "retrieval_type": "dense", "rerank_score": 0.9, "rerank_position": None
+    }, {"id": "raw"}]
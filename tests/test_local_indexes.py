@@ -0,0 +1,124 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from adaptive_rag.core.local_indexes import LocalIndexes, index_subdir
+
+WORDS = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa"]
+
+
+def write_corpus(path, start, count, mode="w"):
+    rng = np.random.RandomState(start)
+    with open(path, mode, encoding="utf-8") as f:
+        for i in range(start, start + count):
+            text = " ".join(rng.choice(WORDS, size=6))
+            f.write(json.dumps({"id": f"d{i}", "contents": f"title {i}\n{text}"}) + "\n")
+
+
+class HashEncoder:
+    """词袋哈希“编码器”，记录被编码的文本数"""
+
+    def __init__(self):
+        self.encoded = 0
+
+    def __call__(self, texts):
+        self.encoded += len(texts)
+        vectors = np.zeros((len(texts), 16), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.split():
+                vectors[row, sum(map(ord, token)) % 16] += 1.0
+        return vectors
+
+
+def open_indexes(corpus, cache_dir, encoder, **kwargs):
+    return LocalIndexes(corpus, cache_dir, encode_fn=encoder, encoder_id="hash", encode_batch_size=7, **kwargs)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = str(tmp_path / "corpus.jsonl")
+    write_corpus(path, 0, 30)
+    return path
+
+
+def test_reload_from_cache_without_rebuild(tmp_path, corpus, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    built = open_indexes(corpus, cache_dir, HashEncoder())
+    assert len(built.documents) == len(built.bm25) == len(built.dense) == 30
+
+    def fail(*args, **kwargs):
+        raise AssertionError("缓存有效时不应重建")
+
+    monkeypatch.setattr(LocalIndexes, "_rebuild", fail)
+    monkeypatch.setattr(LocalIndexes, "_rebuild_bm25_from_store", fail)
+    monkeypatch.setattr(LocalIndexes, "_rebuild_dense_from_store", fail)
+    encoder = HashEncoder()
+    loaded = open_indexes(corpus, cache_dir, encoder)
+
+    assert encoder.encoded == 0
+    assert [loaded.documents.get_id(i) for i in range(30)] == [built.documents.get_id(i) for i in range(30)]
+    np.testing.assert_array_equal(loaded.dense.get_vectors(np.arange(30)), built.dense.get_vectors(np.arange(30)))
+    assert loaded.bm25.search("alpha beta", 5)[0].tolist() == built.bm25.search("alpha beta", 5)[0].tolist()
+
+
+def test_append_matches_rebuild(tmp_path, corpus):
+    cache_dir = str(tmp_path / "cache")
+    open_indexes(corpus, cache_dir, HashEncoder())
+    write_corpus(corpus, 30, 12, mode="a")
+
+    encoder = HashEncoder()
+    appended = open_indexes(corpus, cache_dir, encoder)
+    rebuilt = open_indexes(corpus, str(tmp_path / "fresh"), HashEncoder())
+
+    # 只编码新增文档
+    assert encoder.encoded == 12
+    assert len(appended.documents) == len(appended.bm25) == len(appended.dense) == 42
+    assert [appended.documents.get_id(i) for i in range(42)] == [rebuilt.documents.get_id(i) for i in range(42)]
+    np.testing.assert_array_equal(appended.dense.get_vectors(np.arange(42)), rebuilt.dense.get_vectors(np.arange(42)))
+    for query in ["alpha gamma", "theta kappa eta"]:
+        for got, want in zip(appended.bm25.search(query, 10), rebuilt.bm25.search(query, 10)):
+            np.testing.assert_allclose(got, want, rtol=1e-6)
+
+    # 追加后的产物已登记，再次打开直接加载
+    encoder = HashEncoder()
+    open_indexes(corpus, cache_dir, encoder)
+    assert encoder.encoded == 0
+
+
+def test_batch_search_matches_single(tmp_path, corpus):
+    indexes = open_indexes(corpus, str(tmp_path / "cache"), HashEncoder())
+    queries = ["alpha beta", "gamma", "zeta eta theta", "unknown"]
+
+    keyword_results = indexes.keyword_search_batch(queries, 5)
+    dense_results = indexes.dense_search_batch(queries, 5)
+    for query, (kw_indices, kw_scores), (dense_indices, dense_scores) in zip(queries, keyword_results, dense_results):
+        indices, scores = indexes.bm25.search(query, 5)
+        np.testing.assert_array_equal(kw_indices, indices)
+        np.testing.assert_allclose(kw_scores, scores, rtol=1e-6)
+
+        indices, scores = indexes.dense.search(indexes.encode_queries([query])[0], 5)
+        np.testing.assert_allclose(dense_scores, scores, rtol=1e-5, atol=1e-6)
+        # 分数相同的文档顺序可能不同，比较集合
+        assert set(dense_indices.tolist()) == set(indices.tolist())
+
+
+def test_configs_sharing_cache_dir_do_not_touch_each_other(tmp_path, corpus):
+    cache_dir = str(tmp_path / "cache")
+    # 另一组件（如 LocalModelEngine）直接写在 cache_dir 下的产物
+    foreign = os.path.join(cache_dir, "dense_index")
+    os.makedirs(foreign)
+    with open(os.path.join(foreign, "marker"), "w") as f:
+        f.write("x")
+
+    open_indexes(corpus, cache_dir, HashEncoder())
+    truncated = open_indexes(corpus, cache_dir, HashEncoder(), max_documents=10, embedding_dtype="float16")
+    assert len(truncated.documents) == len(truncated.dense) == 10
+    assert truncated.index_dir == os.path.join(cache_dir, index_subdir(10, "float16"))
+
+    encoder = HashEncoder()
+    full = open_indexes(corpus, cache_dir, encoder)
+    assert encoder.encoded == 0
+    assert len(full.documents) == 30
+    assert os.path.exists(os.path.join(foreign, "marker"))
@@ -0,0 +1,96 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from adaptive_rag.modules.refiner.mmr import (MMRSelector, cosine_similarity_matrix,
+                                              jaccard_similarity_matrix, mmr_select, novelty_scores)
+
+
+def naive_jaccard(a, b):
+    return len(a & b) / len(a | b) if a and b else 0.0
+
+
+def naive_mmr(relevance, similarity, k, lambda_, max_similarity=None, min_keep=0):
+    """教科书式 MMR：每一步对所有剩余候选重新求与已选集合的最大相似度"""
+    relevance = np.asarray(relevance, dtype=np.float64)
+    span = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / span if span > 0 else np.ones_like(relevance)
+    selected = []
+    while len(selected) < min(k, len(relevance)):
+        best, best_score = None, -np.inf
+        for i in range(len(relevance)):
+            if i in selected:
+                continue
+            redundancy = max((similarity[i][j] for j in selected), default=0.0)
+            if max_similarity is not None and selected and len(selected) >= min_keep \
+                    and redundancy > max_similarity:
+                continue
+            score = lambda_ * relevance[i] - (1 - lambda_) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        if best is None:
+            break
+        selected.append(best)
+    return selected
+
+
+def random_token_sets(rng, n):
+    topics = [rng.sample(range(200), 30) for _ in range(5)]
+    return [{f"w{t}" for t in rng.choice(topics)[:rng.randint(5, 30)]} |
+            {f"w{rng.randrange(200)}" for _ in range(rng.randint(0, 10))} for _ in range(n)] + [set()]
+
+
+def test_jaccard_matrix_matches_pairwise():
+    token_sets = random_token_sets(random.Random(0), 40)
+    similarity = jaccard_similarity_matrix(token_sets)
+    expected = [[naive_jaccard(a, b) for b in token_sets] for a in token_sets]
+    np.testing.assert_allclose(similarity, expected, atol=1e-6)
+
+    novelty = [1.0 - max(naive_jaccard(a, b) for j, b in enumerate(token_sets) if j != i)
+               for i, a in enumerate(token_sets)]
+    np.testing.assert_allclose(novelty_scores(similarity), novelty, atol=1e-6)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("lambda_", [0.0, 0.3, 0.7, 1.0])
+def test_mmr_matches_naive_reference_on_jaccard(seed, lambda_):
+    rng = random.Random(seed)
+    token_sets = random_token_sets(rng, 60)
+    similarity = jaccard_similarity_matrix(token_sets)
+    relevance = [rng.random() for _ in token_sets]
+    assert mmr_select(relevance, similarity, 12, lambda_=lambda_) == \
+        naive_mmr(relevance, similarity.tolist(), 12, lambda_)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_mmr_matches_naive_reference_on_cosine(seed):
+    rng = np.random.default_rng(seed)
+    similarity = cosine_similarity_matrix(rng.standard_normal((50, 8)))
+    relevance = rng.random(50)
+    assert mmr_select(relevance, similarity, 10, lambda_=0.5) == \
+        naive_mmr(relevance, similarity.tolist(), 10, 0.5)
+
+
+def test_max_similarity_threshold_and_min_keep():
+    rng = random.Random(3)
+    token_sets = random_token_sets(rng, 60)
+    similarity = jaccard_similarity_matrix(token_sets)
+    relevance = [rng.random() for _ in token_sets]
+    for min_keep in (0, 3):
+        selected = mmr_select(relevance, similarity, 20, lambda_=0.7, max_similarity=0.3, min_keep=min_keep)
+        assert selected == naive_mmr(relevance, similarity.tolist(), 20, 0.7,
+                                     max_similarity=0.3, min_keep=min_keep)
+        for position in range(max(min_keep, 1), len(selected)):
+            assert max(similarity[selected[position], j] for j in selected[:position]) <= 0.3
+
+
+def test_selector_prefers_diverse_documents():
+    items = [SimpleNamespace(content=text) for text in
+             ["apple banana cherry", "apple banana cherry date", "zebra yak xerus", "apple banana"]]
+    selector = MMRSelector(lambda_=0.3)
+    assert [item.content for item in selector.select(items, [1.0, 0.95, 0.6, 0.9], k=2)] == \
+        ["apple banana cherry", "zebra yak xerus"]
+    assert selector.select(items, [1.0, 0.95, 0.6, 0.9], k=2, lambda_=1.0) == items[:2]
+    assert selector.select([], [], k=3) == []
@@ -0,0 +1,274 @@
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from adaptive_rag.core.performance_optimizer import (DocumentCache, PerformanceOptimizer, QueryEmbeddingCache,
+                                                     SingleFlight, estimate_size)
+from adaptive_rag.data_processing.document_store import DocumentStore
+
+
+def make_retriever(delays=None, calls=None):
+    """按 top_k 返回 [0, top_k) 的文档号；delays 按 top_k 指定检索耗时"""
+    def retrieve(query, top_k):
+        if calls is not None:
+            calls.append(top_k)
+        time.sleep((delays or {}).get(top_k, 0))
+        return list(range(top_k))
+    return retrieve
+
+
+@pytest.mark.parametrize("cache_type", ["lru", "clock", "sharded_lru", "tinylfu"])
+def test_shallow_result_does_not_replace_fresh_deeper_entry(cache_type):
+    cache = DocumentCache(cache_type=cache_type)
+    assert cache.cache_documents("q", "dense", 20, list(range(20)), ttl=60)
+    assert not cache.cache_documents("q", "dense", 5, list(range(5)), ttl=60)
+    assert cache.cached_depth("q", "dense") == 20
+    assert cache.get_cached_documents("q", "dense", 10) == list(range(10))
+
+
+def test_shallow_result_replaces_expired_deeper_entry():
+    cache = DocumentCache()
+    cache.cache_documents("q", "dense", 20, list(range(20)), ttl=60)
+    cache.cache.peek(cache.get_cache_key("q", "dense")).timestamp -= 120
+    assert cache.cache_documents("q", "dense", 5, list(range(5)), ttl=60)
+    assert cache.cached_depth("q", "dense") == 5
+
+
+def test_concurrent_misses_keep_the_deeper_result():
+    # k=20 先完成、k=5 后完成：浅结果不能覆盖深结果
+    optimizer = PerformanceOptimizer({})
+    retrieve = make_retriever(delays={5: 0.2, 20: 0.05})
+    results = {}
+
+    def run(k):
+        results[k] = optimizer.optimize_retrieval("q", "dense", k, retrieve, "q", top_k_arg="top_k")
+
+    threads = [threading.Thread(target=run, args=(k,)) for k in (5, 20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {5: list(range(5)), 20: list(range(20))}
+    assert optimizer.document_cache.cached_depth("q", "dense") == 20
+    calls = []
+    documents = optimizer.optimize_retrieval("q", "dense", 20, make_retriever(calls=calls), "q", top_k_arg="top_k")
+    assert documents == list(range(20)) and calls == []
+
+
+def test_stale_refresh_keeps_cached_depth():
+    optimizer = PerformanceOptimizer({'cache_ttl_seconds': 60, 'cache_stale_ttl_seconds': 60})
+    optimizer.optimize_retrieval("q", "dense", 20, make_retriever(), "q", top_k_arg="top_k")
+    optimizer.document_cache.cache.peek(optimizer.document_cache.get_cache_key("q", "dense")).timestamp -= 90
+
+    calls = []
+    documents = optimizer.optimize_retrieval("q", "dense", 5, make_retriever(calls=calls), "q", top_k_arg="top_k")
+    assert documents == list(range(5))
+    optimizer._refresh_pool.shutdown(wait=True)
+    assert calls == [20]
+    assert optimizer.document_cache.cached_depth("q", "dense") == 20
+
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(flight.do("key", compute))
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert all(value == "value" for value, _ in results)
+    assert not flight.in_flight("key")
+
+
+def test_single_flight_propagates_errors_and_forgets_the_key():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("key", fail)
+    assert not flight.in_flight("key")
+    assert flight.do("key", lambda: 1) == (1, False)
+
+
+def test_concurrent_query_misses_are_coalesced():
+    optimizer = PerformanceOptimizer({})
+    calls = []
+
+    def process():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"answer": len(calls)}
+
+    threads = [threading.Thread(target=optimizer.optimize_query_processing, args=("q", {"k": 1}, process))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert optimizer.performance_stats['coalesced_requests'] == 4
+    assert optimizer.optimize_query_processing("q", {"k": 1}, process) == {"answer": 1}
+
+
+def test_stale_entry_is_served_while_refreshing_once():
+    optimizer = PerformanceOptimizer({'cache_ttl_seconds': 60, 'cache_stale_ttl_seconds': 60})
+    versions = iter(range(1, 100))
+    refreshed = threading.Event()
+
+    def process():
+        value = next(versions)
+        if value > 1:
+            time.sleep(0.05)
+            refreshed.set()
+        return value
+
+    assert optimizer.optimize_query_processing("q", {}, process) == 1
+    key = optimizer.query_cache.get_cache_key("q", {})
+    optimizer.query_cache.cache.peek(key).timestamp -= 90
+
+    # 刷新任务提交后要过一会儿才开始执行，期间的 stale 命中不能重复提交
+    do = optimizer.single_flight.do
+
+    def delayed_do(*args):
+        time.sleep(0.05)
+        return do(*args)
+
+    optimizer.single_flight.do = delayed_do
+
+    # 过期但在 stale 窗口内：立即返回旧值，后台只刷新一次
+    assert [optimizer.optimize_query_processing("q", {}, process) for _ in range(3)] == [1, 1, 1]
+    assert refreshed.wait(5)
+    optimizer._refresh_pool.shutdown(wait=True)
+    assert optimizer.performance_stats['background_refreshes'] == 1
+    assert optimizer.optimize_query_processing("q", {}, process) == 2
+
+    # 超出 stale 窗口：同步重新计算
+    optimizer.query_cache.cache.peek(key).timestamp -= 200
+    assert optimizer.optimize_query_processing("q", {}, process) == 3
+
+
+def deep_size(data):
+    """逐元素精确递归的参考大小（不计字典键，与估算口径一致）"""
+    if isinstance(data, dict):
+        return sys.getsizeof(data) + sum(deep_size(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return sys.getsizeof(data) + sum(deep_size(item) for item in data)
+    return sys.getsizeof(data)
+
+
+@pytest.mark.parametrize("num_docs", [3, 20, 200])
+def test_estimate_size_of_builtin_results(num_docs):
+    docs = [{"id": f"doc_{i}", "title": f"标题 {i}", "content": "检索增强生成 retrieval " * (20 + i % 7),
+             "metadata": {"doc_index": i}, "score": 0.5} for i in range(num_docs)]
+    generation = {"answer": "answer " * 200, "contexts": [doc["content"] for doc in docs],
+                  "metadata": {"stage_times": {"retrieval": 0.1}}}
+    for payload in (docs, (num_docs, docs), generation, [doc["content"] for doc in docs]):
+        assert estimate_size(payload) == pytest.approx(deep_size(payload), rel=0.2)
+
+
+def test_estimate_size_does_not_count_the_document_store():
+    store = DocumentStore.from_records((f"doc_{i}", "t", "content " * 500) for i in range(200))
+    hits = [store.hit(i, 0.5, "dense") for i in range(20)]
+    # 命中对象引用共享的文档库，只计对象自身与字段
+    for payload in (hits, (20, hits), {"documents": hits, "answer": "a"}):
+        assert estimate_size(payload) < 10_000
+
+
+def test_estimate_size_of_arrays():
+    owned = np.zeros((100, 768), dtype=np.float32)
+    assert estimate_size(owned) >= owned.nbytes
+    assert estimate_size(owned[:10]) < 1000
+    assert estimate_size([owned, owned]) >= 2 * owned.nbytes
+
+
+class CountingEncoder:
+    """按文本确定性生成 (n, dim) 嵌入，记录每次调用收到的查询"""
+
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text) + j for j in range(self.dim)] for text in texts], dtype=np.float32)
+
+
+def test_query_embedding_cache_normalizes_queries():
+    cache = QueryEmbeddingCache()
+    encoder = CountingEncoder()
+    first = cache.get_or_encode("What is  RAG?", "e5", lambda q: encoder([q]))
+    # 合并空白、NFKC（全角字符）后是同一查询；大小写不同则不是
+    for query in ("  What is RAG?\n", "What\tis RAG？", "Ｗhat is RAG?"):
+        assert cache.get_or_encode(query, "e5", lambda q: encoder([q])) is first
+    cache.get_or_encode("what is rag?", "e5", lambda q: encoder([q]))
+    assert encoder.calls == [["What is  RAG?"], ["what is rag?"]]
+
+
+def test_query_embedding_cache_separates_encoders():
+    cache = QueryEmbeddingCache()
+    e5 = cache.get_or_encode("query", "e5", lambda q: np.ones((1, 4), dtype=np.float32))
+    bge = cache.get_or_encode("query", "bge", lambda q: np.zeros((1, 8), dtype=np.float32))
+    assert e5.shape == (1, 4) and bge.shape == (1, 8)
+    assert cache.get_embedding("query", "e5") is e5
+    assert cache.get_embedding("query", "bge") is bge
+    assert cache.get_embedding("query", "other") is None
+
+
+def test_query_embedding_cache_returns_read_only_copies():
+    cache = QueryEmbeddingCache()
+    original = np.ones((1, 4), dtype=np.float32)
+    cached = cache.get_or_encode("query", "e5", lambda q: original)
+    original[0, 0] = 5.0  # 调用方之后修改自己的数组不影响缓存
+    assert not cached.flags.writeable
+    with pytest.raises(ValueError):
+        cached[0, 0] = 2.0
+    assert cache.get_embedding("query", "e5")[0, 0] == 1.0
+
+    batch = cache.get_or_encode_batch(["a", "b"], "e5", CountingEncoder())
+    assert all(not embedding.flags.writeable for embedding in batch)
+    # 批量缓存的是拷贝，不是编码结果矩阵的视图
+    assert all(embedding.base is None for embedding in batch)
+
+
+def test_query_embedding_cache_batch_matches_single():
+    encoder = CountingEncoder()
+    single_cache, batch_cache = QueryEmbeddingCache(), QueryEmbeddingCache()
+    queries = ["alpha", "beta  gamma", "alpha", "delta"]
+    single = [single_cache.get_or_encode(query, "e5", lambda q: encoder([q])) for query in queries]
+
+    batch_cache.get_or_encode("delta", "e5", lambda q: encoder([q]))
+    encoder.calls.clear()
+    batch = batch_cache.get_or_encode_batch(queries, "e5", encoder)
+
+    # 未命中的查询去重后一次编码
+    assert encoder.calls == [["alpha", "beta  gamma"]]
+    for got, want in zip(batch, single):
+        assert got.shape == want.shape == (1, encoder.dim)
+        np.testing.assert_array_equal(got, want)
+    assert batch[0] is batch[2]
+    # 批量写入的条目随后可被单条接口命中
+    assert batch_cache.get_or_encode("beta gamma", "e5", lambda q: encoder([q])) is batch[1]
+    assert len(encoder.calls) == 1
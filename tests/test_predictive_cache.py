@@ -0,0 +1,38 @@
+import threading
+import time
+
+import pytest
+
+from adaptive_rag.core.predictive_cache import PredictiveCache
+
+
+def test_wait_on_prefetch_is_bounded_by_timeout():
+    release = threading.Event()
+
+    def hung_search(query):
+        release.wait(5)
+        return [f"doc for {query}"]
+
+    cache = PredictiveCache({"max_workers": 1})
+    cache.prefetch(["bm25"], hung_search, namespace="search")
+
+    start = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        cache.get_or_fetch("bm25", hung_search, namespace="search", timeout=0.05)
+    assert time.perf_counter() - start < 1.0
+    assert cache.get_statistics()["wait_timeouts"] == 1
+
+    # 预取条目保留，完成后仍可服务后续请求
+    release.set()
+    assert cache.get_or_fetch("BM25", hung_search, namespace="search", timeout=1.0) == ["doc for bm25"]
+    cache.shutdown(wait=True)
+
+
+def test_transitions_are_learned_per_session():
+    cache = PredictiveCache({"min_support": 1, "confidence_threshold": 0.5})
+    cache.record_query("what is bm25", session_id="a")
+    cache.record_query("what is colbert", session_id="b")
+    cache.record_query("bm25 vs dense", session_id="a")
+
+    assert cache.predict_followups("what is bm25") == ["bm25 vs dense"]
+    assert cache.predict_followups("what is colbert") == []
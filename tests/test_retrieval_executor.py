@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+from adaptive_rag.modules.retriever.retrieval_executor import ParallelRetrievalExecutor
+
+
+def sleeper(delay, value):
+    def search():
+        time.sleep(delay)
+        return [value]
+    return search
+
+
+def test_queue_time_does_not_count_against_timeout():
+    # 单线程池：dense 排在 keyword 之后 0.3s 才开始执行，自身只需 0.05s
+    executor = ParallelRetrievalExecutor(max_workers=1, timeouts={"keyword": 1.0, "dense": 0.2})
+    outcomes = executor.run({"keyword": sleeper(0.3, "k"), "dense": sleeper(0.05, "d")})
+    executor.shutdown()
+    assert outcomes["keyword"].ok and outcomes["dense"].ok
+    assert outcomes["dense"].results == ["d"]
+
+
+def test_running_task_still_times_out():
+    executor = ParallelRetrievalExecutor(max_workers=2, timeouts={"web": 0.05})
+    outcomes = executor.run({"keyword": sleeper(0.01, "k"), "web": sleeper(0.3, "w")})
+    executor.shutdown()
+    assert outcomes["keyword"].ok
+    assert outcomes["web"].status == "timeout" and outcomes["web"].results == []
+
+
+def test_deadline_still_counts_from_submit():
+    executor = ParallelRetrievalExecutor(max_workers=1, timeouts={"keyword": 1.0, "dense": 1.0})
+    start = time.perf_counter()
+    outcomes = executor.run({"keyword": sleeper(0.2, "k"), "dense": sleeper(0.2, "d")}, deadline=0.1)
+    assert time.perf_counter() - start < 0.2
+    executor.shutdown()
+    assert outcomes["keyword"].status == "timeout" and outcomes["dense"].status == "timeout"
+
+
+def test_async_queue_time_does_not_count_against_timeout():
+    executor = ParallelRetrievalExecutor(max_workers=1, timeouts={"keyword": 1.0, "dense": 0.2})
+    outcomes = asyncio.run(executor.run_async({"keyword": sleeper(0.3, "k"), "dense": sleeper(0.05, "d")}))
+    executor.shutdown()
+    assert outcomes["dense"].ok and outcomes["dense"].results == ["d"]
@@ -0,0 +1,125 @@
+import random
+import threading
+import time
+
+import numpy as np
+
+from adaptive_rag.modules.retriever.segmented_index import SegmentedBM25Index, SegmentedDenseIndex
+from adaptive_rag.modules.retriever.sparse_retriever import InvertedBM25Index
+
+QUERIES = ["w1 w2 w3", "w42 w199", "w7", "w5 w5 w77"]
+
+
+def random_texts(rng, n, vocabulary=200):
+    # 文档长度差异较大，避免各段 avgdl 恰好相同掩盖问题
+    return [" ".join(rng.choices([f"w{i}" for i in range(vocabulary)], k=rng.randint(3, 60)))
+            for _ in range(n)]
+
+
+def assert_matches_reference(index, reference, doc_map, top_k=10, excluded=()):
+    """分段检索结果与重建索引一致：分数相同，文档号只在同分时可以不同"""
+    for query, (ids, scores) in zip(QUERIES, index.search_batch(QUERIES, top_k)):
+        single_ids, single_scores = index.search(query, top_k)
+        np.testing.assert_allclose(single_scores, scores, rtol=1e-5)
+
+        ref_ids, ref_scores = reference.search(query, reference.num_docs)
+        ref_by_doc = {doc_map[int(i)]: float(s) for i, s in zip(ref_ids, ref_scores)}
+        expected = [s for i, s in zip(ref_ids, ref_scores) if doc_map[int(i)] not in excluded][:top_k]
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+        for doc_id, score in zip(ids.tolist(), scores.tolist()):
+            assert doc_id not in excluded
+            assert abs(ref_by_doc[doc_id] - score) < 1e-4
+
+
+def test_segments_score_like_rebuilt_index():
+    rng = random.Random(0)
+    base_texts, new_texts = random_texts(rng, 300), random_texts(rng, 120)
+    index = SegmentedBM25Index(InvertedBM25Index.from_texts(base_texts), flush_docs=25,
+                               max_segments=100, background_merge=False)
+    for i in range(0, len(new_texts), 10):
+        index.add_documents(new_texts[i:i + 10])
+    assert len(index.get_segment_info()["segments"]) > 2
+
+    all_texts = base_texts + new_texts
+    reference = InvertedBM25Index.from_texts(all_texts)
+    assert_matches_reference(index, reference, list(range(len(all_texts))))
+
+
+def test_tombstones_filter_results_but_keep_statistics():
+    rng = random.Random(1)
+    base_texts, new_texts = random_texts(rng, 200), random_texts(rng, 60)
+    index = SegmentedBM25Index(InvertedBM25Index.from_texts(base_texts), flush_docs=20, background_merge=False)
+    index.add_documents(new_texts)
+    deleted = set(range(0, 260, 3))
+    assert index.delete(deleted) == len(deleted)
+    assert len(index) == 260 - len(deleted)
+
+    # 合并前已删除文档仍计入统计量，等价于对全部文档重建后过滤
+    all_texts = base_texts + new_texts
+    reference = InvertedBM25Index.from_texts(all_texts)
+    assert_matches_reference(index, reference, list(range(len(all_texts))), excluded=deleted)
+
+
+def test_merge_purges_runtime_deletes():
+    rng = random.Random(2)
+    base_texts, new_texts = random_texts(rng, 150), random_texts(rng, 90)
+    index = SegmentedBM25Index(InvertedBM25Index.from_texts(base_texts), flush_docs=15, background_merge=False)
+    doc_ids = index.add_documents(new_texts)
+    deleted = set(doc_ids[::4])
+    index.delete(deleted)
+    index.compact()
+
+    info = index.get_segment_info()
+    assert info["segments"] == [150, 90 - len(deleted)]
+    assert info["tombstones"] == 0 and info["purged"] == len(deleted)
+
+    survivors = [doc_id for doc_id in doc_ids if doc_id not in deleted]
+    reference = InvertedBM25Index.from_texts(base_texts + [new_texts[doc_id - 150] for doc_id in survivors])
+    assert_matches_reference(index, reference, list(range(150)) + survivors)
+
+
+def test_dense_segments_match_brute_force():
+    rng = np.random.default_rng(3)
+    vectors = rng.standard_normal((200, 16)).astype(np.float32)
+    index = SegmentedDenseIndex(flush_docs=30, max_segments=2, background_merge=False)
+    for i in range(0, 200, 20):
+        index.add_embeddings(vectors[i:i + 20])
+    deleted = set(range(0, 200, 5))
+    index.delete(deleted)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.standard_normal((4, 16)).astype(np.float32)
+    for query, (ids, scores) in zip(queries, index.search_batch(queries, 10)):
+        exact = normalized @ (query / np.linalg.norm(query))
+        order = [i for i in np.argsort(-exact) if i not in deleted][:10]
+        assert ids.tolist() == order
+        np.testing.assert_allclose(scores, exact[order], rtol=1e-5)
+
+
+def test_synchronous_merge_does_not_deadlock_with_compact():
+    # compact 在锁外合并期间，写入触发同步合并：二者的加锁顺序必须一致
+    texts = random_texts(random.Random(4), 6)
+    index = SegmentedBM25Index(flush_docs=2, max_segments=2, background_merge=False)
+    index.add_documents(texts[:2])
+    index.add_documents(texts[2:4])
+
+    merging = threading.Event()
+    merge_indexes = index._merge_indexes
+
+    def slow_merge_indexes(parts):
+        merging.set()
+        time.sleep(0.2)
+        return merge_indexes(parts)
+
+    index._merge_indexes = slow_merge_indexes
+    compactor = threading.Thread(target=index.compact, daemon=True)
+    compactor.start()
+    assert merging.wait(timeout=5)
+    writer = threading.Thread(target=index.add_documents, args=(texts[4:],), daemon=True)
+    writer.start()
+    for thread in (compactor, writer):
+        thread.join(timeout=5)
+        assert not thread.is_alive(), "分段索引合并死锁"
+
+    assert len(index) == len(texts)
+    assert index.get_segment_info()["segments"] == [len(texts)]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+from adaptive_rag.core.semantic_cache import SemanticCache, char_ngram_embedding, key_terms
+
+SYNONYMS = {"ml": "machine learning", "define": "what is", "us": "united states"}
+
+
+def paraphrase_embedding(text):
+    """展开缩写 / 同义词后再做 n-gram 编码，充当能识别改写的嵌入模型"""
+    normalized = " ".join(SYNONYMS.get(word, word) for word in text.lower().replace("?", " ").split())
+    return char_ngram_embedding(normalized)
+
+
+def make_cache(**config):
+    return SemanticCache({"similarity_threshold": 0.8, **config},
+                         encode_fn=char_ngram_embedding, encoder_id="test")
+
+
+def test_fallback_encoder_never_serves():
+    cache = SemanticCache()
+    cache.store("What is machine learning?", {"answer": "ml"})
+    assert cache.lookup("What is machine learning?") is None
+    assert cache.get_statistics()["size"] == 0
+    assert cache.get_statistics()["fallback_skips"] == 1
+
+
+def test_one_word_difference_is_rejected():
+    cache = make_cache()
+    cache.store("Who was the first president of the United States?", {"answer": "Washington"})
+    assert cache.lookup("Who was the third president of the United States?") is None
+    assert cache.get_statistics()["rejections"] == 1
+
+
+def test_surface_rewrite_hits():
+    cache = make_cache()
+    cache.store("What is machine learning?", {"answer": "ml"})
+    hit = cache.lookup("what is machine-learning")
+    assert hit is not None and hit["result"] == {"answer": "ml"}
+
+
+def test_verify_none_uses_threshold_only():
+    cache = make_cache(verify="none")
+    cache.store("Who was the first president of the United States?", {"answer": "Washington"})
+    assert cache.lookup("Who was the third president of the United States?") is not None
+
+
+def test_partitions_and_ttl():
+    cache = make_cache(ttl_seconds=0)
+    cache.store("How does BM25 work?", {"answer": "bm25"}, partition="keyword_only")
+    assert cache.lookup("How does BM25 work?") is None
+    assert cache.lookup("How does BM25 work?", "keyword_only") is None
+    assert cache.get_statistics()["expirations"] == 1
+
+
+def test_paraphrase_hits():
+    cache = SemanticCache({"similarity_threshold": 0.9}, encode_fn=paraphrase_embedding, encoder_id="test")
+    cache.store("What is ML?", {"answer": "ml"})
+    hit = cache.lookup("what is machine learning")
+    assert hit is not None and hit["cached_query"] == "What is ML?"
+    assert cache.lookup("Define machine learning") is not None
+    # token_set 只接受表层改写
+    strict = SemanticCache({"similarity_threshold": 0.9, "verify": "token_set"},
+                           encode_fn=paraphrase_embedding, encoder_id="test")
+    strict.store("What is ML?", {"answer": "ml"})
+    assert strict.lookup("what is machine learning") is None
+
+
+@pytest.mark.parametrize("cached, query, expected", [
+    ("Who was the first president of the United States?", "Who was the third president of the United States?", False),
+    ("Who was the first president of the United States?", "who was the first president of the united states", True),
+    ("Population of France in 2020", "Population of France in 2021", False),
+    ("Which animal is a mammal?", "Which animal isn't a mammal?", False),
+    ("What is the capital of France?", "What is the capital of Germany?", False),
+    ("What is ML?", "What is NLP?", False),
+    ("第一任美国总统是谁", "第三任美国总统是谁", False),
+    ("What is ML?", "tell me about machine learning", True),
+])
+def test_key_terms_guard(cached, query, expected):
+    # 常量编码器：所有查询相似度都为 1，结果只取决于二次确认
+    cache = SemanticCache({}, encode_fn=lambda text: np.ones(4), encoder_id="constant")
+    cache.store(cached, {"answer": cached})
+    assert (cache.lookup(query) is not None) == expected
+
+
+def test_key_terms():
+    assert key_terms("Who was the 3rd president? Not Adams") == (frozenset({"3", "not"}), frozenset({"adams"}))
+    assert key_terms("BM25是什么，第二版") == (frozenset({"25", "第二"}), frozenset({"bm25"}))
+
+
+def test_calibrate_threshold():
+    cache = SemanticCache({}, encode_fn=paraphrase_embedding, encoder_id="test")
+    same = [("What is ML?", "what is machine learning"), ("Define BM25", "what is BM25")]
+    different = [("What is ML?", "What is the history of ML?"),
+                 ("Who was the first US president?", "Who was the third US president?")]
+    threshold = cache.calibrate(same, different)
+    history = float(cache._embed("What is ML?") @ cache._embed("What is the history of ML?"))
+    assert threshold == pytest.approx(history + 0.01)
+
+    cache.store("What is ML?", {"answer": "ml"})
+    assert cache.lookup("what is machine learning") is not None
+    assert cache.lookup("What is the history of ML?") is None
@@ -0,0 +1,73 @@
+import math
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from adaptive_rag.modules.retriever.sparse_retriever import InvertedBM25Index, default_tokenize
+
+
+def brute_force_scores(texts, query, k1=1.5, b=0.75):
+    """逐文档计算 BM25（log1p IDF、小写分词）"""
+    docs = [Counter(default_tokenize(text)) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    avgdl = sum(lengths) / len(docs)
+    scores = np.zeros(len(docs))
+    for term, count in Counter(default_tokenize(query)).items():
+        df = sum(1 for doc in docs if term in doc)
+        if not df:
+            continue
+        idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+        for i, doc in enumerate(docs):
+            tf = doc.get(term, 0)
+            if tf:
+                scores[i] += count * idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[i] / avgdl))
+    return scores
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = random.Random(0)
+    # Zipf 分布的词频，使高频词的倒排很长，MaxScore 剪枝会生效
+    vocabulary = [f"w{i}" for i in range(300)]
+    weights = [1 / (i + 1) for i in range(300)]
+    return [" ".join(rng.choices(vocabulary, weights, k=rng.randint(5, 80))) for _ in range(800)]
+
+
+QUERIES = ["w0 w1 w250", "w3", "W7 w7 w120", "w0 w1 w2 w3 w4 w5 w6 w7", "w299 unknown", "missing"]
+
+
+@pytest.mark.parametrize("top_k", [1, 5, 50])
+def test_search_matches_brute_force(corpus, top_k):
+    index = InvertedBM25Index.from_texts(corpus)
+    for query in QUERIES:
+        exact = brute_force_scores(corpus, query)
+        ids, scores = index.search(query, top_k)
+        expected = np.sort(exact[exact > 0])[::-1][:top_k]
+        np.testing.assert_allclose(scores, expected, rtol=1e-4)
+        np.testing.assert_allclose(exact[ids], scores, rtol=1e-4)
+
+
+def test_search_batch_matches_search(corpus):
+    index = InvertedBM25Index.from_texts(corpus)
+    for query, (ids, scores) in zip(QUERIES, index.search_batch(QUERIES, 10)):
+        single_ids, single_scores = index.search(query, 10)
+        np.testing.assert_allclose(scores, single_scores, rtol=1e-5)
+
+
+def test_tokenization_is_case_insensitive():
+    index = InvertedBM25Index.from_texts(["BM25 Ranking", "dense retrieval", "sparse bm25"])
+    ids, _ = index.search("bm25", 5)
+    assert sorted(ids.tolist()) == [0, 2]
+
+
+def test_save_and_load_roundtrip(corpus, tmp_path):
+    index = InvertedBM25Index.from_texts(corpus)
+    index.save(str(tmp_path))
+    loaded = InvertedBM25Index.load(str(tmp_path))
+    for query in QUERIES:
+        ids, scores = index.search(query, 10)
+        loaded_ids, loaded_scores = loaded.search(query, 10)
+        assert loaded_ids.tolist() == ids.tolist()
+        np.testing.assert_allclose(loaded_scores, scores)